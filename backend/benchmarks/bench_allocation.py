@@ -0,0 +1,81 @@
+# benchmarks/bench_allocation.py
+# Allocation drill-downs: one GROUP BY over the holdings snapshot and the tag closure table
+# (allocation.get_allocation) vs valuing every holding in Python and walking each asset's tags up to the level shown.
+# Usage: python benchmarks/bench_allocation.py [assets ...]
+
+import sys
+import random
+import sqlite3
+import time
+import logging
+from pathlib import Path
+
+# Add src directory to sys.path
+src_path = Path(__file__).parent.parent / "src"
+sys.path.insert(0, str(src_path))
+import database
+import allocation
+import calculations
+
+CURRENCIES = ("USD", "EUR", "GBP")
+REGIONS = {"Americas": ("United States", "Canada", "Brazil"), "Europe": ("France", "Germany", "United Kingdom"), "Asia": ("Japan", "China", "India")}
+
+def _build(conn, assets, seed=9):
+    rng = random.Random(seed)
+    database.bulk_upsert_assets([{"ticker": f"A{i}", "name": f"Asset {i}", "asset_type": ("Stock", "ETF", "Crypto")[i % 3], "currency": CURRENCIES[i % 3]}
+                                 for i in range(assets)], conn=conn)
+    database.bulk_add_transactions([{"asset_id": a, "transaction_type": "Buy", "date": "2024-01-02", "quantity": rng.uniform(1, 100), "price": rng.uniform(10, 500),
+                                     "fees": 0.0, "currency": CURRENCIES[(a - 1) % 3]} for a in range(1, assets + 1)], conn=conn)
+    database.add_prices([{"asset_id": a, "date": "2024-06-03", "close": rng.uniform(10, 500)} for a in range(1, assets + 1)], conn=conn)
+    database.add_fx_rates([{"base": "USD", "quote": "EUR", "date": "2024-01-01", "rate": 0.9}, {"base": "USD", "quote": "GBP", "date": "2024-01-01", "rate": 0.8}], conn=conn)
+    countries = []
+    for region, names in REGIONS.items():
+        parent = allocation.add_tag("region", region, conn=conn)
+        countries += [allocation.add_tag("region", name, parent, conn=conn) for name in names]
+    rows = []
+    for a in range(1, assets + 1): # Most assets in one country, every third one split over two
+        first, second = rng.sample(countries, 2)
+        rows += [{"asset_id": a, "tag_id": first, "weight": 0.7}, {"asset_id": a, "tag_id": second, "weight": 0.3}] if a % 3 == 0 else [{"asset_id": a, "tag_id": first}]
+    allocation.set_asset_tags(rows, conn=conn)
+    return allocation.add_tag("region", "Europe", conn=conn)
+
+def _python_grouping(conn, parent_tag_id, today):
+    """The naive shape: value every holding in Python, then roll each asset's tags up to the children of parent_tag_id."""
+    holdings = calculations.get_holdings_in_base_currency("USD", today=today, conn=conn)
+    tags = {row["id"]: (row["name"], row["parent_id"]) for row in conn.execute("SELECT id, name, parent_id FROM tags")}
+    asset_tags = {}
+    for row in conn.execute("SELECT asset_id, tag_id, weight FROM asset_tags"): asset_tags.setdefault(row["asset_id"], []).append((row["tag_id"], row["weight"]))
+    groups = {}
+    for holding in holdings:
+        if not holding["quantity"] > 0 or holding["market_value"] is None: continue
+        for tag_id, weight in asset_tags.get(holding["asset_id"], ()):
+            while tag_id is not None and tags[tag_id][1] != parent_tag_id: tag_id = tags[tag_id][1]
+            if tag_id is not None: groups[tags[tag_id][0]] = groups.get(tags[tag_id][0], 0.0) + holding["market_value"] * weight
+    return groups
+
+def _timed(function, repeat=5):
+    start = time.perf_counter()
+    for _ in range(repeat): function()
+    return (time.perf_counter() - start) / repeat
+
+def run(sizes=(1000, 10000, 50000)):
+    """Prints milliseconds per drill-down level (regions, then countries of one region) for each portfolio size."""
+    logging.getLogger().setLevel(logging.WARNING)
+    today = "2024-06-03"
+    results = {}
+    for assets in sizes:
+        conn = sqlite3.connect(":memory:")
+        conn.row_factory = sqlite3.Row
+        database._create_schema(conn)
+        europe = _build(conn, assets)
+        database.clear_result_cache()
+        top = _timed(lambda: allocation.get_allocation("region", base_currency="USD", today=today, conn=conn))
+        drill = _timed(lambda: allocation.get_allocation("region", parent_tag_id=europe, base_currency="USD", today=today, conn=conn))
+        python = _timed(lambda: _python_grouping(conn, europe, today))
+        conn.close()
+        results[assets] = {"sql_top_level_ms": top * 1e3, "sql_drill_down_ms": drill * 1e3, "python_drill_down_ms": python * 1e3}
+        print(f"{assets:>6} assets: top level {top * 1e3:8.2f} ms, drill-down {drill * 1e3:8.2f} ms, Python grouping {python * 1e3:8.2f} ms")
+    return results
+
+if __name__ == "__main__":
+    run(tuple(int(arg) for arg in sys.argv[1:]) or (1000, 10000, 50000))
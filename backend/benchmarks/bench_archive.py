@@ -0,0 +1,85 @@
+# benchmarks/bench_archive.py
+# Portfolio archive size vs the SQLite file, export/import time vs replaying the rows through
+# bulk_add_transactions, and loading transaction arrays from the archive vs from SQLite.
+# Usage: python benchmarks/bench_archive.py [transactions]
+
+import sys
+import random
+import sqlite3
+import time
+import tempfile
+import logging
+from pathlib import Path
+
+# Add src directory to sys.path
+src_path = Path(__file__).parent.parent / "src"
+sys.path.insert(0, str(src_path))
+import database
+import calculations
+import archive
+
+def _new_conn(path=":memory:"):
+    conn = sqlite3.connect(path)
+    conn.row_factory = sqlite3.Row
+    database._create_schema(conn)
+    conn.commit()
+    return conn
+
+def _transactions(count, assets, seed=7):
+    rng = random.Random(seed)
+    rows = []
+    for n in range(count):
+        kind = "Buy" if n < assets or rng.random() < 0.7 else rng.choice(["Sell", "Dividend"])
+        rows.append({"asset_id": rng.randint(1, assets), "transaction_type": kind, "date": f"20{rng.randint(10, 24)}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}",
+                     "quantity": round(rng.uniform(0.1, 5), 4), "price": round(rng.uniform(5, 500), 2), "fees": rng.choice([0.0, 1.0, 2.5]),
+                     "currency": "USD", "notes": None, "fingerprint": f"bench-{n}"})
+    return rows
+
+def _timed(function):
+    start = time.perf_counter()
+    result = function()
+    return result, time.perf_counter() - start
+
+def run(transactions=200000, assets=200):
+    """Builds a file database with `transactions` trades and daily prices, then prints sizes and timings."""
+    logging.getLogger().setLevel(logging.WARNING)
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        conn = _new_conn(tmp / "source.db")
+        database.bulk_upsert_assets([{"ticker": f"B{i}", "name": f"Bench {i}", "asset_type": "Stock", "currency": "USD"} for i in range(assets)], conn=conn)
+        rows = _transactions(transactions, assets)
+        database.bulk_add_transactions(rows, conn=conn)
+        prices = [{"asset_id": a, "date": f"2024-{m:02d}-{d:02d}", "close": 100.0 + (a * d) % 17} for a in range(1, assets + 1) for m in range(1, 13) for d in range(1, 29)]
+        database.add_prices(prices, conn=conn)
+        conn.execute("VACUUM")
+        db_size = (tmp / "source.db").stat().st_size
+
+        path = tmp / "portfolio.pit"
+        _, export_time = _timed(lambda: archive.export_portfolio(path, conn=conn))
+        restored = _new_conn()
+        _, import_time = _timed(lambda: archive.import_portfolio(path, conn=restored))
+        restored.close()
+        replay = _new_conn()
+        database.bulk_upsert_assets([{"ticker": f"B{i}", "name": f"Bench {i}", "asset_type": "Stock", "currency": "USD"} for i in range(assets)], conn=replay)
+        _, replay_time = _timed(lambda: (database.bulk_add_transactions(rows, conn=replay), database.add_prices(prices, conn=replay)))
+        replay.close()
+        _, sqlite_arrays_time = _timed(lambda: calculations.load_transaction_arrays(conn=conn))
+        _, archive_arrays_time = _timed(lambda: calculations.load_archive_transaction_arrays(path))
+        archive_size = path.stat().st_size
+        conn.close()
+
+    results = {
+        "db_mb": db_size / 2 ** 20, "archive_mb": archive_size / 2 ** 20,
+        "export_s": export_time, "import_s": import_time, "replay_s": replay_time,
+        "arrays_from_sqlite_s": sqlite_arrays_time, "arrays_from_archive_s": archive_arrays_time,
+    }
+    print(f"size: database {results['db_mb']:.2f} MB, archive {results['archive_mb']:.2f} MB ({db_size / archive_size:.1f}x smaller)")
+    print(f"export:                      {export_time:8.3f} s")
+    print(f"import (all tables):         {import_time:8.3f} s")
+    print(f"replay via bulk inserts:     {replay_time:8.3f} s (transactions and prices)")
+    print(f"transaction arrays, SQLite:  {sqlite_arrays_time:8.3f} s")
+    print(f"transaction arrays, archive: {archive_arrays_time:8.3f} s")
+    return results
+
+if __name__ == "__main__":
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 200000)
@@ -0,0 +1,57 @@
+# benchmarks/bench_asset_search.py
+# Type-ahead latency of search_assets (FTS5 prefix index) vs a LIKE scan over ticker/name/ISIN.
+# Usage: python benchmarks/bench_asset_search.py [instruments]
+
+import sys
+import random
+import string
+import sqlite3
+import time
+import logging
+from pathlib import Path
+
+# Add src directory to sys.path
+src_path = Path(__file__).parent.parent / "src"
+sys.path.insert(0, str(src_path))
+import database
+
+_WORDS = ["Global", "Capital", "Energy", "Holdings", "Technologies", "Pharma", "Bank", "Mining", "Retail", "Systems",
+          "Partners", "Industries", "Motors", "Foods", "Networks", "Bio", "Solar", "Logistics", "Media", "Insurance"]
+
+def _make_assets(count, seed=3):
+    rng = random.Random(seed)
+    tickers = set()
+    while len(tickers) < count:
+        tickers.add("".join(rng.choice(string.ascii_uppercase) for _ in range(rng.randint(2, 5))) + rng.choice(["", ".L", ".DE", "-USD"]))
+    return [{"ticker": ticker, "name": " ".join(rng.sample(_WORDS, 3)), "asset_type": "Stock", "currency": "USD",
+             "isin": f"US{i:09d}{rng.randint(0, 9)}"} for i, ticker in enumerate(sorted(tickers))]
+
+def _time_per_query(function, queries, repeat=5):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for query in queries: function(query)
+    return (time.perf_counter() - start) / (repeat * len(queries))
+
+def run(instruments=100000):
+    """Builds an in-memory universe of `instruments` assets and prints mean milliseconds per type-ahead query."""
+    logging.getLogger().setLevel(logging.WARNING)
+    conn = sqlite3.connect(":memory:")
+    conn.row_factory = sqlite3.Row
+    database._create_schema(conn)
+    assets = _make_assets(instruments)
+    database.bulk_upsert_assets(assets, conn=conn)
+    rng = random.Random(5)
+    queries = [a["ticker"][:rng.randint(1, 3)] for a in rng.sample(assets, 50)] + ["glob", "capital ho", "US00001"]
+
+    fts = _time_per_query(lambda q: database.search_assets(q, limit=10, conn=conn), queries)
+    like_sql = "SELECT * FROM assets WHERE ticker LIKE ? OR name LIKE ? OR isin LIKE ? ORDER BY name LIMIT 10"
+    like = _time_per_query(lambda q: conn.execute(like_sql, (f"%{q}%",) * 3).fetchall(), queries)
+    conn.close()
+
+    results = {"search_assets_ms": fts * 1e3, "like_scan_ms": like * 1e3}
+    print(f"search_assets (FTS5): {results['search_assets_ms']:8.3f} ms/query over {instruments} instruments")
+    print(f"LIKE scan:            {results['like_scan_ms']:8.3f} ms/query")
+    return results
+
+if __name__ == "__main__":
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 100000)
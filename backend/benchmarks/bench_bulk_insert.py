@@ -0,0 +1,54 @@
+# benchmarks/bench_bulk_insert.py
+# Rows-per-second comparison of per-row add_transaction vs bulk_add_transactions.
+# Usage: python benchmarks/bench_bulk_insert.py [rows]
+
+import sys
+import datetime
+import sqlite3
+import time
+import tempfile
+import logging
+from pathlib import Path
+
+# Add src directory to sys.path
+src_path = Path(__file__).parent.parent / "src"
+sys.path.insert(0, str(src_path))
+import database
+
+def _make_rows(asset_id, count, start=datetime.date(2000, 1, 1)):
+    """Builds synthetic Buy rows for one asset in date order (appends, like day-to-day entry)."""
+    return [{"asset_id": asset_id, "transaction_type": "Buy", "date": str(start + datetime.timedelta(days=i // 3)),
+             "quantity": 1 + i % 7, "price": 10.0 + (i % 500) / 10, "fees": 1.0, "currency": "USD"} for i in range(count)]
+
+def run(rows=20000):
+    """Runs both insert paths against a fresh file database and prints rows/second."""
+    logging.getLogger().setLevel(logging.WARNING) # Per-row INFO logging would dominate the timings
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = Path(tmp) / "bench.db"
+        database.initialize_database(db_path=db_path)
+        conn = sqlite3.connect(db_path)
+        conn.row_factory = sqlite3.Row
+        asset_id = database.add_asset("BENCH", "Benchmark Corp", "Stock", "USD", conn=conn)
+
+        single_rows = _make_rows(asset_id, min(rows, 2000)) # The per-row path commits each insert; keep it bounded
+        start = time.perf_counter()
+        for row in single_rows:
+            database.add_transaction(row["asset_id"], row["transaction_type"], row["date"], row["quantity"], row["price"], row["fees"], row["currency"], conn=conn)
+        single_elapsed = time.perf_counter() - start
+
+        bulk_rows = _make_rows(asset_id, rows, start=datetime.date(2030, 1, 1))
+        start = time.perf_counter()
+        database.bulk_add_transactions(bulk_rows, conn=conn)
+        bulk_elapsed = time.perf_counter() - start
+        conn.close()
+
+    results = {
+        "add_transaction_rows_per_sec": len(single_rows) / single_elapsed,
+        "bulk_add_transactions_rows_per_sec": rows / bulk_elapsed,
+    }
+    print(f"add_transaction:       {len(single_rows):>8} rows in {single_elapsed:8.3f}s -> {results['add_transaction_rows_per_sec']:>12,.0f} rows/s")
+    print(f"bulk_add_transactions: {rows:>8} rows in {bulk_elapsed:8.3f}s -> {results['bulk_add_transactions_rows_per_sec']:>12,.0f} rows/s")
+    return results
+
+if __name__ == "__main__":
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 20000)
@@ -0,0 +1,47 @@
+# benchmarks/bench_calculations.py
+# Timing of the vectorized holdings engine on a large synthetic transaction set.
+# Usage: python benchmarks/bench_calculations.py [transactions] [assets]
+
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+# Add src directory to sys.path
+src_path = Path(__file__).parent.parent / "src"
+sys.path.insert(0, str(src_path))
+import calculations
+
+def make_arrays(transactions, assets, seed=42):
+    """Synthetic columnar transactions: mostly buys, some sells and rare splits, sorted by (asset, date, id)."""
+    rng = np.random.default_rng(seed)
+    asset_id = np.sort(rng.integers(1, assets + 1, transactions))
+    kind = rng.choice([calculations.BUY, calculations.SELL, calculations.SPLIT], transactions, p=[0.7, 0.295, 0.005]).astype(np.int8)
+    quantity = np.where(kind == calculations.SPLIT, 2.0, rng.integers(1, 50, transactions).astype(np.float64))
+    # Keep sells small relative to buys so positions stay long
+    quantity = np.where(kind == calculations.SELL, quantity / 4, quantity)
+    return {
+        "id": np.arange(transactions, dtype=np.int64),
+        "asset_id": asset_id,
+        "kind": kind,
+        "date": np.datetime64("2010-01-01") + np.sort(rng.integers(0, 5000, transactions)).astype("timedelta64[D]"),
+        "quantity": quantity,
+        "price": rng.uniform(5, 500, transactions),
+        "fees": rng.choice([0.0, 1.0], transactions),
+    }
+
+def run(transactions=1_000_000, assets=2_000, repeats=5):
+    """Prints the best-of-N time for compute_holdings."""
+    arrays = make_arrays(transactions, assets)
+    best = min(_timed(calculations.compute_holdings, arrays) for _ in range(repeats))
+    print(f"compute_holdings: {transactions:,} transactions / {assets:,} assets in {best * 1000:8.1f} ms")
+    return {"compute_holdings_ms": best * 1000}
+
+def _timed(function, *args):
+    start = time.perf_counter()
+    function(*args)
+    return time.perf_counter() - start
+
+if __name__ == "__main__":
+    run(*(int(a) for a in sys.argv[1:3]))
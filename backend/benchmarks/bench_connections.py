@@ -0,0 +1,84 @@
+# benchmarks/bench_connections.py
+# Per-call latency of the old connect-per-call path vs the pooled connection, and how long a
+# dashboard read waits while an import holds the write lock (rollback journal vs WAL).
+# Usage: python benchmarks/bench_connections.py [calls]
+
+import os
+import sys
+import sqlite3
+import time
+import tempfile
+import logging
+import threading
+from pathlib import Path
+
+# Add src directory to sys.path
+src_path = Path(__file__).parent.parent / "src"
+sys.path.insert(0, str(src_path))
+import database
+
+def _legacy_get_setting(db_path, key):
+    """The previous path: a fresh connection per call with default journal and cache settings."""
+    conn = sqlite3.connect(db_path, timeout=10)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA foreign_keys = ON")
+    try:
+        row = conn.execute("SELECT value FROM settings WHERE key = ?", (key,)).fetchone()
+        return row["value"] if row else None
+    finally:
+        conn.close()
+
+def _read_wait_during_write(db_path, journal_mode, hold=0.2):
+    """Seconds a reader waits for one SELECT while another connection holds an uncommitted write for `hold` seconds."""
+    setup = sqlite3.connect(db_path)
+    setup.execute(f"PRAGMA journal_mode = {journal_mode}")
+    setup.close()
+    writer = sqlite3.connect(db_path, timeout=10, check_same_thread=False)
+    writer.execute("BEGIN EXCLUSIVE" if journal_mode == "DELETE" else "BEGIN IMMEDIATE") # An import's commit needs EXCLUSIVE in rollback mode
+    writer.execute("INSERT OR REPLACE INTO settings (key, value) VALUES ('bench', 'x')")
+    timer = threading.Timer(hold, writer.commit)
+    timer.start()
+    reader = sqlite3.connect(db_path, timeout=10)
+    start = time.perf_counter()
+    reader.execute("SELECT COUNT(*) FROM settings").fetchone()
+    waited = time.perf_counter() - start
+    timer.join()
+    reader.close()
+    writer.close()
+    return waited
+
+def run(calls=5000):
+    """Times both connection paths against a fresh file database and prints microseconds per call."""
+    logging.getLogger().setLevel(logging.WARNING)
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = Path(tmp) / "bench.db"
+        os.environ["PIT_DATABASE_PATH"] = str(db_path)
+        database.initialize_database(db_path=db_path)
+        database.set_setting("base_currency", "USD")
+
+        start = time.perf_counter()
+        for _ in range(calls): _legacy_get_setting(db_path, "base_currency")
+        legacy_elapsed = time.perf_counter() - start
+
+        start = time.perf_counter()
+        for _ in range(calls): database.get_setting("base_currency")
+        pooled_elapsed = time.perf_counter() - start
+        database.close_pooled_connections()
+
+        rollback_wait = _read_wait_during_write(db_path, "DELETE")
+        wal_wait = _read_wait_during_write(db_path, "WAL")
+
+    results = {
+        "connect_per_call_us": legacy_elapsed / calls * 1e6,
+        "pooled_us": pooled_elapsed / calls * 1e6,
+        "read_wait_rollback_journal_ms": rollback_wait * 1e3,
+        "read_wait_wal_ms": wal_wait * 1e3,
+    }
+    print(f"get_setting, connect per call: {results['connect_per_call_us']:>10.1f} us/call")
+    print(f"get_setting, pooled:           {results['pooled_us']:>10.1f} us/call")
+    print(f"read during import, rollback:  {results['read_wait_rollback_journal_ms']:>10.1f} ms")
+    print(f"read during import, WAL:       {results['read_wait_wal_ms']:>10.1f} ms")
+    return results
+
+if __name__ == "__main__":
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 5000)
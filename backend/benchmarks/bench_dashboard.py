@@ -0,0 +1,70 @@
+# benchmarks/bench_dashboard.py
+# Dashboard payload: cold build, warm open (served whole from cache), and the rebuild after a write that only
+# makes some parts stale (a new dividend announcement leaves the valuation parts cached).
+# Usage: python benchmarks/bench_dashboard.py [assets] [days]
+
+import sys
+import random
+import sqlite3
+import time
+import datetime
+import logging
+from pathlib import Path
+
+# Add src directory to sys.path
+src_path = Path(__file__).parent.parent / "src"
+sys.path.insert(0, str(src_path))
+import database
+import corporate_actions
+import dashboard
+import calculations
+
+def _build(conn, assets, days, seed=19):
+    rng = random.Random(seed)
+    start = datetime.date(2022, 1, 3)
+    database.bulk_upsert_assets([{"ticker": f"S{i}", "name": f"Asset {i}", "asset_type": rng.choice(["Stock", "ETF", "Crypto"]),
+                                  "currency": rng.choice(["USD", "EUR"])} for i in range(assets)], conn=conn)
+    database.bulk_add_transactions([{"asset_id": a, "transaction_type": "Buy", "date": (start + datetime.timedelta(days=rng.randint(0, days - 1))).isoformat(),
+                                     "quantity": rng.randint(1, 20), "price": 100.0, "fees": 0.0, "currency": "USD"}
+                                    for a in range(1, assets + 1) for _ in range(20)], conn=conn)
+    database.add_prices([{"asset_id": a, "date": (start + datetime.timedelta(days=d)).isoformat(), "close": 100.0 * (1 + 0.001 * rng.uniform(-d, d))}
+                         for a in range(1, assets + 1) for d in range(days)], conn=conn)
+    database.add_fx_rates([{"base": "EUR", "quote": "USD", "date": (start + datetime.timedelta(days=d)).isoformat(), "rate": 1.1 + rng.uniform(-0.05, 0.05)}
+                           for d in range(days)], conn=conn)
+    database.set_setting("base_currency", "EUR", conn=conn)
+    return (start + datetime.timedelta(days=days - 1)).isoformat()
+
+def _timed(function, repeat=3):
+    start = time.perf_counter()
+    for _ in range(repeat): function()
+    return (time.perf_counter() - start) / repeat
+
+def run(assets=200, days=730):
+    """Builds an in-memory portfolio and prints milliseconds per dashboard payload."""
+    logging.getLogger().setLevel(logging.WARNING)
+    conn = sqlite3.connect(":memory:")
+    conn.row_factory = sqlite3.Row
+    database._create_schema(conn)
+    today = _build(conn, assets, days)
+    calculations.refresh_portfolio_daily(conn=conn) # The IPC handler does this after writes
+
+    def cold():
+        database.clear_result_cache()
+        return dashboard.get_dashboard(today=today, conn=conn)
+    cold_ms = _timed(cold) * 1e3
+    warm_ms = _timed(lambda: dashboard.get_dashboard(today=today, conn=conn), repeat=200) * 1e3
+    announcements = iter(range(1, 1000))
+    def after_dividend(): # Only the dividends part and the payload are rebuilt
+        corporate_actions.add_corporate_actions([{"asset_id": next(announcements), "action_type": "Dividend", "ex_date": today, "amount": 0.1, "currency": "USD"}], conn=conn)
+        return dashboard.get_dashboard(today=today, conn=conn)
+    partial_ms = _timed(after_dividend) * 1e3
+    conn.close()
+
+    results = {"cold_ms": cold_ms, "warm_ms": warm_ms, "partial_rebuild_ms": partial_ms}
+    print(f"dashboard, cold:                   {cold_ms:8.2f} ms ({assets} assets, {days} days of prices)")
+    print(f"dashboard, warm:                   {warm_ms:8.3f} ms")
+    print(f"dashboard, after a dividend write: {partial_ms:8.2f} ms")
+    return results
+
+if __name__ == "__main__":
+    run(*(int(arg) for arg in sys.argv[1:3]))
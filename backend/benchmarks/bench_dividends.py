@@ -0,0 +1,90 @@
+# benchmarks/bench_dividends.py
+# Upcoming-dividend projection: one query plus a vectorized range expansion vs a per-asset loop (one query
+# and Python extrapolation per holding), plus a cached call; and the vectorized split adjustment of all transactions.
+# Usage: python benchmarks/bench_dividends.py [assets]
+
+import sys
+import random
+import sqlite3
+import time
+import datetime
+import logging
+from pathlib import Path
+
+# Add src directory to sys.path
+src_path = Path(__file__).parent.parent / "src"
+sys.path.insert(0, str(src_path))
+import database
+import corporate_actions
+
+def _build(conn, assets, seed=9):
+    rng = random.Random(seed)
+    database.bulk_upsert_assets([{"ticker": f"D{i}", "name": f"Payer {i}", "asset_type": "Stock", "currency": "USD"} for i in range(assets)], conn=conn)
+    trades, actions = [], []
+    for asset_id in range(1, assets + 1):
+        for n in range(10):
+            trades.append({"asset_id": asset_id, "transaction_type": "Buy", "date": f"2015-{n + 1:02d}-10", "quantity": 10.0, "price": 50.0, "fees": 0.0, "currency": "USD"})
+        interval = rng.choice([30, 91, 182, 365])
+        ex = datetime.date(2024, 3, 1) - datetime.timedelta(days=rng.randint(0, interval))
+        for _ in range(40):
+            actions.append({"asset_id": asset_id, "action_type": "Dividend", "ex_date": ex.isoformat(), "amount": 0.25, "currency": "USD",
+                            "pay_date": (ex + datetime.timedelta(days=14)).isoformat()})
+            ex -= datetime.timedelta(days=interval)
+        if rng.random() < 0.2: actions.append({"asset_id": asset_id, "action_type": "Split", "ex_date": "2020-06-01", "amount": 4.0})
+    database.bulk_add_transactions(trades, conn=conn)
+    corporate_actions.add_corporate_actions(actions, conn=conn)
+
+def _per_asset_loop(conn, today, horizon_days):
+    """The naive shape: one history query per holding and Python date stepping, producing the same rows."""
+    end = datetime.date.fromisoformat(today) + datetime.timedelta(days=horizon_days)
+    rows = []
+    for holding in conn.execute("SELECT h.asset_id, h.quantity, a.ticker, a.name FROM holdings h JOIN assets a ON a.id = h.asset_id WHERE h.quantity > 0").fetchall():
+        events = conn.execute("SELECT ex_date, pay_date, amount, currency FROM corporate_actions WHERE asset_id = ? AND action_type = 'Dividend' ORDER BY ex_date DESC LIMIT 5",
+                              (holding["asset_id"],)).fetchall()
+        if len(events) < 2: continue
+        dates = [datetime.date.fromisoformat(e["ex_date"]) for e in events]
+        interval = (dates[0] - dates[-1]).days / (len(dates) - 1)
+        pay_lag = (datetime.date.fromisoformat(events[0]["pay_date"]) - dates[0]).days
+        k = 1
+        while (projected := dates[0] + datetime.timedelta(days=round(k * interval))) <= end:
+            if projected.isoformat() > today:
+                rows.append({"asset_id": holding["asset_id"], "ticker": holding["ticker"], "name": holding["name"], "date": projected.isoformat(),
+                             "pay_date": (projected + datetime.timedelta(days=pay_lag)).isoformat(), "amount_per_share": events[0]["amount"],
+                             "currency": events[0]["currency"], "quantity": holding["quantity"], "amount": events[0]["amount"] * holding["quantity"], "estimated": True})
+            k += 1
+    rows.sort(key=lambda row: (row["date"], row["ticker"]))
+    return rows
+
+def _timed(function, repeat=5):
+    start = time.perf_counter()
+    for _ in range(repeat): function()
+    return (time.perf_counter() - start) / repeat
+
+def run(assets=2000):
+    """Builds an in-memory portfolio of `assets` dividend payers and prints milliseconds per call."""
+    logging.getLogger().setLevel(logging.WARNING)
+    conn = sqlite3.connect(":memory:")
+    conn.row_factory = sqlite3.Row
+    database._create_schema(conn)
+    _build(conn, assets)
+    today, horizon = "2024-04-01", 365
+
+    def uncached():
+        database.clear_result_cache()
+        return corporate_actions.get_upcoming_dividends(horizon, today, conn=conn)
+    projection = _timed(uncached)
+    loop = _timed(lambda: _per_asset_loop(conn, today, horizon))
+    corporate_actions.get_upcoming_dividends(horizon, today, conn=conn)
+    cached = _timed(lambda: corporate_actions.get_upcoming_dividends(horizon, today, conn=conn), repeat=100)
+    adjust = _timed(lambda: corporate_actions.get_adjusted_transaction_arrays(conn=conn))
+    conn.close()
+
+    results = {"projection_ms": projection * 1e3, "per_asset_loop_ms": loop * 1e3, "cached_ms": cached * 1e3, "split_adjustment_ms": adjust * 1e3}
+    print(f"upcoming dividends, vectorized:     {results['projection_ms']:8.2f} ms ({assets} holdings)")
+    print(f"upcoming dividends, per-asset loop: {results['per_asset_loop_ms']:8.2f} ms")
+    print(f"upcoming dividends, cached:         {results['cached_ms']:8.3f} ms")
+    print(f"split-adjusted transaction arrays:  {results['split_adjustment_ms']:8.2f} ms ({assets * 10} transactions)")
+    return results
+
+if __name__ == "__main__":
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 2000)
@@ -0,0 +1,84 @@
+# benchmarks/bench_fx.py
+# Re-valuing the portfolio in a new base currency: vectorized as-of conversion of every transaction
+# (calculations.get_holdings_in_base_currency) vs converting row by row with one rate query per transaction.
+# Usage: python benchmarks/bench_fx.py [transactions]
+
+import sys
+import random
+import sqlite3
+import time
+import datetime
+import logging
+from pathlib import Path
+
+# Add src directory to sys.path
+src_path = Path(__file__).parent.parent / "src"
+sys.path.insert(0, str(src_path))
+import database
+import calculations
+
+CURRENCIES = ("USD", "EUR", "GBP", "JPY", "CHF")
+
+def _build(conn, transactions, assets=500, seed=5):
+    rng = random.Random(seed)
+    database.bulk_upsert_assets([{"ticker": f"F{i}", "name": f"Asset {i}", "asset_type": "Stock", "currency": CURRENCIES[i % len(CURRENCIES)]}
+                                 for i in range(assets)], conn=conn)
+    start = datetime.date(2010, 1, 1)
+    rates = []
+    for quote, level in (("EUR", 0.9), ("GBP", 0.8), ("JPY", 120.0), ("CHF", 0.95)): # USD-quoted pairs only: the rest triangulates
+        for day in range(0, 5300, 1 if quote == "EUR" else 3):
+            rates.append({"base": "USD", "quote": quote, "date": (start + datetime.timedelta(days=day)).isoformat(), "rate": level * (1 + 0.1 * rng.random())})
+    database.add_fx_rates(rates, conn=conn)
+    rows = []
+    for n in range(transactions):
+        asset_id = rng.randint(1, assets)
+        rows.append({"asset_id": asset_id, "transaction_type": "Buy" if n < assets or rng.random() < 0.7 else "Sell",
+                     "date": (start + datetime.timedelta(days=rng.randint(0, 5200))).isoformat(), "quantity": 1.0, "price": rng.uniform(10, 500),
+                     "fees": 1.0, "currency": CURRENCIES[(asset_id - 1) % len(CURRENCIES)]})
+    database.bulk_add_transactions(rows, conn=conn)
+    database.add_prices([{"asset_id": a, "date": "2024-06-01", "close": 100.0} for a in range(1, assets + 1)], conn=conn)
+
+def _row_by_row(conn, base_currency, limit):
+    """The naive shape: one as-of rate query per transaction, summing converted cost per asset (first limit rows)."""
+    sql = "SELECT base, quote, rate FROM fx_rates WHERE ((base = ? AND quote = ?) OR (base = ? AND quote = ?)) AND date <= ? ORDER BY date DESC LIMIT 1"
+    def rate(source, target, date):
+        if source == target: return 1.0
+        row = conn.execute(sql, (source, target, target, source, date)).fetchone()
+        if row is not None: return row["rate"] if row["base"] == source else 1.0 / row["rate"]
+        return rate(source, "USD", date) * rate("USD", target, date)
+    cost = {}
+    for tx in conn.execute("SELECT asset_id, quantity, price, fees, currency, date FROM transactions WHERE transaction_type = 'Buy' LIMIT ?", (limit,)):
+        cost[tx["asset_id"]] = cost.get(tx["asset_id"], 0.0) + (tx["quantity"] * tx["price"] + tx["fees"]) * rate(tx["currency"], base_currency, tx["date"])
+    return cost
+
+def _timed(function, repeat=3):
+    start = time.perf_counter()
+    for _ in range(repeat): function()
+    return (time.perf_counter() - start) / repeat
+
+def run(transactions=100000):
+    """Builds an in-memory portfolio of `transactions` rows in five currencies and prints seconds per re-valuation."""
+    logging.getLogger().setLevel(logging.WARNING)
+    conn = sqlite3.connect(":memory:")
+    conn.row_factory = sqlite3.Row
+    database._create_schema(conn)
+    _build(conn, transactions)
+    today = "2024-06-01"
+
+    def cold(): # Transactions or rates written: arrays, converter and per-pair memo rebuilt
+        database.clear_result_cache()
+        return calculations.get_holdings_in_base_currency("GBP", today=today, conn=conn)
+    revalue_cold = _timed(cold)
+    revalue_warm = _timed(lambda: calculations.get_holdings_in_base_currency("CHF", today=today, conn=conn))
+    sample = min(transactions, 2000) # Scaled up: the full run takes minutes
+    row_by_row = _timed(lambda: _row_by_row(conn, "GBP", sample), repeat=1) * transactions / sample
+    conn.close()
+
+    results = {"revalue_cold_s": revalue_cold, "revalue_warm_s": revalue_warm, "row_by_row_s": row_by_row}
+    print(f"re-value in new base currency, cold: {revalue_cold:8.3f} s ({transactions} transactions)")
+    print(f"re-value in new base currency, warm: {revalue_warm:8.3f} s")
+    print(f"row-by-row rate lookups (estimated): {row_by_row:8.3f} s")
+    return results
+
+if __name__ == "__main__":
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 100000)
@@ -0,0 +1,67 @@
+# benchmarks/bench_ibkr_parser.py
+# Parse throughput and peak memory of the streaming IBKR parser on synthetic statements.
+# Usage: python benchmarks/bench_ibkr_parser.py [trades ...]
+
+import sys
+import csv
+import time
+import random
+import tempfile
+import tracemalloc
+from pathlib import Path
+
+# Add src directory to sys.path
+src_path = Path(__file__).parent.parent / "src"
+sys.path.insert(0, str(src_path))
+from parsers import ibkr_parser
+
+def write_synthetic_statement(path, trades, seed=42):
+    """Writes an IBKR-style activity statement with the given number of trades plus dividends, tax, fees and FX rows."""
+    rng = random.Random(seed)
+    symbols = [f"SYM{i:03d}" for i in range(200)]
+    with open(path, "w", newline="") as handle:
+        writer = csv.writer(handle)
+        writer.writerow(["Statement", "Header", "Field Name", "Field Value"])
+        writer.writerow(["Statement", "Data", "Title", "Activity Statement"])
+        writer.writerow(["Trades", "Header", "DataDiscriminator", "Asset Category", "Currency", "Symbol", "Date/Time", "Quantity", "T. Price", "C. Price", "Proceeds", "Comm/Fee", "Basis", "Realized P/L", "MTM P/L", "Code"])
+        for i in range(trades):
+            quantity = rng.choice([-1, 1]) * rng.randint(1, 500)
+            price = round(rng.uniform(5, 500), 2)
+            date = f"20{10 + i * 15 // max(trades, 1):02d}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}, 10:{i % 60:02d}:00"
+            writer.writerow(["Trades", "Data", "Order", "Stocks", "USD", rng.choice(symbols), date, quantity, price, price, -quantity * price, -1.0, "", "", "", "O"])
+        writer.writerow(["Trades", "Header", "DataDiscriminator", "Asset Category", "Currency", "Symbol", "Date/Time", "Quantity", "T. Price", "Proceeds", "Comm in USD", "Code"])
+        for i in range(trades // 20):
+            writer.writerow(["Trades", "Data", "Order", "Forex", "USD", "EUR.USD", f"2023-{1 + i % 12:02d}-10, 09:00:00", 1000 + i, 1.09, -1090.0, -2.0, ""])
+        writer.writerow(["Dividends", "Header", "Currency", "Date", "Description", "Amount"])
+        for i in range(trades // 10):
+            symbol = rng.choice(symbols)
+            writer.writerow(["Dividends", "Data", "USD", f"2022-{1 + i % 12:02d}-15", f"{symbol}(US{i % 1000000000:09d}1) Cash Dividend USD 0.25 per Share (Ordinary Dividend)", 25.0])
+        writer.writerow(["Withholding Tax", "Header", "Currency", "Date", "Description", "Amount", "Code"])
+        for i in range(trades // 10):
+            writer.writerow(["Withholding Tax", "Data", "USD", f"2022-{1 + i % 12:02d}-15", f"SYM001(US0000000011) Cash Dividend USD 0.25 per Share - US Tax", -3.75, ""])
+        writer.writerow(["Fees", "Header", "Subtitle", "Currency", "Date", "Description", "Amount"])
+        for i in range(trades // 100):
+            writer.writerow(["Fees", "Data", "Other Fees", "USD", f"2022-{1 + i % 12:02d}-01", "Market data fee", -10.0])
+
+def run(trade_counts=(10000, 100000)):
+    """Parses statements of increasing size and prints rows/second and peak traced memory."""
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        for trades in trade_counts:
+            path = Path(tmp) / f"statement_{trades}.csv"
+            write_synthetic_statement(path, trades)
+            start = time.perf_counter()
+            records = sum(len(batch) for batch in ibkr_parser.parse_ibkr_statement(path))
+            elapsed = time.perf_counter() - start
+            # Second pass under tracemalloc (which slows parsing) just to measure peak memory
+            tracemalloc.start()
+            sum(len(batch) for batch in ibkr_parser.parse_ibkr_statement(path))
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            size_mb = path.stat().st_size / 1e6
+            results[trades] = {"records_per_sec": records / elapsed, "peak_mb": peak / 1e6}
+            print(f"{size_mb:8.1f} MB file: {records:>9} records in {elapsed:7.3f}s -> {records / elapsed:>10,.0f} records/s, peak {peak / 1e6:6.2f} MB")
+    return results
+
+if __name__ == "__main__":
+    run(tuple(int(a) for a in sys.argv[1:]) or (10000, 100000))
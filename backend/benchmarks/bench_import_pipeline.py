@@ -0,0 +1,62 @@
+# benchmarks/bench_import_pipeline.py
+# Multi-file statement import: ibkr_parser.import_ibkr_statement file by file vs import_pipeline.import_statements
+# with parsing in a thread (workers=1) and in a process pool, on synthetic IBKR statements.
+# Usage: python benchmarks/bench_import_pipeline.py [files] [trades]
+
+import os
+import sys
+import time
+import sqlite3
+import tempfile
+import logging
+from pathlib import Path
+
+# Add src directory to sys.path
+src_path = Path(__file__).parent.parent / "src"
+sys.path.insert(0, str(src_path))
+sys.path.insert(0, str(Path(__file__).parent))
+import database
+import import_pipeline
+from parsers import ibkr_parser
+from bench_ibkr_parser import write_synthetic_statement
+
+def _new_conn(path):
+    conn = sqlite3.connect(path)
+    conn.row_factory = sqlite3.Row
+    database._create_schema(conn)
+    conn.commit()
+    return conn
+
+def _timed(db_path, function):
+    conn = _new_conn(db_path)
+    start = time.perf_counter()
+    result = function(conn)
+    elapsed = time.perf_counter() - start
+    rows = conn.execute("SELECT COUNT(*) FROM transactions").fetchone()[0]
+    conn.close()
+    return result, elapsed, rows
+
+def run(files=8, trades=50000):
+    """Imports `files` statements of `trades` trades each three ways and prints rows/second of each."""
+    logging.getLogger().setLevel(logging.WARNING)
+    workers = max(2, min(files, (os.cpu_count() or 2) - 1))
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        paths = [tmp / f"statement_{n}.csv" for n in range(files)]
+        for n, path in enumerate(paths): write_synthetic_statement(path, trades, seed=n)
+        _, results["sequential_s"], rows = _timed(tmp / "sequential.db", lambda conn: [ibkr_parser.import_ibkr_statement(path, conn=conn) for path in paths])
+        summary, results["pipeline_thread_s"], _ = _timed(tmp / "thread.db", lambda conn: import_pipeline.import_statements(paths, workers=1, conn=conn))
+        summary, results["pipeline_pool_s"], pipeline_rows = _timed(tmp / "pool.db", lambda conn: import_pipeline.import_statements(paths, workers=workers, conn=conn))
+    results["rows"] = rows
+    print(f"{files} statements, {trades} trades each ({rows} transactions, pipeline {pipeline_rows}; rows repeated across statements are skipped as duplicates)")
+    print(f"file by file (import_ibkr_statement): {results['sequential_s']:8.3f} s {rows / results['sequential_s']:10.0f} rows/s")
+    print(f"pipeline, parse in a thread:          {results['pipeline_thread_s']:8.3f} s {rows / results['pipeline_thread_s']:10.0f} rows/s")
+    print(f"pipeline, {workers} parse processes:        {results['pipeline_pool_s']:8.3f} s {rows / results['pipeline_pool_s']:10.0f} rows/s")
+    if summary:
+        for stage, stats in summary["stages"].items():
+            print(f"  {stage:8s} busy {stats['busy_s']:7.3f} s {stats['rows_per_sec']:10.0f} rows/s")
+    return results
+
+if __name__ == "__main__":
+    run(*(int(arg) for arg in sys.argv[1:3]))
@@ -0,0 +1,63 @@
+# benchmarks/bench_ipc_encoding.py
+# Payload size and encode time of a large IPC result for each response format: row-dict JSON (stdlib, and orjson
+# when installed), columnar JSON (keys once, one array per column) and the binary frame (raw and base64-wrapped
+# as sent in a JSON line), for transaction rows and for a two-column value series.
+# Usage: python benchmarks/bench_ipc_encoding.py [rows]
+
+import sys
+import json
+import time
+import random
+import datetime
+from pathlib import Path
+
+# Add src directory to sys.path
+src_path = Path(__file__).parent.parent / "src"
+sys.path.insert(0, str(src_path))
+import ipc_codec
+
+def make_transactions(rows, seed=11):
+    """Rows shaped like get_all_transactions results."""
+    rng = random.Random(seed)
+    start = datetime.date(2010, 1, 1)
+    return [{"id": i + 1, "asset_id": rng.randint(1, 500), "ticker": f"T{rng.randint(1, 500):03d}", "asset_name": "Synthetic Asset",
+             "transaction_type": rng.choice(("Buy", "Sell", "Dividend")), "date": (start + datetime.timedelta(days=i % 5000)).isoformat(),
+             "quantity": float(rng.randint(1, 100)), "price": round(rng.uniform(1, 500), 4), "fees": rng.choice((0.0, 1.0)),
+             "currency": "USD", "notes": None} for i in range(rows)]
+
+def make_series(rows, seed=12):
+    """A daily value series like get_portfolio_series results."""
+    rng = random.Random(seed)
+    start = datetime.date(1990, 1, 1)
+    return [{"date": (start + datetime.timedelta(days=i)).isoformat(), "value": 10000 * (1 + rng.gauss(0, 0.01))} for i in range(rows)]
+
+def _timed(function, repeat=3):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+def _encodings():
+    encodings = {"json_rows": lambda data: json.dumps(data)}
+    if ipc_codec.orjson is not None: encodings["orjson_rows"] = lambda data: ipc_codec.orjson.dumps(data)
+    encodings["columnar_json"] = lambda data: ipc_codec.dumps(ipc_codec.to_columnar(data))
+    encodings["binary_frame"] = lambda data: ipc_codec.encode_frame(data)
+    encodings["binary_base64"] = lambda data: ipc_codec.encode(data, "binary")[1]
+    return encodings
+
+def run(rows=100000):
+    """Prints payload megabytes and best-of-3 encode milliseconds per encoding."""
+    results = {}
+    for dataset, data in (("transactions", make_transactions(rows)), ("series", make_series(rows))):
+        print(f"{dataset} ({rows} rows, JSON backend: {ipc_codec.JSON_BACKEND})")
+        results[dataset] = {}
+        for name, encode in _encodings().items():
+            seconds, payload = _timed(lambda: encode(data))
+            results[dataset][name] = {"encode_ms": seconds * 1e3, "payload_mb": len(payload) / 1e6}
+            print(f"  {name:14} {len(payload) / 1e6:8.2f} MB {seconds * 1e3:9.1f} ms")
+    return results
+
+if __name__ == "__main__":
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 100000)
@@ -0,0 +1,62 @@
+# benchmarks/bench_metrics.py
+# Cost of observability on a large IPC result: the old payload logging (every result formatted into the
+# log at INFO) vs the summary line, and the overhead of the phase timers and of SQL statement tracing.
+# Usage: python benchmarks/bench_metrics.py [transactions]
+
+import os
+import sys
+import sqlite3
+import time
+import json
+import logging
+from pathlib import Path
+
+# Add src directory to sys.path
+src_path = Path(__file__).parent.parent / "src"
+sys.path.insert(0, str(src_path))
+import database
+import metrics
+import ipc_handler
+
+def _timed(function, repeat=5):
+    start = time.perf_counter()
+    for _ in range(repeat): function()
+    return (time.perf_counter() - start) / repeat
+
+def run(transactions=50000):
+    """Prints milliseconds per get_all_transactions request through the server-mode handler."""
+    conn = sqlite3.connect(":memory:")
+    conn.row_factory = sqlite3.Row
+    database._create_schema(conn)
+    database.bulk_upsert_assets([{"ticker": f"M{i}", "name": f"Asset {i}", "asset_type": "Stock", "currency": "USD"} for i in range(100)], conn=conn)
+    database.bulk_add_transactions([{"asset_id": 1 + n % 100, "transaction_type": "Buy", "date": f"2024-{1 + n % 12:02d}-{1 + n % 28:02d}", "quantity": 1.0,
+                                     "price": 10.0 + n % 50, "fees": 0.0, "currency": "USD"} for n in range(transactions)], conn=conn)
+    request = json.dumps({"id": 1, "function": "get_all_transactions", "args": []})
+    root = logging.getLogger()
+    handler = logging.StreamHandler(open(os.devnull, "w")) # Formatting and writing the log, not the terminal
+    root.handlers, saved_handlers = [handler], root.handlers
+    try:
+        root.setLevel(logging.DEBUG) # The previous default: result payloads formatted into the log
+        payload_logged = _timed(lambda: ipc_handler.handle_request_line(request, conn=conn))
+        root.setLevel(logging.INFO)
+        summary_only = _timed(lambda: ipc_handler.handle_request_line(request, conn=conn))
+        metrics.ENABLED = False
+        uninstrumented = _timed(lambda: ipc_handler.handle_request_line(request, conn=conn))
+        metrics.ENABLED = True
+        metrics.trace_connection(conn)
+        traced = _timed(lambda: ipc_handler.handle_request_line(request, conn=conn))
+        metrics.trace_connection(conn, enabled=False)
+    finally:
+        root.handlers = saved_handlers
+        handler.stream.close()
+        conn.close()
+
+    results = {"payload_logged_ms": payload_logged * 1e3, "summary_only_ms": summary_only * 1e3, "uninstrumented_ms": uninstrumented * 1e3, "sql_traced_ms": traced * 1e3}
+    print(f"payload logged (DEBUG):      {results['payload_logged_ms']:8.1f} ms ({transactions} rows)")
+    print(f"summary line only (INFO):    {results['summary_only_ms']:8.1f} ms")
+    print(f"metrics disabled:            {results['uninstrumented_ms']:8.1f} ms")
+    print(f"with SQL statement tracing:  {results['sql_traced_ms']:8.1f} ms")
+    return results
+
+if __name__ == "__main__":
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 50000)
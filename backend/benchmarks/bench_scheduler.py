@@ -0,0 +1,71 @@
+# benchmarks/bench_scheduler.py
+# Quick UI reads while bulk reads are in flight, through a real --server process: the concurrent scheduler
+# (reader pool with a reserved interactive reader) vs --sequential (one request at a time on one connection).
+# Usage: python benchmarks/bench_scheduler.py [assets] [years]
+
+import os
+import sys
+import json
+import time
+import tempfile
+import threading
+import subprocess
+import statistics
+from pathlib import Path
+
+# Add src directory to sys.path
+src_path = Path(__file__).parent.parent / "src"
+sys.path.insert(0, str(src_path))
+sys.path.insert(0, str(Path(__file__).parent))
+import database
+import portfolio_generator
+
+IPC_HANDLER_SCRIPT = src_path / "ipc_handler.py"
+
+def _measure(db_path, server_args, bulk=4, quick=40):
+    """Sends bulk get_all_transactions requests, then quick get_setting ones every 5 ms; returns latencies in ms."""
+    env = {**os.environ, "PIT_DATABASE_PATH": str(db_path), "PIT_LOG_LEVEL": "WARNING"}
+    server = subprocess.Popen([sys.executable, str(IPC_HANDLER_SCRIPT), "--server", *server_args], stdin=subprocess.PIPE,
+                              stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True, bufsize=1, env=env)
+    sent, answered = {}, {}
+    def read():
+        for line in server.stdout:
+            response = json.loads(line)
+            if "chunk" not in response and "progress" not in response: answered[response["id"]] = time.perf_counter()
+    reader = threading.Thread(target=read)
+    reader.start()
+    def send(request_id, function_name, args):
+        sent[request_id] = time.perf_counter()
+        server.stdin.write(json.dumps({"id": request_id, "function": function_name, "args": args}) + "\n")
+        server.stdin.flush()
+    send("warm-up", "get_setting", ["base_currency"])
+    while "warm-up" not in answered: time.sleep(0.01)
+    for n in range(bulk): send(f"bulk-{n}", "get_all_transactions", [])
+    for n in range(quick):
+        send(f"quick-{n}", "get_setting", ["base_currency"])
+        time.sleep(0.005)
+    server.stdin.close()
+    server.wait(timeout=120)
+    reader.join()
+    quick_ms = [(answered[f"quick-{n}"] - sent[f"quick-{n}"]) * 1e3 for n in range(quick)]
+    bulk_ms = [(answered[f"bulk-{n}"] - sent[f"bulk-{n}"]) * 1e3 for n in range(bulk)]
+    return {"quick_p50_ms": statistics.median(quick_ms), "quick_max_ms": max(quick_ms), "bulk_last_ms": max(bulk_ms)}
+
+def run(assets=200, years=5):
+    """Prints quick-read latency under bulk load for both server modes."""
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = Path(tmp) / "portfolio.db"
+        database.initialize_database(db_path=db_path)
+        conn = database._connect(db_path)
+        counts = portfolio_generator.generate_portfolio(conn, assets=assets, years=years, trades_per_year=24, prices=False)
+        conn.close()
+        results = {"transactions": counts["transactions"]}
+        for mode, server_args in (("sequential", ["--sequential"]), ("concurrent", [])):
+            results[mode] = _measure(db_path, server_args)
+            print(f"{mode:<11} quick p50 {results[mode]['quick_p50_ms']:8.1f} ms  max {results[mode]['quick_max_ms']:8.1f} ms  "
+                  f"bulk done {results[mode]['bulk_last_ms']:8.1f} ms ({counts['transactions']} transactions each)")
+        database.close_pooled_connections()
+    return results
+
+if __name__ == "__main__":
+    run(*(int(a) for a in sys.argv[1:3]))
@@ -0,0 +1,69 @@
+# benchmarks/bench_transaction_index.py
+# Cost and benefit of idx_transactions_type_covering: bulk insert time (holdings refresh deferred, so only the
+# table, its indexes and version bumps are timed) and query_transactions preset latency, with the covering index,
+# with a narrow (transaction_type, date) index in its place, and with neither.
+# Usage: python benchmarks/bench_transaction_index.py [transactions]
+
+import sys
+import time
+import random
+import sqlite3
+import tempfile
+import logging
+from pathlib import Path
+
+# Add src directory to sys.path
+src_path = Path(__file__).parent.parent / "src"
+sys.path.insert(0, str(src_path))
+import database
+
+VARIANTS = {
+    "covering": "CREATE INDEX idx_transactions_type_covering ON transactions (transaction_type, asset_id, date, currency, quantity, price, fees)",
+    "narrow": "CREATE INDEX idx_transactions_type_date ON transactions (transaction_type, date)",
+    "none": None,
+}
+
+def _transactions(count, assets, seed=11):
+    rng = random.Random(seed)
+    return [{"asset_id": rng.randint(1, assets), "transaction_type": rng.choice(["Buy", "Buy", "Sell", "Dividend", "Fee"]),
+             "date": f"20{rng.randint(10, 24)}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}", "quantity": float(rng.randint(1, 50)),
+             "price": round(rng.uniform(5, 500), 2), "fees": rng.choice([0.0, 1.0]), "currency": rng.choice(["USD", "EUR"]),
+             "notes": None, "fingerprint": f"bench-{n}"} for n in range(count)]
+
+def _measure(db_path, index_sql, rows, assets, batch=20000, repeats=5):
+    conn = sqlite3.connect(db_path)
+    conn.row_factory = sqlite3.Row
+    database._create_schema(conn)
+    conn.execute("DROP INDEX idx_transactions_type_covering")
+    if index_sql: conn.execute(index_sql)
+    conn.commit()
+    database.bulk_upsert_assets([{"ticker": f"B{i}", "name": f"Bench {i}", "asset_type": "Stock", "currency": "USD"} for i in range(assets)], conn=conn)
+    start = time.perf_counter()
+    for offset in range(0, len(rows), batch):
+        database.bulk_add_transactions(rows[offset:offset + batch], conn=conn, changed={})
+    insert_s = time.perf_counter() - start
+    queries = {}
+    for preset in database.TRANSACTION_QUERY_PRESETS:
+        start = time.perf_counter()
+        for _ in range(repeats): database.query_transactions(preset=preset, conn=conn)
+        queries[preset] = (time.perf_counter() - start) / repeats * 1e3
+    conn.close()
+    return insert_s, queries
+
+def run(transactions=200000, assets=200):
+    """Inserts `transactions` rows under each index variant and prints insert rows/second and preset latency in ms."""
+    logging.getLogger().setLevel(logging.WARNING)
+    rows = _transactions(transactions, assets)
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        for name, index_sql in VARIANTS.items():
+            results[name] = _measure(Path(tmp) / f"{name}.db", index_sql, rows, assets)
+    presets = list(database.TRANSACTION_QUERY_PRESETS)
+    print(f"{transactions} transactions; preset latency in ms")
+    print(f"{'index':10s} {'insert rows/s':>14s} " + " ".join(f"{preset:>20s}" for preset in presets))
+    for name, (insert_s, queries) in results.items():
+        print(f"{name:10s} {transactions / insert_s:14,.0f} " + " ".join(f"{queries[preset]:20.1f}" for preset in presets))
+    return {name: {"insert_s": insert_s, **{f"{preset}_ms": ms for preset, ms in queries.items()}} for name, (insert_s, queries) in results.items()}
+
+if __name__ == "__main__":
+    run(*(int(arg) for arg in sys.argv[1:2]))
@@ -0,0 +1,100 @@
+# benchmarks/portfolio_generator.py
+# Seeded synthetic portfolios for the benchmark suite: assets in several currencies and types, years of
+# buys/sells/dividends per asset, a business-day price history per asset and daily FX rates.
+# The same (size, seed) always produces the same rows, so runs on different commits compare like for like.
+
+import random
+import datetime
+
+CURRENCIES = ("USD", "EUR", "GBP", "CHF")
+ASSET_TYPES = ("Stock", "ETF", "Crypto", "Bond")
+START_DATE = datetime.date(2015, 1, 1)
+
+# Named sizes used by run_benchmarks.py: assets, years of history, trades per asset per year
+SIZES = {
+    "small": {"assets": 50, "years": 3, "trades_per_year": 12},
+    "medium": {"assets": 200, "years": 5, "trades_per_year": 24},
+    "large": {"assets": 1000, "years": 10, "trades_per_year": 24},
+}
+
+def business_days(years, start=START_DATE):
+    """ISO dates of every weekday in `years` years from start."""
+    days = []
+    for offset in range(int(365.25 * years)):
+        day = start + datetime.timedelta(days=offset)
+        if day.weekday() < 5: days.append(day.isoformat())
+    return days
+
+def asset_rows(assets, seed=1):
+    """Asset dicts (ticker, name, asset_type, currency) for bulk_upsert_assets."""
+    rng = random.Random(seed)
+    return [{"ticker": f"SYN{i:05d}", "name": f"Synthetic Asset {i}", "asset_type": rng.choice(ASSET_TYPES),
+             "currency": CURRENCIES[i % len(CURRENCIES)]} for i in range(assets)]
+
+def transaction_rows(assets, years, trades_per_year, seed=1, start=START_DATE):
+    """Transaction dicts in date order: an opening buy per asset, then buys, sells (never more than held)
+    and quarterly dividends. Asset ids are 1..assets, as assigned by bulk_upsert_assets on an empty database."""
+    rng = random.Random(seed)
+    span = int(365.25 * years)
+    rows = []
+    for asset_id in range(1, assets + 1):
+        currency = CURRENCIES[(asset_id - 1) % len(CURRENCIES)]
+        price = rng.uniform(20, 400)
+        held = 0.0
+        offsets = sorted(rng.randrange(span) for _ in range(max(1, int(trades_per_year * years))))
+        offsets[0] = 0
+        for n, offset in enumerate(offsets):
+            price *= 1 + rng.gauss(0.002, 0.04)
+            date = (start + datetime.timedelta(days=offset)).isoformat()
+            if n and held > 1 and rng.random() < 0.3:
+                quantity = round(held * rng.uniform(0.1, 0.5), 4)
+                held -= quantity
+                kind = "Sell"
+            else:
+                quantity = float(rng.randint(1, 50))
+                held += quantity
+                kind = "Buy"
+            rows.append({"asset_id": asset_id, "transaction_type": kind, "date": date, "quantity": quantity, "price": round(price, 4),
+                         "fees": rng.choice((0.0, 1.0, 4.95)), "currency": currency})
+        for quarter in range(1, 4 * int(years)):
+            if asset_id % 3 or not held: continue # One asset in three pays dividends (quantity: shares, price: amount per share)
+            rows.append({"asset_id": asset_id, "transaction_type": "Dividend", "date": (start + datetime.timedelta(days=91 * quarter)).isoformat(),
+                         "quantity": round(held, 4), "price": round(price * 0.005, 4), "fees": 0.0, "currency": currency})
+    rows.sort(key=lambda row: row["date"])
+    return rows
+
+def price_rows(assets, years, seed=1, start=START_DATE):
+    """Daily close dicts (asset_id, date, close) on business days: a random walk per asset."""
+    rng = random.Random(seed + 1)
+    dates = business_days(years, start)
+    rows = []
+    for asset_id in range(1, assets + 1):
+        close = rng.uniform(20, 400)
+        for date in dates:
+            close *= 1 + rng.gauss(0.0002, 0.015)
+            rows.append({"asset_id": asset_id, "date": date, "close": round(close, 4)})
+    return rows
+
+def fx_rate_rows(years, seed=1, start=START_DATE):
+    """Daily USD-quoted rates (base USD) for the other currencies on business days."""
+    rng = random.Random(seed + 2)
+    rows = []
+    for quote, level in (("EUR", 0.9), ("GBP", 0.78), ("CHF", 0.95)):
+        for date in business_days(years, start):
+            level *= 1 + rng.gauss(0, 0.004)
+            rows.append({"base": "USD", "quote": quote, "date": date, "rate": round(level, 6)})
+    return rows
+
+def generate_portfolio(conn, assets=50, years=3, trades_per_year=12, seed=1, prices=True):
+    """Fills an empty database (schema created) with a synthetic portfolio and returns its row counts."""
+    import database # Imported here so the row builders above have no backend dependency
+    database.bulk_upsert_assets(asset_rows(assets, seed), conn=conn)
+    transactions = transaction_rows(assets, years, trades_per_year, seed)
+    database.bulk_add_transactions(transactions, conn=conn)
+    fx_rates = fx_rate_rows(years, seed)
+    database.add_fx_rates(fx_rates, conn=conn)
+    closes = price_rows(assets, years, seed) if prices else []
+    if closes: database.add_prices(closes, conn=conn)
+    database.set_setting("base_currency", "USD", conn=conn)
+    return {"assets": assets, "transactions": len(transactions), "prices": len(closes), "fx_rates": len(fx_rates),
+            "last_date": business_days(years)[-1]}
@@ -0,0 +1,282 @@
+# benchmarks/run_benchmarks.py
+# Benchmark harness: runs the core hot-path scenarios on a seeded synthetic portfolio (portfolio_generator.py)
+# and optionally every bench_*.py script, writes the results as JSON, and compares two result files,
+# flagging metrics that got worse than a threshold. Metric direction comes from the name: *_ms, *_s, *_us,
+# *_mb and *_bytes are lower-is-better, *_per_sec higher-is-better; anything else is reported, not judged.
+# Usage:
+#   python benchmarks/run_benchmarks.py run [--size small|medium|large] [--seed N] [--only name,...] [--legacy] [--output FILE]
+#   python benchmarks/run_benchmarks.py compare BASELINE CURRENT [--threshold 0.2]
+#   python benchmarks/run_benchmarks.py run --output current.json --baseline baseline.json   (run, then compare)
+
+import os
+import sys
+import json
+import time
+import sqlite3
+import logging
+import platform
+import argparse
+import datetime
+import tempfile
+import importlib
+import statistics
+import subprocess
+from pathlib import Path
+
+# Add src directory to sys.path
+benchmarks_path = Path(__file__).parent
+src_path = benchmarks_path.parent / "src"
+sys.path.insert(0, str(src_path))
+sys.path.insert(0, str(benchmarks_path))
+import database
+import calculations
+import fx
+import portfolio_generator
+
+IPC_HANDLER_SCRIPT = src_path / "ipc_handler.py"
+DEFAULT_THRESHOLD = 0.2 # Fractional slowdown flagged as a regression
+LOWER_IS_BETTER = ("_ms", "_s", "_us", "_mb", "_bytes")
+HIGHER_IS_BETTER = ("_per_sec",)
+
+# bench_*.py scripts run with --legacy, with their run() arguments per size (medium: the script's defaults)
+LEGACY_BENCHMARKS = {
+    "bench_bulk_insert": {"small": {"rows": 5000}, "large": {"rows": 100000}},
+    "bench_calculations": {"small": {"transactions": 100000, "assets": 500}},
+    "bench_connections": {"small": {"calls": 1000}},
+    "bench_asset_search": {"small": {"instruments": 10000}},
+    "bench_ibkr_parser": {"small": {"trade_counts": (10000,)}},
+    "bench_archive": {"small": {"transactions": 20000, "assets": 50}},
+    "bench_dividends": {"small": {"assets": 500}},
+    "bench_fx": {"small": {"transactions": 10000}},
+    "bench_returns": {"small": {"assets": 100, "days": 750}},
+    "bench_dashboard": {"small": {"assets": 50, "days": 365}},
+    "bench_allocation": {"small": {"sizes": (1000,)}, "large": {"sizes": (1000, 10000, 50000, 100000)}},
+    "bench_metrics": {"small": {"transactions": 10000}},
+    "bench_scheduler": {"small": {"assets": 50, "years": 3}},
+    "bench_import_pipeline": {"small": {"files": 4, "trades": 5000}},
+    "bench_transaction_index": {"small": {"transactions": 20000}},
+}
+
+
+def _median_time(function, repeat):
+    """Median seconds of repeat calls after one untimed warm-up call (robust to the odd slow run)."""
+    function()
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples)
+
+def _connect(db_path):
+    conn = sqlite3.connect(db_path)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA foreign_keys = ON")
+    return conn
+
+def _ipc_env(db_path):
+    env = os.environ.copy()
+    env["PIT_DATABASE_PATH"] = str(db_path)
+    env["PIT_LOG_LEVEL"] = "WARNING"
+    return env
+
+
+# --- Core Scenarios ---
+# Each takes the size parameters, the seed and the path of the generated portfolio database, and returns a dict.
+
+def bench_inserts(params, seed, db_path, repeat):
+    """Per-row add_transaction (each commits) vs bulk_add_transactions into a fresh file database."""
+    rows = portfolio_generator.transaction_rows(params["assets"], params["years"], params["trades_per_year"], seed)
+    single_rows = rows[:1000] # The per-row path is slow by design; its rate does not depend on the count
+    with tempfile.TemporaryDirectory() as tmp:
+        insert_path = Path(tmp) / "inserts.db"
+        database.initialize_database(db_path=insert_path)
+        conn = _connect(insert_path)
+        database.bulk_upsert_assets(portfolio_generator.asset_rows(params["assets"], seed), conn=conn)
+        start = time.perf_counter()
+        for row in single_rows:
+            database.add_transaction(row["asset_id"], row["transaction_type"], row["date"], row["quantity"], row["price"], row["fees"], row["currency"], conn=conn)
+        single = time.perf_counter() - start
+        conn.execute("DELETE FROM transactions")
+        conn.commit()
+        start = time.perf_counter()
+        database.bulk_add_transactions(rows, conn=conn)
+        bulk = time.perf_counter() - start
+        conn.close()
+    return {"add_transaction_rows_per_sec": len(single_rows) / single, "bulk_add_transactions_rows_per_sec": len(rows) / bulk}
+
+def bench_reads(params, seed, db_path, repeat):
+    """Reading the whole transaction table: get_all_transactions and the chunked iter_transactions."""
+    conn = _connect(db_path)
+    try:
+        all_rows = _median_time(lambda: database.get_all_transactions(conn=conn), repeat)
+        chunked = _median_time(lambda: sum(len(chunk) for chunk in database.iter_transactions(conn=conn)), repeat)
+        page = _median_time(lambda: database.get_transactions_page(conn=conn), repeat)
+    finally: conn.close()
+    return {"get_all_transactions_ms": all_rows * 1e3, "iter_transactions_ms": chunked * 1e3, "first_page_ms": page * 1e3}
+
+def bench_ipc(params, seed, db_path, repeat):
+    """IPC round trips: one process per call (argv mode) vs the resident --server process."""
+    env = _ipc_env(db_path)
+    spawn_command = [sys.executable, str(IPC_HANDLER_SCRIPT), "get_setting", json.dumps(["base_currency"])]
+    spawn = _median_time(lambda: subprocess.run(spawn_command, capture_output=True, check=True, env=env), repeat)
+    server = subprocess.Popen([sys.executable, str(IPC_HANDLER_SCRIPT), "--server"], stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                              stderr=subprocess.DEVNULL, text=True, bufsize=1, env=env)
+    try:
+        def call(function_name, args):
+            server.stdin.write(json.dumps({"id": 1, "function": function_name, "args": args}) + "\n")
+            server.stdin.flush()
+            while "data" not in (response := json.loads(server.stdout.readline())) and "error" not in response: pass # Skip chunk lines
+            return response
+        call("get_setting", ["base_currency"]) # Warm-up: imports and the pooled connection
+        calls = 200
+        start = time.perf_counter()
+        for _ in range(calls): call("get_setting", ["base_currency"])
+        resident = (time.perf_counter() - start) / calls
+        resident_all = _median_time(lambda: call("get_all_transactions", []), repeat)
+    finally:
+        server.stdin.close()
+        server.wait(timeout=30)
+    return {"spawn_call_ms": spawn * 1e3, "resident_call_us": resident * 1e6, "resident_get_all_transactions_ms": resident_all * 1e3}
+
+def bench_calculations(params, seed, db_path, repeat):
+    """Holdings and returns on the generated portfolio, cold (result cache cleared) and warm."""
+    conn = _connect(db_path)
+    today = portfolio_generator.business_days(params["years"])[-1]
+    try:
+        def cold(function):
+            def run():
+                database.clear_result_cache()
+                function()
+            return run
+        arrays = _median_time(lambda: calculations.load_transaction_arrays(conn=conn), repeat)
+        loaded = calculations.load_transaction_arrays(conn=conn)
+        holdings = _median_time(lambda: calculations.compute_holdings(loaded), repeat)
+        summary = _median_time(lambda: calculations.get_holdings_summary(conn=conn), repeat)
+        base_holdings = _median_time(cold(lambda: calculations.get_holdings_in_base_currency("EUR", today=today, conn=conn)), repeat)
+        calculations.refresh_portfolio_daily(conn=conn) # Built once, then kept up to date by the write path
+        returns_cold = _median_time(cold(lambda: calculations.get_returns(base_currency="EUR", conn=conn)), repeat)
+        periods_warm = _median_time(lambda: calculations.get_period_returns(today=today, base_currency="EUR", conn=conn), repeat)
+    finally: conn.close()
+    return {"load_transaction_arrays_ms": arrays * 1e3, "compute_holdings_ms": holdings * 1e3, "get_holdings_summary_ms": summary * 1e3,
+            "holdings_in_base_currency_cold_ms": base_holdings * 1e3, "get_returns_cold_ms": returns_cold * 1e3, "period_returns_warm_ms": periods_warm * 1e3}
+
+CORE_BENCHMARKS = {"inserts": bench_inserts, "reads": bench_reads, "ipc": bench_ipc, "calculations": bench_calculations}
+
+
+# --- Running ---
+
+def _metadata(size, seed, params, portfolio):
+    try: commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, cwd=benchmarks_path).stdout.strip() or None
+    except OSError: commit = None
+    return {"created": datetime.datetime.now().isoformat(timespec="seconds"), "commit": commit, "size": size, "seed": seed, "params": params,
+            "portfolio": portfolio, "python": platform.python_version(), "sqlite": sqlite3.sqlite_version, "platform": platform.platform()}
+
+def run_suite(size="small", seed=1, only=None, legacy=False, repeat=5):
+    """Generates the portfolio for size and runs the selected benchmarks. Returns {"meta", "results": {name: metrics}}."""
+    logging.getLogger().setLevel(logging.WARNING)
+    params = portfolio_generator.SIZES[size]
+    names = list(CORE_BENCHMARKS) + (list(LEGACY_BENCHMARKS) if legacy else [])
+    if only: names = [name for name in names if name in only] + [name for name in only if name in LEGACY_BENCHMARKS and name not in names]
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = Path(tmp) / "portfolio.db"
+        database.initialize_database(db_path=db_path)
+        conn = _connect(db_path)
+        start = time.perf_counter()
+        portfolio = portfolio_generator.generate_portfolio(conn, seed=seed, **params)
+        conn.close()
+        print(f"Generated {size} portfolio in {time.perf_counter() - start:.1f}s: {portfolio}")
+        for name in names:
+            print(f"\n== {name}")
+            try:
+                if name in CORE_BENCHMARKS: results[name] = CORE_BENCHMARKS[name](params, seed, db_path, repeat)
+                else: results[name] = importlib.import_module(name).run(**LEGACY_BENCHMARKS[name].get(size, {}))
+                logging.getLogger().setLevel(logging.WARNING) # Scripts may change it
+                for metric, value in _flatten(results[name]).items(): print(f"  {metric:45} {value:14.3f}")
+            except Exception as e: # One broken benchmark should not lose the others' results
+                logging.exception(f"Benchmark {name} failed")
+                results[name] = {"error": str(e)}
+    return {"meta": _metadata(size, seed, params, portfolio), "results": results}
+
+
+# --- Comparing ---
+
+def _flatten(value, prefix=""):
+    """{"a": {"b": 1}} -> {"a.b": 1}, keeping numeric leaves only."""
+    flat = {}
+    for key, item in value.items():
+        name = f"{prefix}{key}"
+        if isinstance(item, dict): flat.update(_flatten(item, f"{name}."))
+        elif isinstance(item, (int, float)) and not isinstance(item, bool): flat[name] = float(item)
+    return flat
+
+def _direction(metric):
+    """-1 if lower is better, 1 if higher is better, 0 if the name does not say."""
+    if metric.endswith(HIGHER_IS_BETTER): return 1
+    if metric.endswith(LOWER_IS_BETTER): return -1
+    return 0
+
+def compare_results(baseline, current, threshold=DEFAULT_THRESHOLD):
+    """Compares two result dicts (as written by run). Returns rows of (metric, baseline, current, change, status),
+    change being the relative slowdown (positive = worse) and status "regression", "improvement", "ok" or "-"."""
+    old, new = _flatten(baseline["results"]), _flatten(current["results"])
+    rows = []
+    for metric in sorted(old.keys() & new.keys()):
+        direction = _direction(metric)
+        if not direction or not old[metric]:
+            rows.append((metric, old[metric], new[metric], None, "-"))
+            continue
+        # Slowdown as a fraction: time ratio for lower-is-better, inverse rate ratio for throughputs
+        change = new[metric] / old[metric] - 1 if direction < 0 else (old[metric] / new[metric] - 1 if new[metric] else float("inf"))
+        status = "regression" if change > threshold else "improvement" if change < -threshold else "ok"
+        rows.append((metric, old[metric], new[metric], change, status))
+    return rows
+
+def print_comparison(rows, baseline_meta, current_meta):
+    print(f"baseline: {baseline_meta.get('commit')} ({baseline_meta.get('created')}, {baseline_meta.get('size')})")
+    print(f"current:  {current_meta.get('commit')} ({current_meta.get('created')}, {current_meta.get('size')})")
+    if baseline_meta.get("size") != current_meta.get("size") or baseline_meta.get("seed") != current_meta.get("seed"):
+        print("warning: different portfolio size or seed, numbers are not comparable")
+    for metric, old, new, change, status in rows:
+        change_text = f"{change * 100:+7.1f}%" if change is not None else "       "
+        marker = "  <-- REGRESSION" if status == "regression" else ""
+        print(f"{metric:55} {old:14.3f} {new:14.3f} {change_text}{marker}")
+    regressions = [row for row in rows if row[4] == "regression"]
+    print(f"\n{len(regressions)} regression(s) in {len(rows)} metrics")
+    return regressions
+
+def _load(path):
+    with open(path, encoding="utf-8") as f: return json.load(f)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Backend benchmark suite.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    run_parser = commands.add_parser("run", help="run the benchmarks and write the results as JSON")
+    run_parser.add_argument("--size", choices=sorted(portfolio_generator.SIZES), default="small")
+    run_parser.add_argument("--seed", type=int, default=1)
+    run_parser.add_argument("--only", help="comma-separated benchmark names (core: " + ", ".join(CORE_BENCHMARKS) + ")")
+    run_parser.add_argument("--legacy", action="store_true", help="also run every bench_*.py script")
+    run_parser.add_argument("--repeat", type=int, default=5)
+    run_parser.add_argument("--output", default="benchmark_results.json")
+    run_parser.add_argument("--baseline", help="compare against this result file after running")
+    run_parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD)
+    compare_parser = commands.add_parser("compare", help="compare two result files; exits 1 on regressions")
+    compare_parser.add_argument("baseline")
+    compare_parser.add_argument("current")
+    compare_parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD)
+    args = parser.parse_args(argv)
+
+    if args.command == "run":
+        current = run_suite(args.size, args.seed, args.only.split(",") if args.only else None, args.legacy, args.repeat)
+        with open(args.output, "w", encoding="utf-8") as f: json.dump(current, f, indent=2)
+        print(f"\nWrote {args.output}")
+        if not args.baseline: return 0
+        baseline = _load(args.baseline)
+    else:
+        baseline, current = _load(args.baseline), _load(args.current)
+    regressions = print_comparison(compare_results(baseline, current, args.threshold), baseline["meta"], current["meta"])
+    return 1 if regressions else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
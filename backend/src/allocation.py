@@ -0,0 +1,212 @@
+# src/allocation.py
+# Asset tagging (hierarchical tags per category such as sector, region or account, stored in tags/asset_tags)
+# and the allocation engine: weights of the current holdings by asset type, currency, asset or any tag category,
+# grouped in SQL over the holdings snapshot. Tags roll up through the tag_ancestors closure table, so each
+# level of a drill-down is a single grouped query instead of a walk over every holding and its tags in Python.
+
+import json
+import sqlite3
+import logging
+import datetime
+
+import fx
+import database
+
+COLUMN_DIMENSIONS = {"asset_type": "asset_type", "currency": "currency", "asset": "label"} # Other dimensions are tag categories
+UNTAGGED = "Untagged"
+
+# Current value of every open position in its own currency (latest close, falling back to the average cost of the
+# snapshot) and in the base currency at the current rate of its currency (fx_rates rows are passed in as :fx JSON;
+# value is NULL without a rate)
+_VALUED_HOLDINGS_SQL = """
+    WITH fx_rate AS (SELECT key AS currency, value AS rate FROM json_each(:fx)),
+    local AS (
+        SELECT h.asset_id, a.asset_type, a.currency, COALESCE(a.ticker, a.name) AS label,
+               h.quantity * COALESCE((SELECT p.close FROM prices p WHERE p.asset_id = h.asset_id ORDER BY p.date DESC LIMIT 1),
+                                     h.cost_basis / h.quantity) AS local_value
+        FROM holdings h JOIN assets a ON a.id = h.asset_id
+        WHERE h.quantity > 0),
+    valued AS MATERIALIZED (SELECT l.*, l.local_value * r.rate AS value FROM local l LEFT JOIN fx_rate r ON r.currency = l.currency)"""
+# Rows following the groups (kind 0) in the same statement: the total (kind 1) and the positions left out of it
+# for lack of a rate (kind 2: asset id, label, value in their own currency, currency)
+_TOTAL_AND_UNCONVERTED_SQL = """
+    UNION ALL
+    SELECT NULL, NULL, COALESCE(SUM(value), 0), NULL, 1 FROM valued
+    UNION ALL
+    SELECT asset_id, label, local_value, currency, 2 FROM valued WHERE value IS NULL
+    ORDER BY kind, value DESC"""
+
+
+# --- Tags ---
+
+def add_tag(category, name, parent_id=None, conn=None):
+    """Adds a tag (or finds the existing one with the same category, parent and name) and returns its id.
+    A child must have its parent's category. Uses provided conn or creates a new one. Returns None on error."""
+    local_conn = False
+    if conn is None: conn = database._get_db_connection(); local_conn = True
+    if not conn: return None
+    tag_id = None
+    try:
+        cursor = conn.cursor()
+        if parent_id is not None:
+            parent = cursor.execute("SELECT category FROM tags WHERE id = ?", (parent_id,)).fetchone()
+            if parent is None or parent["category"] != category: raise ValueError(f"Parent tag {parent_id} is not a '{category}' tag")
+        existing = cursor.execute("SELECT id FROM tags WHERE category = ? AND COALESCE(parent_id, 0) = ? AND name = ?", (category, parent_id or 0, name)).fetchone()
+        if existing: tag_id = existing["id"]
+        else:
+            cursor.execute("INSERT INTO tags (category, name, parent_id) VALUES (?, ?, ?)", (category, name, parent_id))
+            tag_id = cursor.lastrowid
+            conn.commit()
+            logging.info(f"Added tag '{name}' in '{category}' with ID: {tag_id}")
+    except (sqlite3.Error, ValueError) as e:
+        logging.error(f"Error adding tag '{name}' in '{category}': {e}")
+        conn.rollback()
+        tag_id = None
+    finally:
+        if local_conn and conn: conn.close()
+    return tag_id
+
+def delete_tag(tag_id, conn=None):
+    """Deletes a tag with its descendants and their asset assignments. Uses provided conn or creates a new one.
+    Returns True on success."""
+    local_conn = False
+    if conn is None: conn = database._get_db_connection(); local_conn = True
+    if not conn: return False
+    success = False
+    try:
+        cursor = conn.cursor()
+        cursor.execute("DELETE FROM tags WHERE id IN (SELECT tag_id FROM tag_ancestors WHERE ancestor_id = ?)", (tag_id,))
+        conn.commit()
+        success = True
+    except sqlite3.Error as e:
+        logging.error(f"Database error deleting tag {tag_id}: {e}")
+        conn.rollback()
+    finally:
+        if local_conn and conn: conn.close()
+    return success
+
+def get_tags(category=None, conn=None):
+    """Retrieves tags (optionally of one category) with id, category, name, parent_id and depth, parents before children.
+    Uses provided conn or creates a new one."""
+    sql = """SELECT t.id, t.category, t.name, t.parent_id, MAX(a.depth) AS depth FROM tags t JOIN tag_ancestors a ON a.tag_id = t.id
+             WHERE ? IS NULL OR t.category = ? GROUP BY t.id ORDER BY t.category, depth, t.name"""
+    local_conn = False
+    if conn is None: conn = database._get_db_connection(); local_conn = True
+    if not conn: return []
+    tags = []
+    try:
+        cursor = conn.cursor()
+        tags = [dict(row) for row in cursor.execute(sql, (category, category)).fetchall()]
+    except sqlite3.Error as e: logging.error(f"Database error retrieving tags: {e}")
+    finally:
+        if local_conn and conn: conn.close()
+    return tags
+
+def set_asset_tags(rows, conn=None, commit=True):
+    """Assigns tags to assets: dicts with asset_id, tag_id and optionally weight (the fraction of the asset's value
+    exposed to the tag, default 1; e.g. 0.6 US / 0.4 Europe for a fund). Tag assets at the most specific level:
+    a drill-down rolls child tags up to their ancestors. Uses provided conn or creates a new one.
+    Returns the number of rows written, or None on error."""
+    sql = "INSERT INTO asset_tags (asset_id, tag_id, weight) VALUES (?, ?, ?) ON CONFLICT(asset_id, tag_id) DO UPDATE SET weight = excluded.weight"
+    rows = list(rows)
+    local_conn = False
+    if conn is None: conn = database._get_db_connection(); local_conn = True
+    if not conn: return None
+    written = None
+    try:
+        cursor = conn.cursor()
+        cursor.executemany(sql, ((row["asset_id"], row["tag_id"], row.get("weight", 1.0)) for row in rows))
+        written = len(rows)
+        if commit: conn.commit()
+        logging.debug(f"Wrote {written} asset tags.")
+    except (sqlite3.Error, KeyError) as e:
+        logging.error(f"Database error tagging assets, rolling back: {e}")
+        conn.rollback()
+        written = None
+    finally:
+        if local_conn and conn: conn.close()
+    return written
+
+def remove_asset_tag(asset_id, tag_id, conn=None):
+    """Removes one tag from an asset. Uses provided conn or creates a new one. Returns True on success."""
+    local_conn = False
+    if conn is None: conn = database._get_db_connection(); local_conn = True
+    if not conn: return False
+    success = False
+    try:
+        conn.execute("DELETE FROM asset_tags WHERE asset_id = ? AND tag_id = ?", (asset_id, tag_id))
+        conn.commit()
+        success = True
+    except sqlite3.Error as e:
+        logging.error(f"Database error removing tag {tag_id} from asset {asset_id}: {e}")
+        conn.rollback()
+    finally:
+        if local_conn and conn: conn.close()
+    return success
+
+
+# --- Allocation ---
+
+def _current_rates_json(converter, base_currency, today):
+    """{currency: rate into base_currency today} for base_currency and every currency the converter has rates for,
+    as JSON for _VALUED_HOLDINGS_SQL. No query needed: positions in any other currency cannot be converted anyway."""
+    currencies = sorted({base_currency}.union(*converter.series))
+    rates = converter.rates(currencies, base_currency, [today] * len(currencies))
+    return json.dumps({currency: float(rate) for currency, rate in zip(currencies, rates) if rate == rate}) # NaN: no rate
+
+def get_allocation(dimension="asset_type", parent_tag_id=None, base_currency=None, today=None, conn=None):
+    """Allocation of the current holdings by dimension: "asset_type", "currency", "asset" or a tag category.
+    For a tag category, groups are its top-level tags, or the children of parent_tag_id to drill down; holdings
+    tagged below a group count towards it (times their tag weight), and at the top level untagged value is
+    grouped as UNTAGGED. Values are in base_currency (default: the base currency setting) at today's rates.
+    Returns {"dimension", "base_currency", "total", "groups": [{"key", "label", "value", "weight"}], "unconverted"}: groups
+    ordered by value, weight being the fraction of the total portfolio value; tag groups also carry tag_id and has_children.
+    Positions in a currency without a rate to base_currency cannot be added up: they are left out of groups and total
+    and listed in unconverted as [{"asset_id", "label", "currency", "value"}], value in their own currency.
+    Uses provided conn or creates a new one. Returns None on error."""
+    local_conn = False
+    if conn is None: conn = database._get_db_connection(); local_conn = True
+    if not conn: return None
+    result = None
+    try:
+        base_currency = base_currency or fx.get_base_currency(conn=conn)
+        cursor = conn.cursor()
+        cursor.row_factory = None
+        converter = fx.get_fx_converter(conn=conn)
+        if converter is None: return None
+        params = {"fx": _current_rates_json(converter, base_currency, today or datetime.date.today().isoformat())}
+        if dimension in COLUMN_DIMENSIONS:
+            column = COLUMN_DIMENSIONS[dimension]
+            sql = f"""{_VALUED_HOLDINGS_SQL}
+                SELECT {column}, {column}, SUM(value) AS value, NULL, 0 AS kind FROM valued WHERE value IS NOT NULL GROUP BY {column}
+                {_TOTAL_AND_UNCONVERTED_SQL}"""
+        else:
+            # Untagged positions count towards the total too, so it is summed over valued, not over the groups
+            sql = f"""{_VALUED_HOLDINGS_SQL}
+                SELECT g.id, g.name, SUM(v.value * t.weight) AS value, EXISTS (SELECT 1 FROM tags c WHERE c.parent_id = g.id), 0 AS kind
+                FROM tags g
+                JOIN tag_ancestors d ON d.ancestor_id = g.id
+                JOIN asset_tags t ON t.tag_id = d.tag_id
+                JOIN valued v ON v.asset_id = t.asset_id
+                WHERE g.category = :category AND COALESCE(g.parent_id, 0) = :parent AND v.value IS NOT NULL
+                GROUP BY g.id
+                {_TOTAL_AND_UNCONVERTED_SQL}"""
+            params.update(category=dimension, parent=parent_tag_id or 0)
+        rows = cursor.execute(sql, params).fetchall()
+        total = next(value for _, _, value, _, kind in rows if kind == 1)
+        unconverted = [{"asset_id": asset_id, "label": label, "currency": currency, "value": value}
+                       for asset_id, label, value, currency, kind in rows if kind == 2]
+        if dimension in COLUMN_DIMENSIONS:
+            groups = [{"key": key, "label": label, "value": value} for key, label, value, _, kind in rows if kind == 0]
+        else:
+            groups = [{"key": tag_id, "label": name, "value": value, "tag_id": tag_id, "has_children": bool(has_children)}
+                      for tag_id, name, value, has_children, kind in rows if kind == 0]
+            untagged = total - sum(group["value"] for group in groups)
+            if parent_tag_id is None and untagged > 1e-9 * max(total, 1.0):
+                groups.append({"key": None, "label": UNTAGGED, "value": untagged, "tag_id": None, "has_children": False})
+        for group in groups: group["weight"] = group["value"] / total if total else 0.0
+        result = {"dimension": dimension, "base_currency": base_currency, "total": total, "groups": groups, "unconverted": unconverted}
+    except sqlite3.Error as e: logging.error(f"Database error computing allocation by '{dimension}': {e}")
+    finally:
+        if local_conn and conn: conn.close()
+    return result
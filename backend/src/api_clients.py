@@ -0,0 +1,421 @@
+# src/api_clients.py
+# Market data (quotes) and FX clients with a local SQLite cache.
+# Providers fetch many symbols per request over a pooled requests.Session; MarketDataClient
+# splits large requests into batches fetched concurrently on a bounded thread pool, serves
+# cached values while they are within their TTL, returns stale values immediately while
+# refreshing them in the background, and falls back to the cache when the provider is unreachable.
+# Fetched values are stored through database.run_on_writer, so a fetch on a server read lane never holds the writer;
+# background refreshes route their writes the same way and then bring the daily portfolio series up to date.
+# Historical daily closes are backfilled per asset for date ranges not yet covered; run as a job, a backfill
+# reports progress and can be cancelled between commits (see jobs.py).
+
+import time
+import datetime
+import logging
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+import database
+import jobs
+import calculations
+
+DEFAULT_PRICE_TTL = 15 * 60 # Seconds a cached quote counts as fresh
+DEFAULT_FX_TTL = 60 * 60
+DEFAULT_MAX_WORKERS = 4
+MARKET_DATA_URL_SETTING = "market_data_url"
+BACKFILL_CHECKPOINT_SETTING = "price_backfill_checkpoint" # "<end date>|<last completed asset id>"
+DEFAULT_BACKFILL_MERGE_DAYS = 30
+DEFAULT_BACKFILL_MAX_SPAN_DAYS = 366
+
+
+def price_series_key(ticker): return f"price:{ticker}"
+def fx_series_key(base, quote): return f"fx:{base}/{quote}"
+
+
+# --- Providers ---
+
+class MarketDataProvider:
+    """Interface for a market data source. Both methods take a batch of keys and return results only
+    for the keys the source knows; they raise requests.RequestException (or ValueError) when the source fails."""
+    max_batch_size = 50
+
+    def fetch_quotes(self, tickers):
+        """Returns {ticker: {"date": "YYYY-MM-DD", "close": float}}."""
+        raise NotImplementedError
+
+    def fetch_fx_rates(self, pairs):
+        """Returns {(base, quote): {"date": "YYYY-MM-DD", "rate": float}} for (base, quote) pairs."""
+        raise NotImplementedError
+
+    def fetch_history(self, ticker, start, end):
+        """Returns daily closes [{"date": "YYYY-MM-DD", "close": float}, ...] for one ticker over [start, end]."""
+        raise NotImplementedError
+
+
+class HttpJsonProvider(MarketDataProvider):
+    """Provider for a JSON HTTP API answering batched requests:
+        GET {base_url}/quotes?symbols=AAPL,MSFT -> {"quotes": [{"symbol", "date", "close"}, ...]}
+        GET {base_url}/fx?pairs=EURUSD,GBPUSD   -> {"rates": [{"base", "quote", "date", "rate"}, ...]}
+        GET {base_url}/history?symbol=AAPL&start=2024-01-01&end=2024-06-30 -> {"prices": [{"date", "close"}, ...]}
+    Connections are kept alive in a pool shared by all worker threads."""
+
+    def __init__(self, base_url, api_key=None, timeout=10.0, max_batch_size=50, pool_size=DEFAULT_MAX_WORKERS, retries=2):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.max_batch_size = max_batch_size
+        self.session = requests.Session()
+        retry = Retry(total=retries, backoff_factor=0.3, status_forcelist=(429, 500, 502, 503, 504), allowed_methods=("GET",))
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        if api_key: self.session.headers["Authorization"] = f"Bearer {api_key}"
+
+    def _get(self, path, params):
+        response = self.session.get(f"{self.base_url}/{path}", params=params, timeout=self.timeout)
+        response.raise_for_status()
+        return response.json()
+
+    def fetch_quotes(self, tickers):
+        payload = self._get("quotes", {"symbols": ",".join(tickers)})
+        return {q["symbol"]: {"date": q["date"], "close": float(q["close"])} for q in payload.get("quotes", []) if q.get("close") is not None}
+
+    def fetch_fx_rates(self, pairs):
+        payload = self._get("fx", {"pairs": ",".join(base + quote for base, quote in pairs)})
+        return {(r["base"], r["quote"]): {"date": r["date"], "rate": float(r["rate"])} for r in payload.get("rates", []) if r.get("rate") is not None}
+
+    def fetch_history(self, ticker, start, end):
+        payload = self._get("history", {"symbol": ticker, "start": start, "end": end})
+        return [{"date": p["date"], "close": float(p["close"])} for p in payload.get("prices", []) if p.get("close") is not None]
+
+    def close(self):
+        self.session.close()
+
+
+# --- Cached Client ---
+
+class MarketDataClient:
+    """Cached quotes and FX rates on top of a provider.
+    ttls maps a series key (see price_series_key / fx_series_key) to its TTL in seconds, overriding the defaults.
+    With stale_while_revalidate, expired values that are still cached are returned at once (marked stale) and
+    refreshed in the background; only values never fetched before are fetched before returning."""
+
+    def __init__(self, provider=None, price_ttl=DEFAULT_PRICE_TTL, fx_ttl=DEFAULT_FX_TTL, ttls=None,
+                 max_workers=DEFAULT_MAX_WORKERS, stale_while_revalidate=True):
+        self.provider = provider
+        self.price_ttl = price_ttl
+        self.fx_ttl = fx_ttl
+        self.ttls = dict(ttls or {})
+        self.stale_while_revalidate = stale_while_revalidate
+        self._fetch_pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="market-data")
+        self._refresh_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="market-data-refresh") # Never waits on itself
+        self._refreshing = set()
+        self._refreshing_lock = threading.Lock()
+        self._pending = []
+
+    def _ttl(self, key, default): return self.ttls.get(key, default)
+
+    def _fetch_batched(self, fetch, keys):
+        """Runs fetch over batches of keys concurrently. Returns (results, keys whose batch failed)."""
+        size = max(1, getattr(self.provider, "max_batch_size", 50))
+        batches = [keys[i:i + size] for i in range(0, len(keys), size)]
+        futures = {self._fetch_pool.submit(fetch, batch): batch for batch in batches}
+        results, failed = {}, []
+        for future in as_completed(futures):
+            try:
+                results.update(future.result())
+            except (requests.RequestException, ValueError, KeyError) as e:
+                logging.warning(f"Market data fetch failed for {len(futures[future])} series, using cache: {e}")
+                failed.extend(futures[future])
+        return results, failed
+
+    # Quotes
+
+    def _store_quotes(self, fetched, asset_ids, conn):
+        """Writes fetched quotes to prices and records their fetch time in one transaction."""
+        rows = [{"asset_id": asset_ids[t], "date": q["date"], "close": q["close"]} for t, q in fetched.items() if t in asset_ids]
+        if database.add_prices(rows, conn=conn, commit=False) is None: return False
+        ttls = {price_series_key(t): self._ttl(price_series_key(t), self.price_ttl) for t in fetched}
+        return database.mark_market_data_fetched(ttls, time.time(), conn=conn)
+
+    def _refresh_quotes(self, tickers):
+        """Background refresh; reads on its own connection (sqlite3 connections stay on their thread), writes through
+        database.run_on_writer like the request that scheduled it, then brings the daily portfolio series up to date."""
+        conn = database._get_db_connection()
+        try:
+            if not conn: return
+            asset_ids = _asset_ids(tickers, conn)
+            fetched, _ = self._fetch_batched(self.provider.fetch_quotes, tickers)
+            if fetched: database.run_on_writer(lambda write_conn: self._store_quotes(fetched, asset_ids, write_conn) and _refresh_portfolio_daily(write_conn), conn)
+        finally:
+            if conn: conn.close()
+            with self._refreshing_lock: self._refreshing.difference_update(price_series_key(t) for t in tickers)
+
+    def get_quotes(self, tickers, conn=None):
+        """Returns {ticker: {"price", "fetched_at", "stale"}} for the given tickers of known assets.
+        Tickers with no cached value and no provider answer are omitted. Only storing fetched quotes is a write, made
+        through database.run_on_writer here and in the background refresh (the fetch itself never holds the writer).
+        Uses provided conn or creates a new one."""
+        local_conn = False
+        if conn is None: conn = database._get_db_connection(); local_conn = True
+        if not conn: return {}
+        quotes = {}
+        try:
+            asset_ids = _asset_ids(tickers, conn)
+            freshness = database.get_market_data_freshness([price_series_key(t) for t in asset_ids], conn=conn)
+            cached = database.get_latest_prices(asset_ids.values(), conn=conn)
+            now = time.time()
+            missing, expired = [], []
+            for ticker, asset_id in asset_ids.items():
+                fetched_at, ttl = freshness.get(price_series_key(ticker), (None, None))
+                if asset_id not in cached: missing.append(ticker)
+                elif fetched_at is None or now - fetched_at >= ttl: expired.append(ticker)
+                quotes[ticker] = {"price": cached.get(asset_id), "fetched_at": fetched_at, "stale": ticker in expired}
+            if self.provider and expired and self.stale_while_revalidate:
+                self._schedule(expired, price_series_key, self._refresh_quotes)
+            elif expired:
+                missing += expired
+            if self.provider and missing:
+                fetched, _ = self._fetch_batched(self.provider.fetch_quotes, missing)
+                if fetched and database.run_on_writer(lambda write_conn: self._store_quotes(fetched, asset_ids, write_conn), conn):
+                    for ticker, quote in fetched.items():
+                        if ticker in quotes: quotes[ticker] = {"price": quote["close"], "fetched_at": time.time(), "stale": False}
+            quotes = {t: q for t, q in quotes.items() if q["price"] is not None} # Offline and never cached
+        except sqlite3.Error as e:
+            logging.error(f"Database error reading cached quotes: {e}")
+        finally:
+            if local_conn and conn: conn.close()
+        return quotes
+
+    # FX rates
+
+    def _store_fx(self, fetched, conn):
+        rows = [{"base": base, "quote": quote, "date": r["date"], "rate": r["rate"]} for (base, quote), r in fetched.items()]
+        if database.add_fx_rates(rows, conn=conn, commit=False) is None: return False
+        ttls = {fx_series_key(*pair): self._ttl(fx_series_key(*pair), self.fx_ttl) for pair in fetched}
+        return database.mark_market_data_fetched(ttls, time.time(), conn=conn)
+
+    def _refresh_fx(self, pairs):
+        """Background refresh, writing like _refresh_quotes."""
+        conn = database._get_db_connection()
+        try:
+            if not conn: return
+            fetched, _ = self._fetch_batched(self.provider.fetch_fx_rates, pairs)
+            if fetched: database.run_on_writer(lambda write_conn: self._store_fx(fetched, write_conn) and _refresh_portfolio_daily(write_conn), conn)
+        finally:
+            if conn: conn.close()
+            with self._refreshing_lock: self._refreshing.difference_update(fx_series_key(*p) for p in pairs)
+
+    def get_fx_rates(self, pairs, conn=None):
+        """Returns {(base, quote): {"rate", "fetched_at", "stale"}} with the same caching rules as get_quotes.
+        Uses provided conn or creates a new one."""
+        pairs = list(dict.fromkeys(tuple(p) for p in pairs))
+        local_conn = False
+        if conn is None: conn = database._get_db_connection(); local_conn = True
+        if not conn: return {}
+        rates = {}
+        try:
+            freshness = database.get_market_data_freshness([fx_series_key(*p) for p in pairs], conn=conn)
+            cached = database.get_latest_fx_rates(conn=conn)
+            now = time.time()
+            missing, expired = [], []
+            for pair in pairs:
+                fetched_at, ttl = freshness.get(fx_series_key(*pair), (None, None))
+                if pair not in cached: missing.append(pair)
+                elif fetched_at is None or now - fetched_at >= ttl: expired.append(pair)
+                rates[pair] = {"rate": cached.get(pair), "fetched_at": fetched_at, "stale": pair in expired}
+            if self.provider and expired and self.stale_while_revalidate:
+                self._schedule(expired, lambda p: fx_series_key(*p), self._refresh_fx)
+            elif expired:
+                missing += expired
+            if self.provider and missing:
+                fetched, _ = self._fetch_batched(self.provider.fetch_fx_rates, missing)
+                if fetched and database.run_on_writer(lambda write_conn: self._store_fx(fetched, write_conn), conn):
+                    for pair, rate in fetched.items():
+                        if pair in rates: rates[pair] = {"rate": rate["rate"], "fetched_at": time.time(), "stale": False}
+            rates = {p: r for p, r in rates.items() if r["rate"] is not None}
+        except sqlite3.Error as e:
+            logging.error(f"Database error reading cached FX rates: {e}")
+        finally:
+            if local_conn and conn: conn.close()
+        return rates
+
+    # Historical backfill
+
+    def backfill_history(self, end=None, merge_within_days=DEFAULT_BACKFILL_MERGE_DAYS, max_span_days=DEFAULT_BACKFILL_MAX_SPAN_DAYS,
+                         max_requests=None, assets_per_commit=20, conn=None):
+        """Fetches missing daily closes for every traded asset from its first transaction date to end (default: yesterday),
+        or to its last transaction date once the position is closed. Only ranges not in price_coverage are requested;
+        nearby gaps are merged into one range request. Progress is committed every assets_per_commit assets together
+        with a checkpoint in settings, so an interrupted run (or one stopped by max_requests) resumes where it left off.
+        Uses provided conn or creates a new one.
+        Returns {"requests", "prices", "failed": [tickers], "complete": bool}, or None on error."""
+        end = end or (datetime.date.today() - datetime.timedelta(days=1)).isoformat()
+        local_conn = False
+        if conn is None: conn = database._get_db_connection(); local_conn = True
+        if not conn: return None
+        summary = {"requests": 0, "prices": 0, "failed": [], "complete": False}
+        try:
+            checkpoint = database.get_setting(BACKFILL_CHECKPOINT_SETTING, conn=conn)
+            resume_after = int(checkpoint.split("|")[1]) if checkpoint and checkpoint.split("|")[0] == end else 0
+            plan = _backfill_plan(conn, end, resume_after, merge_within_days, max_span_days)
+            for start in range(0, len(plan), assets_per_commit):
+                jobs.report_progress(start, len(plan), "assets") # Stops here if cancelled: earlier chunks are committed with their checkpoint
+                chunk = plan[start:start + assets_per_commit]
+                fetches = [(asset_id, ticker, r_start, r_end) for asset_id, ticker, ranges in chunk for r_start, r_end in ranges]
+                budget_hit = max_requests is not None and summary["requests"] + len(fetches) > max_requests
+                if budget_hit: fetches = fetches[:max_requests - summary["requests"]]
+                futures = {self._fetch_pool.submit(self.provider.fetch_history, ticker, r_start, r_end): (asset_id, ticker, r_start, r_end)
+                           for asset_id, ticker, r_start, r_end in fetches}
+                cursor = conn.cursor()
+                for future in as_completed(futures):
+                    asset_id, ticker, r_start, r_end = futures[future]
+                    try:
+                        history = future.result()
+                    except (requests.RequestException, ValueError, KeyError) as e:
+                        logging.warning(f"Price history fetch failed for {ticker} {r_start}..{r_end}: {e}")
+                        summary["failed"].append(ticker)
+                        continue
+                    rows = [{"asset_id": asset_id, "date": p["date"], "close": p["close"]} for p in history if r_start <= p["date"] <= r_end]
+                    if database.add_prices(rows, conn=conn, commit=False) is None: raise sqlite3.Error("price write failed")
+                    database._add_price_coverage(cursor, asset_id, r_start, r_end)
+                    summary["prices"] += len(rows)
+                summary["requests"] += len(fetches)
+                if not budget_hit: database._write_setting(cursor, BACKFILL_CHECKPOINT_SETTING, f"{end}|{chunk[-1][0]}")
+                conn.commit()
+                if budget_hit: break
+            else:
+                conn.execute("DELETE FROM settings WHERE key = ?", (BACKFILL_CHECKPOINT_SETTING,))
+                conn.commit()
+                summary["complete"] = not summary["failed"]
+            logging.info(f"Price backfill to {end}: {summary['requests']} requests, {summary['prices']} prices, {len(summary['failed'])} failed.")
+        except sqlite3.Error as e:
+            logging.error(f"Database error during price backfill, rolling back the current chunk: {e}")
+            conn.rollback()
+            summary = None
+        finally:
+            if local_conn and conn: conn.close()
+        return summary
+
+    # Background refresh
+
+    def _schedule(self, keys, series_key, refresh):
+        """Queues a background refresh for keys not already being refreshed. It routes its writes
+        as the calling thread does (see database.write_router)."""
+        with self._refreshing_lock:
+            keys = [k for k in keys if series_key(k) not in self._refreshing]
+            self._refreshing.update(series_key(k) for k in keys)
+        if keys: self._pending.append(self._refresh_pool.submit(_routed, database.write_router(), refresh, keys))
+
+    def wait_for_refresh(self, timeout=None):
+        """Blocks until queued background refreshes finish (used by tests and before shutdown)."""
+        pending, self._pending = self._pending, []
+        for future in pending: future.result(timeout=timeout)
+
+    def close(self):
+        self._refresh_pool.shutdown(wait=True)
+        self._fetch_pool.shutdown(wait=True)
+        if hasattr(self.provider, "close"): self.provider.close()
+
+
+def _routed(router, function, *args):
+    with database.routing_writes(router): return function(*args)
+
+def _refresh_portfolio_daily(conn):
+    """Brings the daily portfolio series up to date after a background store (the IPC handler does it for requests)."""
+    return calculations.refresh_portfolio_daily(conn=conn) is not None
+
+def _asset_ids(tickers, conn):
+    """Maps the given tickers to asset ids; unknown tickers are left out."""
+    tickers = list(dict.fromkeys(t for t in tickers if t))
+    ids = {}
+    for start in range(0, len(tickers), database._SQL_IN_CHUNK):
+        chunk = tickers[start:start + database._SQL_IN_CHUNK]
+        placeholders = ", ".join("?" * len(chunk))
+        for row in conn.execute(f"SELECT id, ticker FROM assets WHERE ticker IN ({placeholders})", chunk).fetchall():
+            ids[row[1]] = row[0]
+    return ids
+
+
+def _missing_ranges(start, end, covered, merge_within_days=DEFAULT_BACKFILL_MERGE_DAYS, max_span_days=DEFAULT_BACKFILL_MAX_SPAN_DAYS):
+    """Date ranges of [start, end] (ISO strings) outside the sorted covered ranges, as [(start, end), ...].
+    Gaps separated by fewer than merge_within_days covered days become one range (re-fetching a short covered
+    stretch is cheaper than another request); ranges longer than max_span_days are split."""
+    day = datetime.timedelta(days=1)
+    start, end = datetime.date.fromisoformat(start), datetime.date.fromisoformat(end)
+    gaps, position = [], start
+    for c_start, c_end in covered:
+        c_start, c_end = datetime.date.fromisoformat(c_start), datetime.date.fromisoformat(c_end)
+        if c_end < position: continue
+        if c_start > end: break
+        if c_start > position: gaps.append([position, c_start - day])
+        position = c_end + day
+        if position > end: break
+    if position <= end: gaps.append([position, end])
+    merged = []
+    for gap in gaps:
+        if merged and (gap[0] - merged[-1][1]).days - 1 < merge_within_days: merged[-1][1] = gap[1]
+        else: merged.append(gap)
+    ranges = []
+    for g_start, g_end in merged:
+        while g_start <= g_end:
+            r_end = min(g_end, g_start + datetime.timedelta(days=max_span_days - 1))
+            ranges.append((g_start.isoformat(), r_end.isoformat()))
+            g_start = r_end + day
+    return ranges
+
+def _backfill_plan(conn, end, resume_after, merge_within_days, max_span_days):
+    """[(asset_id, ticker, missing ranges)] for traded assets with id > resume_after, ordered by asset id."""
+    sql = """SELECT t.asset_id, a.ticker, MIN(t.date) AS first_date, MAX(t.date) AS last_date, h.quantity
+             FROM transactions t JOIN assets a ON a.id = t.asset_id LEFT JOIN holdings h ON h.asset_id = t.asset_id
+             WHERE t.asset_id > ? AND a.ticker IS NOT NULL GROUP BY t.asset_id ORDER BY t.asset_id"""
+    coverage = database.get_price_coverage(conn=conn)
+    plan = []
+    for row in conn.execute(sql, (resume_after,)).fetchall():
+        asset_id, ticker, first_date, last_date, quantity = tuple(row)
+        asset_end = end if quantity else min(end, last_date[:10]) # Closed positions need prices only while held
+        if first_date[:10] > asset_end: continue
+        ranges = _missing_ranges(first_date[:10], asset_end, coverage.get(asset_id, []), merge_within_days, max_span_days)
+        if ranges: plan.append((asset_id, ticker, ranges))
+    return plan
+
+
+# --- Default client (used over IPC) ---
+
+_default_client = (None, None) # (market_data_url it was built for, client)
+_default_client_lock = threading.Lock()
+
+def get_default_client(conn=None):
+    """Client for the provider configured in the market_data_url setting; cache-only when no provider is set.
+    Rebuilt when the setting changes. Uses provided conn or creates a new one."""
+    global _default_client
+    url = database.get_setting(MARKET_DATA_URL_SETTING, conn=conn) or None
+    replaced = None
+    with _default_client_lock:
+        if _default_client[1] is None or _default_client[0] != url:
+            replaced = _default_client[1]
+            _default_client = (url, MarketDataClient(HttpJsonProvider(url) if url else None))
+        client = _default_client[1]
+    if replaced is not None: replaced.close() # Its thread pools and HTTP session; outside the lock, as it waits for running fetches
+    return client
+
+def get_quotes(tickers, conn=None):
+    """Cached quotes for the given tickers via the default client."""
+    return get_default_client(conn).get_quotes(tickers, conn=conn)
+
+def backfill_price_history(end=None, max_requests=None, conn=None):
+    """Backfills missing daily price history via the default client (see MarketDataClient.backfill_history)."""
+    client = get_default_client(conn)
+    if client.provider is None:
+        logging.error("Price backfill needs a market data provider; set the market_data_url setting.")
+        return None
+    return client.backfill_history(end=end, max_requests=max_requests, conn=conn)
+
+def get_fx_rates(pairs, conn=None):
+    """Cached FX rates for [[base, quote], ...] via the default client, as [{"base", "quote", "rate", "fetched_at", "stale"}]."""
+    rates = get_default_client(conn).get_fx_rates(pairs, conn=conn)
+    return [{"base": base, "quote": quote, **rate} for (base, quote), rate in rates.items()]
@@ -0,0 +1,326 @@
+# src/archive.py
+# Compact columnar export/import of the portfolio (assets, transactions, prices, corporate actions, settings, tags).
+# Tables are streamed from SQLite cursors in batches; each batch is stored column by column,
+# zlib-compressed: integers and dates as delta-encoded packed arrays, floats byte-shuffled,
+# text dictionary-encoded. read_table() decodes an archive without touching SQLite, and
+# calculations.load_archive_transaction_arrays() feeds it straight into the vectorized engine.
+# Imports report progress per batch and can be cancelled when run as a job (see jobs.py).
+#
+# File layout (little endian):
+#   magic b"PITARCH" + u8 version, u32 header length, JSON header {"created", "tables"}
+#   per batch: b"B", u16 table name length, name, u32 rows, u16 columns,
+#              per column: u16 name length, name, u32 block length, zlib block
+#   b"E" end marker
+# A zlib block holds: u8 column type, u32 null bitmap length, null bitmap, values.
+
+import io
+import json
+import zlib
+import struct
+import logging
+import sqlite3
+import datetime
+from array import array
+
+import database
+import jobs
+
+ARCHIVE_MAGIC = b"PITARCH"
+ARCHIVE_VERSION = 1
+ARCHIVE_TABLES = ("assets", "transactions", "prices", "corporate_actions", "settings", "tags", "asset_tags") # Holdings, the daily series and tag_ancestors are derived on import
+DEFAULT_BATCH_SIZE = 50000
+
+_NULL, _INT, _FLOAT, _DATE, _TEXT, _JSON = range(6)
+_EPOCH_ORDINAL = datetime.date(1970, 1, 1).toordinal()
+_TABLE_ORDER = {"assets": "id", "transactions": "id", "prices": "asset_id, date", "corporate_actions": "id", "settings": "key", "tags": "id", "asset_tags": "asset_id, tag_id"}
+
+
+class ArchiveError(Exception):
+    """Raised for unreadable or incompatible archive files."""
+
+
+# --- Column encoding ---
+
+def _is_iso_date(value):
+    return len(value) == 10 and value[4] == "-" and value[7] == "-" and value[:4].isdigit() and value[5:7].isdigit() and value[8:].isdigit()
+
+def _column_type(values):
+    """Picks the most compact encoding that represents every non-null value exactly."""
+    present = [v for v in values if v is not None]
+    if not present: return _NULL
+    kinds = {type(v) for v in present}
+    if bytes in kinds: raise ArchiveError("BLOB values are not supported")
+    if kinds == {int}: return _INT if all(-2 ** 62 <= v < 2 ** 62 for v in present) else _JSON # Deltas must fit in int64
+    if kinds <= {int, float}: return _FLOAT if all(isinstance(v, float) or abs(v) < 2 ** 53 for v in present) else _JSON
+    if kinds == {str}: return _DATE if all(_is_iso_date(v) for v in present) else _TEXT
+    return _JSON # Mixed types, e.g. settings values
+
+def _null_bitmap(values):
+    bits = bytearray((len(values) + 7) // 8)
+    for i, value in enumerate(values):
+        if value is None: bits[i >> 3] |= 1 << (i & 7)
+    return bytes(bits)
+
+def _deltas(values, typecode):
+    packed, previous = array(typecode), 0
+    for value in values:
+        packed.append(value - previous)
+        previous = value
+    return packed
+
+def _undelta(packed):
+    total, values = 0, []
+    for delta in packed:
+        total += delta
+        values.append(total)
+    return values
+
+def _shuffle(data, width):
+    """Groups byte i of every value together: exponents and high bytes repeat and compress well."""
+    return b"".join(data[i::width] for i in range(width))
+
+def _unshuffle(data, width):
+    out = bytearray(len(data))
+    step = len(data) // width
+    for i in range(width): out[i::width] = data[i * step:(i + 1) * step]
+    return bytes(out)
+
+def _encode_column(values):
+    kind = _column_type(values)
+    has_nulls = kind != _NULL and any(v is None for v in values)
+    nulls = _null_bitmap(values) if has_nulls else b""
+    if kind == _INT:
+        filled, last = [], 0
+        for v in values: # Nulls repeat the previous value so their delta is zero
+            last = last if v is None else v
+            filled.append(last)
+        body = _deltas(filled, "q").tobytes()
+    elif kind == _FLOAT:
+        body = _shuffle(array("d", (0.0 if v is None else float(v) for v in values)).tobytes(), 8)
+    elif kind == _DATE:
+        days, last = [], 0
+        for v in values:
+            last = last if v is None else datetime.date(int(v[:4]), int(v[5:7]), int(v[8:])).toordinal() - _EPOCH_ORDINAL
+            days.append(last)
+        body = _deltas(days, "i").tobytes()
+    elif kind == _TEXT:
+        dictionary, codes = {}, array("I")
+        for v in values: codes.append(0 if v is None else dictionary.setdefault(v, len(dictionary)))
+        encoded = [word.encode("utf-8") for word in dictionary]
+        body = struct.pack("<I", len(encoded)) + array("I", map(len, encoded)).tobytes() + b"".join(encoded) + codes.tobytes()
+    elif kind == _JSON:
+        body = json.dumps(values, separators=(",", ":")).encode("utf-8")
+    else:
+        body = b""
+    return zlib.compress(struct.pack("<BI", kind, len(nulls)) + nulls + body, 6)
+
+def _decode_column(block, rows, raw=False):
+    """Decodes one column block into a list (or, with raw, a packed array for numeric and date columns)."""
+    data = zlib.decompress(block)
+    kind, nulls_length = struct.unpack_from("<BI", data)
+    nulls, body = data[5:5 + nulls_length], data[5 + nulls_length:]
+    if kind == _NULL: return [None] * rows
+    if kind == _INT:
+        values = _undelta(array("q", body))
+        if raw and not nulls: return array("q", values)
+    elif kind == _FLOAT:
+        values = array("d", _unshuffle(body, 8))
+        if raw and not nulls: return values
+        values = values.tolist()
+    elif kind == _DATE:
+        days = _undelta(array("i", body))
+        if raw and not nulls: return array("i", days)
+        values = [datetime.date.fromordinal(d + _EPOCH_ORDINAL).isoformat() for d in days]
+    elif kind == _TEXT:
+        (size,) = struct.unpack_from("<I", body)
+        lengths = array("I", body[4:4 + 4 * size])
+        offset, dictionary = 4 + 4 * size, []
+        for length in lengths:
+            dictionary.append(body[offset:offset + length].decode("utf-8"))
+            offset += length
+        values = [dictionary[code] for code in array("I", body[offset:])] if dictionary else [None] * rows
+    elif kind == _JSON:
+        values = json.loads(body.decode("utf-8"))
+    else:
+        raise ArchiveError(f"Unknown column type {kind}")
+    if nulls:
+        values = list(values)
+        for i in range(rows):
+            if nulls[i >> 3] & (1 << (i & 7)): values[i] = None
+    return values
+
+
+# --- File framing ---
+
+def _write_name(stream, name):
+    encoded = name.encode("utf-8")
+    stream.write(struct.pack("<H", len(encoded)) + encoded)
+
+def _read_exact(stream, size):
+    data = stream.read(size)
+    if len(data) != size: raise ArchiveError("Truncated archive")
+    return data
+
+def _read_name(stream):
+    (length,) = struct.unpack("<H", _read_exact(stream, 2))
+    return _read_exact(stream, length).decode("utf-8")
+
+def _write_batch(stream, table, columns, rows):
+    stream.write(b"B")
+    _write_name(stream, table)
+    stream.write(struct.pack("<IH", len(rows), len(columns)))
+    for name, values in zip(columns, zip(*rows)):
+        block = _encode_column(list(values))
+        _write_name(stream, name)
+        stream.write(struct.pack("<I", len(block)) + block)
+
+def _read_header(stream):
+    magic = _read_exact(stream, len(ARCHIVE_MAGIC) + 1)
+    if magic[:-1] != ARCHIVE_MAGIC: raise ArchiveError("Not a portfolio archive")
+    if magic[-1] > ARCHIVE_VERSION: raise ArchiveError(f"Archive version {magic[-1]} is newer than supported ({ARCHIVE_VERSION})")
+    (length,) = struct.unpack("<I", _read_exact(stream, 4))
+    return json.loads(_read_exact(stream, length).decode("utf-8"))
+
+def _iter_batches(stream, tables=None, columns=None, raw=False):
+    """Yields (table, rows, {column: values}) per batch. Blocks of skipped tables/columns are not decompressed."""
+    while True:
+        marker = stream.read(1)
+        if marker == b"E": return
+        if marker != b"B": raise ArchiveError("Corrupt archive: expected a batch marker")
+        table = _read_name(stream)
+        rows, count = struct.unpack("<IH", _read_exact(stream, 6))
+        wanted = tables is None or table in tables
+        decoded = {}
+        for _ in range(count):
+            name = _read_name(stream)
+            (length,) = struct.unpack("<I", _read_exact(stream, 4))
+            if wanted and (columns is None or name in columns):
+                decoded[name] = _decode_column(_read_exact(stream, length), rows, raw)
+            else:
+                stream.seek(length, io.SEEK_CUR)
+        if wanted: yield table, rows, decoded
+
+
+# --- Public API ---
+
+def export_portfolio(path, batch_size=DEFAULT_BATCH_SIZE, conn=None):
+    """Writes assets, transactions, prices, corporate actions and settings to a compressed columnar archive at path.
+    Rows are streamed from one read snapshot in batches of batch_size. Uses provided conn or creates a new one.
+    Returns {table: rows exported}, or None on error."""
+    local_conn = False
+    if conn is None: conn = database._get_db_connection(); local_conn = True
+    if not conn: return None
+    counts = None
+    began = False
+    try:
+        if not conn.in_transaction: conn.execute("BEGIN"); began = True # Every table is read from the same snapshot
+        cursor = conn.cursor()
+        cursor.row_factory = None
+        header = {"created": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"), "tables": {}}
+        for table in ARCHIVE_TABLES:
+            header["tables"][table] = [row[1] for row in cursor.execute(f"PRAGMA table_info({table})").fetchall()]
+        encoded_header = json.dumps(header).encode("utf-8")
+        counts = dict.fromkeys(ARCHIVE_TABLES, 0)
+        with open(path, "wb") as stream:
+            stream.write(ARCHIVE_MAGIC + bytes([ARCHIVE_VERSION]) + struct.pack("<I", len(encoded_header)) + encoded_header)
+            for table in ARCHIVE_TABLES:
+                columns = header["tables"][table]
+                cursor.execute(f"SELECT {', '.join(columns)} FROM {table} ORDER BY {_TABLE_ORDER[table]}")
+                while True:
+                    rows = cursor.fetchmany(batch_size)
+                    if not rows: break
+                    _write_batch(stream, table, columns, rows)
+                    counts[table] += len(rows)
+            stream.write(b"E")
+        logging.info(f"Exported portfolio archive to {path}: {counts}")
+    except (sqlite3.Error, OSError, ArchiveError) as e:
+        logging.error(f"Error exporting portfolio archive to {path}: {e}")
+        counts = None
+    finally:
+        if began: conn.rollback() # Read-only snapshot
+        if local_conn and conn: conn.close()
+    return counts
+
+def read_table(path, table, columns=None, raw=False):
+    """Reads one table from an archive as {column: values} without touching SQLite.
+    columns limits decoding to the named columns. With raw, integer, float and date columns without nulls
+    come back as packed array.array objects (dates as int32 days since 1970-01-01) for zero-copy numpy use;
+    everything else is a list. Raises ArchiveError for invalid files."""
+    with open(path, "rb") as stream:
+        header = _read_header(stream)
+        names = [c for c in header["tables"].get(table, []) if columns is None or c in columns]
+        result = {name: [] for name in names}
+        packed = {}
+        for _, rows, decoded in _iter_batches(stream, {table}, set(names), raw):
+            for name in names:
+                values = decoded.get(name, [None] * rows)
+                target = result[name]
+                if isinstance(values, array) and (not target or packed.get(name) == values.typecode):
+                    if not target: result[name] = target = array(values.typecode); packed[name] = values.typecode
+                    target.extend(values)
+                else:
+                    if name in packed: # Mixed batches: fall back to plain values
+                        target = result[name] = _unpack(target, packed.pop(name))
+                    target.extend(_unpack(values, values.typecode) if isinstance(values, array) else values)
+    return result
+
+def _unpack(values, typecode):
+    if typecode == "i": return [datetime.date.fromordinal(d + _EPOCH_ORDINAL).isoformat() for d in values]
+    return values.tolist()
+
+def import_portfolio(path, replace=False, conn=None):
+    """Loads an archive written by export_portfolio into the database in one transaction, keeping asset and
+    transaction ids, then rebuilds holdings. The database must not contain assets or transactions unless
+    replace is True, which clears them (and all derived data) first. Settings from the archive overwrite existing ones.
+    Uses provided conn or creates a new one. Returns {table: rows imported}, or None on error."""
+    local_conn = False
+    if conn is None: conn = database._get_db_connection(); local_conn = True
+    if not conn: return None
+    counts = None
+    try:
+        with open(path, "rb") as stream:
+            header = _read_header(stream)
+            cursor = conn.cursor()
+            cursor.row_factory = None
+            if not conn.in_transaction: cursor.execute("BEGIN IMMEDIATE")
+            if replace:
+                for table in ("holdings_history", "holdings", "portfolio_daily", "transactions", "corporate_actions", "price_coverage", "prices", "asset_tags", "tag_ancestors", "tags", "assets"):
+                    cursor.execute(f"DELETE FROM {table}")
+                cursor.execute("DELETE FROM settings WHERE key = ?", (database.PORTFOLIO_DIRTY_SETTING,))
+            elif cursor.execute("SELECT EXISTS (SELECT 1 FROM assets) OR EXISTS (SELECT 1 FROM transactions)").fetchone()[0]:
+                raise ArchiveError("Database already contains a portfolio; pass replace=True to overwrite it")
+            # Plain secondary indexes are dropped and rebuilt by _create_schema after the load: building an index
+            # from sorted keys once is much cheaper than updating it row by row
+            for table in ("transactions", "holdings_history", "prices"):
+                for index in cursor.execute(f"PRAGMA index_list({table})").fetchall():
+                    if index[3] == "c" and not index[2]: cursor.execute(f"DROP INDEX {index[1]}")
+            known = {table: {row[1] for row in cursor.execute(f"PRAGMA table_info({table})").fetchall()} for table in ARCHIVE_TABLES}
+            counts = dict.fromkeys(ARCHIVE_TABLES, 0)
+            for table, rows, decoded in _iter_batches(stream, set(ARCHIVE_TABLES)):
+                names = [name for name in header["tables"][table] if name in known[table] and name in decoded]
+                if table == "prices":
+                    written = database.add_prices(({"asset_id": a, "date": d, "close": c} for a, d, c in
+                                                   zip(decoded["asset_id"], decoded["date"], decoded["close"])), conn=conn, commit=False)
+                    if written is None: raise ArchiveError("Could not load prices") # add_prices already rolled back
+                else:
+                    verb = "INSERT OR REPLACE" if table == "settings" else "INSERT"
+                    cursor.executemany(f"{verb} INTO {table} ({', '.join(names)}) VALUES ({', '.join('?' * len(names))})",
+                                       zip(*(decoded[name] for name in names)))
+                counts[table] += rows
+                jobs.report_progress(sum(counts.values()), None, f"rows imported ({table})")
+            database._create_schema(conn)
+            database._bump_data_version(cursor, "transactions") # Rows were inserted directly, past bulk_add_transactions
+            database._rebuild_holdings(conn)
+            conn.commit()
+        logging.info(f"Imported portfolio archive from {path}: {counts}")
+    except (sqlite3.Error, OSError, ArchiveError, KeyError, struct.error, zlib.error, ValueError) as e:
+        logging.error(f"Error importing portfolio archive from {path}, rolling back: {e}")
+        if conn.in_transaction: conn.rollback()
+        counts = None
+    except jobs.JobCancelled:
+        logging.info(f"Import of portfolio archive from {path} cancelled, rolling back.")
+        conn.rollback()
+        raise
+    finally:
+        if local_conn and conn: conn.close()
+    return counts
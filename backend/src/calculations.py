@@ -0,0 +1,717 @@
+# src/calculations.py
+# Portfolio calculations on columnar NumPy arrays.
+# Transactions are loaded once into arrays sorted by (asset_id, date, id) and every
+# per-asset running value (quantity, cost basis, realized P&L) is computed for all
+# assets at once with segmented cumulative sums, instead of replaying rows in Python.
+# Time- and money-weighted returns run on the same principle over daily valuations and cash flows.
+
+import sqlite3
+import logging
+import datetime
+
+import numpy as np
+
+import fx
+import archive
+import database
+
+# Transaction type codes used in the arrays (only these affect holdings)
+OTHER, BUY, SELL, SPLIT = 0, 1, 2, 3
+_TYPE_CODES = {"Buy": BUY, "Sell": SELL, "Split": SPLIT}
+# A sell leaving less than this fraction of the position is treated as closing it
+_CLOSE_TOLERANCE = 1e-9
+
+
+# --- Loading ---
+
+def transaction_arrays_from_rows(rows):
+    """Builds columnar arrays from transaction dicts (asset_id, transaction_type, date, quantity, price, fees[, id]).
+    Split rows carry the split ratio in quantity (e.g. 4 for a 4:1 split). Rows are sorted by (asset_id, date, id)."""
+    rows = [r for r in rows if r.get("asset_id") is not None and r["transaction_type"] in _TYPE_CODES]
+    arrays = {
+        "id": np.array([r.get("id", i) for i, r in enumerate(rows)], dtype=np.int64),
+        "asset_id": np.array([r["asset_id"] for r in rows], dtype=np.int64),
+        "kind": np.array([_TYPE_CODES[r["transaction_type"]] for r in rows], dtype=np.int8),
+        "date": np.array([r["date"][:10] for r in rows], dtype="datetime64[D]"),
+        "quantity": np.array([r.get("quantity") or 0.0 for r in rows], dtype=np.float64),
+        "price": np.array([r.get("price") or 0.0 for r in rows], dtype=np.float64),
+        "fees": np.array([r.get("fees") or 0.0 for r in rows], dtype=np.float64),
+    }
+    order = np.lexsort((arrays["id"], arrays["date"], arrays["asset_id"]))
+    return {name: values[order] for name, values in arrays.items()}
+
+def load_transaction_arrays(conn=None, with_currency=False):
+    """Loads holdings-affecting transactions into columnar arrays sorted by (asset_id, date, id), with Split
+    corporate actions as Split rows of negative id (see database._SPLIT_ACTIONS_SQL).
+    with_currency adds a "currency" array (the currency of price and fees, see fx.convert_transaction_arrays).
+    Uses provided conn or creates a new one."""
+    sql = ("SELECT id, asset_id, transaction_type, date, quantity, price, fees, currency FROM transactions "
+           f"WHERE asset_id IS NOT NULL AND transaction_type IN ('Buy', 'Sell', 'Split') UNION ALL {database._SPLIT_ACTIONS_SQL} ORDER BY asset_id, date, id")
+    local_conn = False
+    if conn is None: conn = database._get_db_connection(); local_conn = True
+    if not conn: return None
+    arrays = None
+    try:
+        cursor = conn.cursor()
+        cursor.row_factory = None # Plain tuples: much cheaper than sqlite3.Row for bulk loads
+        results = cursor.execute(sql).fetchall()
+        ids, asset_ids, types, dates, quantities, prices, fees, currencies = zip(*results) if results else ((),) * 8
+        arrays = {
+            "id": np.array(ids, dtype=np.int64),
+            "asset_id": np.array(asset_ids, dtype=np.int64),
+            "kind": np.array([_TYPE_CODES[t] for t in types], dtype=np.int8),
+            "date": np.array([d[:10] for d in dates], dtype="datetime64[D]"),
+            "quantity": np.array([q or 0.0 for q in quantities], dtype=np.float64),
+            "price": np.array([p or 0.0 for p in prices], dtype=np.float64),
+            "fees": np.array([f or 0.0 for f in fees], dtype=np.float64),
+        }
+        if with_currency: arrays["currency"] = np.array(currencies, dtype=str)
+        logging.debug(f"Loaded {len(ids)} transactions into arrays.")
+    except sqlite3.Error as e: logging.error(f"Database error loading transaction arrays: {e}")
+    finally:
+        if local_conn and conn: conn.close()
+    return arrays
+
+def load_archive_transaction_arrays(path):
+    """Loads holdings-affecting transactions from a portfolio archive (see archive.export_portfolio) into the same
+    arrays as load_transaction_arrays, without going through SQLite. Returns None if the archive cannot be read."""
+    try:
+        columns = archive.read_table(path, "transactions", columns=("id", "asset_id", "transaction_type", "date", "quantity", "price", "fees"), raw=True)
+        actions = archive.read_table(path, "corporate_actions", columns=("id", "asset_id", "action_type", "ex_date", "amount"), raw=True)
+    except (OSError, archive.ArchiveError, ValueError) as e:
+        logging.error(f"Error reading transaction arrays from archive {path}: {e}")
+        return None
+    def numeric(columns, name, dtype): # Packed columns convert without copying; columns with nulls come back as lists
+        values = columns[name]
+        if isinstance(values, list): values = [0 if v is None else v for v in values]
+        return np.asarray(values, dtype=dtype)
+    def days(dates):
+        if isinstance(dates, list): return np.array([d[:10] if d else "NaT" for d in dates], dtype="datetime64[D]")
+        return np.asarray(dates, dtype=np.int64).astype("datetime64[D]") # Days since 1970-01-01
+    codes = np.array([_TYPE_CODES.get(t, OTHER) for t in columns["transaction_type"]], dtype=np.int8)
+    asset_ids = columns["asset_id"]
+    keep = (codes != OTHER) & np.array([a is not None for a in asset_ids]) if isinstance(asset_ids, list) else codes != OTHER
+    arrays = {"id": numeric(columns, "id", np.int64), "asset_id": numeric(columns, "asset_id", np.int64), "kind": codes, "date": days(columns["date"]),
+              "quantity": numeric(columns, "quantity", np.float64), "price": numeric(columns, "price", np.float64), "fees": numeric(columns, "fees", np.float64)}
+    arrays = {name: values[keep] for name, values in arrays.items()}
+    if actions:
+        splits = np.array([t == "Split" for t in actions["action_type"]], dtype=bool)
+        arrays = _with_split_actions(arrays, numeric(actions, "id", np.int64)[splits], numeric(actions, "asset_id", np.int64)[splits],
+                                     days(actions["ex_date"])[splits], numeric(actions, "amount", np.float64)[splits])
+    order = np.lexsort((arrays["id"], arrays["date"], arrays["asset_id"]))
+    return {name: values[order] for name, values in arrays.items()}
+
+def _with_split_actions(arrays, ids, asset_ids, ex_dates, amounts):
+    """Transaction arrays plus Split corporate actions as Split rows of negative id, by the rules of
+    database._SPLIT_ACTIONS_SQL: only positive ratios, only after the asset's first trade day, and not on a
+    day with a Split transaction. Rows are appended unsorted."""
+    day_keys = lambda assets, dates: (np.asarray(assets, dtype=np.int64) << 32) + (dates.astype(np.int64) + (1 << 31))
+    trade_keys = np.sort(day_keys(arrays["asset_id"], arrays["date"]))
+    action_keys = day_keys(asset_ids, ex_dates)
+    # Some trade of the asset on an earlier day: one falls in [start of the asset's keys, action key)
+    after_first = np.searchsorted(trade_keys, action_keys) > np.searchsorted(trade_keys, np.asarray(asset_ids, dtype=np.int64) << 32)
+    split_days = day_keys(arrays["asset_id"][arrays["kind"] == SPLIT], arrays["date"][arrays["kind"] == SPLIT])
+    keep = (amounts > 0) & after_first & ~np.isin(action_keys, split_days)
+    added = {"id": -ids[keep], "asset_id": asset_ids[keep], "kind": np.full(keep.sum(), SPLIT, dtype=np.int8), "date": ex_dates[keep],
+             "quantity": amounts[keep], "price": np.zeros(keep.sum()), "fees": np.zeros(keep.sum())}
+    return {name: np.concatenate((values, added[name])) for name, values in arrays.items()}
+
+
+# --- Segmented array helpers ---
+
+def _segment_cumsum(values, starts):
+    """Cumulative sum that restarts at every index where starts is True.
+    Each segment's total is subtracted at the next segment start before the global cumsum,
+    so the running sum stays at segment magnitude instead of growing across all assets."""
+    values = np.asarray(values, dtype=np.float64)
+    if not len(values): return values.copy()
+    first = np.flatnonzero(starts)
+    adjusted = values.copy()
+    adjusted[first[1:]] -= np.add.reduceat(values, first)[:-1]
+    running = np.cumsum(adjusted)
+    drift = running[first] - values[first] # Rounding carried over from earlier segments
+    return running - drift[np.cumsum(starts) - 1]
+
+def _segment_cumprod(factors, starts):
+    """Cumulative product of positive factors that restarts at every segment start (via log-space cumsum)."""
+    return np.exp(_segment_cumsum(np.log(factors), starts))
+
+def _segment_shift(values, starts, fill=0.0):
+    """Value of the previous element within the same segment (fill at segment starts)."""
+    shifted = np.empty_like(values)
+    if not len(values): return shifted
+    shifted[0] = fill
+    shifted[1:] = values[:-1]
+    shifted[starts] = fill
+    return shifted
+
+
+# --- Holdings Engine ---
+
+def compute_positions(arrays):
+    """Computes running position values after every transaction, for all assets at once.
+    Returns per-row arrays: quantity, split_factor, avg_cost_basis, avg_realized_pnl, fifo_cost_basis, fifo_realized_pnl.
+    Quantities are tracked in pre-split units internally so splits only rescale them; fees are added to the
+    cost of buys and deducted from the proceeds of sells. Short positions are not supported."""
+    asset_id, kind = arrays["asset_id"], arrays["kind"]
+    quantity, price, fees = arrays["quantity"], arrays["price"], arrays["fees"]
+    n = len(asset_id)
+    starts = np.ones(n, dtype=bool)
+    starts[1:] = asset_id[1:] != asset_id[:-1]
+    is_buy, is_sell, is_split = kind == BUY, kind == SELL, kind == SPLIT
+
+    # Splits: cumulative split factor per asset; all running quantities are kept in pre-split units
+    split_factor = _segment_cumprod(np.where(is_split & (quantity > 0), quantity, 1.0), starts)
+    bought = np.where(is_buy, quantity, 0.0) / split_factor
+    sold = np.where(is_sell, quantity, 0.0) / split_factor
+    held_after = _segment_cumsum(bought - sold, starts)
+    held_before = held_after + sold - bought
+    fraction_sold = np.clip(np.divide(sold, held_before, out=np.zeros(n), where=held_before > 0), 0.0, 1.0)
+    closes = is_sell & (fraction_sold >= 1.0 - _CLOSE_TOLERANCE)
+
+    buy_cost = np.where(is_buy, quantity * price + fees, 0.0)
+    proceeds = np.where(is_sell, quantity * price - fees, 0.0)
+
+    # Average cost: basis_t = basis_(t-1) * (1 - fraction_sold_t) + buy_cost_t, a linear recurrence solved as
+    # basis = P * cumsum(buy_cost / P) with P the running product of the kept fractions. Segments restart
+    # after a position is fully closed so P never reaches zero.
+    keep = np.where(closes, 1.0, 1.0 - fraction_sold)
+    segment_starts = starts.copy()
+    segment_starts[1:] |= closes[:-1]
+    kept_product = _segment_cumprod(keep, segment_starts)
+    avg_cost_basis = kept_product * _segment_cumsum(buy_cost / kept_product, segment_starts)
+    avg_cost_basis[closes] = 0.0
+    avg_realized_pnl = np.where(is_sell, proceeds - _segment_shift(avg_cost_basis, starts) * fraction_sold, 0.0)
+
+    # FIFO: the cost of the first x units ever bought is a piecewise-linear function of x (one piece per lot).
+    # Lay every asset's curve end to end on one axis and evaluate all assets with a single np.interp.
+    total_bought = _segment_cumsum(bought, starts)
+    total_cost = _segment_cumsum(buy_cost, starts)
+    total_sold = np.minimum(_segment_cumsum(np.minimum(sold, np.maximum(held_before, 0.0)), starts), total_bought)
+    group = np.cumsum(starts) - 1
+    first = np.flatnonzero(starts)
+    last = np.r_[first[1:] - 1, n - 1] if n else first
+    offsets = np.r_[0.0, np.cumsum(total_bought[last] + 1.0)[:-1]] if n else np.zeros(0)
+    buy_rows = np.flatnonzero(is_buy)
+    keys = np.r_[np.arange(len(first)), group[buy_rows]]
+    order = np.argsort(keys, kind="stable") # Each asset's (0, 0) point sorts before its lots
+    curve_x = np.r_[offsets, offsets[group[buy_rows]] + total_bought[buy_rows]][order]
+    curve_cost = np.r_[np.zeros(len(first)), total_cost[buy_rows]][order]
+    consumed_cost = np.interp(offsets[group] + total_sold, curve_x, curve_cost) if n else np.zeros(0)
+    fifo_cost_basis = total_cost - consumed_cost
+    fifo_realized_pnl = np.where(is_sell, proceeds - (consumed_cost - _segment_shift(consumed_cost, starts)), 0.0)
+
+    position = held_after * split_factor
+    position[np.abs(held_after) < _CLOSE_TOLERANCE * np.maximum(total_bought, 1.0)] = 0.0
+    return {
+        "quantity": position,
+        "split_factor": split_factor,
+        "avg_cost_basis": avg_cost_basis,
+        "avg_realized_pnl": avg_realized_pnl,
+        "fifo_cost_basis": np.where(position == 0.0, 0.0, fifo_cost_basis),
+        "fifo_realized_pnl": fifo_realized_pnl,
+    }
+
+def compute_holdings(arrays, prices=None):
+    """Per-asset holdings summary arrays (one entry per asset, ordered by asset_id): quantity, cost basis,
+    realized P&L (average cost and FIFO), fees and last transaction date. If prices (asset_id -> price)
+    are given, market value and unrealized P&L are added (NaN where no price is known)."""
+    positions = compute_positions(arrays)
+    asset_id = arrays["asset_id"]
+    n = len(asset_id)
+    starts = np.ones(n, dtype=bool)
+    starts[1:] = asset_id[1:] != asset_id[:-1]
+    first = np.flatnonzero(starts)
+    last = np.r_[first[1:] - 1, n - 1] if n else first
+    _sum = (lambda values: np.add.reduceat(values, first)) if n else (lambda values: np.zeros(0))
+    summary = {
+        "asset_id": asset_id[last],
+        "quantity": positions["quantity"][last],
+        "avg_cost_basis": positions["avg_cost_basis"][last],
+        "fifo_cost_basis": positions["fifo_cost_basis"][last],
+        "avg_realized_pnl": _sum(positions["avg_realized_pnl"]),
+        "fifo_realized_pnl": _sum(positions["fifo_realized_pnl"]),
+        "fees": _sum(arrays["fees"]),
+        "last_date": arrays["date"][last],
+    }
+    if n and (arrays["id"] < 0).any(): # Split corporate actions are not transactions: last date of the trades only
+        trade_days = np.where(arrays["id"] > 0, arrays["date"].astype(np.int64), np.iinfo(np.int64).min)
+        summary["last_date"] = np.maximum.reduceat(trade_days, first).astype("datetime64[D]")
+    if prices is not None:
+        current = np.array([prices.get(int(a), np.nan) for a in summary["asset_id"]], dtype=np.float64)
+        summary["price"] = current
+        summary["market_value"] = summary["quantity"] * current
+        summary["avg_unrealized_pnl"] = summary["market_value"] - summary["avg_cost_basis"]
+        summary["fifo_unrealized_pnl"] = summary["market_value"] - summary["fifo_cost_basis"]
+    return summary
+
+def get_holdings_summary(prices=None, method="fifo", conn=None):
+    """Holdings per asset for the UI: quantity, cost basis, average cost, realized and unrealized P&L.
+    method is 'fifo' or 'average'; prices optionally maps asset_id -> current price. Uses provided conn or creates a new one."""
+    if method not in ("fifo", "average"): raise ValueError(f"Unknown cost method '{method}'.")
+    arrays = load_transaction_arrays(conn=conn)
+    if arrays is None: return []
+    prefix = "fifo" if method == "fifo" else "avg"
+    prices = {int(k): float(v) for k, v in prices.items()} if prices else None
+    summary = compute_holdings(arrays, prices)
+    holdings = []
+    for i, asset_id in enumerate(summary["asset_id"]):
+        quantity = float(summary["quantity"][i])
+        cost_basis = float(summary[f"{prefix}_cost_basis"][i])
+        holding = {
+            "asset_id": int(asset_id),
+            "quantity": quantity,
+            "cost_basis": cost_basis,
+            "avg_cost": cost_basis / quantity if quantity else None,
+            "realized_pnl": float(summary[f"{prefix}_realized_pnl"][i]),
+            "fees": float(summary["fees"][i]),
+            "last_transaction_date": str(summary["last_date"][i]),
+            "market_value": None,
+            "unrealized_pnl": None,
+        }
+        if prices is not None and not np.isnan(summary["price"][i]):
+            holding["market_value"] = float(summary["market_value"][i])
+            holding["unrealized_pnl"] = float(summary[f"{prefix}_unrealized_pnl"][i])
+        holdings.append(holding)
+    return holdings
+
+
+# --- Holdings in Base Currency ---
+
+@database.cached_by_versions("transactions")
+def _load_currency_transaction_arrays(conn=None):
+    """Transaction arrays with currencies, kept between base-currency switches (loading dominates re-valuation)."""
+    return load_transaction_arrays(conn=conn, with_currency=True)
+
+def get_holdings_in_base_currency(base_currency=None, prices=None, method="fifo", today=None, conn=None):
+    """Holdings valued in base_currency (default: the base currency setting). Cost basis and realized P&L use the
+    rate of each transaction's date; market value uses prices (asset_id -> price in the asset's currency, default:
+    the latest stored prices) at today's rate. avg_cost and price stay in the asset's currency.
+    Uses provided conn or creates a new one."""
+    if method not in ("fifo", "average"): raise ValueError(f"Unknown cost method '{method}'.")
+    local_conn = False
+    if conn is None: conn = database._get_db_connection(); local_conn = True
+    if not conn: return []
+    holdings = []
+    try:
+        base_currency = base_currency or fx.get_base_currency(conn=conn)
+        today = today or datetime.date.today().isoformat()
+        converter = fx.get_fx_converter(conn=conn)
+        arrays = _load_currency_transaction_arrays(conn=conn)
+        if converter is None or arrays is None: return []
+        prices = {int(k): float(v) for k, v in prices.items()} if prices else database.get_latest_prices(conn=conn)
+        prefix = "fifo" if method == "fifo" else "avg"
+        local = compute_holdings(arrays)
+        base = compute_holdings(fx.convert_transaction_arrays(arrays, converter, base_currency))
+        cursor = conn.cursor()
+        cursor.row_factory = None
+        assets = {row[0]: row[1:] for row in cursor.execute("SELECT id, ticker, name, asset_type, currency FROM assets").fetchall()}
+        asset_currency = [assets.get(int(a), (None, None, None, base_currency))[3] for a in base["asset_id"]]
+        current_rate = converter.rates(asset_currency, base_currency, np.full(len(asset_currency), today, dtype="datetime64[D]"))
+        price = np.array([prices.get(int(a), np.nan) for a in base["asset_id"]], dtype=np.float64)
+        market_value = base["quantity"] * price * current_rate
+        for i, asset_id in enumerate(base["asset_id"]):
+            ticker, name, asset_type, currency = assets.get(int(asset_id), (None, None, None, asset_currency[i]))
+            quantity = float(base["quantity"][i])
+            cost_basis = float(base[f"{prefix}_cost_basis"][i])
+            holding = {
+                "asset_id": int(asset_id), "ticker": ticker, "name": name, "asset_type": asset_type, "currency": currency,
+                "quantity": quantity,
+                "avg_cost": float(local[f"{prefix}_cost_basis"][i]) / quantity if quantity else None,
+                "price": None if np.isnan(price[i]) else float(price[i]),
+                "base_currency": base_currency,
+                "fx_rate": None if np.isnan(current_rate[i]) else float(current_rate[i]),
+                "cost_basis": None if np.isnan(cost_basis) else cost_basis,
+                "realized_pnl": None if np.isnan(base[f"{prefix}_realized_pnl"][i]) else float(base[f"{prefix}_realized_pnl"][i]),
+                "market_value": None,
+                "unrealized_pnl": None,
+            }
+            if not np.isnan(market_value[i]):
+                holding["market_value"] = float(market_value[i])
+                if holding["cost_basis"] is not None: holding["unrealized_pnl"] = holding["market_value"] - cost_basis
+            holdings.append(holding)
+    except sqlite3.Error as e: logging.error(f"Database error valuing holdings in {base_currency}: {e}")
+    finally:
+        if local_conn and conn: conn.close()
+    return holdings
+
+
+# --- Daily Portfolio Series ---
+# portfolio_daily holds quantity, price and value per (date, asset) for every day an asset is held.
+# Writes in database.py only mark the earliest stale date; refresh_portfolio_daily recomputes from
+# there with one vectorized as-of join of holdings_history (quantities) against prices. Reads never
+# refresh (they would take the write lock): the IPC handler refreshes after every write call.
+
+_SERIES_THROUGH_SETTING = "portfolio_daily_through"
+_SERIES_PERIODS = {"D": "date", "W": "strftime('%Y-%W', date)", "M": "substr(date, 1, 7)", "Y": "substr(date, 1, 4)"}
+
+def _asof(event_asset, event_day, event_value, grid_asset, grid_day, n_days):
+    """For each grid point, the value of the last event for the same asset on or before its day (NaN if none).
+    Day -1 is allowed for state carried in from before the range; on equal days later events win."""
+    keys = event_asset * (n_days + 1) + (event_day + 1)
+    order = np.argsort(keys, kind="stable")
+    keys, values, assets = keys[order], event_value[order], event_asset[order]
+    grid_keys = grid_asset * (n_days + 1) + (grid_day + 1)
+    position = np.searchsorted(keys, grid_keys, side="right") - 1
+    found = position >= 0
+    found[found] = assets[position[found]] == grid_asset[found]
+    result = np.full(len(grid_keys), np.nan)
+    result[found] = values[position[found]]
+    return result
+
+def _event_arrays(rows, assets, start, checkpoint=False):
+    """(asset index, day offset from start, value) arrays for (asset_id, date, value) rows; checkpoint rows get day -1."""
+    if not rows: return np.zeros(0, np.int64), np.zeros(0, np.int64), np.zeros(0)
+    asset_ids, dates, values = zip(*rows)
+    asset_index = np.searchsorted(assets, np.array(asset_ids, dtype=np.int64))
+    if checkpoint:
+        days = np.full(len(rows), -1, dtype=np.int64)
+    else:
+        days = (np.array([d[:10] for d in dates], dtype="datetime64[D]") - start).astype(np.int64)
+    return asset_index, days, np.array(values, dtype=np.float64)
+
+def _rollback_refresh(conn, own_transaction):
+    if own_transaction: conn.rollback()
+    elif conn.in_transaction: conn.execute("ROLLBACK TO refresh_portfolio_daily"); conn.execute("RELEASE refresh_portfolio_daily")
+
+def refresh_portfolio_daily(end=None, conn=None):
+    """Recomputes portfolio_daily from the earliest stale date to end (default: last transaction or price date).
+    Prices are as-of the latest market close, falling back to the latest trade price. Inside a transaction of the
+    caller it writes under a savepoint and leaves committing to the caller. Uses provided conn or creates a new one.
+    Returns the number of (date, asset) rows written (0 if already current), or None on error."""
+    local_conn = False
+    if conn is None: conn = database._get_db_connection(); local_conn = True
+    if not conn: return None
+    written = None
+    own_transaction = not conn.in_transaction
+    try:
+        cursor = conn.cursor()
+        cursor.row_factory = None
+        marker = "SELECT key, value FROM settings WHERE key IN (?, ?)", (database.PORTFOLIO_DIRTY_SETTING, _SERIES_THROUGH_SETTING)
+        if own_transaction and database.PORTFOLIO_DIRTY_SETTING not in dict(cursor.execute(*marker).fetchall()):
+            return 0 # Current: no write lock taken
+        conn.execute("BEGIN IMMEDIATE" if own_transaction else "SAVEPOINT refresh_portfolio_daily") # Marker read and rows written atomically
+        settings = dict(cursor.execute(*marker).fetchall())
+        dirty, through = settings.get(database.PORTFOLIO_DIRTY_SETTING), settings.get(_SERIES_THROUGH_SETTING)
+        if not dirty:
+            conn.execute("COMMIT" if own_transaction else "RELEASE refresh_portfolio_daily")
+            return 0
+        start = np.datetime64(dirty)
+        if through and np.datetime64(through) + 1 < start: start = np.datetime64(through) + 1 # Don't leave unfilled days
+        start_str = str(start)
+        last_dates = cursor.execute("SELECT (SELECT MAX(date) FROM holdings_history), (SELECT MAX(date) FROM prices)").fetchone()
+        end_day = max([np.datetime64(d[:10]) for d in (*last_dates, end) if d] + [start])
+
+        # Quantities: the stored day before start is the checkpoint, then every history row from start on
+        checkpoint = cursor.execute("SELECT asset_id, date, quantity FROM portfolio_daily WHERE date = ?", (str(start - 1),)).fetchall()
+        history = cursor.execute("SELECT asset_id, date, quantity FROM holdings_history WHERE date >= ? ORDER BY date, transaction_id", (start_str,)).fetchall()
+        # Prices: last known before start, then every price from start on (trade prices first so market closes win)
+        trades = "FROM transactions WHERE asset_id IS NOT NULL AND transaction_type IN ('Buy', 'Sell') AND price > 0"
+        carried = cursor.execute(f"""SELECT asset_id, date, price FROM (
+                                         SELECT asset_id, date, price, ROW_NUMBER() OVER (PARTITION BY asset_id ORDER BY date DESC, id DESC) AS rn
+                                         {trades} AND date < ?) WHERE rn = 1""", (start_str,)).fetchall()
+        carried += cursor.execute("SELECT asset_id, MAX(date), close FROM prices WHERE date < ? GROUP BY asset_id", (start_str,)).fetchall()
+        carried.sort(key=lambda row: row[1]) # Stable: a close on the same day as a trade still wins
+        current = cursor.execute(f"SELECT asset_id, date, price {trades} AND date >= ? ORDER BY date, id", (start_str,)).fetchall()
+        current += cursor.execute("SELECT asset_id, date, close FROM prices WHERE date >= ? ORDER BY date", (start_str,)).fetchall()
+
+        assets = np.unique(np.array([r[0] for r in checkpoint] + [r[0] for r in history], dtype=np.int64))
+        cursor.execute("DELETE FROM portfolio_daily WHERE date >= ?", (start_str,))
+        written = 0
+        if len(assets):
+            n_days = int((end_day - start).astype(np.int64)) + 1
+            grid_asset = np.repeat(np.arange(len(assets)), n_days)
+            grid_day = np.tile(np.arange(n_days), len(assets))
+            q_asset, q_day, q_value = (np.concatenate(parts) for parts in zip(_event_arrays(checkpoint, assets, start, checkpoint=True), _event_arrays(history, assets, start)))
+            held = np.isin([r[0] for r in carried + current], assets)
+            price_rows = [row for row, keep in zip(carried + current, held) if keep]
+            carried_count = int(held[:len(carried)].sum())
+            p_asset, p_day, p_value = (np.concatenate(parts) for parts in zip(_event_arrays(price_rows[:carried_count], assets, start, checkpoint=True), _event_arrays(price_rows[carried_count:], assets, start)))
+            quantity = np.nan_to_num(_asof(q_asset, q_day, q_value, grid_asset, grid_day, n_days))
+            price = _asof(p_asset, p_day, p_value, grid_asset, grid_day, n_days)
+            keep = quantity != 0.0
+            value = quantity * price
+            dates = (start + grid_day[keep]).astype(str)
+            rows = zip(dates.tolist(), assets[grid_asset[keep]].tolist(), quantity[keep].tolist(),
+                       [None if np.isnan(p) else p for p in price[keep].tolist()], [None if np.isnan(v) else v for v in value[keep].tolist()])
+            cursor.executemany("INSERT INTO portfolio_daily (date, asset_id, quantity, price, value) VALUES (?, ?, ?, ?, ?)", rows)
+            written = int(keep.sum())
+        cursor.execute("DELETE FROM settings WHERE key = ?", (database.PORTFOLIO_DIRTY_SETTING,))
+        database._write_setting(cursor, _SERIES_THROUGH_SETTING, str(end_day))
+        database._bump_data_version(cursor, "portfolio_daily")
+        conn.execute("COMMIT" if own_transaction else "RELEASE refresh_portfolio_daily")
+        logging.info(f"Refreshed portfolio_daily from {start_str} to {end_day}: {written} rows.")
+    except sqlite3.Error as e:
+        logging.error(f"Database error refreshing portfolio_daily: {e}")
+        _rollback_refresh(conn, own_transaction)
+        written = None
+    except Exception:
+        _rollback_refresh(conn, own_transaction) # Leave nothing half-written for the caller to commit
+        raise
+    finally:
+        if local_conn and conn: conn.close()
+    return written
+
+def get_portfolio_series(start=None, end=None, freq="D", asset_id=None, base_currency=None, conn=None):
+    """Portfolio value over [start, end] as [{"date", "value"}] in base_currency (default: the base currency setting),
+    each asset converted at the FX rate of the day. Reads portfolio_daily as last refreshed (see refresh_portfolio_daily).
+    freq "D" gives every day; "W", "M" and "Y" give the last day of each period. asset_id limits it to one asset.
+    Uses provided conn or creates a new one. Returns None on error."""
+    period = _SERIES_PERIODS.get(str(freq).upper())
+    if period is None:
+        logging.error(f"Unknown portfolio series frequency '{freq}'.")
+        return None
+    local_conn = False
+    if conn is None: conn = database._get_db_connection(); local_conn = True
+    if not conn: return None
+    try:
+        base_currency = base_currency or fx.get_base_currency(conn=conn)
+        filters, params = [], []
+        if start: filters.append("date >= ?"); params.append(start)
+        if end: filters.append("date <= ?"); params.append(end)
+        if asset_id is not None: filters.append("asset_id = ?"); params.append(asset_id)
+        where = f"WHERE {' AND '.join(filters)}" if filters else ""
+        if period != "date": # Last day of each period that has values
+            filters.append(f"date IN (SELECT MAX(date) FROM portfolio_daily {where} GROUP BY {period})"); params += params
+        sql = f"""SELECT p.date, a.currency, SUM(p.value), COUNT(p.value) FROM portfolio_daily p JOIN assets a ON a.id = p.asset_id
+                  {f"WHERE {' AND '.join(filters)}" if filters else ""} GROUP BY p.date, a.currency ORDER BY p.date"""
+        cursor = conn.cursor()
+        cursor.row_factory = None
+        rows = cursor.execute(sql, params).fetchall()
+        if not rows: return []
+        converter = fx.get_fx_converter(conn=conn)
+        if converter is None: return None
+        dates, currencies, values, priced = zip(*rows)
+        days, inverse = np.unique(np.array(dates, dtype="datetime64[D]"), return_inverse=True)
+        converted = np.array(values, dtype=np.float64) * converter.rates(currencies, base_currency, days[inverse])
+        totals = np.bincount(inverse, weights=np.nan_to_num(converted), minlength=len(days))
+        valued = np.bincount(inverse, weights=np.array(priced, dtype=np.float64), minlength=len(days)) > 0 # Days with no priced asset stay None
+        return [{"date": str(day), "value": float(total) if ok else None} for day, total, ok in zip(days, totals, valued)]
+    except sqlite3.Error as e:
+        logging.error(f"Database error reading portfolio series: {e}")
+        return None
+    finally:
+        if local_conn and conn: conn.close()
+
+
+# --- Returns ---
+# Time-weighted returns link one growth factor per valued day, (value + outflow) / (previous value + inflow):
+# purchases enter at the start of the day, sales and dividends leave at its end. The cumulative logs of these
+# factors are cached per asset (asset_id PORTFOLIO for the whole portfolio) until transactions, prices or FX
+# rates change, so the TWR of any window is one subtraction instead of a re-link from inception.
+# Money-weighted returns (XIRR) solve every asset's cash-flow equation at once with a vectorized Newton iteration.
+
+PORTFOLIO = 0 # asset_id of the whole-portfolio rows in the performance arrays
+PERIODS = ("daily", "wtd", "mtd", "ytd", "overall")
+_DAYS_PER_YEAR = 365.0
+_XIRR_GUESS = 0.1
+_XIRR_MAX_ITERATIONS = 100
+_XIRR_TOLERANCE = 1e-10
+_KEY_DAYS_OFFSET = 1 << 31 # Keeps pre-1970 day numbers positive in the (asset, day) search keys
+
+# Cash flows per asset, day and currency from the investor's side: money put in (buys), taken out (sales, dividends)
+_CASH_FLOWS_SQL = """
+    SELECT asset_id, substr(date, 1, 10) AS day, currency,
+           SUM(CASE WHEN transaction_type = 'Buy' THEN quantity * price + COALESCE(fees, 0) ELSE 0 END),
+           SUM(CASE WHEN transaction_type = 'Sell' THEN quantity * price - COALESCE(fees, 0)
+                    WHEN transaction_type = 'Dividend' THEN COALESCE(quantity, 1) * price - COALESCE(fees, 0) ELSE 0 END)
+    FROM transactions WHERE asset_id IS NOT NULL AND transaction_type IN ('Buy', 'Sell', 'Dividend')
+    GROUP BY asset_id, day, currency"""
+
+def _day_keys(asset_ids, days):
+    return (np.asarray(asset_ids, dtype=np.int64) << 32) + (np.asarray(days, dtype=np.int64) + _KEY_DAYS_OFFSET)
+
+def _day_number(date):
+    """Days since 1970-01-01 of an ISO date string (None stays None)."""
+    return None if date is None else int(np.datetime64(str(date)[:10], "D").astype(np.int64))
+
+def performance_arrays(value_asset, value_day, value, flow_asset, flow_day, inflow, outflow):
+    """Daily performance arrays for every asset plus the portfolio (asset_id PORTFOLIO), sorted by (asset_id, day):
+    end-of-day value, inflow, outflow and log_growth, the running sum of the log daily TWR factors.
+    Inputs are valuations of held positions (asset, day, value) and cash flows (asset, day, inflow, outflow), days
+    being int64 day numbers. A day with flows but no valuation is one on which the position ended at zero."""
+    n_values, n_flows = len(value_day), len(flow_day)
+    keys, inverse = np.unique(_day_keys(np.concatenate((value_asset, flow_asset)), np.concatenate((value_day, flow_day))), return_inverse=True)
+    _sum = lambda weights: np.bincount(inverse, weights=weights, minlength=len(keys))
+    asset_value = _sum(np.concatenate((np.asarray(value, dtype=np.float64), np.zeros(n_flows))))
+    asset_inflow = _sum(np.concatenate((np.zeros(n_values), np.asarray(inflow, dtype=np.float64))))
+    asset_outflow = _sum(np.concatenate((np.zeros(n_values), np.asarray(outflow, dtype=np.float64))))
+    asset_day = (keys & 0xFFFFFFFF) - _KEY_DAYS_OFFSET
+    # Portfolio rows: totals per day (unpriced positions count as zero)
+    days, day_inverse = np.unique(asset_day, return_inverse=True)
+    _total = lambda weights: np.bincount(day_inverse, weights=weights, minlength=len(days))
+    performance = {
+        "asset_id": np.concatenate((np.full(len(days), PORTFOLIO, dtype=np.int64), keys >> 32)),
+        "day": np.concatenate((days, asset_day)),
+        "value": np.concatenate((_total(np.nan_to_num(asset_value)), asset_value)),
+        "inflow": np.concatenate((_total(asset_inflow), asset_inflow)),
+        "outflow": np.concatenate((_total(asset_outflow), asset_outflow)),
+    }
+    asset_id, day, value = performance["asset_id"], performance["day"], performance["value"]
+    starts = np.ones(len(day), dtype=bool)
+    starts[1:] = asset_id[1:] != asset_id[:-1]
+    contiguous = ~starts & (_segment_shift(day, starts) == day - 1) # A gap means the position was zero in between
+    previous = np.where(contiguous, _segment_shift(value, starts), 0.0)
+    denominator = previous + performance["inflow"]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        factor = (value + performance["outflow"]) / denominator
+        valid = (denominator > 0) & (factor > 0) & np.isfinite(factor) # Unpriced days link as no change
+        performance["log_growth"] = _segment_cumsum(np.where(valid, np.log(np.where(valid, factor, 1.0)), 0.0), starts)
+    return performance
+
+def xirr(segments, years, amounts, n_segments, guess=_XIRR_GUESS):
+    """Annual rates r solving sum(amount / (1 + r) ** years) = 0 for every segment at once. Newton's method runs on
+    all segments together in x = log(1 + r), where the sum is a smooth sum of exponentials (no step lands below -100%,
+    and short windows with huge annualized rates still converge). segments gives each cash flow's segment index;
+    NaN where a segment has no sign change or does not converge."""
+    segments, years, amounts = np.asarray(segments, dtype=np.int64), np.asarray(years, dtype=np.float64), np.asarray(amounts, dtype=np.float64)
+    _sum = lambda weights: np.bincount(segments, weights=weights, minlength=n_segments)
+    solvable = (_sum(amounts > 0) > 0) & (_sum(amounts < 0) > 0)
+    log_growth = np.full(n_segments, np.log1p(guess))
+    active = solvable.copy()
+    with np.errstate(over="ignore", divide="ignore", invalid="ignore"):
+        for _ in range(_XIRR_MAX_ITERATIONS):
+            if not active.any(): break
+            discounted = amounts * np.exp(-log_growth[segments] * years)
+            step = np.where(active, _sum(discounted) / _sum(-years * discounted), 0.0)
+            log_growth -= step
+            active &= np.isfinite(step) & (np.abs(step) > _XIRR_TOLERANCE)
+        rate = np.expm1(log_growth)
+    return np.where(solvable & ~active & np.isfinite(rate), rate, np.nan)
+
+def compute_returns(performance, start=None, end=None):
+    """TWR and XIRR per asset (and the portfolio) over [start, end] (day numbers; None for first/last day of data)
+    from performance_arrays. Returns arrays keyed asset_id, twr, xirr, start_value (end of the day before start),
+    end_value, inflow and outflow."""
+    asset_id, day, value = performance["asset_id"], performance["day"], performance["value"]
+    entities, first = np.unique(asset_id, return_index=True)
+    n = len(entities)
+    if not n: return {name: np.zeros(0) for name in ("asset_id", "twr", "xirr", "start_value", "end_value", "inflow", "outflow")}
+    last = np.r_[first[1:] - 1, len(day) - 1]
+    start_day = day[first] if start is None else np.full(n, start, dtype=np.int64)
+    end_day = day[last] if end is None else np.full(n, end, dtype=np.int64)
+    keys = _day_keys(asset_id, day)
+    end_row = np.searchsorted(keys, _day_keys(entities, end_day), side="right") - 1 # Last row on or before end
+    before_row = np.searchsorted(keys, _day_keys(entities, start_day), side="left") - 1 # Last row before start
+    has_end, has_before = end_row >= first, before_row >= first
+    log_growth = performance["log_growth"]
+    twr = np.exp(np.where(has_end, log_growth[end_row], 0.0) - np.where(has_before, log_growth[before_row], 0.0)) - 1.0
+    # Values carried to the window edges: a gap before the edge means the position had been closed
+    start_value = np.where(has_before & ((day[before_row] == start_day - 1) | (before_row == last)), np.nan_to_num(value[before_row]), 0.0)
+    end_value = np.where(has_end & ((day[end_row] == end_day) | (end_row == last)), np.nan_to_num(value[end_row]), 0.0)
+    # Cash flows for XIRR, in years from the end of the day before start: the start value goes in, the end value comes out
+    entity = np.cumsum(np.r_[True, asset_id[1:] != asset_id[:-1]]) - 1
+    in_window = (day >= start_day[entity]) & (day <= end_day[entity])
+    flow = performance["outflow"] - performance["inflow"]
+    flowing = in_window & (flow != 0) # Most rows are valuations only: keep the solver on actual flows
+    flow_entity = entity[flowing]
+    segments = np.concatenate((np.arange(n), flow_entity, np.arange(n)))
+    years = np.concatenate((np.zeros(n), day[flowing] - start_day[flow_entity] + 1, end_day - start_day + 1)) / _DAYS_PER_YEAR
+    amounts = np.concatenate((-start_value, flow[flowing], end_value))
+    _window_sum = lambda values: np.bincount(entity[in_window], weights=values[in_window], minlength=n)
+    return {"asset_id": entities, "twr": twr, "xirr": xirr(segments, years, amounts, n), "start_value": start_value, "end_value": end_value,
+            "inflow": _window_sum(performance["inflow"]), "outflow": _window_sum(performance["outflow"])}
+
+@database.cached_by_versions("transactions", "portfolio_daily", "fx_rates")
+def _load_performance(base_currency, conn=None):
+    """performance_arrays from portfolio_daily (as last refreshed) and the transactions' cash flows, converted into base_currency."""
+    try:
+        cursor = conn.cursor()
+        cursor.row_factory = None
+        values = cursor.execute("SELECT p.asset_id, p.date, p.value, a.currency FROM portfolio_daily p JOIN assets a ON a.id = p.asset_id").fetchall()
+        flows = cursor.execute(_CASH_FLOWS_SQL).fetchall()
+    except sqlite3.Error as e:
+        logging.error(f"Database error loading performance data: {e}")
+        return None
+    converter = fx.get_fx_converter(conn=conn)
+    if converter is None: return None
+    value_asset, value_date, value, value_currency = zip(*values) if values else ((),) * 4
+    flow_asset, flow_date, flow_currency, inflow, outflow = zip(*flows) if flows else ((),) * 5
+    value_date = np.array(value_date, dtype="datetime64[D]")
+    flow_date = np.array(flow_date, dtype="datetime64[D]")
+    value_rate = converter.rates(value_currency, base_currency, value_date)
+    flow_rate = converter.rates(flow_currency, base_currency, flow_date)
+    return performance_arrays(np.array(value_asset, dtype=np.int64), value_date.astype(np.int64), np.array(value, dtype=np.float64) * value_rate,
+                              np.array(flow_asset, dtype=np.int64), flow_date.astype(np.int64),
+                              np.array(inflow, dtype=np.float64) * flow_rate, np.array(outflow, dtype=np.float64) * flow_rate)
+
+def _period_start(period, as_of):
+    """First day of a dashboard period ending on as_of (a datetime.date); None for 'overall'."""
+    if period == "daily": return as_of
+    if period == "wtd": return as_of - datetime.timedelta(days=as_of.weekday())
+    if period == "mtd": return as_of.replace(day=1)
+    if period == "ytd": return as_of.replace(month=1, day=1)
+    if period == "overall": return None
+    raise ValueError(f"Unknown return period '{period}'.")
+
+def get_returns(start=None, end=None, base_currency=None, conn=None):
+    """Time-weighted return and XIRR (annualized) over [start, end] for the portfolio and each asset, in base_currency
+    (default: the base currency setting). Returns {"base_currency", "portfolio": {...}, "assets": [{...}]} with keys
+    asset_id, twr, xirr, start_value, end_value, inflow and outflow (None where undefined), or None on error.
+    Uses provided conn or creates a new one."""
+    local_conn = False
+    if conn is None: conn = database._get_db_connection(); local_conn = True
+    if not conn: return None
+    try:
+        base_currency = base_currency or fx.get_base_currency(conn=conn)
+        performance = _load_performance(base_currency, conn=conn)
+        if performance is None: return None
+        returns = compute_returns(performance, _day_number(start), _day_number(end))
+        rows = [{name: (int(values[i]) if name == "asset_id" else None if np.isnan(values[i]) else float(values[i])) for name, values in returns.items()}
+                for i in range(len(returns["asset_id"]))]
+        portfolio = rows[0] if rows and rows[0]["asset_id"] == PORTFOLIO else None
+        if portfolio: portfolio["asset_id"] = None
+        return {"base_currency": base_currency, "portfolio": portfolio, "assets": rows[1:] if portfolio else rows}
+    finally:
+        if local_conn and conn: conn.close()
+
+def get_period_returns(today=None, base_currency=None, conn=None):
+    """Portfolio time-weighted return for each of PERIODS, ending on the last valued day up to today.
+    Returns {"as_of", "base_currency", "returns": {period: twr or None}}, or None on error. Uses provided conn or creates a new one."""
+    local_conn = False
+    if conn is None: conn = database._get_db_connection(); local_conn = True
+    if not conn: return None
+    try:
+        base_currency = base_currency or fx.get_base_currency(conn=conn)
+        performance = _load_performance(base_currency, conn=conn)
+        if performance is None: return None
+        portfolio = performance["asset_id"] == PORTFOLIO
+        today = datetime.date.fromisoformat(today or datetime.date.today().isoformat())
+        if not portfolio.any(): return {"as_of": today.isoformat(), "base_currency": base_currency, "returns": {period: None for period in PERIODS}}
+        as_of = min(today, datetime.date.fromisoformat(str(np.datetime64(int(performance["day"][portfolio][-1]), "D"))))
+        returns = {}
+        for period in PERIODS: # Each window reads two points of the cached cumulative factors
+            twr = compute_returns(performance, _day_number(_period_start(period, as_of)), _day_number(as_of))["twr"][0]
+            returns[period] = float(twr)
+        return {"as_of": as_of.isoformat(), "base_currency": base_currency, "returns": returns}
+    finally:
+        if local_conn and conn: conn.close()
+
+def get_movers(period="daily", count=5, today=None, base_currency=None, conn=None):
+    """Best and worst time-weighted returns over a dashboard period among assets held on its last day.
+    Returns {"period", "as_of", "gainers": [...], "losers": [...]} with {"asset_id", "ticker", "change"} entries,
+    or None on error. Uses provided conn or creates a new one."""
+    local_conn = False
+    if conn is None: conn = database._get_db_connection(); local_conn = True
+    if not conn: return None
+    try:
+        base_currency = base_currency or fx.get_base_currency(conn=conn)
+        performance = _load_performance(base_currency, conn=conn)
+        if performance is None: return None
+        today = datetime.date.fromisoformat(today or datetime.date.today().isoformat())
+        as_of = min(today, datetime.date.fromisoformat(str(np.datetime64(int(performance["day"].max()), "D")))) if len(performance["day"]) else today
+        returns = compute_returns(performance, _day_number(_period_start(period, as_of)), _day_number(as_of))
+        held = (returns["asset_id"] != PORTFOLIO) & (returns["end_value"] > 0)
+        order = np.argsort(-returns["twr"][held], kind="stable")
+        asset_ids, changes = returns["asset_id"][held][order], returns["twr"][held][order]
+        cursor = conn.cursor()
+        cursor.row_factory = None
+        tickers = dict(cursor.execute("SELECT id, COALESCE(ticker, name) FROM assets").fetchall())
+        movers = [{"asset_id": int(a), "ticker": tickers.get(int(a)), "change": float(c)} for a, c in zip(asset_ids, changes)]
+        return {"period": period, "as_of": as_of.isoformat(),
+                "gainers": [m for m in movers[:count] if m["change"] > 0], "losers": [m for m in movers[::-1][:count] if m["change"] < 0]}
+    except sqlite3.Error as e:
+        logging.error(f"Database error computing movers: {e}")
+        return None
+    finally:
+        if local_conn and conn: conn.close()
@@ -0,0 +1,281 @@
+# src/corporate_actions.py
+# Dividends, splits and spin-offs: storage in the corporate_actions table, split/spin-off adjustment
+# of historical quantities and prices in one vectorized pass, and projected dividend income for the
+# current holdings (announced events plus dates extrapolated from each asset's recent cadence).
+# Splits also apply to positions: writing one replays the asset's holdings from its ex-date, and the
+# transaction arrays include it (calculations.load_transaction_arrays). Spin-offs only adjust prices;
+# the shares received are recorded as a Buy of the target asset, at the cost basis moved to it.
+# Projections are cached until transactions or corporate actions change (database.cached_by_versions).
+
+import sqlite3
+import logging
+import datetime
+
+import numpy as np
+
+import database
+import calculations
+
+ACTION_TYPES = ("Dividend", "Split", "SpinOff")
+DEFAULT_DIVIDEND_HORIZON_DAYS = 90
+_CADENCE_EVENTS = 5 # Most recent dividends used to estimate how often an asset pays
+_MIN_DIVIDEND_INTERVAL = 7 # Days; shorter average gaps are treated as irregular and not extrapolated
+_MAX_DIVIDEND_INTERVAL = 400 # Annual payers with some date drift
+_KEY_DAYS_OFFSET = 1 << 31 # Keeps pre-1970 day numbers positive in the (asset, day) search keys
+
+
+# --- Storage ---
+
+def add_corporate_actions(rows, conn=None, commit=True):
+    """Inserts or updates many corporate actions, keyed on (asset_id, action_type, ex_date), in one transaction.
+    rows are dicts with asset_id, action_type, ex_date, amount and optionally pay_date, currency,
+    target_asset_id, cost_fraction and source. Holdings of assets with a split among the rows are replayed
+    from its ex-date. Uses provided conn or creates a new one. Returns the number of rows written, or None on error."""
+    sql = ("INSERT INTO corporate_actions (asset_id, action_type, ex_date, pay_date, amount, currency, target_asset_id, cost_fraction, source) "
+           "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?) ON CONFLICT(asset_id, action_type, ex_date) DO UPDATE SET "
+           "pay_date = excluded.pay_date, amount = excluded.amount, currency = excluded.currency, "
+           "target_asset_id = excluded.target_asset_id, cost_fraction = excluded.cost_fraction, source = excluded.source")
+    rows = list(rows)
+    local_conn = False
+    if conn is None: conn = database._get_db_connection(); local_conn = True
+    if not conn: return None
+    written = None
+    try:
+        invalid = [row for row in rows if row["action_type"] not in ACTION_TYPES]
+        if invalid: raise ValueError(f"Unknown corporate action type '{invalid[0]['action_type']}'")
+        cursor = conn.cursor()
+        cursor.executemany(sql, ((row["asset_id"], row["action_type"], row["ex_date"], row.get("pay_date"), row["amount"], row.get("currency"),
+                                  row.get("target_asset_id"), row.get("cost_fraction"), row.get("source")) for row in rows))
+        changed = {}
+        for row in rows:
+            if row["action_type"] == "Split" and (row["asset_id"] not in changed or row["ex_date"] < changed[row["asset_id"]][0]):
+                changed[row["asset_id"]] = (row["ex_date"], 0)
+        if changed: # Positions changed: invalidates results cached on transactions (holdings, transaction arrays)
+            database._refresh_holdings(conn, changed)
+            database._bump_data_version(cursor, "transactions")
+        written = len(rows)
+        if commit: conn.commit()
+        logging.info(f"Wrote {written} corporate actions.")
+    except (sqlite3.Error, KeyError, ValueError) as e:
+        logging.error(f"Error adding corporate actions, rolling back: {e}")
+        conn.rollback()
+        written = None
+    finally:
+        if local_conn and conn: conn.close()
+    return written
+
+def get_corporate_actions(asset_id=None, action_type=None, start=None, end=None, conn=None):
+    """Retrieves corporate actions (optionally for one asset/type and an ex-date range), ordered by ex-date.
+    Uses provided conn or creates a new one."""
+    clauses, params = [], []
+    for column, op, value in (("c.asset_id", "=", asset_id), ("c.action_type", "=", action_type), ("c.ex_date", ">=", start), ("c.ex_date", "<=", end)):
+        if value is not None: clauses.append(f"{column} {op} ?"); params.append(value)
+    sql = ("SELECT c.*, a.ticker FROM corporate_actions c JOIN assets a ON a.id = c.asset_id"
+           + (f" WHERE {' AND '.join(clauses)}" if clauses else "") + " ORDER BY c.ex_date, c.id")
+    local_conn = False
+    if conn is None: conn = database._get_db_connection(); local_conn = True
+    if not conn: return []
+    actions = []
+    try:
+        actions = [dict(row) for row in conn.execute(sql, params).fetchall()]
+    except sqlite3.Error as e: logging.error(f"Database error getting corporate actions: {e}")
+    finally:
+        if local_conn and conn: conn.close()
+    return actions
+
+
+# --- Split and Spin-off Adjustment ---
+
+def load_adjustment_events(conn=None):
+    """Loads the events that rescale history as arrays sorted by (asset_id, date): quantity_factor (split ratio)
+    and price_factor (1 / split ratio, or 1 - cost_fraction for spin-offs). Split transactions count as split
+    events unless a Split corporate action exists for the same asset and day. Uses provided conn or creates a new one."""
+    sql = """
+        SELECT asset_id, ex_date, amount, 1.0 / amount FROM corporate_actions WHERE action_type = 'Split' AND amount > 0
+        UNION ALL
+        SELECT t.asset_id, substr(t.date, 1, 10), t.quantity, 1.0 / t.quantity FROM transactions t
+        WHERE t.transaction_type = 'Split' AND t.asset_id IS NOT NULL AND t.quantity > 0
+          AND NOT EXISTS (SELECT 1 FROM corporate_actions c WHERE c.asset_id = t.asset_id AND c.action_type = 'Split' AND c.ex_date = substr(t.date, 1, 10))
+        UNION ALL
+        SELECT asset_id, ex_date, 1.0, 1.0 - cost_fraction FROM corporate_actions WHERE action_type = 'SpinOff' AND cost_fraction > 0 AND cost_fraction < 1
+        ORDER BY 1, 2"""
+    local_conn = False
+    if conn is None: conn = database._get_db_connection(); local_conn = True
+    if not conn: return None
+    events = None
+    try:
+        cursor = conn.cursor()
+        cursor.row_factory = None
+        results = cursor.execute(sql).fetchall()
+        asset_ids, dates, quantity_factors, price_factors = zip(*results) if results else ((),) * 4
+        events = {
+            "asset_id": np.array(asset_ids, dtype=np.int64),
+            "date": np.array([d[:10] for d in dates], dtype="datetime64[D]"),
+            "quantity_factor": np.array(quantity_factors, dtype=np.float64),
+            "price_factor": np.array(price_factors, dtype=np.float64),
+        }
+    except sqlite3.Error as e: logging.error(f"Database error loading adjustment events: {e}")
+    finally:
+        if local_conn and conn: conn.close()
+    return events
+
+def _search_keys(asset_ids, days):
+    return (np.asarray(asset_ids, dtype=np.int64) << 32) + (np.asarray(days, dtype=np.int64) + _KEY_DAYS_OFFSET)
+
+def adjustment_factors(asset_ids, dates, events):
+    """Cumulative quantity and price factors of all events after each (asset_id, date), for all rows at once.
+    An event on the row's own date counts as already applied (ex-date semantics). Multiply quantities by the
+    first and prices by the second to express history in today's share terms."""
+    days = np.asarray(dates, dtype="datetime64[D]").astype(np.int64)
+    asset_ids = np.asarray(asset_ids, dtype=np.int64)
+    if not len(events["asset_id"]): return np.ones(len(asset_ids)), np.ones(len(asset_ids))
+    event_keys = _search_keys(events["asset_id"], events["date"].astype(np.int64))
+    first_after = np.searchsorted(event_keys, _search_keys(asset_ids, days), side="right")
+    asset_end = np.searchsorted(event_keys, (asset_ids + 1) << 32, side="left")
+    factors = []
+    for name in ("quantity_factor", "price_factor"):
+        # Products over [first_after, asset_end) as differences of a prefix sum in log space
+        prefix = np.concatenate(([0.0], np.cumsum(np.log(events[name]))))
+        factors.append(np.exp(prefix[asset_end] - prefix[first_after]))
+    return tuple(factors)
+
+def get_adjusted_transaction_arrays(conn=None):
+    """Loads the transaction arrays (calculations.load_transaction_arrays) with Buy/Sell quantities and prices
+    restated in post-split terms. Split rows (transactions and Split corporate actions) are kept as they are.
+    Uses provided conn or creates a new one."""
+    local_conn = False
+    if conn is None: conn = database._get_db_connection(); local_conn = True
+    if not conn: return None
+    try:
+        arrays = calculations.load_transaction_arrays(conn=conn)
+        events = load_adjustment_events(conn=conn)
+        if arrays is None or events is None: return None
+        quantity_factor, price_factor = adjustment_factors(arrays["asset_id"], arrays["date"], events)
+        trades = arrays["kind"] != calculations.SPLIT
+        arrays["quantity"] = np.where(trades, arrays["quantity"] * quantity_factor, arrays["quantity"])
+        arrays["price"] = np.where(trades, arrays["price"] * price_factor, arrays["price"])
+        return arrays
+    finally:
+        if local_conn and conn: conn.close()
+
+def get_adjusted_prices(asset_id, start=None, end=None, conn=None):
+    """Retrieves daily closes for one asset with split/spin-off adjusted closes, as a list of
+    {date, close, adjusted_close}. Uses provided conn or creates a new one."""
+    sql = "SELECT date, close FROM prices WHERE asset_id = ? AND date >= ? AND date <= ? ORDER BY date"
+    local_conn = False
+    if conn is None: conn = database._get_db_connection(); local_conn = True
+    if not conn: return []
+    prices = []
+    try:
+        cursor = conn.cursor()
+        cursor.row_factory = None
+        results = cursor.execute(sql, (asset_id, start or "0000-00-00", end or "9999-99-99")).fetchall()
+        events = load_adjustment_events(conn=conn)
+        if results and events is not None:
+            dates, closes = zip(*results)
+            _, price_factor = adjustment_factors(np.full(len(dates), asset_id), np.array(dates, dtype="datetime64[D]"), events)
+            adjusted = np.array(closes, dtype=np.float64) * price_factor
+            prices = [{"date": d, "close": c, "adjusted_close": a} for d, c, a in zip(dates, closes, adjusted.tolist())]
+    except sqlite3.Error as e: logging.error(f"Database error getting adjusted prices for asset ID {asset_id}: {e}")
+    finally:
+        if local_conn and conn: conn.close()
+    return prices
+
+
+# --- Dividend Projections ---
+
+# Dividend history per held asset, newest first: its most recent recorded dividends plus every announced one
+# (read through the (asset_id, action_type, ex_date) index instead of the whole history), or for assets without
+# any recorded dividends, the dividends actually received (per share = amount received / position held that day)
+_RECENT_DIVIDENDS_SQL = """
+    WITH held AS MATERIALIZED ( -- Computed once per holding: the ex-date from which its dividends are needed
+        SELECT asset_id, quantity,
+               MIN(:today, COALESCE((SELECT c.ex_date FROM corporate_actions c WHERE c.asset_id = holdings.asset_id AND c.action_type = 'Dividend'
+                                     ORDER BY c.ex_date DESC LIMIT 1 OFFSET :cadence_events - 1), '')) AS dividends_since
+        FROM holdings WHERE quantity > 0)
+    SELECT e.asset_id, e.ex_date, julianday(e.pay_date) - julianday(e.ex_date), e.amount, e.currency, h.quantity, a.ticker, a.name
+    FROM (SELECT c.asset_id, c.ex_date, c.pay_date, c.amount, c.currency
+          FROM held h JOIN corporate_actions c ON c.asset_id = h.asset_id AND c.action_type = 'Dividend' AND c.ex_date >= h.dividends_since
+          UNION ALL
+          SELECT t.asset_id, substr(t.date, 1, 10), NULL,
+                 SUM(COALESCE(t.quantity, 1) * t.price) / (SELECT h.quantity FROM holdings_history h WHERE h.asset_id = t.asset_id AND h.date <= t.date
+                                                           ORDER BY h.date DESC, h.transaction_id DESC LIMIT 1),
+                 t.currency
+          FROM transactions t JOIN held USING (asset_id)
+          WHERE t.transaction_type = 'Dividend'
+            AND NOT EXISTS (SELECT 1 FROM corporate_actions c WHERE c.asset_id = t.asset_id AND c.action_type = 'Dividend')
+          GROUP BY t.asset_id, substr(t.date, 1, 10), t.currency) e
+    JOIN held h USING (asset_id) JOIN assets a ON a.id = e.asset_id
+    WHERE e.amount > 0
+    ORDER BY e.asset_id, e.ex_date DESC"""
+
+def _project_dividends(events, today, end):
+    """Announced events in (today, end] plus dates extrapolated from each asset's recent cadence, for all assets at once.
+    events are rows of _RECENT_DIVIDENDS_SQL. Each asset's last _CADENCE_EVENTS ex-dates give its average interval;
+    projections are last ex-date + k * interval for k = 1..last step inside the window (expanded with np.repeat,
+    no per-asset loop). Returns (row index of the source event, ex-date, estimated) arrays."""
+    asset_id = np.array([e[0] for e in events], dtype=np.int64)
+    ex_date = np.array([e[1][:10] for e in events], dtype="datetime64[D]")
+    today, end = np.datetime64(today, "D"), np.datetime64(end, "D")
+    n = len(events)
+    starts = np.ones(n, dtype=bool)
+    starts[1:] = asset_id[1:] != asset_id[:-1]
+    first = np.flatnonzero(starts) # Newest event of each asset
+    counts = np.minimum(np.diff(np.append(first, n)), _CADENCE_EVENTS)
+    last_ex = ex_date[first]
+    span = (last_ex - ex_date[first + counts - 1]).astype(np.float64)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        interval = np.where(counts >= 2, span / (counts - 1), np.nan)
+        eligible = ((interval >= _MIN_DIVIDEND_INTERVAL) & (interval <= _MAX_DIVIDEND_INTERVAL)
+                    & ((today - last_ex).astype(np.float64) <= 2 * interval)) # Two missed payments: treat as suspended
+        last_step = np.where(eligible, np.floor((end - last_ex).astype(np.float64) / interval), 0).astype(np.int64)
+    last_step = np.maximum(last_step, 0)
+    # Range expansion: one output row per (asset, k) with k = 1..last_step
+    owner = np.repeat(np.arange(len(first)), last_step)
+    k = np.arange(len(owner)) - np.repeat(np.cumsum(last_step) - last_step, last_step) + 1
+    projected = last_ex[owner] + np.round(k * interval[owner]).astype(np.int64).astype("timedelta64[D]")
+    future = projected > today
+    announced = np.flatnonzero((ex_date > today) & (ex_date <= end))
+    source = np.concatenate((first[owner][future], announced))
+    dates = np.concatenate((projected[future], ex_date[announced]))
+    estimated = np.concatenate((np.ones(future.sum(), dtype=bool), np.zeros(len(announced), dtype=bool)))
+    return source, dates, estimated
+
+@database.cached_by_versions("transactions", "corporate_actions")
+def _upcoming_dividends(horizon_days, today, conn=None):
+    end = (datetime.date.fromisoformat(today) + datetime.timedelta(days=horizon_days)).isoformat()
+    try:
+        cursor = conn.cursor()
+        cursor.row_factory = None
+        events = cursor.execute(_RECENT_DIVIDENDS_SQL, {"today": today, "cadence_events": _CADENCE_EVENTS}).fetchall()
+    except sqlite3.Error as e:
+        logging.error(f"Database error projecting dividends: {e}")
+        return None
+    if not events: return []
+    source, dates, estimated = _project_dividends(events, today, end)
+    pay_lag = np.array([np.nan if e[2] is None else e[2] for e in events])[source]
+    pay_dates = dates + np.where(np.isnan(pay_lag), np.timedelta64("NaT"), np.round(np.nan_to_num(pay_lag)).astype(np.int64).astype("timedelta64[D]"))
+    tickers = np.array([e[6] or "" for e in events])
+    order = np.lexsort((np.unique(tickers, return_inverse=True)[1][source], dates)) # By date, then ticker
+    rows = []
+    for index, date, pay_date, is_estimate in zip(source[order].tolist(), np.datetime_as_string(dates[order]).tolist(),
+                                                  np.datetime_as_string(pay_dates[order]).tolist(), estimated[order].tolist()):
+        asset_id, _, _, amount, currency, quantity, ticker, name = events[index]
+        rows.append({"asset_id": asset_id, "ticker": ticker, "name": name, "date": date, "pay_date": None if pay_date == "NaT" else pay_date,
+                     "amount_per_share": amount, "currency": currency, "quantity": quantity, "amount": amount * quantity, "estimated": is_estimate})
+    return rows
+
+def get_upcoming_dividends(horizon_days=DEFAULT_DIVIDEND_HORIZON_DAYS, today=None, conn=None):
+    """Projects dividends for current holdings with an ex-date in (today, today + horizon_days], ordered by date.
+    Rows: asset_id, ticker, name, date (ex-date), pay_date, amount_per_share, currency, quantity (held now),
+    amount and estimated (False for announced events). Cached until transactions or corporate actions change.
+    Uses provided conn or creates a new one."""
+    today = today or datetime.date.today().isoformat()
+    return _upcoming_dividends(int(horizon_days), today, conn=conn) or []
+
+def get_projected_dividend_income(horizon_days=365, today=None, conn=None):
+    """Sums the projected dividends over the horizon per currency, as {currency: amount}."""
+    income = {}
+    for row in get_upcoming_dividends(horizon_days, today, conn=conn):
+        income[row["currency"]] = income.get(row["currency"], 0.0) + row["amount"]
+    return income
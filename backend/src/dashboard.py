@@ -0,0 +1,74 @@
+# src/dashboard.py
+# The whole dashboard payload (portfolio value and period returns, top movers, upcoming dividends, allocation)
+# from one call. Every part is cached with the tables it depends on (database.cached_by_versions), and so is
+# the assembled payload: a warm open is one data_versions read, and after a write only the parts depending
+# on the written tables are rebuilt.
+
+import datetime
+
+import fx
+import database
+import allocation
+import calculations
+import corporate_actions
+
+DEFAULT_MOVERS_PERIOD = "daily"
+MOVERS_COUNT = 5
+DIVIDEND_HORIZON_DAYS = corporate_actions.DEFAULT_DIVIDEND_HORIZON_DAYS
+
+# Dependencies of each part (the payload itself also depends on settings: base currency)
+_VALUATION_TABLES = ("transactions", "prices", "fx_rates", "portfolio_daily")
+_DIVIDEND_TABLES = ("transactions", "corporate_actions")
+
+
+# --- Parts ---
+
+@database.cached_by_versions(*_VALUATION_TABLES)
+def _returns_part(base_currency, today, conn=None):
+    """Period returns of the portfolio in base_currency."""
+    periods = calculations.get_period_returns(today=today, base_currency=base_currency, conn=conn)
+    if periods is None: return None
+    return {"changes": periods["returns"], "as_of": periods["as_of"]}
+
+@database.cached_by_versions(*_VALUATION_TABLES)
+def _allocation_part(base_currency, today, conn=None):
+    """Total value in base_currency and the allocation by asset type as chart data (labels and percent of value),
+    from one valuation: positions without a price count at cost in both, positions without an FX rate in neither
+    (they are passed on as unconverted, see allocation.get_allocation)."""
+    result = allocation.get_allocation("asset_type", base_currency=base_currency, today=today, conn=conn)
+    if result is None: return None
+    chart = {"labels": [group["label"] for group in result["groups"]], "values": [group["weight"] * 100 for group in result["groups"]]}
+    return {"total_value": result["total"], "chart": chart, "unconverted": result["unconverted"]}
+
+@database.cached_by_versions(*_VALUATION_TABLES)
+def _movers_part(period, base_currency, today, conn=None):
+    return calculations.get_movers(period, MOVERS_COUNT, today=today, base_currency=base_currency, conn=conn)
+
+@database.cached_by_versions(*_DIVIDEND_TABLES)
+def _dividends_part(today, conn=None):
+    return corporate_actions.get_upcoming_dividends(DIVIDEND_HORIZON_DAYS, today, conn=conn)
+
+
+# --- Payload ---
+
+@database.cached_by_versions(*_VALUATION_TABLES, "corporate_actions", "settings")
+def _dashboard(period, today, conn=None):
+    base_currency = fx.get_base_currency(conn=conn)
+    returns = _returns_part(base_currency, today, conn=conn)
+    movers = _movers_part(period, base_currency, today, conn=conn)
+    dividends = _dividends_part(today, conn=conn)
+    valuation = _allocation_part(base_currency, today, conn=conn)
+    if returns is None or movers is None or valuation is None: return None
+    return {"base_currency": base_currency, "as_of": returns["as_of"], "total_value": valuation["total_value"], "changes": returns["changes"],
+            "movers": movers, "dividends": dividends, "allocation": valuation["chart"], "unconverted": valuation["unconverted"]}
+
+def get_dashboard(period=DEFAULT_MOVERS_PERIOD, today=None, conn=None):
+    """The dashboard payload: base_currency, as_of, total_value (latest closes, or cost for positions without one,
+    as in the allocation), changes ({period: TWR} for calculations.PERIODS),
+    movers (for period, see calculations.get_movers), dividends (see corporate_actions.get_upcoming_dividends)
+    and allocation ({"labels", "values"} by asset type, in percent); unconverted lists positions left out of total_value and
+    allocation for lack of an FX rate (see allocation.get_allocation). Served from cache until a table it depends on
+    is written. Cached payloads are shared: callers must not mutate them. Returns None on error.
+    Uses provided conn or creates a new one."""
+    if period not in calculations.PERIODS: raise ValueError(f"Unknown dashboard period '{period}'.")
+    return _dashboard(period, today or datetime.date.today().isoformat(), conn=conn)
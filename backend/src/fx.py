@@ -0,0 +1,144 @@
+# src/fx.py
+# Currency conversion into the base currency (settings.base_currency) from the dated series in fx_rates.
+# Rates are looked up as of each date (the latest quote on or before it), through a pivot currency when no
+# direct pair is stored, and memoized per pair as one rate per calendar day so whole columns convert with a
+# single array index. Converters are cached until fx_rates changes (database.cached_by_versions).
+
+import sqlite3
+import logging
+import datetime
+import itertools
+import threading
+
+import numpy as np
+
+import database
+
+DEFAULT_BASE_CURRENCY = "USD"
+DEFAULT_PIVOT_CURRENCY = "USD" # Most providers quote every currency against the dollar
+
+
+# --- Loading ---
+
+def load_fx_series(conn=None):
+    """Loads all FX rates as {(base, quote): (days, rates)}, days being int64 days since 1970-01-01 in ascending order.
+    Uses provided conn or creates a new one."""
+    sql = "SELECT base, quote, date, rate FROM fx_rates ORDER BY base, quote, date"
+    local_conn = False
+    if conn is None: conn = database._get_db_connection(); local_conn = True
+    if not conn: return None
+    series = None
+    try:
+        cursor = conn.cursor()
+        cursor.row_factory = None
+        series = {}
+        for pair, rows in itertools.groupby(cursor.execute(sql).fetchall(), key=lambda row: (row[0], row[1])):
+            _, _, dates, rates = zip(*rows)
+            series[pair] = (np.array([d[:10] for d in dates], dtype="datetime64[D]").astype(np.int64), np.array(rates, dtype=np.float64))
+        logging.debug(f"Loaded FX series for {len(series)} currency pairs.")
+    except sqlite3.Error as e: logging.error(f"Database error loading FX rates: {e}")
+    finally:
+        if local_conn and conn: conn.close()
+    return series
+
+
+# --- Conversion ---
+
+class FxConverter:
+    """Converts amounts between currencies as of given dates.
+    series is {(base, quote): (days, rates)} as returned by load_fx_series (rate = units of quote per unit of base).
+    A pair is resolved from its direct quote, the inverse quote, or the two legs through pivot. Dates before the
+    first quote use the first rate; pairs that cannot be resolved convert to NaN."""
+
+    def __init__(self, series, pivot=DEFAULT_PIVOT_CURRENCY):
+        self.series = series
+        self.pivot = pivot
+        self._daily = {} # (from, to) -> (first day, rate per day from it) or None; the per (pair, date) memo
+        self._lock = threading.Lock()
+
+    def _direct(self, source, target):
+        if (source, target) in self.series: return self.series[(source, target)]
+        if (target, source) in self.series:
+            days, rates = self.series[(target, source)]
+            return days, 1.0 / rates
+        return None
+
+    def _daily_rates(self, source, target):
+        """Rate from source to target for every day between the first and last quote of its legs (memoized)."""
+        pair = (source, target)
+        if pair in self._daily: return self._daily[pair]
+        legs = [self._direct(source, target)]
+        if legs[0] is None and self.pivot not in pair: legs = [self._direct(source, self.pivot), self._direct(self.pivot, target)]
+        daily = None
+        if all(leg is not None for leg in legs):
+            first = min(int(days[0]) for days, _ in legs)
+            grid = np.arange(first, max(int(days[-1]) for days, _ in legs) + 1, dtype=np.int64)
+            rates = np.ones(len(grid), dtype=np.float64)
+            for days, leg_rates in legs: # As-of join of the calendar against each leg
+                rates *= leg_rates[np.maximum(np.searchsorted(days, grid, side="right") - 1, 0)]
+            daily = (first, rates)
+        else: logging.warning(f"No FX rates to convert {source} to {target} (directly or via {self.pivot}).")
+        with self._lock: self._daily[pair] = daily
+        return daily
+
+    def rates(self, currencies, target, dates):
+        """Rates converting each amount's currency to target as of its date.
+        currencies is a sequence of currency codes and dates a datetime64[D] array (or ISO strings) of the same length."""
+        dates = np.asarray(dates, dtype="datetime64[D]").astype(np.int64)
+        result = np.ones(len(dates), dtype=np.float64)
+        if not len(dates): return result
+        codes, inverse = np.unique(np.asarray(currencies, dtype=str), return_inverse=True)
+        for code_index, code in enumerate(codes):
+            if code == target: continue
+            rows = inverse == code_index
+            daily = self._daily_rates(code, target)
+            if daily is None:
+                result[rows] = np.nan
+                continue
+            first, rates = daily # Past the last quote the last rate holds
+            result[rows] = rates[np.clip(dates[rows] - first, 0, len(rates) - 1)]
+        return result
+
+    def rate(self, source, target, date):
+        """Rate converting one unit of source into target as of date (ISO string or date)."""
+        return float(self.rates([source], target, [str(date)[:10]])[0])
+
+    def convert(self, amounts, currencies, target, dates):
+        """Converts an array of amounts in the given currencies into target as of each date."""
+        return np.asarray(amounts, dtype=np.float64) * self.rates(currencies, target, dates)
+
+@database.cached_by_versions("fx_rates")
+def get_fx_converter(pivot=DEFAULT_PIVOT_CURRENCY, conn=None):
+    """FxConverter over all stored rates, shared until fx_rates is written (its memo survives between calls).
+    Uses provided conn or creates a new one. Returns None on database errors."""
+    series = load_fx_series(conn=conn)
+    return FxConverter(series, pivot) if series is not None else None
+
+def get_base_currency(conn=None):
+    """The reporting currency from settings, DEFAULT_BASE_CURRENCY if unset."""
+    return database.get_setting("base_currency", conn=conn) or DEFAULT_BASE_CURRENCY
+
+def convert_amounts(amounts, currencies, dates, base_currency=None, conn=None):
+    """Converts amounts (in currencies, as of dates) into base_currency (default: the base currency setting).
+    Returns a list of floats (None where no rate is known). Uses provided conn or creates a new one."""
+    local_conn = False
+    if conn is None: conn = database._get_db_connection(); local_conn = True
+    if not conn: return None
+    try:
+        converter = get_fx_converter(conn=conn)
+        if converter is None: return None
+        converted = converter.convert(amounts, currencies, base_currency or get_base_currency(conn=conn), [str(d)[:10] for d in dates])
+        return [None if np.isnan(value) else float(value) for value in converted]
+    finally:
+        if local_conn and conn: conn.close()
+
+def convert_transaction_arrays(arrays, converter, base_currency):
+    """Copy of transaction arrays (see calculations.load_transaction_arrays with with_currency=True) with price and
+    fees converted into base_currency at each transaction's date, so cost basis and realized P&L come out in it
+    (calculations.get_holdings_in_base_currency)."""
+    rates = converter.rates(arrays["currency"], base_currency, arrays["date"])
+    converted = dict(arrays)
+    converted["price"] = arrays["price"] * rates
+    converted["fees"] = arrays["fees"] * rates
+    return converted
+
@@ -0,0 +1,308 @@
+# src/import_pipeline.py
+# Parallel import of broker statements in three stages connected by bounded queues (a full queue blocks the
+# stage feeding it, so memory stays flat however many and however large the files are):
+#   parse    statement files are parsed in a process pool, one file per worker, into batches of fingerprinted
+#            records (parsers.ibkr_parser / parsers.revolut_parser, detected from the file's first line)
+#   resolve  one thread normalizes the records and resolves their assets through a ticker/ISIN -> id map
+#            preloaded from assets; an unknown asset is handed to the writer once, with the first batch using it
+#   write    the calling thread, which owns the connection, creates new assets and bulk-inserts every batch;
+#            holdings of the assets written are replayed once before each commit rather than after every batch
+# mode "atomic" commits the whole import at once (or nothing); "resumable" commits every commit_every batches
+# together with a checkpoint in settings, and a rerun over the same files skips the batches already committed;
+# run as a server job, it lets queued writes run between its commits, while an atomic import holds them off to the end.
+# Rows already in the database are skipped by fingerprint either way. Progress and per-stage throughput go
+# through jobs.report_progress, so an import run as an IPC job sends progress lines and can be cancelled.
+
+import os
+import csv
+import json
+import time
+import queue
+import logging
+import sqlite3
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import jobs
+import database
+from parsers import ibkr_parser, revolut_parser
+
+DEFAULT_BATCH_SIZE = 5000
+DEFAULT_COMMIT_EVERY = 10 # Batches per commit in resumable mode
+QUEUE_BATCHES = 4 # Capacity of each stage queue, in batches
+MODES = ("atomic", "resumable")
+BROKERS = ("ibkr", "revolut")
+CHECKPOINT_SETTING = "import_pipeline_checkpoint" # JSON: {"batch_size", "files": {path: {"size", "mtime", "batches"}}}
+
+
+class PipelineError(Exception):
+    """Raised when a statement cannot be imported (unknown format, unreadable file, failed write)."""
+
+
+def detect_broker(path):
+    """Broker of a statement file ("ibkr" or "revolut") from its first line, or None."""
+    with open(path, newline="", encoding="utf-8-sig") as handle:
+        first_line = handle.readline()
+    if first_line.startswith("Statement,"): return "ibkr"
+    if {"Date", "Ticker", "Type"} <= {field.strip() for field in first_line.split(",")}: return "revolut"
+    return None
+
+
+# --- Parse Stage (worker processes) ---
+
+_parse_output = None # The parse queue, handed to each worker process by _init_parse_worker
+
+def _init_parse_worker(output):
+    global _parse_output
+    _parse_output = output
+
+def _parse_file(index, path, broker, batch_size, skip_batches, output=None):
+    """Parses one file, putting ("batch", index, number, records, seconds) on the parse queue for every batch
+    after the first skip_batches and finally ("done", index, rows, error). Both parsers fingerprint their records
+    from content and occurrence in the file, so a rerun produces the same fingerprints."""
+    output = output or _parse_output
+    rows, error = 0, None
+    try:
+        broker = broker or detect_broker(path)
+        if broker == "ibkr": batches = ibkr_parser.parse_ibkr_statement(path, batch_size)
+        elif broker == "revolut": batches = revolut_parser.parse_revolut_statement(path, batch_size=batch_size)
+        else: raise PipelineError("unrecognized statement format")
+        start = time.perf_counter()
+        for number, batch in enumerate(batches):
+            rows += len(batch)
+            if number >= skip_batches: output.put(("batch", index, number, batch, time.perf_counter() - start))
+            start = time.perf_counter() # Time blocked on a full queue is not parse time
+    except (OSError, UnicodeDecodeError, csv.Error, PipelineError) as e:
+        error = f"{path}: {e}"
+    output.put(("done", index, rows, error))
+
+class _ParseStage:
+    """Runs _parse_file for every file: in a process pool with a bounded multiprocessing queue, or (one worker)
+    in a thread with a bounded in-process queue."""
+
+    def __init__(self, files, broker, batch_size, workers):
+        arguments = [(index, f["path"], broker, batch_size, f["skip_batches"]) for index, f in enumerate(files)]
+        if workers > 1:
+            context = multiprocessing.get_context("spawn") # Forking a process that runs threads (the IPC server) is unsafe
+            self.queue = context.Queue(QUEUE_BATCHES)
+            self._pool = ProcessPoolExecutor(workers, mp_context=context, initializer=_init_parse_worker, initargs=(self.queue,))
+            self._futures = [self._pool.submit(_parse_file, *args) for args in arguments]
+        else:
+            self.queue = queue.Queue(QUEUE_BATCHES)
+            self._pool = ThreadPoolExecutor(1, thread_name_prefix="pit-import-parse")
+            self._futures = [self._pool.submit(_parse_file, *args, output=self.queue) for args in arguments]
+
+    def failure(self):
+        """Error of a worker that failed without reporting (its file never gets a "done" message), or None."""
+        for future in self._futures:
+            if future.done() and not future.cancelled() and future.exception() is not None: return repr(future.exception())
+        return None
+
+    def close(self):
+        """Stops the workers, discarding whatever they still produce so none stays blocked on a full queue."""
+        draining = threading.Event()
+        def drain():
+            while not draining.is_set():
+                try: self.queue.get(timeout=0.05)
+                except queue.Empty: pass
+        drainer = threading.Thread(target=drain, daemon=True)
+        drainer.start()
+        self._pool.shutdown(wait=True, cancel_futures=True)
+        draining.set()
+        drainer.join()
+
+
+# --- Resolve Stage ---
+
+class _StageStats:
+    """Rows, batches and busy seconds of one stage."""
+    __slots__ = ("rows", "batches", "busy")
+
+    def __init__(self):
+        self.rows, self.batches, self.busy = 0, 0, 0.0
+
+    def add(self, rows, seconds):
+        self.rows += rows
+        self.batches += 1
+        self.busy += seconds
+
+    def to_dict(self):
+        return {"rows": self.rows, "batches": self.batches, "busy_s": round(self.busy, 3),
+                "rows_per_sec": round(self.rows / self.busy) if self.busy else None}
+
+def _load_asset_ids(conn):
+    """ticker -> id and ISIN -> id for every asset."""
+    asset_ids = {}
+    for asset_id, ticker, isin in conn.execute("SELECT id, ticker, isin FROM assets").fetchall():
+        if isin: asset_ids[isin] = asset_id
+        if ticker: asset_ids[ticker] = asset_id
+    return asset_ids
+
+def _normalize(record):
+    """Record with trimmed identifiers and an upper-case currency, or None if it lacks a valid date, type or currency."""
+    date, currency = record.get("date") or "", (record.get("currency") or "").strip().upper()
+    if len(date) != 10 or date[4] != "-" or date[7] != "-" or not record.get("transaction_type") or not currency: return None
+    record["ticker"] = (record.get("ticker") or "").strip() or None
+    record["isin"] = (record.get("isin") or "").strip().upper() or None
+    record["currency"] = currency
+    return record
+
+def _put(target, item, stop):
+    """Puts item on a bounded queue, giving up if stop is set while it is full."""
+    while not stop.is_set():
+        try:
+            target.put(item, timeout=0.1)
+            return True
+        except queue.Full: pass
+    return False
+
+def _resolve_stage(parse, write_queue, files, asset_ids, stats, stop):
+    """Resolve stage thread: turns parse messages into ("batch", index, number, records, new_assets, invalid) for the
+    writer, sets asset_id from asset_ids and ends with ("error", message) or None. Records parse and resolve stats."""
+    announced = set() # Assets already handed to the writer for creation
+    remaining = len(files)
+    outcome = None
+    try:
+        while remaining and not stop.is_set():
+            try: message = parse.queue.get(timeout=0.1)
+            except queue.Empty:
+                failure = parse.failure()
+                if failure: outcome = ("error", f"Parse stage failed: {failure}"); break
+                continue
+            if message[0] == "done":
+                _, index, rows, error = message
+                if error: outcome = ("error", error); break
+                files[index]["rows"] = rows
+                remaining -= 1
+                continue
+            _, index, number, records, parse_seconds = message
+            stats["parse"].add(len(records), parse_seconds)
+            start = time.perf_counter()
+            resolved, new_assets = [], []
+            for record in records:
+                if _normalize(record) is None: continue
+                key = record["ticker"] or record["isin"]
+                record["asset_id"] = (asset_ids.get(record["ticker"]) or asset_ids.get(record["isin"])) if key else None
+                if key and record["asset_id"] is None and key not in announced:
+                    announced.add(key)
+                    new_assets.append({"ticker": record["ticker"], "name": key, "asset_type": record.get("asset_type") or "Stock",
+                                       "currency": record["currency"], "isin": record["isin"]})
+                resolved.append(record)
+            stats["resolve"].add(len(records), time.perf_counter() - start)
+            if not _put(write_queue, ("batch", index, number, resolved, new_assets, len(records) - len(resolved)), stop): return
+    except Exception as e: # Reported to the writer, which raises it in the calling thread
+        logging.exception("Import resolve stage failed")
+        outcome = ("error", f"Resolve stage failed: {e}")
+    _put(write_queue, outcome, stop)
+
+
+# --- Write Stage and Entry Point ---
+
+def _file_state(path):
+    stat = os.stat(path)
+    return {"size": stat.st_size, "mtime": int(stat.st_mtime)}
+
+def _load_checkpoint(paths, batch_size, conn):
+    """Batches already committed per file by an interrupted resumable import of the same (unchanged) files."""
+    raw = database.get_setting(CHECKPOINT_SETTING, conn=conn)
+    try: checkpoint = json.loads(raw) if raw else {}
+    except ValueError: checkpoint = {}
+    if checkpoint.get("batch_size") != batch_size: return {}
+    committed = {}
+    for path in paths:
+        entry = checkpoint.get("files", {}).get(path)
+        if entry and {"size": entry["size"], "mtime": entry["mtime"]} == _file_state(path): committed[path] = entry["batches"]
+    return committed
+
+def _write_checkpoint(cursor, files, batch_size):
+    state = {"batch_size": batch_size, "files": {f["path"]: {**f["state"], "batches": f["written"]} for f in files}}
+    database._write_setting(cursor, CHECKPOINT_SETTING, json.dumps(state))
+
+def import_statements(paths, broker=None, mode="atomic", workers=None, batch_size=DEFAULT_BATCH_SIZE,
+                      commit_every=DEFAULT_COMMIT_EVERY, conn=None):
+    """Imports broker statement files through the parse/resolve/write pipeline (see the module header).
+    broker ("ibkr" or "revolut") applies to every file; None detects each file's format. workers is the number of
+    parse processes (default: one per file up to the CPU count less one; 1 parses in a thread). mode "atomic"
+    commits everything or nothing, "resumable" commits every commit_every batches and resumes from there.
+    Uses provided conn or creates a new one.
+    Returns {"files", "rows", "inserted", "duplicates", "invalid", "assets_created", "resumed_batches", "elapsed_s",
+    "stages": {stage: {rows, batches, busy_s, rows_per_sec}}}, or None on error."""
+    paths = [str(paths)] if isinstance(paths, (str, os.PathLike)) else [str(path) for path in paths]
+    if mode not in MODES or broker not in BROKERS + (None,) or not paths:
+        logging.error(f"Invalid statement import: mode '{mode}', broker '{broker}', {len(paths)} files.")
+        return None
+    workers = workers or min(len(paths), max(1, (os.cpu_count() or 2) - 1))
+    local_conn = False
+    if conn is None: conn = database._get_db_connection(); local_conn = True
+    if not conn: return None
+    started = time.perf_counter()
+    stop = threading.Event()
+    parse, resolver = None, None
+    summary = None
+    try:
+        committed = _load_checkpoint(paths, batch_size, conn) if mode == "resumable" else {}
+        files = [{"path": path, "state": _file_state(path), "skip_batches": committed.get(path, 0), "written": committed.get(path, 0),
+                  "rows": 0} for path in paths]
+        stats = {"parse": _StageStats(), "resolve": _StageStats(), "write": _StageStats()}
+        write_queue = queue.Queue(QUEUE_BATCHES)
+        parse = _ParseStage(files, broker, batch_size, workers)
+        resolver = threading.Thread(target=_resolve_stage, args=(parse, write_queue, files, _load_asset_ids(conn), stats, stop),
+                                    name="pit-import-resolve", daemon=True)
+        resolver.start()
+        created, totals, uncommitted = {}, {"inserted": 0, "invalid": 0, "assets_created": 0}, 0
+        changed = {} # Assets written since the last commit -> earliest date: holdings are replayed once per commit, not per batch
+        cursor = conn.cursor()
+        if not conn.in_transaction: cursor.execute("BEGIN IMMEDIATE") # Resolution and writes see one consistent assets table
+        while (message := write_queue.get()) is not None:
+            if message[0] == "error": raise PipelineError(message[1])
+            if not conn.in_transaction: cursor.execute("BEGIN IMMEDIATE") # Resumable: reopened with the first batch after each commit
+            _, index, number, records, new_assets, invalid = message
+            start = time.perf_counter()
+            if new_assets:
+                id_map = database.bulk_upsert_assets(new_assets, conn=conn, commit=False)
+                if id_map is None: raise PipelineError("asset upsert failed")
+                created.update(id_map)
+                totals["assets_created"] += len(new_assets)
+            for record in records:
+                if record["asset_id"] is None and (record["ticker"] or record["isin"]): record["asset_id"] = created.get(record["ticker"] or record["isin"])
+            inserted = database.bulk_add_transactions(records, conn=conn, commit=False, changed=changed)
+            if inserted is None: raise PipelineError("transaction insert failed")
+            totals["inserted"] += inserted
+            totals["invalid"] += invalid
+            files[index]["written"] = number + 1 # A file's batches arrive in order
+            uncommitted += 1
+            if mode == "resumable" and uncommitted >= commit_every:
+                database._refresh_holdings(conn, changed)
+                changed.clear()
+                _write_checkpoint(cursor, files, batch_size)
+                conn.commit() # The progress report below is then outside a transaction: server writes can go in between
+                uncommitted = 0
+            stats["write"].add(len(records), time.perf_counter() - start)
+            jobs.report_progress(stats["write"].rows, None, f"{stats['write'].rows} rows written",
+                                 stages={name: stage.to_dict() for name, stage in stats.items()}) # Stops here if cancelled
+        start = time.perf_counter()
+        database._refresh_holdings(conn, changed)
+        stats["write"].busy += time.perf_counter() - start
+        if mode == "resumable": cursor.execute("DELETE FROM settings WHERE key = ?", (CHECKPOINT_SETTING,))
+        conn.commit()
+        summary = {"files": len(files), "rows": sum(f["rows"] for f in files), "inserted": totals["inserted"],
+                   "duplicates": stats["write"].rows - totals["inserted"], "invalid": totals["invalid"],
+                   "assets_created": totals["assets_created"], "resumed_batches": sum(f["skip_batches"] for f in files),
+                   "elapsed_s": round(time.perf_counter() - started, 3), "stages": {name: stage.to_dict() for name, stage in stats.items()}}
+        logging.info(f"Imported {summary['inserted']} transactions from {len(files)} statements ({summary['duplicates']} duplicates, "
+                     f"{summary['invalid']} invalid) in {summary['elapsed_s']} s.")
+    except jobs.JobCancelled:
+        logging.info("Statement import cancelled, rolling back the uncommitted batches.")
+        conn.rollback()
+        raise
+    except (PipelineError, sqlite3.Error, OSError) as e:
+        logging.error(f"Error importing statements, rolling back{' to the last checkpoint' if mode == 'resumable' else ''}: {e}")
+        if conn.in_transaction: conn.rollback()
+        summary = None
+    finally:
+        stop.set()
+        if parse is not None: parse.close()
+        if resolver is not None: resolver.join()
+        if local_conn and conn: conn.close()
+    return summary
@@ -0,0 +1,214 @@
+# src/ipc_codec.py
+# Response encodings for the IPC layer, negotiated per request (see ipc_handler.iter_response_lines):
+#   "json"      the result as is (list of row dicts, every row repeating its keys)
+#   "columnar"  every list of row dicts becomes {"$columns": [names], "$values": [[column values], ...]}:
+#               key names are sent once and each column is one JSON array
+#   "binary"    a tabular result (list of flat row dicts, or a dict of equal-length lists) as a typed
+#               columnar frame, base64-wrapped in the JSON line; numeric columns decode straight into typed arrays
+# JSON text is produced by orjson when it is installed (PIT_JSON_BACKEND=json forces the stdlib); either way
+# non-string dict keys (asset ids, dates) are written as strings, as the stdlib does.
+#
+# Binary frame layout (little endian):
+#   magic b"PITF" + u8 version, u32 frame length, u32 rows, u16 columns,
+#   per column: u16 name length, name, u8 column type, u32 null bitmap length, null bitmap,
+#               u32 body length, zero padding to an 8-byte offset, body
+# Bodies: float f8 (nulls stored as NaN), int i8, bool u1, date i4 days since 1970-01-01,
+# text a JSON array of strings. Frames are length-prefixed, so chunks can be concatenated.
+
+import os
+import sys
+import json
+import base64
+import struct
+import logging
+import datetime
+import operator
+from array import array
+
+import numpy as np
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+ENCODINGS = ("json", "columnar", "binary")
+FRAME_MAGIC = b"PITF"
+FRAME_VERSION = 1
+JSON_BACKEND = "orjson" if orjson is not None and os.environ.get("PIT_JSON_BACKEND", "auto") != "json" else "json"
+
+_FLOAT, _INT, _BOOL, _DATE, _TEXT = range(5)
+_EPOCH_ORDINAL = datetime.date(1970, 1, 1).toordinal()
+_FRAME_HEADER = struct.Struct("<4sBIIH")
+_CONTAINERS = {dict, list}
+_BIG_ENDIAN_HOST = sys.byteorder == "big"
+
+
+class EncodingError(Exception):
+    """Raised when a result cannot be encoded as requested."""
+
+
+# --- JSON ---
+
+def dumps(value):
+    """JSON text of value with the selected backend (orjson writes NaN as null, the stdlib as NaN)."""
+    if JSON_BACKEND == "orjson": return orjson.dumps(value, option=orjson.OPT_NON_STR_KEYS).decode("utf-8")
+    return json.dumps(value)
+
+
+# --- Columnar ---
+
+def _is_row_list(value):
+    if not isinstance(value, list) or not value: return False
+    kinds = set(map(type, value))
+    return kinds == {dict} or all(issubclass(kind, dict) for kind in kinds)
+
+def _columns(rows):
+    """(names, columns) of row dicts, names in first-seen order (rows missing a key get None)."""
+    names = list(rows[0])
+    if set(map(len, rows)) == {len(names)}: # Same size and (unless a KeyError says otherwise) the same keys: one query's rows
+        try: return names, [list(map(operator.itemgetter(name), rows)) for name in names]
+        except KeyError: pass
+    names = list(dict.fromkeys(name for row in rows for name in row))
+    return names, [[row.get(name) for row in rows] for name in names]
+
+def _nested(column):
+    return not _CONTAINERS.isdisjoint(map(type, column))
+
+def to_columnar(value):
+    """Replaces every list of row dicts in value (at any depth) with {"$columns", "$values"}."""
+    if _is_row_list(value):
+        names, columns = _columns(value)
+        return {"$columns": names, "$values": [[to_columnar(item) for item in column] if _nested(column) else column for column in columns]}
+    if isinstance(value, dict): return {key: to_columnar(item) for key, item in value.items()}
+    if isinstance(value, list): return [to_columnar(item) for item in value]
+    return value
+
+def from_columnar(value):
+    """Inverse of to_columnar."""
+    if isinstance(value, dict):
+        if value.keys() == {"$columns", "$values"}:
+            names, columns = value["$columns"], [[from_columnar(item) for item in column] for column in value["$values"]]
+            return [dict(zip(names, row)) for row in zip(*columns)]
+        return {key: from_columnar(item) for key, item in value.items()}
+    if isinstance(value, list): return [from_columnar(item) for item in value]
+    return value
+
+
+# --- Binary Frames ---
+
+def _is_iso_date(value):
+    return len(value) == 10 and value[4] == "-" and value[7] == "-" and value[:4].isdigit() and value[5:7].isdigit() and value[8:].isdigit()
+
+def tabular_columns(value):
+    """(names, columns) of a tabular result: a list of flat row dicts or a dict of equal-length lists; None otherwise."""
+    if _is_row_list(value):
+        names, columns = _columns(value)
+    elif isinstance(value, dict) and value and all(isinstance(column, list) for column in value.values()):
+        names, columns = list(value), list(value.values())
+        if len({len(column) for column in columns}) != 1: return None
+    else: return None
+    if any(_nested(column) for column in columns): return None
+    return names, columns
+
+def _column_type(values):
+    kinds = set(map(type, values))
+    kinds.discard(type(None))
+    if not kinds or kinds <= {float, int} and float in kinds: return _FLOAT
+    if kinds == {bool}: return _BOOL
+    if kinds == {int}:
+        present = [v for v in values if v is not None] if None in values else values
+        return _INT if -2 ** 63 <= min(present) and max(present) < 2 ** 63 else _FLOAT
+    if kinds == {str}: return _DATE if all(_is_iso_date(v) for v in values[:100] if v is not None) else _TEXT # Sampled; _encode_body checks all
+    raise EncodingError(f"Cannot encode a column of {', '.join(sorted(k.__name__ for k in kinds))} values")
+
+def _null_bitmap(values):
+    bits = bytearray((len(values) + 7) // 8)
+    for i, value in enumerate(values):
+        if value is None: bits[i >> 3] |= 1 << (i & 7)
+    return bytes(bits)
+
+def _little_endian(typecode, values):
+    packed = array(typecode, values) # Native byte order
+    if _BIG_ENDIAN_HOST: packed.byteswap()
+    return packed.tobytes()
+
+def _encode_body(kind, values):
+    if kind == _FLOAT: return _little_endian("d", [float("nan") if v is None else v for v in values] if None in values else values)
+    if kind == _INT: return _little_endian("q", [0 if v is None else v for v in values] if None in values else values)
+    if kind == _BOOL: return bytes(1 if v else 0 for v in values)
+    if kind == _DATE:
+        if {len(v) for v in values if v is not None} != {10}: raise ValueError("Not all values are dates") # numpy would truncate timestamps
+        days = np.array(values, dtype="datetime64[D]") # Parsed in C; raises ValueError for other text, None is NaT
+        return np.where(np.isnat(days), 0, days.astype(np.int64)).astype("<i4").tobytes()
+    return dumps(values).encode("utf-8")
+
+def encode_frame(value):
+    """Binary frame (bytes) of a tabular result; raises EncodingError for anything else."""
+    table = tabular_columns(value)
+    if table is None: raise EncodingError("Binary frames need a list of flat rows or a dict of equal-length columns")
+    names, columns = table
+    rows = len(columns[0]) if columns else 0
+    parts = []
+    offset = _FRAME_HEADER.size
+    for name, values in zip(names, columns):
+        kind = _column_type(values)
+        nulls = _null_bitmap(values) if kind != _FLOAT and None in values else b""
+        try: body = _encode_body(kind, values)
+        except ValueError: # Date-like sample, but not every value is an ISO date
+            if kind != _DATE: raise
+            kind, body = _TEXT, _encode_body(_TEXT, values)
+        encoded_name = str(name).encode("utf-8")
+        header = struct.pack("<H", len(encoded_name)) + encoded_name + struct.pack("<BI", kind, len(nulls)) + nulls + struct.pack("<I", len(body))
+        padding = b"\0" * (-(offset + len(header)) % 8) # Typed arrays over the frame need aligned bodies
+        parts += [header, padding, body]
+        offset += len(header) + len(padding) + len(body)
+    return _FRAME_HEADER.pack(FRAME_MAGIC, FRAME_VERSION, offset, rows, len(names)) + b"".join(parts)
+
+def decode_frame(frame):
+    """Decodes a binary frame into {name: list of values} (dates as ISO strings, NaN floats as None)."""
+    magic, version, length, rows, count = _FRAME_HEADER.unpack_from(frame)
+    if magic != FRAME_MAGIC or version != FRAME_VERSION: raise EncodingError("Not a PITF frame of a supported version")
+    offset, columns = _FRAME_HEADER.size, {}
+    for _ in range(count):
+        (name_length,) = struct.unpack_from("<H", frame, offset)
+        name = bytes(frame[offset + 2:offset + 2 + name_length]).decode("utf-8")
+        offset += 2 + name_length
+        kind, nulls_length = struct.unpack_from("<BI", frame, offset)
+        nulls = frame[offset + 5:offset + 5 + nulls_length]
+        offset += 5 + nulls_length
+        (body_length,) = struct.unpack_from("<I", frame, offset)
+        offset += 4
+        offset += -offset % 8
+        body = bytes(frame[offset:offset + body_length])
+        offset += body_length
+        if kind == _FLOAT: values = [None if v != v else v for v in np.frombuffer(body, "<f8").tolist()]
+        elif kind == _INT: values = np.frombuffer(body, "<i8").tolist()
+        elif kind == _BOOL: values = [bool(b) for b in body]
+        elif kind == _DATE: values = [datetime.date.fromordinal(d + _EPOCH_ORDINAL).isoformat() for d in np.frombuffer(body, "<i4").tolist()]
+        else: values = json.loads(body)
+        if nulls: values = [None if nulls[i >> 3] >> (i & 7) & 1 else v for i, v in enumerate(values)]
+        columns[name] = values
+    return columns
+
+
+# --- Negotiation ---
+
+def _has_rows(value):
+    if _is_row_list(value): return True
+    if isinstance(value, dict): return any(_has_rows(item) for item in value.values())
+    return False
+
+def encode(result, accepted):
+    """Encodes result with the first encoding in accepted (a name or a preference list) that suits it: binary for
+    tabular results, columnar when result holds lists of row dicts, json otherwise (and for unknown names).
+    Returns (encoding, payload): payload is the result itself (json), its columnar form, or the base64 text
+    of its binary frame, ready to be sent as the response's "data"."""
+    for encoding in [accepted] if isinstance(accepted, str) else (accepted or []):
+        if encoding == "binary" and (_is_row_list(result) or isinstance(result, dict) and result):
+            try: return "binary", base64.b64encode(encode_frame(result)).decode("ascii")
+            except EncodingError: continue
+        elif encoding == "columnar" and _has_rows(result): return "columnar", to_columnar(result)
+        elif encoding == "json": return "json", result
+        elif encoding not in ENCODINGS: logging.warning(f"Unknown IPC encoding '{encoding}' requested.")
+    return "json", result
@@ -1,5 +1,23 @@
 # src/ipc_handler.py
 # *** UPDATED: Explicit signature binding BEFORE function call ***
+# *** UPDATED: Resident server mode (--server) over newline-delimited JSON ***
+# *** UPDATED: Batch envelope (--batch / {"batch": [...]}) in a single transaction ***
+# *** UPDATED: Generator results streamed as chunk lines in server mode ***
+# *** UPDATED: archive module (portfolio export/import) callable over IPC ***
+# *** UPDATED: corporate_actions module (dividend projections, split adjustment) callable over IPC ***
+# *** UPDATED: fx module (base-currency conversion and holdings) callable over IPC ***
+# *** UPDATED: dashboard module (cached dashboard payload) callable over IPC ***
+# *** UPDATED: allocation module (tags, allocation drill-downs) callable over IPC ***
+# *** UPDATED: Phase timers, row/byte counters and opt-in profiles (metrics module); payloads logged at DEBUG only ***
+# *** UPDATED: Negotiated response encodings (columnar JSON, binary frames) and the orjson backend (ipc_codec) ***
+# *** UPDATED: Server mode runs requests concurrently (ipc_scheduler: reader pool, single writer, cancellable jobs) ***
+# *** UPDATED: import_pipeline module (parallel statement imports) callable over IPC ***
+# *** UPDATED: Explicit per-module allowlist of IPC functions; invalid PIT_LOG_LEVEL falls back to INFO ***
+# *** UPDATED: Daily portfolio series refreshed after write calls instead of on read ***
+# *** UPDATED: Refresh after a fetch on a read lane handed to the writer (database.run_on_writer) ***
+# *** UPDATED: A batch call fails on SQLite errors its helper caught, and on a null result from a write ***
+# *** UPDATED: A failed refresh of the daily series is logged, never turned into an error after a committed write ***
+# *** UPDATED: get_holdings_in_base_currency served from calculations (fx no longer imports calculations) ***
 
 import sys
 import json
@@ -7,9 +25,17 @@ import logging
 import os
 from pathlib import Path
 import inspect # Import inspect module
+import importlib
+import sqlite3
+import types
+import time
+import contextlib
 
-# Setup basic logging
-logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - HANDLER - %(levelname)s - %(message)s', stream=sys.stderr)
+# Setup basic logging (PIT_LOG_LEVEL=DEBUG adds arguments and result payloads, formatted only at that level)
+_log_level = os.environ.get("PIT_LOG_LEVEL", "INFO").upper()
+_valid_log_level = isinstance(logging.getLevelName(_log_level), int) # Unknown names map to "Level X"; basicConfig would raise
+logging.basicConfig(level=_log_level if _valid_log_level else "INFO", format='%(asctime)s - HANDLER - %(levelname)s - %(message)s', stream=sys.stderr)
+if not _valid_log_level: logging.warning(f"Invalid PIT_LOG_LEVEL '{_log_level}', using INFO.")
 
 # --- Determine Database Path ---
 _db_path_override = os.environ.get("PIT_DATABASE_PATH")
@@ -21,6 +47,9 @@ else:
 # Import the database functions
 try:
     import database
+    import metrics
+    import ipc_codec
+    import ipc_scheduler
 except ImportError as e:
     logging.exception("Failed to import database module.")
     print(json.dumps({"error": f"Internal backend error: Cannot import database module. {e}"}))
@@ -30,70 +59,148 @@ except Exception as e:
     print(json.dumps({"error": f"Internal backend error on import: {e}"}))
     sys.exit(1)
 
+# Functions that can be called over IPC, per module, searched in this order. Nothing else is callable, public
+# or not: connection and cache management, array-level helpers and provider plumbing stay internal.
+# Optional modules are imported on first use so plain database calls don't pay for
+# their dependencies; a module whose dependencies are missing is skipped with a warning.
+_IPC_FUNCTIONS = {
+    "database": frozenset({
+        "add_asset", "get_asset_by_ticker", "get_asset_by_id", "search_assets", "get_all_assets", "add_transaction",
+        "get_transactions_for_asset", "get_all_transactions", "get_transactions_page", "iter_transactions", "query_transactions",
+        "transaction_fingerprint", "bulk_add_transactions", "bulk_upsert_assets", "rebuild_holdings", "check_holdings_consistency",
+        "get_holdings", "add_prices", "get_latest_prices", "add_fx_rates", "get_latest_fx_rates", "get_market_data_freshness",
+        "get_price_coverage", "set_setting", "get_setting", "get_data_versions",
+    }),
+    "calculations": frozenset({"get_holdings_summary", "get_holdings_in_base_currency", "refresh_portfolio_daily", "get_portfolio_series", "get_returns", "get_period_returns", "get_movers"}),
+    "api_clients": frozenset({"get_quotes", "backfill_price_history", "get_fx_rates"}),
+    "archive": frozenset({"export_portfolio", "import_portfolio"}),
+    "corporate_actions": frozenset({"add_corporate_actions", "get_corporate_actions", "get_adjusted_prices", "get_upcoming_dividends", "get_projected_dividend_income"}),
+    "fx": frozenset({"get_base_currency"}),
+    "dashboard": frozenset({"get_dashboard"}),
+    "allocation": frozenset({"add_tag", "delete_tag", "get_tags", "set_asset_tags", "remove_asset_tag", "get_allocation"}),
+    "metrics": frozenset({"get_metrics", "reset_metrics"}),
+    "import_pipeline": frozenset({"detect_broker", "import_statements"}),
+}
+_IPC_MODULE_NAMES = tuple(_IPC_FUNCTIONS)
+_ipc_modules = {"database": database}
 
-def main():
+def _get_ipc_module(module_name):
+    """Returns an IPC module, importing it on first use (None if it cannot be imported)."""
+    if module_name not in _ipc_modules:
+        try:
+            _ipc_modules[module_name] = importlib.import_module(module_name)
+        except ImportError as e:
+            logging.warning(f"IPC Handler: module '{module_name}' unavailable, its functions won't be callable. {e}")
+            _ipc_modules[module_name] = None
+    return _ipc_modules[module_name]
+
+def _resolve_function(function_name):
+    """Finds an allowlisted IPC function by name, returning (module, function) or (None, None)."""
+    for module_name, function_names in _IPC_FUNCTIONS.items():
+        if function_name not in function_names: continue
+        module = _get_ipc_module(module_name)
+        target_function = getattr(module, function_name, None) if module else None
+        if callable(target_function): return module, target_function
+    return None, None
+
+
+# Signature cache: function name -> (signature without 'conn', whether it accepts 'conn').
+# Built once per process so the resident server does not re-inspect on every request.
+_SIGNATURE_CACHE = {}
+
+def _get_ipc_signature(function_name, target_function):
+    """Returns the cached (signature, accepts_conn) pair used to validate IPC arguments."""
+    entry = _SIGNATURE_CACHE.get(function_name)
+    if entry is None:
+        full_sig = inspect.signature(target_function)
+        # We only bind the arguments passed via IPC, ignoring the optional 'conn' parameter
+        params_to_bind = [p for k, p in full_sig.parameters.items() if k != 'conn']
+        entry = (inspect.Signature(parameters=params_to_bind), 'conn' in full_sig.parameters)
+        _SIGNATURE_CACHE[function_name] = entry
+    return entry
+
+def _result_rows(result):
+    """Row count reported for a result: list length, 1 for other non-None results."""
+    if isinstance(result, list): return len(result)
+    return 0 if result is None else 1
+
+def _refresh_derived_data(function_name, conn=None):
+    """Brings the daily portfolio series up to date after a write call, so reads never refresh it themselves
+    (that would make them take the write lock). Does nothing when nothing marked it stale; otherwise the refresh
+    runs through database.run_on_writer, as a fetch on a server read lane cannot write itself."""
+    calculations = _get_ipc_module("calculations")
+    if calculations is None: return
+    if database.get_setting(database.PORTFOLIO_DIRTY_SETTING, conn=conn) is None: return # Current: no trip to the writer
+    start = time.perf_counter()
+    try: written = database.run_on_writer(lambda write_conn: calculations.refresh_portfolio_daily(conn=write_conn), conn)
+    except Exception: # The write itself succeeded: its response must not be lost to a failed refresh
+        logging.exception(f"Unexpected error refreshing the daily portfolio series after {function_name}")
+        written = None
+    if written is None:
+        logging.warning(f"Could not refresh the daily portfolio series after {function_name}; it stays marked stale.")
+    metrics.observe(f"ipc.{function_name}.refresh", (time.perf_counter() - start) * 1e3)
+
+def dispatch(function_name, args, conn=None):
     """
-    Parses command line arguments, validates arguments against function signature,
-    calls the requested database function, and prints the result as JSON.
+    Validates arguments against the function signature, calls the requested
+    backend function and returns the response dict ({"data": ...} or {"error": ...}).
+    If conn is given it is passed to functions that accept it. After a successful
+    write call (anything not in ipc_scheduler.READ_FUNCTIONS) derived data is refreshed,
+    except inside a batch, which refreshes once before it commits.
     """
-    if len(sys.argv) < 2:
-        logging.error("No function name provided.")
-        print(json.dumps({"error": "Backend Error: No function name specified."}))
-        sys.exit(1)
-
-    function_name = sys.argv[1]
-    raw_args = sys.argv[2] if len(sys.argv) > 2 else '[]'
-    args = []
     error_message = None
     result = None
 
-    logging.debug(f"Received call for function: {function_name}")
-    logging.debug(f"Raw arguments string: {raw_args}")
-
     try:
-        args = json.loads(raw_args)
         if not isinstance(args, list): raise ValueError("Arguments must be provided as a JSON array.")
-        logging.debug(f"Parsed arguments: {args}")
+        if logging.getLogger().isEnabledFor(logging.DEBUG): logging.debug(f"Parsed arguments: {args}")
 
-        target_function = getattr(database, function_name, None)
+        module, target_function = _resolve_function(function_name)
 
-        if callable(target_function):
+        if target_function:
             # === Explicit Signature Check ===
             try:
-                sig = inspect.signature(target_function)
-                # We only bind the arguments passed via IPC, ignoring the optional 'conn' parameter
-                # Create a temporary signature excluding 'conn' for binding check
-                params_to_bind = {k: v for k, v in sig.parameters.items() if k != 'conn'}
-                temp_sig = inspect.Signature(parameters=params_to_bind.values())
                 # Attempt to bind the provided arguments from IPC
-                bound_args = temp_sig.bind(*args)
+                bind_start = time.perf_counter()
+                sig, accepts_conn = _get_ipc_signature(function_name, target_function)
+                sig.bind(*args)
+                metrics.observe(f"ipc.{function_name}.bind", (time.perf_counter() - bind_start) * 1e3)
                 logging.debug(f"Arguments successfully bound to signature (excluding conn).")
                 # If binding succeeds, args are valid (in count/type) for the function call
             except TypeError as e_bind:
                 # Binding failed - wrong number/type of args provided via IPC
-                logging.exception(f"Argument binding error for {function_name} with args {args}")
+                logging.exception(f"Argument binding error for {function_name} with {len(args)} args")
                 error_message = f"Backend Error calling {function_name}: Invalid arguments provided via IPC. Details: {e_bind}"
                 target_function = None # Prevent calling the function later
             # === End Signature Check ===
 
             # === Call Function (only if signature check passed) ===
             if target_function and not error_message:
+                execute_start = time.perf_counter()
                 try:
-                    logging.info(f"Calling database.{function_name} with args: {args}")
-                    # Call the function - arguments should now be valid for the signature
-                    # The function will manage its own connection as 'conn' is not passed
-                    result = target_function(*args)
-                    logging.info(f"Result from database.{function_name}: {result}")
+                    logging.info(f"Calling {module.__name__}.{function_name}")
+                    if logging.getLogger().isEnabledFor(logging.DEBUG): logging.debug(f"Arguments for {function_name}: {args}")
+                    if conn is not None and accepts_conn:
+                        # Resident mode: reuse the warm connection
+                        result = target_function(*args, conn=conn)
+                    else:
+                        # The function will manage its own connection as 'conn' is not passed
+                        result = target_function(*args)
+                    logging.info(f"{module.__name__}.{function_name} returned {_result_rows(result)} rows in {(time.perf_counter() - execute_start) * 1e3:.1f} ms")
+                    if logging.getLogger().isEnabledFor(logging.DEBUG): logging.debug(f"Result from {module.__name__}.{function_name}: {result}")
                 except Exception as e_exec:
                     # Catch runtime errors *during* function execution (e.g., DB errors)
                     logging.exception(f"Error executing function '{function_name}'")
                     error_detail = str(e_exec)
                     error_message = f"Backend Error executing {function_name}: {error_detail}"
+                finally:
+                    metrics.flush_sql()
+                    metrics.observe(f"ipc.{function_name}.execute", (time.perf_counter() - execute_start) * 1e3)
         else:
             error_message = f"Backend Error: Unknown function '{function_name}'."
             logging.error(error_message)
 
-    except (json.JSONDecodeError, ValueError) as e:
+    except ValueError as e:
             logging.exception("Argument parsing error.")
             error_message = f"Backend Error: Invalid arguments format for {function_name}. Details: {e}"
     except Exception as e_outer:
@@ -101,18 +208,342 @@ def main():
         logging.exception(f"Unexpected outer error processing {function_name}")
         error_message = f"Unexpected Backend Error processing {function_name}: {e_outer}"
 
-    # Prepare and print JSON response
-    response = {}
     if error_message:
-        response["error"] = error_message
-    else:
-        response["data"] = result
+        metrics.increment(f"ipc.{function_name}.errors")
+        return {"error": error_message}
+    metrics.increment(f"ipc.{function_name}.calls")
+    if not isinstance(result, types.GeneratorType): metrics.increment(f"ipc.{function_name}.rows", _result_rows(result)) # Streams count their chunks
+    if function_name not in ipc_scheduler.READ_FUNCTIONS and not isinstance(conn, _BatchConnection): _refresh_derived_data(function_name, conn)
+    return {"data": result}
+
+# --- Batch Envelope ---
+# A batch is a list of {"function": name, "args": [...]} calls run in order on one
+# connection inside one transaction. An argument of the form {"$ref": "0.id"} is
+# replaced by a value from an earlier call's result (call index, then keys/indexes).
+
+# Calls that may return None without having failed; for any other write, None means it failed (and logged why)
+_BATCH_NONE_RESULTS = frozenset({"detect_broker", "reset_metrics"})
+
+class _BatchCursor(sqlite3.Cursor):
+    """Cursor handed out during a batch: records SQLite errors on the batch before raising them,
+    as the helpers catch them and only return None."""
+    batch = None
+    def execute(self, *args):
+        try: return super().execute(*args)
+        except sqlite3.Error as e: self.batch.error = e; raise
+    def executemany(self, *args):
+        try: return super().executemany(*args)
+        except sqlite3.Error as e: self.batch.error = e; raise
+    def executescript(self, *args):
+        try: return super().executescript(*args)
+        except sqlite3.Error as e: self.batch.error = e; raise
+
+class _BatchConnection:
+    """Connection proxy used during a batch: defers commits to the end of the batch and records rollbacks
+    and SQLite errors of a call (even when the call caught them) so the whole batch can be aborted."""
+    def __init__(self, conn):
+        self._conn = conn
+        self.rolled_back = False
+        self.error = None
+    def commit(self):
+        pass # The batch commits once after the last call
+    def rollback(self):
+        self.rolled_back = True
+        self._conn.rollback()
+    def cursor(self, factory=_BatchCursor):
+        cursor = self._conn.cursor(factory)
+        cursor.batch = self
+        return cursor
+    def execute(self, *args):
+        return self.cursor().execute(*args)
+    def executemany(self, *args):
+        return self.cursor().executemany(*args)
+    def executescript(self, *args):
+        return self.cursor().executescript(*args)
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+def _resolve_batch_refs(value, results, call_names):
+    """Recursively replaces {"$ref": "<index>.<key>..."} placeholders with earlier results."""
+    if isinstance(value, list):
+        return [_resolve_batch_refs(v, results, call_names) for v in value]
+    if isinstance(value, dict):
+        if set(value) == {"$ref"}:
+            ref = str(value["$ref"])
+            parts = ref.split(".")
+            try:
+                index = int(parts[0])
+            except ValueError:
+                raise ValueError(f"reference '{ref}' must start with a call index")
+            if not 0 <= index < len(results):
+                raise ValueError(f"reference '{ref}' points to call {index}, which has not run yet")
+            resolved = results[index]
+            for key in parts[1:]:
+                if resolved is None:
+                    raise ValueError(f"reference '{ref}' is unresolved because call {index} ({call_names[index]}) returned null")
+                try:
+                    resolved = resolved[int(key)] if isinstance(resolved, list) else resolved[key]
+                except (KeyError, IndexError, ValueError, TypeError):
+                    raise ValueError(f"reference '{ref}' is unresolved: no '{key}' in result of call {index} ({call_names[index]})")
+            return resolved
+        return {k: _resolve_batch_refs(v, results, call_names) for k, v in value.items()}
+    return value
+
+def _collect_stream(result):
+    """Flattens a streamed result (a generator of row chunks) into one list; other results pass through.
+    Used where a single response is expected (argv and batch modes)."""
+    if isinstance(result, types.GeneratorType):
+        return [row for chunk in result for row in chunk]
+    return result
+
+def run_batch(calls, conn=None):
+    """
+    Runs a batch of calls in order on one shared connection inside a single
+    SQLite transaction. Returns {"data": [result, ...]} on success; on the first
+    failing call everything is rolled back and {"error": ...} is returned.
+    """
+    if not isinstance(calls, list) or not calls:
+        return {"error": "Backend Error: Batch must be a non-empty JSON array of calls."}
+    local_conn = False
+    if conn is None: conn = database._get_db_connection(); local_conn = True
+    if not conn: return {"error": "Backend Error: Cannot connect to database."}
+
+    results = []
+    call_names = []
+    error_message = None
     try:
-        print(json.dumps(response))
+        if conn.in_transaction: conn.commit()
+        conn.execute("BEGIN IMMEDIATE") # Take the write lock up front so lookups and writes are atomic
+        batch_conn = _BatchConnection(conn)
+        for index, call in enumerate(calls):
+            function_name = call.get("function") if isinstance(call, dict) else None
+            if not function_name:
+                error_message = f"Backend Error in batch call {index}: Each call must be an object with a 'function'."
+                break
+            call_names.append(function_name)
+            try:
+                args = _resolve_batch_refs(call.get("args", []), results, call_names)
+            except ValueError as e_ref:
+                error_message = f"Backend Error in batch call {index} ({function_name}): {e_ref}"
+                break
+            response = dispatch(function_name, args, conn=batch_conn)
+            if "data" in response:
+                try:
+                    response["data"] = _collect_stream(response["data"])
+                except Exception as e_stream:
+                    logging.exception(f"Error streaming result of '{function_name}'")
+                    response = {"error": f"Backend Error executing {function_name}: {e_stream}"}
+            if "error" in response:
+                error_message = f"Backend Error in batch call {index} ({function_name}): {response['error']}"
+                break
+            if batch_conn.rolled_back:
+                error_message = f"Backend Error in batch call {index} ({function_name}): call failed and rolled back the batch."
+                break
+            if batch_conn.error is not None:
+                error_message = f"Backend Error in batch call {index} ({function_name}): database error: {batch_conn.error}"
+                break
+            if response["data"] is None and function_name not in ipc_scheduler.READ_FUNCTIONS and function_name not in _BATCH_NONE_RESULTS:
+                error_message = f"Backend Error in batch call {index} ({function_name}): call failed (returned null)."
+                break
+            results.append(response["data"])
+
+        if error_message:
+            logging.error(f"{error_message} Rolling back batch.")
+            conn.rollback()
+        else:
+            if any(name not in ipc_scheduler.READ_FUNCTIONS for name in call_names): _refresh_derived_data("batch", conn)
+            conn.commit()
+            logging.info(f"Batch of {len(results)} calls committed.")
+    except sqlite3.Error as e:
+        logging.exception("Database error running batch.")
+        if conn.in_transaction: conn.rollback()
+        error_message = f"Backend Error running batch: {e}"
+    finally:
+        if local_conn and conn: conn.close()
+
+    if error_message:
+        return {"error": error_message}
+    return {"data": results}
+
+def _serialize_response(response, function_name, encoding=None):
+    """Serializes a response dict to a single JSON line, reporting unserializable results as errors.
+    encoding is the request's accepted encoding(s): the "data" or "chunk" payload
+    is encoded accordingly (see ipc_codec.encode) and the line tagged with "encoding" unless plain JSON was chosen.
+    Serialization time and bytes are recorded under ipc.<function>.serialize and ipc.<function>.bytes."""
+    start = time.perf_counter()
+    try:
+        payload_key = "chunk" if "chunk" in response else "data"
+        if encoding and payload_key in response:
+            chosen, payload = ipc_codec.encode(response[payload_key], encoding)
+            if chosen != "json": response = {**response, payload_key: payload, "encoding": chosen}
+        line = ipc_codec.dumps(response)
+        metrics.observe(f"ipc.{function_name}.serialize", (time.perf_counter() - start) * 1e3)
+        metrics.increment(f"ipc.{function_name}.bytes", len(line)) # ASCII JSON: characters are bytes
+        return line
     except TypeError as e_serialize:
-            logging.exception(f"Failed to serialize result for {function_name}")
-            # Try sending back just the error message if serialization failed
-            print(json.dumps({"error": f"Backend Error: Result for {function_name} is not JSON serializable. Details: {e_serialize}"}))
+        logging.exception(f"Failed to serialize result for {function_name}")
+        # Try sending back just the error message if serialization failed
+        error_response = {"error": f"Backend Error: Result for {function_name} is not JSON serializable. Details: {e_serialize}"}
+        if "id" in response: error_response["id"] = response["id"]
+        return ipc_codec.dumps(error_response)
+
+def iter_response_lines(line, conn=None):
+    """
+    Handles one newline-delimited JSON request in server mode:
+    {"id": <any>, "function": <name>, "args": [...]} or {"id": <any>, "batch": [calls]}.
+    Yields serialized response lines, each tagged with the request id so several requests
+    can be in flight at once. Usually that is a single {"id", "data"} or {"id", "error"} line;
+    functions returning a generator of row chunks are streamed as {"id", "chunk": [...]} lines
+    as they are produced, ended by {"id", "data": <total rows>} (or an error line).
+    Long calls report progress as {"id", "progress": {...}} lines when run as jobs (see ipc_scheduler).
+    With "profile": true in the request the call runs under cProfile (see metrics.profiled) and the
+    final line carries the path of the dump as "profile". "encoding": "columnar" | "binary" | "json" (or a
+    preference list) negotiates the payload encoding of data and chunk lines (see ipc_codec.encode).
+    """
+    request_id = None
+    function_name = None
+    profile = None
+    encoding = None
+    profiling = contextlib.ExitStack() # Open until the last line is produced, so streamed chunks are profiled too
+    try:
+        parse_start = time.perf_counter()
+        request = json.loads(line)
+        if not isinstance(request, dict): raise ValueError("Request must be a JSON object.")
+        request_id = request.get("id")
+        encoding = request.get("encoding")
+        function_name = "batch" if "batch" in request else request.get("function")
+        if not function_name: raise ValueError("Request is missing 'function' or 'batch'.")
+        metrics.observe(f"ipc.{function_name}.parse", (time.perf_counter() - parse_start) * 1e3)
+        profile = profiling.enter_context(metrics.profiled(str(function_name), bool(request.get("profile"))))
+        if "batch" in request:
+            logging.debug(f"Received batch request {request_id}")
+            response = run_batch(request["batch"], conn=conn)
+        else:
+            logging.debug(f"Received request {request_id} for function: {function_name}")
+            response = dispatch(function_name, request.get("args", []), conn=conn)
+    except (json.JSONDecodeError, ValueError) as e:
+        logging.exception("Request parsing error.")
+        response = {"error": f"Backend Error: Invalid request format. Details: {e}"}
+
+    if isinstance(response.get("data"), types.GeneratorType):
+        total = 0
+        chunks = response["data"]
+        try:
+            while True:
+                chunk_start = time.perf_counter()
+                chunk = next(chunks, None) # Producing a chunk runs the function's query: timed as execute
+                metrics.flush_sql()
+                metrics.observe(f"ipc.{function_name}.execute", (time.perf_counter() - chunk_start) * 1e3)
+                if chunk is None: break
+                total += len(chunk)
+                yield _serialize_response({"id": request_id, "chunk": chunk}, function_name, encoding)
+            response = {"data": total}
+            metrics.increment(f"ipc.{function_name}.rows", total)
+        except Exception as e_stream:
+            logging.exception(f"Error streaming result of '{function_name}'")
+            response = {"error": f"Backend Error executing {function_name}: {e_stream}"}
+        finally:
+            profiling.close() # Also when the consumer abandons the stream
+    response["id"] = request_id
+    profiling.close()
+    if profile is not None and profile["path"]: response["profile"] = profile["path"]
+    yield _serialize_response(response, function_name, encoding)
+
+def handle_request_line(line, conn=None):
+    """Handles one server-mode request and returns all of its response lines joined by newlines."""
+    return "\n".join(iter_response_lines(line, conn=conn))
+
+def serve(input_stream=None, output_stream=None, sequential=False):
+    """
+    Resident server mode: reads newline-delimited JSON requests from stdin and
+    writes tagged JSON response lines (see iter_response_lines) to stdout. Requests run
+    concurrently on warm connections (reads on a reader pool, writes on one writer, long
+    calls as cancellable jobs; see ipc_scheduler). With sequential=True they run one at a
+    time on a single connection shared for the lifetime of the process.
+    """
+    input_stream = input_stream or sys.stdin
+    output_stream = output_stream or sys.stdout
+    if not sequential:
+        logging.info("IPC Handler running in server mode (concurrent).")
+        ipc_scheduler.serve(iter_response_lines, input_stream, output_stream)
+        logging.info("IPC Handler server mode stopped.")
+        return 0
+    conn = database._get_db_connection()
+    if not conn:
+        output_stream.write(json.dumps({"id": None, "error": "Backend Error: Cannot connect to database."}) + "\n")
+        output_stream.flush()
+        return 1
+    logging.info("IPC Handler running in server mode.")
+    try:
+        for line in input_stream:
+            line = line.strip()
+            if not line: continue
+            for response_line in iter_response_lines(line, conn=conn):
+                output_stream.write(response_line + "\n")
+                output_stream.flush() # Stream each chunk/response back as soon as it is ready
+            if conn.in_transaction:
+                # A failed write left the shared connection mid-transaction; don't leak it into the next request
+                logging.warning("Rolling back transaction left open by previous request.")
+                conn.rollback()
+    finally:
+        conn.close()
+        logging.info("IPC Handler server mode stopped.")
+    return 0
+
+
+def main():
+    """
+    Parses command line arguments, validates arguments against function signature,
+    calls the requested database function, and prints the result as JSON.
+    With '--server', runs the resident stdin/stdout server instead ('--server --sequential'
+    runs its requests one at a time);
+    with '--batch <calls JSON>', runs a batch of calls in one transaction. A leading
+    '--encoding <columnar|binary|json>' selects the result encoding (see ipc_codec).
+    """
+    argv = sys.argv[1:]
+    encoding = None
+    if len(argv) >= 2 and argv[0] == "--encoding":
+        encoding, argv = argv[1], argv[2:]
+    if not argv:
+        logging.error("No function name provided.")
+        print(json.dumps({"error": "Backend Error: No function name specified."}))
+        sys.exit(1)
+
+    if argv[0] == "--server":
+        sys.exit(serve(sequential="--sequential" in argv[1:]))
+
+    if argv[0] == "--batch":
+        raw_calls = argv[1] if len(argv) > 1 else '[]'
+        try:
+            response = run_batch(json.loads(raw_calls))
+        except json.JSONDecodeError as e:
+            logging.exception("Batch parsing error.")
+            response = {"error": f"Backend Error: Invalid batch format. Details: {e}"}
+        print(_serialize_response(response, "batch", encoding))
+        return
+
+    function_name = argv[0]
+    raw_args = argv[1] if len(argv) > 1 else '[]'
+
+    logging.debug(f"Received call for function: {function_name}")
+    logging.debug(f"Raw arguments string: {raw_args}")
+
+    try:
+        with metrics.timer(f"ipc.{function_name}.parse"): args = json.loads(raw_args)
+    except json.JSONDecodeError as e:
+        logging.exception("Argument parsing error.")
+        response = {"error": f"Backend Error: Invalid arguments format for {function_name}. Details: {e}"}
+    else:
+        response = dispatch(function_name, args)
+        if "data" in response:
+            try:
+                response["data"] = _collect_stream(response["data"])
+            except Exception as e_stream:
+                logging.exception(f"Error streaming result of '{function_name}'")
+                response = {"error": f"Backend Error executing {function_name}: {e_stream}"}
+
+    # Print JSON response
+    print(_serialize_response(response, function_name, encoding))
 
 
 if __name__ == "__main__":
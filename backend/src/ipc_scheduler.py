@@ -0,0 +1,334 @@
+# src/ipc_scheduler.py
+# Concurrent request scheduling for the resident server (ipc_handler.py --server). An asyncio loop reads request
+# lines and queues each on one of three lanes of worker threads. Every worker keeps its own database connection
+# (the thread-local pool in database.py); response lines are written by the loop as workers produce them.
+#   read   pure reads (READ_FUNCTIONS) on a pool of reader connections opened with PRAGMA query_only, queued by
+#          priority (interactive, normal, background). The first reader only takes interactive requests, so bulk
+#          reads can never occupy every connection while the UI waits
+#   write  everything else (writes, batches) in arrival order on one writer connection: SQLite allows a single
+#          writer anyway, and this keeps writes in request order
+#          Network fetches (FETCH_FUNCTIONS) run here too, at normal priority; the writes they need (storing what
+#          they fetched) are handed to the writer lane through database.run_on_writer
+#   job    long calls (JOB_FUNCTIONS, or "job": true in the request) on a connection of their own, off the writer
+#          lane; they send {"id", "progress": {"done", "total", "message"}} lines and stop when cancelled (see jobs.py)
+#          The writer and a job that writes take turns through a write gate rather than meeting at SQLite's lock
+#          (where the loser fails with "database is locked" once the busy timeout runs out): queued writes go first
+#          whenever the job reports progress with nothing uncommitted, e.g. between the commits of a resumable
+#          import; a job in one long transaction (an atomic import) holds them until it ends
+# A read or job waits until the writes received before it are done, so pipelined requests see earlier writes.
+# {"id", "cancel": <request id>} drops a queued request or stops a running job and answers true if it did;
+# the cancelled request then ends with an error line carrying "cancelled": true.
+
+import os
+import json
+import heapq
+import asyncio
+import logging
+import itertools
+import threading
+import time
+import contextlib
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import jobs
+import metrics
+import database
+import ipc_codec
+
+# Functions that never write, safe on a read-only connection. Anything not listed runs on the writer lane.
+# The series, returns and dashboard read portfolio_daily as the write path left it (ipc_handler refreshes it after writes).
+READ_FUNCTIONS = frozenset({
+    "get_asset_by_ticker", "get_asset_by_id", "search_assets", "get_all_assets", "get_transactions_for_asset",
+    "get_all_transactions", "get_transactions_page", "iter_transactions", "query_transactions", "transaction_fingerprint",
+    "check_holdings_consistency", "get_holdings", "get_latest_prices", "get_latest_fx_rates", "get_market_data_freshness",
+    "get_price_coverage", "get_setting", "get_data_versions", "get_holdings_summary", "get_corporate_actions",
+    "get_adjusted_prices", "get_upcoming_dividends", "get_projected_dividend_income", "get_base_currency",
+    "get_holdings_in_base_currency", "get_tags", "get_allocation", "get_metrics", "get_portfolio_series", "get_returns",
+    "get_period_returns", "get_movers", "get_dashboard",
+})
+BULK_READS = frozenset({"get_all_transactions", "iter_transactions", "query_transactions", "check_holdings_consistency"}) # Default to normal priority
+FETCH_FUNCTIONS = frozenset({"get_quotes", "get_fx_rates"}) # Read lane at normal priority, stores through the writer
+JOB_FUNCTIONS = frozenset({"backfill_price_history", "import_portfolio", "export_portfolio", "rebuild_holdings", "refresh_portfolio_daily",
+                           "import_statements"})
+READ_JOB_FUNCTIONS = frozenset({"export_portfolio"}) # Jobs that only read: no turn at the write gate needed
+PRIORITIES = {"interactive": 0, "normal": 1, "background": 2}
+DEFAULT_READERS = max(2, int(os.environ.get("PIT_READERS", "4")))
+
+
+def classify(request):
+    """(lane, priority) of a parsed request. Only reads are reordered by priority: "priority" in the request
+    overrides their default (interactive, or normal for BULK_READS). Writes and jobs keep arrival order."""
+    function_name = request.get("function")
+    if "batch" in request: return "write", 0
+    if request.get("job") or function_name in JOB_FUNCTIONS: return "job", 0
+    if function_name not in READ_FUNCTIONS and function_name not in FETCH_FUNCTIONS: return "write", 0
+    default = PRIORITIES["normal"] if function_name in BULK_READS or function_name in FETCH_FUNCTIONS else PRIORITIES["interactive"]
+    return "read", PRIORITIES.get(request.get("priority"), default)
+
+def _request_key(request_id):
+    return json.dumps(request_id, sort_keys=True) # Ids may be any JSON value
+
+def _mark_cancelled(line):
+    response = json.loads(line)
+    if "error" not in response: return line # Finished before it noticed the cancellation
+    response["cancelled"] = True
+    return ipc_codec.dumps(response)
+
+
+class _Request:
+    """A request on its way through a lane. done is resolved once its last line has been written."""
+    __slots__ = ("id", "line", "function_name", "lane", "priority", "order", "control", "call", "done", "started", "queued_at")
+
+    def __init__(self, request_id, line, function_name, lane, priority, order, done):
+        self.id, self.line, self.function_name, self.lane, self.priority, self.order = request_id, line, function_name, lane, priority, order
+        self.control = None
+        self.call = None # (function, concurrent Future) of a write handed over by run_on_writer instead of a line
+        self.done = done
+        self.started = False
+        self.queued_at = time.perf_counter()
+
+
+class _WriteGate:
+    """Lets the writer lane and a writing job write one at a time, queued writes first (see the module header)."""
+
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._held = False
+        self._waiting_writes = 0
+
+    @contextlib.contextmanager
+    def holding(self, lane):
+        self._acquire(lane)
+        try: yield
+        finally: self._release()
+
+    def yield_to_writes(self):
+        """Called by the job holding the gate with nothing uncommitted: lets the writes waiting for it run first."""
+        with self._condition:
+            if not self._waiting_writes: return
+        self._release()
+        self._acquire("job")
+
+    def _acquire(self, lane):
+        with self._condition:
+            if lane == "write": self._waiting_writes += 1
+            try:
+                while self._held or lane != "write" and self._waiting_writes: self._condition.wait()
+            finally:
+                if lane == "write": self._waiting_writes -= 1
+            self._held = True
+
+    def _release(self):
+        with self._condition:
+            self._held = False
+            self._condition.notify_all()
+
+
+class _Lane:
+    """Worker threads fed from one priority queue (ties in arrival order). Each worker has a thread of its own and
+    so one connection; the first `reserved` workers only take interactive (priority 0) requests.
+    run(request, conn) is called in the worker thread."""
+
+    def __init__(self, name, workers, run, reserved=0, read_only=False):
+        self.name = name
+        self.read_only = read_only
+        self._run = run
+        self._reserved = reserved
+        self._executors = [ThreadPoolExecutor(1, thread_name_prefix=f"pit-{name}") for _ in range(workers)]
+        self._local = threading.local()
+        self._queue = [] # Heap of (priority, order, request)
+        self._closing = False
+        self._wakeup = None
+        self._workers = []
+
+    def start(self):
+        self._wakeup = asyncio.Condition()
+        self._workers = [asyncio.create_task(self._worker(index)) for index in range(len(self._executors))]
+
+    async def put(self, request):
+        async with self._wakeup:
+            heapq.heappush(self._queue, (request.priority, request.order, request))
+            self._wakeup.notify_all()
+
+    def remove(self, request):
+        """Takes a request that has not started off the queue; False if it is not queued."""
+        for index, entry in enumerate(self._queue):
+            if entry[2] is request:
+                self._queue.pop(index)
+                heapq.heapify(self._queue)
+                return True
+        return False
+
+    async def close(self):
+        """Stops the workers once idle, then closes their connections and threads."""
+        async with self._wakeup:
+            self._closing = True
+            self._wakeup.notify_all()
+        await asyncio.gather(*self._workers)
+        loop = asyncio.get_running_loop()
+        for executor in self._executors:
+            await loop.run_in_executor(executor, database.close_pooled_connections) # Connections belong to their thread
+            executor.shutdown()
+
+    async def _take(self, interactive_only):
+        async with self._wakeup:
+            while True:
+                if self._queue and (not interactive_only or self._queue[0][0] == PRIORITIES["interactive"]):
+                    return heapq.heappop(self._queue)[2]
+                if self._closing: return None
+                await self._wakeup.wait()
+
+    async def _worker(self, index):
+        loop = asyncio.get_running_loop()
+        while (request := await self._take(index < self._reserved)) is not None:
+            request.started = True
+            metrics.observe(f"ipc.{request.function_name}.queue", (time.perf_counter() - request.queued_at) * 1e3)
+            try: await loop.run_in_executor(self._executors[index], self._run_with_connection, request)
+            finally: request.done.set_result(None)
+
+    def _connection(self):
+        """The calling worker thread's connection, opened on first use (read-only on a read-only lane)."""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = database._get_db_connection()
+            if conn is not None and self.read_only: conn.execute("PRAGMA query_only = ON")
+            self._local.conn = conn
+        return conn
+
+    def _run_with_connection(self, request):
+        conn = self._connection()
+        try: self._run(request, conn)
+        finally:
+            if conn is not None and conn.in_transaction:
+                # A failed write left the connection mid-transaction; don't leak it into the next request
+                logging.warning(f"Rolling back transaction left open by {request.function_name} on the {self.name} lane.")
+                conn.rollback()
+
+
+class Scheduler:
+    """Runs server-mode requests concurrently (see the module header). handler(line, conn=...) yields the response
+    lines of one request (ipc_handler.iter_response_lines); they are written to output_stream as they come."""
+
+    def __init__(self, handler, output_stream, readers=DEFAULT_READERS):
+        self._handler = handler
+        self._output = output_stream
+        self._lanes = {"read": _Lane("read", readers, self._execute, reserved=1, read_only=True),
+                       "write": _Lane("write", 1, self._execute),
+                       "job": _Lane("job", 1, self._execute)}
+        self._write_gate = _WriteGate()
+        self._order = itertools.count()
+        self._requests = {} # Request key -> _Request, until answered
+        self._in_flight = set()
+        self._last_write = None
+        self._loop = None
+
+    async def run(self, input_stream):
+        """Serves requests from input_stream until it ends and every request has been answered."""
+        self._loop = asyncio.get_running_loop()
+        for lane in self._lanes.values(): lane.start()
+        with ThreadPoolExecutor(1, thread_name_prefix="pit-stdin") as reader:
+            while line := await self._loop.run_in_executor(reader, input_stream.readline):
+                line = line.strip()
+                if line: self.submit(line)
+        while self._in_flight: await asyncio.wait(list(self._in_flight))
+        for lane in self._lanes.values(): await lane.close()
+
+    def submit(self, line):
+        """Queues one request line on its lane (parsing just enough to classify it; the handler parses it again)."""
+        try: request = json.loads(line)
+        except json.JSONDecodeError: request = None
+        if not isinstance(request, dict) or not ({"function", "batch", "cancel"} & request.keys()):
+            for response_line in self._handler(line, conn=None): self._write(response_line) # Format errors need no database
+            return
+        if "cancel" in request:
+            self._write(ipc_codec.dumps({"id": request.get("id"), "data": self.cancel(request["cancel"])}))
+            return
+        lane, priority = classify(request)
+        function_name = "batch" if "batch" in request else request.get("function")
+        pending = _Request(request.get("id"), line, function_name, lane, priority, next(self._order), self._loop.create_future())
+        if lane == "job":
+            pending.control = jobs.JobControl(lambda progress: self._emit(ipc_codec.dumps({"id": pending.id, "progress": progress})))
+        self._requests[_request_key(pending.id)] = pending
+        self._in_flight.add(pending.done)
+        pending.done.add_done_callback(lambda _: self._forget(pending))
+        barrier = self._last_write
+        if lane == "write": self._last_write = pending.done
+        asyncio.create_task(self._enqueue(pending, None if lane == "write" else barrier)) # Tracked through pending.done
+
+    def cancel(self, request_id):
+        """Cancels a request: a queued one is answered with a cancelled error at once, a running job stops at its next
+        progress report. Returns True if either happened (a running read or write cannot be cancelled)."""
+        pending = self._requests.get(_request_key(request_id))
+        if pending is None or pending.done.done(): return False
+        if pending.started:
+            if pending.control is None: return False
+            pending.control.cancel()
+            logging.info(f"Cancelling running job {pending.function_name} ({pending.id}).")
+            return True
+        self._lanes[pending.lane].remove(pending) # Not queued yet if still waiting for earlier writes
+        self._write(ipc_codec.dumps({"id": pending.id, "error": f"Backend Error: {pending.function_name} was cancelled before it started.", "cancelled": True}))
+        pending.done.set_result(None)
+        return True
+
+    async def _enqueue(self, pending, barrier):
+        if barrier is not None: await barrier
+        if not pending.done.done(): await self._lanes[pending.lane].put(pending) # Unless cancelled while waiting
+
+    def _forget(self, pending):
+        self._in_flight.discard(pending.done)
+        key = _request_key(pending.id)
+        if self._requests.get(key) is pending: del self._requests[key]
+        if self._last_write is pending.done: self._last_write = None
+
+    def run_on_writer(self, function):
+        """Runs function(conn) on the writer lane, after the writes queued before it, and returns its result.
+        Called from worker threads of the other lanes (see database.run_on_writer); blocks the caller meanwhile."""
+        result = Future()
+        self._loop.call_soon_threadsafe(self._submit_call, function, result)
+        return result.result()
+
+    def _submit_call(self, function, result):
+        pending = _Request(None, None, "run_on_writer", "write", 0, next(self._order), self._loop.create_future())
+        pending.call = (function, result)
+        self._in_flight.add(pending.done)
+        pending.done.add_done_callback(lambda _: self._forget(pending))
+        self._last_write = pending.done # Later reads see what it writes
+        asyncio.create_task(self._lanes["write"].put(pending))
+
+    def _execute(self, pending, conn):
+        """Runs one request in a worker thread, writers and writing jobs at their turn of the write gate."""
+        if pending.lane == "read" or pending.lane == "job" and (pending.function_name in READ_JOB_FUNCTIONS or pending.function_name in READ_FUNCTIONS):
+            return self._run(pending, conn)
+        with self._write_gate.holding(pending.lane):
+            if pending.control is not None:
+                pending.control.on_report = lambda: conn is not None and conn.in_transaction or self._write_gate.yield_to_writes()
+            self._run(pending, conn)
+
+    def _run(self, pending, conn):
+        """Runs one request, passing its response lines to the loop as they are produced."""
+        if pending.call is not None:
+            function, result = pending.call
+            try: result.set_result(function(conn))
+            except Exception as e: result.set_exception(e)
+            return
+        try:
+            with (jobs.running(pending.control) if pending.control else
+                  database.routing_writes(self.run_on_writer) if pending.lane == "read" else contextlib.nullcontext()):
+                for line in self._handler(pending.line, conn=conn):
+                    if pending.control is not None and pending.control.cancelled: line = _mark_cancelled(line)
+                    self._emit(line)
+        except Exception as e:
+            logging.exception(f"Unexpected error running {pending.function_name}")
+            self._emit(ipc_codec.dumps({"id": pending.id, "error": f"Unexpected Backend Error processing {pending.function_name}: {e}"}))
+
+    def _emit(self, line):
+        self._loop.call_soon_threadsafe(self._write, line)
+
+    def _write(self, line):
+        self._output.write(line + "\n")
+        self._output.flush() # Each line goes out as soon as it is ready
+
+
+def serve(handler, input_stream, output_stream, readers=DEFAULT_READERS):
+    """Runs a Scheduler over the streams until input ends and all requests are answered."""
+    asyncio.run(Scheduler(handler, output_stream, readers).run(input_stream))
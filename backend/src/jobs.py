@@ -0,0 +1,64 @@
+# src/jobs.py
+# Progress reporting and cooperative cancellation for long-running backend calls (backfills, imports).
+# Long functions call report_progress() at points where stopping is safe; when the call runs as a job of the
+# resident server (see ipc_scheduler.py) that sends a progress line to the caller, and raises JobCancelled
+# once the job has been cancelled. It is also where a job gives way to queued writes (see JobControl.on_report).
+# Outside a job report_progress() does nothing.
+
+import time
+import threading
+import contextlib
+
+PROGRESS_INTERVAL_S = 0.1 # At most one progress report per interval is passed on (the final one always is)
+
+
+class JobCancelled(Exception):
+    """Raised by report_progress() in a job that has been cancelled."""
+
+
+class JobControl:
+    """Progress sink and cancellation flag of one job. on_progress(progress) receives
+    {"done", "total", "message", **details} dicts, throttled to one per interval. on_report(), if set, is called
+    at every report (not throttled): the scheduler lets queued writes run there when the job has nothing uncommitted."""
+
+    def __init__(self, on_progress=None, interval=PROGRESS_INTERVAL_S):
+        self.progress = None
+        self.on_report = None
+        self._on_progress = on_progress
+        self._interval = interval
+        self._last_report = 0.0
+        self._cancelled = threading.Event()
+
+    @property
+    def cancelled(self):
+        return self._cancelled.is_set()
+
+    def cancel(self):
+        """Flags the job; it stops at its next report_progress()."""
+        self._cancelled.set()
+
+    def report(self, done, total=None, message=None, **details):
+        if self.cancelled: raise JobCancelled("Job cancelled")
+        if self.on_report is not None: self.on_report()
+        self.progress = {"done": done, "total": total, "message": message, **details}
+        now = time.monotonic()
+        if self._on_progress is not None and (now - self._last_report >= self._interval or total is not None and done >= total):
+            self._last_report = now
+            self._on_progress(self.progress)
+
+
+_state = threading.local()
+
+@contextlib.contextmanager
+def running(control):
+    """Makes control the current job of the calling thread for the enclosed block."""
+    previous = getattr(_state, "control", None)
+    _state.control = control
+    try: yield control
+    finally: _state.control = previous
+
+def report_progress(done, total=None, message=None, **details):
+    """Reports progress of the calling thread's job (done out of total units, total None if unknown; details are
+    passed along, e.g. per-stage throughput). Raises JobCancelled if the job has been cancelled; does nothing outside a job."""
+    control = getattr(_state, "control", None)
+    if control is not None: control.report(done, total, message, **details)
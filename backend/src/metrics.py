@@ -0,0 +1,193 @@
+# src/metrics.py
+# In-process metrics for the hot paths: latency histograms (log-spaced buckets, so percentiles come out of a
+# fixed-size array per name), counters, SQL statement timing through the sqlite3 trace callback and opt-in
+# cProfile dumps per request. Everything lives in the backend process; get_metrics() reports it over IPC.
+# Enabled with PIT_METRICS (default on); SQL tracing with PIT_METRICS_SQL=1 (the callback runs for every
+# statement, every row of an executemany included); profiling with PIT_PROFILE=1 or per request.
+
+import os
+import re
+import time
+import bisect
+import logging
+import cProfile
+import tempfile
+import threading
+import contextlib
+from pathlib import Path
+
+ENABLED = os.environ.get("PIT_METRICS", "1") != "0"
+SQL_TRACING = os.environ.get("PIT_METRICS_SQL", "0") == "1"
+PROFILE_ALL = os.environ.get("PIT_PROFILE", "0") == "1"
+PROFILE_DIR = Path(os.environ.get("PIT_PROFILE_DIR") or Path(tempfile.gettempdir()) / "pit-profiles")
+
+# Bucket upper bounds in milliseconds: 10 us doubling up to ~168 s, then overflow
+BUCKET_BOUNDS_MS = tuple(0.01 * 2 ** k for k in range(25))
+PERCENTILES = (50, 90, 99)
+MAX_SQL_STATEMENTS = 500 # Distinct normalized statements kept; the rest are counted under "other"
+
+_SQL_LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?(?:[eE][-+]?\d+)?\b")
+_SQL_WHITESPACE = re.compile(r"\s+")
+
+
+# --- Histograms and Counters ---
+
+class Histogram:
+    """Latency distribution in milliseconds over BUCKET_BOUNDS_MS, with count, sum, min and max."""
+
+    __slots__ = ("buckets", "count", "total", "min", "max")
+
+    def __init__(self):
+        self.buckets = [0] * (len(BUCKET_BOUNDS_MS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.min = float("inf")
+        self.max = 0.0
+
+    def observe(self, ms):
+        self.buckets[bisect.bisect_left(BUCKET_BOUNDS_MS, ms)] += 1
+        self.count += 1
+        self.total += ms
+        if ms < self.min: self.min = ms
+        if ms > self.max: self.max = ms
+
+    def percentile(self, p):
+        """Upper bound of the bucket holding the p-th percentile (capped at the observed max)."""
+        if not self.count: return None
+        rank = p / 100.0 * self.count
+        seen = 0
+        for index, count in enumerate(self.buckets):
+            seen += count
+            if seen >= rank and count: return min(BUCKET_BOUNDS_MS[index], self.max) if index < len(BUCKET_BOUNDS_MS) else self.max
+        return self.max
+
+    def to_dict(self):
+        summary = {"count": self.count, "sum_ms": self.total, "mean_ms": self.total / self.count if self.count else None,
+                   "min_ms": self.min if self.count else None, "max_ms": self.max if self.count else None}
+        for p in PERCENTILES: summary[f"p{p}_ms"] = self.percentile(p)
+        summary["buckets"] = [[bound, count] for bound, count in zip(BUCKET_BOUNDS_MS + (None,), self.buckets) if count] # [upper bound ms, count]
+        return summary
+
+_lock = threading.Lock()
+_histograms = {}
+_counters = {}
+_sql_names = set()
+_started = time.time()
+
+def observe(name, ms):
+    """Records one latency sample (milliseconds) under name."""
+    if not ENABLED: return
+    with _lock:
+        histogram = _histograms.get(name)
+        if histogram is None: histogram = _histograms[name] = Histogram()
+        histogram.observe(ms)
+
+def increment(name, amount=1):
+    """Adds amount to the counter name."""
+    if not ENABLED: return
+    with _lock: _counters[name] = _counters.get(name, 0) + amount
+
+@contextlib.contextmanager
+def timer(name):
+    """Times the enclosed block into the histogram name."""
+    start = time.perf_counter()
+    try: yield
+    finally: observe(name, (time.perf_counter() - start) * 1e3)
+
+def reset_metrics():
+    """Clears all histograms and counters."""
+    global _started
+    with _lock:
+        _histograms.clear()
+        _counters.clear()
+        _sql_names.clear()
+        _started = time.time()
+
+
+# --- SQL Tracing ---
+# The trace callback fires as each statement starts. A statement's time runs until the next statement starts
+# on the same thread or the IPC call ends (flush_sql), so it includes stepping through and fetching its rows.
+
+_sql_state = threading.local()
+
+def normalize_sql(statement):
+    """Statement text with literals replaced by ? and whitespace collapsed (trace callbacks get bound values inlined)."""
+    return _SQL_WHITESPACE.sub(" ", _SQL_LITERALS.sub("?", statement)).strip()[:200]
+
+def _trace_statement(statement):
+    now = time.perf_counter()
+    pending = _sql_state.__dict__.setdefault("pending", {})
+    current = getattr(_sql_state, "current", None)
+    if current is not None:
+        entry = pending.get(current[0])
+        pending[current[0]] = (now - current[1], 1) if entry is None else (entry[0] + now - current[1], entry[1] + 1)
+    _sql_state.current = (statement, now)
+
+def flush_sql():
+    """Ends the running statement and records this thread's pending statement timings under "sql.<statement>".
+    Raw statements are normalized here, once per distinct text, rather than in the trace callback."""
+    if getattr(_sql_state, "current", None) is not None: _trace_statement(None)
+    _sql_state.current = None
+    pending = getattr(_sql_state, "pending", None)
+    if not pending: return
+    _sql_state.pending = {}
+    grouped = {}
+    for statement, (seconds, count) in pending.items():
+        if statement is None: continue
+        key = normalize_sql(statement)
+        total, calls = grouped.get(key, (0.0, 0))
+        grouped[key] = (total + seconds, calls + count)
+    with _lock:
+        for key, (seconds, count) in grouped.items():
+            name = f"sql.{key}"
+            if name not in _sql_names:
+                if len(_sql_names) >= MAX_SQL_STATEMENTS: name = "sql.other"
+                else: _sql_names.add(name)
+            histogram = _histograms.get(name)
+            if histogram is None: histogram = _histograms[name] = Histogram()
+            histogram.observe(seconds * 1e3 / count) # Mean per execution, once per call: executemany rows fold into one sample
+            _counters[f"{name}.executions"] = _counters.get(f"{name}.executions", 0) + count
+
+def trace_connection(conn, enabled=True):
+    """Installs (or removes) the SQL timing trace callback on a connection."""
+    conn.set_trace_callback(_trace_statement if enabled else None)
+    return conn
+
+
+# --- Profiling ---
+
+@contextlib.contextmanager
+def profiled(name, enabled=False):
+    """Runs the enclosed block under cProfile when enabled (or PIT_PROFILE=1) and dumps the stats to
+    PROFILE_DIR/<name>-<timestamp>.prof. Yields a dict whose "path" is set to the dump once written."""
+    dump = {"path": None}
+    if not (enabled or PROFILE_ALL):
+        yield dump
+        return
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try: yield dump
+    finally:
+        profiler.disable()
+        try:
+            PROFILE_DIR.mkdir(parents=True, exist_ok=True)
+            path = PROFILE_DIR / f"{re.sub(r'[^A-Za-z0-9_.-]', '_', name)}-{time.strftime('%Y%m%d-%H%M%S')}-{time.perf_counter_ns() % 10**9}.prof"
+            profiler.dump_stats(str(path))
+            dump["path"] = str(path)
+            logging.info(f"Wrote profile for {name} to {path}")
+        except OSError as e: logging.error(f"Error writing profile for {name}: {e}")
+
+
+# --- Report ---
+
+def get_metrics(prefix=None, reset=False):
+    """Snapshot of all metrics: {"enabled", "sql_tracing", "uptime_s", "counters": {name: value},
+    "histograms": {name: {count, sum_ms, mean_ms, min_ms, max_ms, p50_ms, p90_ms, p99_ms, buckets}}}.
+    IPC timings are named "ipc.<function>.<phase>" (queue, parse, bind, execute, refresh, serialize), SQL ones "sql.<statement>".
+    prefix filters names; reset clears everything after the snapshot."""
+    with _lock:
+        histograms = {name: histogram.to_dict() for name, histogram in _histograms.items() if prefix is None or name.startswith(prefix)}
+        counters = {name: value for name, value in _counters.items() if prefix is None or name.startswith(prefix)}
+        uptime = time.time() - _started
+    if reset: reset_metrics()
+    return {"enabled": ENABLED, "sql_tracing": SQL_TRACING, "uptime_s": uptime, "counters": counters, "histograms": histograms}
@@ -0,0 +1,163 @@
+# src/parsers/ibkr_parser.py
+# Streaming parser for Interactive Brokers activity statement CSV exports.
+# The file is read row by row (never loaded whole), so memory stays flat no matter
+# how large the statement is. Records are yielded in fixed-size batches ready for
+# database.bulk_upsert_assets / database.bulk_add_transactions, each with a content
+# fingerprint so re-importing a statement skips the rows already in the database.
+
+import csv
+import re
+import sqlite3
+import logging
+
+import database
+
+DEFAULT_BATCH_SIZE = 5000
+
+# IBKR asset categories -> our asset_type values
+_ASSET_TYPES = {
+    "Stocks": "Stock",
+    "Equity and Index Options": "Option",
+    "Futures": "Future",
+    "Bonds": "Bond",
+    "Funds": "ETF",
+    "Crypto": "Crypto",
+}
+# Dividend / withholding descriptions look like "AAPL(US0378331005) Cash Dividend USD 0.24 per Share (Ordinary Dividend)"
+_DESCRIPTION_RE = re.compile(r"^\s*([^\s(]+)\s*\(([A-Z]{2}[A-Z0-9]{9}[0-9])\)")
+_PER_SHARE_RE = re.compile(r"([0-9]*\.?[0-9]+) per Share", re.IGNORECASE)
+
+
+def _to_float(value):
+    """Parses an IBKR number ("1,234.50", "--", "") into a float or None."""
+    if value is None: return None
+    value = value.strip().replace(",", "")
+    if not value or value == "--": return None
+    try:
+        return float(value)
+    except ValueError:
+        return None
+
+def _to_date(value):
+    """Normalizes IBKR dates ("2024-01-05, 10:30:00", "20240105;103000", "2024-01-05") to YYYY-MM-DD."""
+    value = (value or "").strip()
+    if len(value) >= 8 and value[:8].isdigit():
+        return f"{value[:4]}-{value[4:6]}-{value[6:8]}"
+    if len(value) >= 10 and value[4] == "-" and value[7] == "-":
+        return value[:10]
+    return None
+
+def iter_statement_rows(path):
+    """Yields (section, fields) for every Data row, where fields maps the section's current header to the row values.
+    Sections may repeat their Header row with different columns (e.g. Trades for Forex), so the header is tracked per section."""
+    headers = {}
+    with open(path, newline="", encoding="utf-8-sig") as handle:
+        for row in csv.reader(handle):
+            if len(row) < 2: continue
+            section, row_type = row[0], row[1]
+            if row_type == "Header":
+                headers[section] = row[2:]
+            elif row_type == "Data" and section in headers:
+                yield section, dict(zip(headers[section], row[2:]))
+
+def _trade_record(fields):
+    """Normalizes a Trades row (stocks, options, ... and Forex conversions)."""
+    if fields.get("DataDiscriminator", "Order") not in ("Order", "Trade"): return None # Skip ClosedLot and similar detail rows
+    date = _to_date(fields.get("Date/Time"))
+    quantity = _to_float(fields.get("Quantity"))
+    if not date or not quantity: return None
+    category = fields.get("Asset Category", "")
+    currency = fields.get("Currency", "")
+    price = _to_float(fields.get("T. Price"))
+    fees = abs(_to_float(fields.get("Comm/Fee")) or _to_float(fields.get("Comm in USD")) or 0.0)
+    symbol = fields.get("Symbol", "").strip()
+    if category == "Forex":
+        # FX conversion: quantity is the signed amount of the base currency of the pair (e.g. EUR in EUR.USD)
+        return {"ticker": None, "isin": None, "asset_type": None, "transaction_type": "FX", "date": date,
+                "quantity": quantity, "price": price, "fees": fees, "currency": currency, "notes": f"FX {symbol}"}
+    return {"ticker": symbol, "isin": None, "asset_type": _ASSET_TYPES.get(category, category or "Stock"),
+            "transaction_type": "Buy" if quantity > 0 else "Sell", "date": date, "quantity": abs(quantity),
+            "price": price, "fees": fees, "currency": currency, "notes": None}
+
+def _cash_record(section, fields):
+    """Normalizes Dividends, Withholding Tax and Fees rows."""
+    currency = fields.get("Currency", "")
+    date = _to_date(fields.get("Date"))
+    amount = _to_float(fields.get("Amount"))
+    if not date or amount is None or currency.startswith("Total"): return None # Skip total/subtotal lines
+    description = fields.get("Description", "").strip()
+    match = _DESCRIPTION_RE.match(description)
+    ticker, isin = (match.group(1), match.group(2)) if match else (None, None)
+    if section == "Dividends":
+        per_share = _PER_SHARE_RE.search(description)
+        per_share = float(per_share.group(1)) if per_share else None
+        quantity, price = (round(amount / per_share, 6), per_share) if per_share else (1.0, amount)
+        return {"ticker": ticker, "isin": isin, "asset_type": "Stock", "transaction_type": "Dividend", "date": date,
+                "quantity": quantity, "price": price, "fees": 0.0, "currency": currency, "notes": description}
+    transaction_type = "Tax" if section == "Withholding Tax" else "Fee"
+    # Tax/Fee follow the Fee convention: no quantity, price is the amount paid (negative for refunds)
+    return {"ticker": ticker if section == "Withholding Tax" else None, "isin": isin, "asset_type": "Stock",
+            "transaction_type": transaction_type, "date": date, "quantity": None, "price": -amount,
+            "fees": 0.0, "currency": currency, "notes": description}
+
+def iter_ibkr_records(path):
+    """Yields normalized transaction records from an IBKR activity statement, one row at a time."""
+    for section, fields in iter_statement_rows(path):
+        if section == "Trades":
+            record = _trade_record(fields)
+        elif section in ("Dividends", "Withholding Tax", "Fees"):
+            record = _cash_record(section, fields)
+        else:
+            continue
+        if record: yield record
+
+def parse_ibkr_statement(path, batch_size=DEFAULT_BATCH_SIZE):
+    """Yields lists of at most batch_size normalized, fingerprinted records, ready for bulk insert."""
+    occurrences = {} # Numbers otherwise identical rows so genuine repeats get distinct fingerprints
+    batch = []
+    for record in iter_ibkr_records(path):
+        key = (record["date"], record["ticker"] or record["isin"], record["transaction_type"], record["quantity"], record["price"])
+        occurrence = occurrences.get(key, 0)
+        occurrences[key] = occurrence + 1
+        record["fingerprint"] = database.transaction_fingerprint(*key, occurrence=occurrence)
+        batch.append(record)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch: yield batch
+
+def _asset_rows(records):
+    """Distinct asset rows referenced by a batch of records."""
+    assets = {}
+    for record in records:
+        if record["ticker"] and record["ticker"] not in assets:
+            assets[record["ticker"]] = {"ticker": record["ticker"], "name": record["ticker"], "asset_type": record["asset_type"],
+                                        "currency": record["currency"], "isin": record["isin"]}
+    return list(assets.values())
+
+def import_ibkr_statement(path, batch_size=DEFAULT_BATCH_SIZE, conn=None):
+    """Imports a whole IBKR statement in one transaction (all or nothing). Re-importing a statement is safe: rows
+    already present are skipped by fingerprint. Uses provided conn or creates a new one.
+    Returns the number of new transactions inserted, or None on error."""
+    local_conn = False
+    if conn is None: conn = database._get_db_connection(); local_conn = True
+    if not conn: return None
+    total = 0
+    try:
+        for batch in parse_ibkr_statement(path, batch_size):
+            id_map = database.bulk_upsert_assets(_asset_rows(batch), conn=conn, commit=False)
+            if id_map is None: raise RuntimeError("asset upsert failed")
+            for record in batch:
+                record["asset_id"] = id_map.get(record["ticker"]) if record["ticker"] else None
+            inserted = database.bulk_add_transactions(batch, conn=conn, commit=False)
+            if inserted is None: raise RuntimeError("transaction insert failed")
+            total += inserted
+        conn.commit()
+        logging.info(f"Imported {total} transactions from IBKR statement {path}")
+    except (OSError, RuntimeError, sqlite3.Error, csv.Error, UnicodeDecodeError) as e:
+        logging.error(f"Error importing IBKR statement {path}, rolling back: {e}")
+        conn.rollback()
+        total = None
+    finally:
+        if local_conn and conn: conn.close()
+    return total
@@ -0,0 +1,128 @@
+# src/parsers/revolut_parser.py
+# Incremental, idempotent import of Revolut trading account statement CSV exports.
+# Overlapping monthly exports are expected: each import only parses rows on or after
+# the source's high-water mark (stored in settings), and every row carries a content
+# fingerprint so rows already in the database are skipped by the unique index.
+# STOCK SPLIT rows are not imported: Revolut only reports the extra shares, and a split is recorded as a
+# corporate action (corporate_actions.add_corporate_actions), which adjusts holdings and prices from its ex-date.
+# Booking the extra shares as well would count the split twice.
+
+import csv
+import sqlite3
+import logging
+
+import database
+
+DEFAULT_BATCH_SIZE = 5000
+_HWM_SETTING_PREFIX = "import_hwm:"
+
+# Revolut "Type" column -> our transaction_type (matched on the text before " - ", e.g. "BUY - MARKET")
+_TRANSACTION_TYPES = {
+    "BUY": "Buy",
+    "SELL": "Sell",
+    "DIVIDEND": "Dividend",
+    "CUSTODY FEE": "Fee",
+    "CASH TOP-UP": "Deposit",
+    "CASH WITHDRAWAL": "Withdrawal",
+}
+_SPLIT_TYPE = "STOCK SPLIT" # Skipped with a warning, see the module header
+_CURRENCY_SYMBOLS = {"$": "USD", "€": "EUR", "£": "GBP"}
+
+
+def _to_amount(value):
+    """Parses Revolut amounts such as "USD 1,234.50", "$12.00" or "-€3.10" into a float or None."""
+    value = (value or "").strip().replace(",", "")
+    negative = value.startswith("-")
+    value = value.lstrip("-").strip()
+    for symbol in _CURRENCY_SYMBOLS: value = value.replace(symbol, "")
+    value = value.split(" ")[-1] # Drop a leading currency code
+    try:
+        amount = float(value) if value else None
+    except ValueError:
+        return None
+    return -amount if negative and amount is not None else amount
+
+def get_high_water_mark(source, conn=None):
+    """Returns the last imported date (YYYY-MM-DD) for an import source, or None if never imported."""
+    return database.get_setting(_HWM_SETTING_PREFIX + source, conn=conn)
+
+def _normalize_row(row):
+    """Turns one Revolut CSV row (dict) into a transaction record, or None for rows we don't import."""
+    raw_type = (row.get("Type") or "").strip().upper()
+    date = (row.get("Date") or "")[:10]
+    ticker = (row.get("Ticker") or "").strip() or None
+    if raw_type == _SPLIT_TYPE:
+        logging.warning(f"Skipping Revolut stock split of {ticker} on {date}: record it as a Split corporate action instead.")
+        return None
+    transaction_type = _TRANSACTION_TYPES.get(raw_type.split(" - ")[0])
+    if not transaction_type: return None
+    currency = (row.get("Currency") or "").strip()
+    quantity = _to_amount(row.get("Quantity"))
+    price = _to_amount(row.get("Price per share"))
+    total = _to_amount(row.get("Total Amount"))
+    if transaction_type in ("Buy", "Sell"):
+        if not quantity or price is None: return None
+    elif transaction_type == "Dividend":
+        quantity, price = 1.0, total
+    else:
+        # Fee/Deposit/Withdrawal follow the Fee convention: no quantity, price is the amount
+        quantity, price = None, abs(total) if total is not None else None
+        if transaction_type in ("Deposit", "Withdrawal"): ticker = None
+    return {"ticker": ticker, "isin": None, "asset_type": "Stock", "transaction_type": transaction_type, "date": date,
+            "quantity": abs(quantity) if quantity is not None else None, "price": price, "fees": 0.0,
+            "currency": currency, "notes": None}
+
+def parse_revolut_statement(path, since=None, batch_size=DEFAULT_BATCH_SIZE):
+    """Yields batches of fingerprinted records for rows dated on or after `since` (YYYY-MM-DD).
+    Rows before `since` are skipped on a cheap date-prefix compare without being normalized."""
+    occurrences = {} # Numbers otherwise identical rows so genuine repeats get distinct fingerprints
+    batch = []
+    with open(path, newline="", encoding="utf-8-sig") as handle:
+        for row in csv.DictReader(handle):
+            if since and (row.get("Date") or "")[:10] < since: continue
+            record = _normalize_row(row)
+            if not record: continue
+            key = (record["date"], record["ticker"], record["transaction_type"], record["quantity"], record["price"])
+            occurrence = occurrences.get(key, 0)
+            occurrences[key] = occurrence + 1
+            record["fingerprint"] = database.transaction_fingerprint(*key, occurrence=occurrence)
+            batch.append(record)
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+    if batch: yield batch
+
+def import_revolut_statement(path, source="revolut", batch_size=DEFAULT_BATCH_SIZE, conn=None):
+    """Imports the new part of a Revolut statement in one transaction and advances the source's high-water mark.
+    Re-importing overlapping files is safe: rows already present are skipped by fingerprint.
+    Uses provided conn or creates a new one. Returns the number of new transactions inserted, or None on error."""
+    local_conn = False
+    if conn is None: conn = database._get_db_connection(); local_conn = True
+    if not conn: return None
+    total = 0
+    try:
+        since = get_high_water_mark(source, conn=conn)
+        # Re-read the high-water day itself: an earlier export may have ended part-way through it
+        latest = since
+        for batch in parse_revolut_statement(path, since=since, batch_size=batch_size):
+            assets = {r["ticker"]: {"ticker": r["ticker"], "name": r["ticker"], "asset_type": r["asset_type"], "currency": r["currency"]}
+                      for r in batch if r["ticker"]}
+            id_map = database.bulk_upsert_assets(assets.values(), conn=conn, commit=False)
+            if id_map is None: raise RuntimeError("asset upsert failed")
+            for record in batch:
+                record["asset_id"] = id_map.get(record["ticker"]) if record["ticker"] else None
+                if not latest or record["date"] > latest: latest = record["date"]
+            inserted = database.bulk_add_transactions(batch, conn=conn, commit=False)
+            if inserted is None: raise RuntimeError("transaction insert failed")
+            total += inserted
+        if latest and latest != since:
+            database._write_setting(conn.cursor(), _HWM_SETTING_PREFIX + source, latest)
+        conn.commit()
+        logging.info(f"Imported {total} new transactions from Revolut statement {path} (source '{source}', high-water mark {latest}).")
+    except (OSError, RuntimeError, sqlite3.Error, csv.Error, UnicodeDecodeError) as e:
+        logging.error(f"Error importing Revolut statement {path}, rolling back: {e}")
+        conn.rollback()
+        total = None
+    finally:
+        if local_conn and conn: conn.close()
+    return total
@@ -0,0 +1,92 @@
+# tests/test_allocation.py
+
+import pytest
+import sqlite3
+import sys
+from pathlib import Path
+
+np = pytest.importorskip("numpy")
+
+# Add src directory to sys.path
+src_path = Path(__file__).parent.parent / "src"
+sys.path.insert(0, str(src_path))
+import database
+import allocation
+
+
+@pytest.fixture
+def conn():
+    conn = sqlite3.connect(":memory:")
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA foreign_keys = ON")
+    database._create_schema(conn)
+    database.add_asset("AAA", "AAA Corp", "Stock", "USD", conn=conn)
+    database.add_asset("BBB", "BBB SA", "Stock", "EUR", conn=conn)
+    database.add_asset("FND", "World Fund", "ETF", "USD", conn=conn)
+    database.add_transaction(1, "Buy", "2024-01-01", 10, 100.0, 0.0, "USD", conn=conn) # 1000 at cost, 1200 at the latest close
+    database.add_transaction(2, "Buy", "2024-01-01", 10, 40.0, 0.0, "EUR", conn=conn)  # 400 EUR, no price: valued at cost
+    database.add_transaction(3, "Buy", "2024-01-01", 4, 100.0, 0.0, "USD", conn=conn)  # 400
+    database.add_prices([{"asset_id": 1, "date": "2024-01-02", "close": 120.0}], conn=conn)
+    database.add_fx_rates([{"base": "EUR", "quote": "USD", "date": "2024-01-01", "rate": 1.5}], conn=conn) # BBB: 600 USD
+    database.clear_result_cache()
+    yield conn
+    conn.close()
+
+def _values(result):
+    return {group["label"]: pytest.approx(group["value"]) for group in result["groups"]}
+
+
+def test_allocation_by_column(conn):
+    by_type = allocation.get_allocation("asset_type", base_currency="USD", today="2024-01-02", conn=conn)
+    assert by_type["total"] == pytest.approx(2200.0)
+    assert [group["label"] for group in by_type["groups"]] == ["Stock", "ETF"]
+    assert by_type["groups"][0]["value"] == pytest.approx(1800.0) and by_type["groups"][0]["weight"] == pytest.approx(1800.0 / 2200.0)
+    assert _values(allocation.get_allocation("currency", base_currency="USD", today="2024-01-02", conn=conn)) == {"USD": 1600.0, "EUR": 600.0}
+    in_eur = allocation.get_allocation("asset", base_currency="EUR", today="2024-01-02", conn=conn)
+    assert in_eur["base_currency"] == "EUR" and in_eur["total"] == pytest.approx(2200.0 / 1.5)
+    assert _values(in_eur) == {"AAA": 800.0, "BBB": 400.0, "FND": 400.0 / 1.5}
+
+def test_tag_hierarchy_and_drill_down(conn):
+    americas = allocation.add_tag("region", "Americas", conn=conn)
+    us = allocation.add_tag("region", "United States", americas, conn=conn)
+    europe = allocation.add_tag("region", "Europe", conn=conn)
+    france = allocation.add_tag("region", "France", europe, conn=conn)
+    assert allocation.add_tag("region", "France", europe, conn=conn) == france
+    assert allocation.add_tag("sector", "Tech", europe, conn=conn) is None # Parent of another category
+    assert allocation.set_asset_tags([{"asset_id": 1, "tag_id": us}, {"asset_id": 2, "tag_id": france},
+                                      {"asset_id": 3, "tag_id": us, "weight": 0.6}, {"asset_id": 3, "tag_id": france, "weight": 0.4}], conn=conn) == 4
+    top = allocation.get_allocation("region", base_currency="USD", today="2024-01-02", conn=conn)
+    assert _values(top) == {"Americas": 1200.0 + 240.0, "Europe": 600.0 + 160.0}
+    assert all(group["has_children"] for group in top["groups"])
+    assert sum(group["weight"] for group in top["groups"]) == pytest.approx(1.0)
+    statements = []
+    conn.set_trace_callback(statements.append)
+    drill = allocation.get_allocation("region", parent_tag_id=europe, base_currency="USD", today="2024-01-02", conn=conn)
+    conn.set_trace_callback(None)
+    assert sum("holdings" in statement for statement in statements) == 1 # Groups and total in one statement
+    assert drill["groups"] == [{"key": france, "label": "France", "value": pytest.approx(760.0), "tag_id": france, "has_children": False, "weight": pytest.approx(760.0 / 2200.0)}]
+    assert [(tag["name"], tag["depth"]) for tag in allocation.get_tags("region", conn=conn)] == [("Americas", 0), ("Europe", 0), ("France", 1), ("United States", 1)]
+
+def test_untagged_remainder_and_tag_deletion(conn):
+    europe = allocation.add_tag("region", "Europe", conn=conn)
+    france = allocation.add_tag("region", "France", europe, conn=conn)
+    allocation.set_asset_tags([{"asset_id": 2, "tag_id": france}, {"asset_id": 3, "tag_id": france, "weight": 0.5}], conn=conn)
+    assert _values(allocation.get_allocation("region", base_currency="USD", today="2024-01-02", conn=conn)) == {"Untagged": 1400.0, "Europe": 800.0}
+    assert allocation.remove_asset_tag(3, france, conn=conn)
+    assert _values(allocation.get_allocation("region", base_currency="USD", today="2024-01-02", conn=conn)) == {"Untagged": 1600.0, "Europe": 600.0}
+    assert allocation.delete_tag(europe, conn=conn)
+    assert allocation.get_tags(conn=conn) == []
+    assert conn.execute("SELECT COUNT(*) FROM asset_tags").fetchone()[0] == 0 and conn.execute("SELECT COUNT(*) FROM tag_ancestors").fetchone()[0] == 0
+    assert _values(allocation.get_allocation("region", base_currency="USD", today="2024-01-02", conn=conn)) == {"Untagged": 2200.0}
+
+def test_unconvertible_positions_are_reported(conn):
+    database.add_asset("JPX", "Tokyo Corp", "Stock", "JPY", conn=conn) # No JPY rate at all
+    database.add_transaction(4, "Buy", "2024-01-01", 100, 50.0, 0.0, "JPY", conn=conn)
+    by_type = allocation.get_allocation("asset_type", base_currency="USD", today="2024-01-02", conn=conn)
+    assert by_type["total"] == pytest.approx(2200.0) and _values(by_type) == {"Stock": 1800.0, "ETF": 400.0} # Not added in at a made-up rate
+    assert by_type["unconverted"] == [{"asset_id": 4, "label": "JPX", "currency": "JPY", "value": pytest.approx(5000.0)}]
+    asia = allocation.add_tag("region", "Asia", conn=conn)
+    allocation.set_asset_tags([{"asset_id": 4, "tag_id": asia}, {"asset_id": 1, "tag_id": asia}], conn=conn)
+    by_region = allocation.get_allocation("region", base_currency="USD", today="2024-01-02", conn=conn)
+    assert _values(by_region) == {"Asia": 1200.0, "Untagged": 1000.0} and by_region["unconverted"][0]["asset_id"] == 4
+    assert allocation.get_allocation("currency", base_currency="USD", today="2024-01-02", conn=conn)["unconverted"][0]["currency"] == "JPY"
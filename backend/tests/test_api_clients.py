@@ -0,0 +1,226 @@
+# tests/test_api_clients.py
+
+import pytest
+import datetime
+import json
+import sqlite3
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import urlparse, parse_qs
+
+import requests as requests_lib
+
+# Add src directory to sys.path
+src_path = Path(__file__).parent.parent / "src"
+sys.path.insert(0, str(src_path))
+import database
+import api_clients
+
+
+# --- Fake market data server (no network access needed) ---
+class FakeMarketData:
+    def __init__(self):
+        self.closes = {"AAA": 10.0, "BBB": 20.0, "CCC": 30.0}
+        self.rates = {("EUR", "USD"): 1.1, ("GBP", "USD"): 1.3}
+        self.requests = []
+        self.fail = False
+
+class FakeHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        market = self.server.market
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        market.requests.append((url.path, query))
+        if market.fail:
+            self.send_response(404); self.end_headers(); return
+        if url.path == "/quotes":
+            symbols = query.get("symbols", [""])[0].split(",")
+            body = {"quotes": [{"symbol": s, "date": "2024-05-01", "close": market.closes[s]} for s in symbols if s in market.closes]}
+        else:
+            pairs = [(p[:3], p[3:]) for p in query.get("pairs", [""])[0].split(",")]
+            body = {"rates": [{"base": b, "quote": q, "date": "2024-05-01", "rate": market.rates[(b, q)]} for b, q in pairs if (b, q) in market.rates]}
+        payload = json.dumps(body).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, *args): pass
+
+@pytest.fixture
+def market_server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FakeHandler)
+    server.market = FakeMarketData()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+@pytest.fixture
+def db_path(tmp_path, monkeypatch):
+    # File database: background refreshes open their own connection to it
+    path = tmp_path / "market.db"
+    monkeypatch.setenv("PIT_DATABASE_PATH", str(path))
+    database.initialize_database(path)
+    for ticker in ("AAA", "BBB", "CCC"):
+        database.add_asset(ticker, ticker, "Stock", "USD")
+    return path
+
+def make_client(server, **kwargs):
+    provider = api_clients.HttpJsonProvider(f"http://127.0.0.1:{server.server_port}", max_batch_size=2, retries=0)
+    return api_clients.MarketDataClient(provider, **kwargs)
+
+
+# --- Tests ---
+def test_batched_fetch_and_cache(db_path, market_server):
+    client = make_client(market_server)
+    quotes = client.get_quotes(["AAA", "BBB", "CCC", "UNKNOWN"])
+    assert {t: q["price"] for t, q in quotes.items()} == {"AAA": 10.0, "BBB": 20.0, "CCC": 30.0}
+    assert not any(q["stale"] for q in quotes.values())
+    assert len(market_server.market.requests) == 2 # 3 tickers in batches of 2
+    # Within the TTL the cache answers without touching the provider
+    assert client.get_quotes(["AAA", "CCC"])["CCC"]["price"] == 30.0
+    assert len(market_server.market.requests) == 2
+    assert database.get_setting(database.PORTFOLIO_DIRTY_SETTING) == "2024-05-01" # Fetched quotes feed the daily series
+    assert database.get_latest_prices([3, 1, 99]) == {3: 30.0, 1: 10.0} and database.get_latest_prices() == {1: 10.0, 2: 20.0, 3: 30.0}
+    client.close()
+
+def test_stale_while_revalidate(db_path, market_server):
+    client = make_client(market_server, price_ttl=0)
+    client.get_quotes(["AAA"])
+    market_server.market.closes["AAA"] = 11.0
+    routed = []
+    def submit(function): # Stands in for the server's writer lane
+        routed.append(threading.current_thread().name)
+        write_conn = database._get_db_connection()
+        try: return function(write_conn)
+        finally: write_conn.close()
+    with database.routing_writes(submit):
+        stale = client.get_quotes(["AAA"])["AAA"]
+    assert stale["price"] == 10.0 and stale["stale"] # Served from cache immediately
+    client.wait_for_refresh(timeout=5)
+    assert routed and routed[0].startswith("market-data-refresh") # The refresh writes through the writer too
+    conn = sqlite3.connect(db_path)
+    assert conn.execute("SELECT close FROM prices").fetchone()[0] == 11.0
+    conn.close()
+    assert database.get_setting(database.PORTFOLIO_DIRTY_SETTING) is None # And brings the daily series up to date
+    client.close()
+
+def test_offline_fallback(db_path, market_server):
+    client = make_client(market_server, price_ttl=0, stale_while_revalidate=False)
+    client.get_quotes(["AAA"])
+    market_server.market.fail = True
+    quotes = client.get_quotes(["AAA", "BBB"])
+    assert list(quotes) == ["AAA"] # BBB was never cached
+    assert quotes["AAA"]["price"] == 10.0 and quotes["AAA"]["stale"]
+    client.close()
+    offline = api_clients.MarketDataClient(None) # No provider configured: cache only
+    assert offline.get_quotes(["AAA"])["AAA"]["price"] == 10.0
+    offline.close()
+
+def test_fx_rates_and_per_series_ttl(db_path, market_server):
+    client = make_client(market_server, ttls={api_clients.fx_series_key("EUR", "USD"): 0})
+    rates = client.get_fx_rates([("EUR", "USD"), ("GBP", "USD")])
+    assert rates[("EUR", "USD")]["rate"] == 1.1 and rates[("GBP", "USD")]["rate"] == 1.3
+    freshness = database.get_market_data_freshness(["fx:EUR/USD", "fx:GBP/USD"])
+    assert freshness["fx:EUR/USD"][1] == 0 and freshness["fx:GBP/USD"][1] == api_clients.DEFAULT_FX_TTL
+    again = client.get_fx_rates([("EUR", "USD"), ("GBP", "USD")])
+    assert again[("EUR", "USD")]["stale"] and not again[("GBP", "USD")]["stale"]
+    client.wait_for_refresh(timeout=5)
+    client.close()
+
+def test_default_client_follows_provider_setting(db_path, market_server):
+    assert api_clients.get_default_client().provider is None # No market_data_url: cache only
+    url = f"http://127.0.0.1:{market_server.server_port}"
+    database.set_setting(api_clients.MARKET_DATA_URL_SETTING, url)
+    client = api_clients.get_default_client()
+    assert client.provider.base_url == url and api_clients.get_default_client() is client # Rebuilt once per change
+    assert api_clients.get_quotes(["AAA"])["AAA"]["price"] == 10.0
+    database.set_setting(api_clients.MARKET_DATA_URL_SETTING, "")
+    assert api_clients.get_default_client().provider is None
+    with pytest.raises(RuntimeError): client._fetch_pool.submit(int) # The replaced client was closed
+
+
+# --- Historical backfill ---
+class StubHistoryProvider(api_clients.MarketDataProvider):
+    """ Weekday closes for any ticker; records every range request """
+    def __init__(self, fail_tickers=()):
+        self.calls = []
+        self.fail_tickers = set(fail_tickers)
+
+    def fetch_history(self, ticker, start, end):
+        self.calls.append((ticker, start, end))
+        if ticker in self.fail_tickers: raise requests_lib.ConnectionError("provider down")
+        day, last, prices = datetime.date.fromisoformat(start), datetime.date.fromisoformat(end), []
+        while day <= last:
+            if day.weekday() < 5: prices.append({"date": day.isoformat(), "close": 100.0 + day.toordinal() % 7})
+            day += datetime.timedelta(days=1)
+        return prices
+
+@pytest.fixture
+def backfill_conn():
+    conn = sqlite3.connect(":memory:", check_same_thread=False); conn.row_factory = sqlite3.Row
+    database._create_schema(conn)
+    for asset_id, ticker in enumerate(("AAA", "BBB", "CCC"), start=1):
+        database.add_asset(ticker, ticker, "Stock", "USD", conn=conn)
+        database.add_transaction(asset_id, "Buy", f"2023-0{asset_id}-02", 1, 100.0, 0.0, "USD", conn=conn)
+    database.add_transaction(3, "Sell", "2023-06-30", 1, 100.0, 0.0, "USD", conn=conn) # CCC closed mid-year
+    yield conn
+    conn.close()
+
+def test_missing_ranges_merge_and_split():
+    covered = [("2024-02-01", "2024-02-10"), ("2024-02-20", "2024-06-30")]
+    assert api_clients._missing_ranges("2024-01-01", "2024-12-31", covered, merge_within_days=15) == [
+        ("2024-01-01", "2024-02-19"), ("2024-07-01", "2024-12-31")] # The 10 covered days in between are re-fetched
+    assert api_clients._missing_ranges("2024-01-01", "2024-01-10", [], max_span_days=4) == [
+        ("2024-01-01", "2024-01-04"), ("2024-01-05", "2024-01-08"), ("2024-01-09", "2024-01-10")]
+    assert api_clients._missing_ranges("2024-03-01", "2024-03-31", [("2024-01-01", "2024-12-31")]) == []
+
+def test_backfill_fills_gaps_and_is_idempotent(backfill_conn):
+    conn = backfill_conn
+    provider = StubHistoryProvider()
+    client = api_clients.MarketDataClient(provider)
+    summary = client.backfill_history(end="2023-12-31", conn=conn)
+    assert summary["complete"] and summary["requests"] == 3 # One range per asset
+    assert ("CCC", "2023-03-02", "2023-06-30") in provider.calls # Closed positions stop at their last trade
+    first_close = conn.execute("SELECT MIN(date) FROM prices WHERE asset_id = 1").fetchone()[0]
+    assert first_close == "2023-01-02"
+    # Complete cache (weekends and holidays included): zero provider calls
+    provider.calls.clear()
+    assert client.backfill_history(end="2023-12-31", conn=conn)["requests"] == 0
+    assert provider.calls == []
+    # Later end date and a deleted stretch: only the missing ranges are requested
+    conn.execute("DELETE FROM price_coverage WHERE asset_id = 2")
+    database._add_price_coverage(conn.cursor(), 2, "2023-02-02", "2023-05-31")
+    database._add_price_coverage(conn.cursor(), 2, "2023-06-10", "2023-12-31")
+    client.backfill_history(end="2024-01-31", conn=conn)
+    assert sorted(provider.calls) == [("AAA", "2024-01-01", "2024-01-31"), ("BBB", "2023-06-01", "2023-06-09"), ("BBB", "2024-01-01", "2024-01-31")]
+    assert database.get_price_coverage(conn=conn)[2] == [("2023-02-02", "2024-01-31")]
+    client.close()
+
+def test_backfill_resumes_from_checkpoint(backfill_conn):
+    conn = backfill_conn
+    provider = StubHistoryProvider()
+    client = api_clients.MarketDataClient(provider)
+    partial = client.backfill_history(end="2023-12-31", max_requests=1, assets_per_commit=1, conn=conn)
+    assert not partial["complete"] and partial["requests"] == 1
+    assert database.get_setting(api_clients.BACKFILL_CHECKPOINT_SETTING, conn=conn) == "2023-12-31|1"
+    resumed = client.backfill_history(end="2023-12-31", assets_per_commit=1, conn=conn)
+    assert resumed["complete"] and resumed["requests"] == 2
+    assert [call[0] for call in provider.calls] == ["AAA", "BBB", "CCC"]
+    assert database.get_setting(api_clients.BACKFILL_CHECKPOINT_SETTING, conn=conn) is None
+    client.close()
+
+def test_backfill_failed_ranges_are_retried(backfill_conn):
+    conn = backfill_conn
+    client = api_clients.MarketDataClient(StubHistoryProvider(fail_tickers={"BBB"}))
+    summary = client.backfill_history(end="2023-12-31", conn=conn)
+    assert summary["failed"] == ["BBB"] and not summary["complete"]
+    assert 2 not in database.get_price_coverage(conn=conn)
+    client.provider = StubHistoryProvider()
+    assert client.backfill_history(end="2023-12-31", conn=conn)["requests"] == 1
+    client.close()
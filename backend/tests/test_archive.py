@@ -0,0 +1,117 @@
+# tests/test_archive.py
+
+import pytest
+import random
+import sqlite3
+import sys
+from pathlib import Path
+
+import numpy as np
+
+# Add src directory to sys.path
+src_path = Path(__file__).parent.parent / "src"
+sys.path.insert(0, str(src_path))
+import database
+import calculations
+import corporate_actions
+import archive
+
+
+def make_conn():
+    conn = sqlite3.connect(":memory:")
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA foreign_keys = ON")
+    database._create_schema(conn)
+    return conn
+
+@pytest.fixture
+def portfolio_conn():
+    conn = make_conn()
+    rng = random.Random(11)
+    assets = [{"ticker": f"T{i}", "name": f"Asset {i}", "asset_type": "Stock", "currency": "USD" if i % 2 else "EUR", "isin": None if i % 3 else f"US{i:010d}"}
+              for i in range(20)]
+    database.bulk_upsert_assets(assets, conn=conn)
+    rows = []
+    for n in range(2000):
+        asset_id = rng.randint(1, 20)
+        kind = "Buy" if n < 40 or rng.random() < 0.6 else rng.choice(["Sell", "Dividend", "Split"])
+        rows.append({"asset_id": asset_id, "transaction_type": kind, "date": f"20{rng.randint(18, 24)}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}",
+                     "quantity": 4.0 if kind == "Split" else round(rng.uniform(0.1, 5), 4), "price": round(rng.uniform(5, 500), 2),
+                     "fees": rng.choice([0.0, 1.0, 2.5]), "currency": "USD", "notes": rng.choice([None, "dca", "rebalance"]), "fingerprint": f"fp{n}"})
+    rows.append({"asset_id": None, "transaction_type": "Deposit", "date": "2019-01-01", "quantity": None, "price": None, "fees": 0.0, "currency": "USD"})
+    database.bulk_add_transactions(rows, conn=conn)
+    corporate_actions.add_corporate_actions([{"asset_id": a, "action_type": "Split", "ex_date": f"2021-0{a}-15", "amount": 3} for a in range(1, 6)], conn=conn)
+    database.add_prices([{"asset_id": a, "date": f"2024-01-{d:02d}", "close": 100.0 + a + d / 10} for a in range(1, 21) for d in range(1, 29)], conn=conn)
+    database.set_setting("base_currency", "EUR", conn=conn)
+    database.set_setting("market_data_url", "http://localhost:9999", conn=conn)
+    yield conn
+    conn.close()
+
+def dump(conn, table, order):
+    return [tuple(row) for row in conn.execute(f"SELECT * FROM {table} ORDER BY {order}").fetchall()]
+
+
+# --- Tests ---
+def test_round_trip(portfolio_conn, tmp_path):
+    path = tmp_path / "portfolio.pit"
+    counts = archive.export_portfolio(path, batch_size=300, conn=portfolio_conn) # Several batches per table
+    assert counts == {"assets": 20, "transactions": 2001, "prices": 560, "corporate_actions": 5, "settings": 2 + 1, "tags": 0, "asset_tags": 0} # + the dirty marker
+    restored = make_conn()
+    assert archive.import_portfolio(path, conn=restored) == counts
+    for table, order in (("assets", "id"), ("transactions", "id"), ("prices", "asset_id, date"), ("holdings", "asset_id"), ("holdings_history", "transaction_id")):
+        assert dump(restored, table, order) == dump(portfolio_conn, table, order), table
+    assert database.get_setting("base_currency", conn=restored) == "EUR"
+    assert database.search_assets("T1", conn=restored)[0]["ticker"] == "T1" # FTS index filled by the triggers
+    restored.close()
+
+def test_import_refuses_non_empty_database_unless_replacing(portfolio_conn, tmp_path):
+    path = tmp_path / "portfolio.pit"
+    archive.export_portfolio(path, conn=portfolio_conn)
+    database.add_transaction(1, "Buy", "2025-01-01", 1, 1.0, 0.0, "USD", conn=portfolio_conn)
+    before = dump(portfolio_conn, "transactions", "id")
+    assert archive.import_portfolio(path, conn=portfolio_conn) is None
+    assert dump(portfolio_conn, "transactions", "id") == before # Rolled back
+    assert archive.import_portfolio(path, replace=True, conn=portfolio_conn)["transactions"] == 2001
+    assert portfolio_conn.execute("SELECT COUNT(*) FROM transactions WHERE date = '2025-01-01'").fetchone()[0] == 0
+
+def test_read_table_and_column_encodings(tmp_path):
+    conn = make_conn()
+    conn.execute("INSERT INTO settings (key, value) VALUES ('a', 'x'), ('b', NULL), ('c', 42), ('d', 1.5)")
+    path = tmp_path / "mixed.pit"
+    archive.export_portfolio(path, conn=conn)
+    assert archive.read_table(path, "settings") == {"key": ["a", "b", "c", "d"], "value": ["x", None, "42", "1.5"]}
+    assert archive.read_table(path, "transactions") == {name: [] for name in archive.read_table(path, "transactions")}
+    values = [None, 3, 2 ** 40, -7, None, 0]
+    assert archive._decode_column(archive._encode_column(values), len(values)) == values
+    values = ["2024-02-29", None, "1999-12-31", "2024-02-29 10:00"]
+    assert archive._decode_column(archive._encode_column(values), len(values)) == values
+    values = [1, "x", 2.5, None]
+    assert archive._decode_column(archive._encode_column(values), len(values)) == values
+    conn.close()
+
+def test_archive_feeds_transaction_arrays(portfolio_conn, tmp_path):
+    path = tmp_path / "portfolio.pit"
+    archive.export_portfolio(path, conn=portfolio_conn)
+    expected = calculations.load_transaction_arrays(conn=portfolio_conn)
+    loaded = calculations.load_archive_transaction_arrays(path)
+    assert set(loaded) == set(expected)
+    for name in expected:
+        assert loaded[name].dtype == expected[name].dtype
+        np.testing.assert_array_equal(loaded[name], expected[name])
+
+def test_archive_is_smaller_than_database(portfolio_conn, tmp_path):
+    db_file = tmp_path / "portfolio.db"
+    portfolio_conn.execute(f"VACUUM INTO '{db_file}'")
+    path = tmp_path / "portfolio.pit"
+    archive.export_portfolio(path, conn=portfolio_conn)
+    assert path.stat().st_size * 4 < db_file.stat().st_size
+
+def test_invalid_archive(tmp_path):
+    path = tmp_path / "junk.pit"
+    path.write_bytes(b"not an archive")
+    with pytest.raises(archive.ArchiveError):
+        archive.read_table(path, "assets")
+    conn = make_conn()
+    assert archive.import_portfolio(path, conn=conn) is None
+    assert calculations.load_archive_transaction_arrays(path) is None
+    conn.close()
@@ -0,0 +1,295 @@
+# tests/test_calculations.py
+
+import pytest
+import random
+import sqlite3
+import sys
+from collections import deque
+from pathlib import Path
+
+np = pytest.importorskip("numpy")
+
+# Add src directory to sys.path
+src_path = Path(__file__).parent.parent / "src"
+sys.path.insert(0, str(src_path))
+import database
+import calculations
+
+
+# --- Pure-Python reference (test oracle) ---
+def reference_holdings(transactions):
+    """ Replays transactions one by one per asset: average cost and FIFO lots """
+    state = {}
+    for tx in sorted(transactions, key=lambda t: (t["asset_id"], t["date"], t["id"])):
+        s = state.setdefault(tx["asset_id"], {"quantity": 0.0, "avg_basis": 0.0, "avg_realized": 0.0, "lots": deque(), "fifo_realized": 0.0})
+        q, p, fee = tx["quantity"], tx["price"], tx["fees"]
+        if tx["transaction_type"] == "Buy":
+            s["quantity"] += q
+            s["avg_basis"] += q * p + fee
+            s["lots"].append([q, (q * p + fee) / q])
+        elif tx["transaction_type"] == "Sell":
+            fraction = min(q / s["quantity"], 1.0) if s["quantity"] > 0 else 0.0
+            proceeds = q * p - fee
+            s["avg_realized"] += proceeds - s["avg_basis"] * fraction
+            s["avg_basis"] *= 1.0 - fraction
+            remaining, consumed = min(q, s["quantity"]), 0.0
+            while remaining > 1e-12 and s["lots"]:
+                lot = s["lots"][0]
+                take = min(lot[0], remaining)
+                consumed += take * lot[1]
+                lot[0] -= take
+                remaining -= take
+                if lot[0] <= 1e-12: s["lots"].popleft()
+            s["fifo_realized"] += proceeds - consumed
+            s["quantity"] = max(s["quantity"] - q, 0.0)
+        elif tx["transaction_type"] == "Split":
+            s["quantity"] *= q
+            for lot in s["lots"]: lot[0] *= q; lot[1] /= q
+    return {asset_id: {"quantity": s["quantity"], "avg_cost_basis": s["avg_basis"], "avg_realized_pnl": s["avg_realized"],
+                       "fifo_cost_basis": sum(l[0] * l[1] for l in s["lots"]), "fifo_realized_pnl": s["fifo_realized"]}
+            for asset_id, s in state.items()}
+
+def random_transactions(seed, assets=20, per_asset=60):
+    rng = random.Random(seed)
+    transactions = []
+    for asset_id in range(1, assets + 1):
+        held = 0.0
+        for i in range(per_asset):
+            date = f"2020-{1 + i // 28 % 12:02d}-{1 + i % 28:02d}"
+            roll = rng.random()
+            if held > 0 and roll < 0.05:
+                tx = {"transaction_type": "Split", "quantity": rng.choice([2.0, 3.0, 0.5]), "price": None, "fees": 0.0}
+                held *= tx["quantity"]
+            elif held > 0 and roll < 0.4:
+                q = held if rng.random() < 0.2 else round(rng.uniform(0.1, held), 4) # Sometimes close the position
+                tx = {"transaction_type": "Sell", "quantity": q, "price": rng.uniform(10, 200), "fees": rng.choice([0.0, 1.0])}
+                held -= q
+            else:
+                q = float(rng.randint(1, 100))
+                tx = {"transaction_type": "Buy", "quantity": q, "price": rng.uniform(10, 200), "fees": rng.choice([0.0, 1.5])}
+                held += q
+            tx.update({"id": len(transactions) + 1, "asset_id": asset_id, "date": date, "currency": "USD"})
+            transactions.append(tx)
+    rng.shuffle(transactions) # Engine must not depend on input order
+    return transactions
+
+
+# --- Tests ---
+@pytest.mark.parametrize("seed", [1, 2, 3])
+def test_engine_matches_reference(seed):
+    transactions = random_transactions(seed)
+    expected = reference_holdings(transactions)
+    summary = calculations.compute_holdings(calculations.transaction_arrays_from_rows(transactions))
+    for i, asset_id in enumerate(summary["asset_id"]):
+        for key, value in expected[int(asset_id)].items():
+            assert summary[key][i] == pytest.approx(value, rel=1e-6, abs=1e-6), f"asset {asset_id} {key}"
+
+def test_average_and_fifo_simple_case():
+    rows = [
+        {"id": 1, "asset_id": 7, "transaction_type": "Buy", "date": "2024-01-01", "quantity": 10, "price": 100.0, "fees": 0.0},
+        {"id": 2, "asset_id": 7, "transaction_type": "Buy", "date": "2024-02-01", "quantity": 10, "price": 200.0, "fees": 0.0},
+        {"id": 3, "asset_id": 7, "transaction_type": "Sell", "date": "2024-03-01", "quantity": 10, "price": 250.0, "fees": 0.0},
+        {"id": 4, "asset_id": 7, "transaction_type": "Split", "date": "2024-04-01", "quantity": 2, "price": None, "fees": 0.0},
+    ]
+    summary = calculations.compute_holdings(calculations.transaction_arrays_from_rows(rows), prices={7: 150.0})
+    assert summary["quantity"][0] == 20 # 10 shares left, split 2:1
+    assert summary["avg_cost_basis"][0] == pytest.approx(1500.0)
+    assert summary["avg_realized_pnl"][0] == pytest.approx(1000.0)
+    assert summary["fifo_cost_basis"][0] == pytest.approx(2000.0)
+    assert summary["fifo_realized_pnl"][0] == pytest.approx(1500.0)
+    assert summary["market_value"][0] == pytest.approx(3000.0)
+    assert summary["fifo_unrealized_pnl"][0] == pytest.approx(1000.0)
+
+def test_get_holdings_summary_from_database():
+    conn = sqlite3.connect(":memory:"); conn.row_factory = sqlite3.Row
+    database._create_schema(conn)
+    asset_id = database.add_asset("AAPL", "Apple", "Stock", "USD", conn=conn)
+    database.add_transaction(asset_id, "Buy", "2024-01-01", 10, 100.0, 1.0, "USD", conn=conn)
+    database.add_transaction(asset_id, "Dividend", "2024-02-01", 10, 0.24, 0.0, "USD", conn=conn) # Ignored by holdings
+    database.add_transaction(None, "Fee", "2024-02-01", None, 5.0, 0.0, "USD", conn=conn) # Ignored by holdings
+    database.add_transaction(asset_id, "Sell", "2024-03-01", 4, 120.0, 1.0, "USD", conn=conn)
+    holdings = calculations.get_holdings_summary(prices={str(asset_id): 130.0}, method="average", conn=conn)
+    conn.close()
+    assert len(holdings) == 1
+    holding = holdings[0]
+    assert holding["asset_id"] == asset_id and holding["quantity"] == 6
+    assert holding["cost_basis"] == pytest.approx(600.6) # 1001 * 6/10
+    assert holding["avg_cost"] == pytest.approx(100.1)
+    assert holding["realized_pnl"] == pytest.approx(78.6) # 479 proceeds - 400.4 cost
+    assert holding["unrealized_pnl"] == pytest.approx(179.4)
+    assert holding["last_transaction_date"] == "2024-03-01"
+
+def test_empty_portfolio():
+    conn = sqlite3.connect(":memory:"); conn.row_factory = sqlite3.Row
+    database._create_schema(conn)
+    assert calculations.get_holdings_summary(conn=conn) == []
+    conn.close()
+
+def test_holdings_snapshot_matches_engine():
+    conn = sqlite3.connect(":memory:"); conn.row_factory = sqlite3.Row
+    database._create_schema(conn)
+    transactions = random_transactions(4, assets=5, per_asset=40)
+    for asset_id in range(1, 6):
+        database.add_asset(f"T{asset_id}", f"Test {asset_id}", "Stock", "USD", conn=conn)
+    for tx in transactions: # Shuffled order: many of these are back-dated inserts
+        database.add_transaction(tx["asset_id"], tx["transaction_type"], tx["date"], tx["quantity"], tx["price"], tx["fees"], "USD", conn=conn)
+    snapshot = {row["asset_id"]: row for row in conn.execute("SELECT * FROM holdings").fetchall()}
+    summary = calculations.compute_holdings(calculations.load_transaction_arrays(conn=conn))
+    conn.close()
+    for i, asset_id in enumerate(summary["asset_id"]):
+        assert snapshot[int(asset_id)]["quantity"] == pytest.approx(summary["quantity"][i], abs=1e-6)
+        assert snapshot[int(asset_id)]["cost_basis"] == pytest.approx(summary["avg_cost_basis"][i], rel=1e-6, abs=1e-6)
+        assert snapshot[int(asset_id)]["realized_pnl"] == pytest.approx(summary["avg_realized_pnl"][i], rel=1e-6, abs=1e-6)
+
+
+# --- Daily portfolio series ---
+def reference_series(conn):
+    """ Brute-force daily value: per day and asset, last quantity and last price (closes beat trades on the same day) """
+    history = conn.execute("SELECT asset_id, date, quantity FROM holdings_history ORDER BY date, transaction_id").fetchall()
+    prices = [(r[0], r[1], 0, r[2]) for r in conn.execute("SELECT asset_id, date, price FROM transactions WHERE transaction_type IN ('Buy', 'Sell') AND price > 0 ORDER BY id")]
+    prices += [(r[0], r[1], 1, r[2]) for r in conn.execute("SELECT asset_id, date, close FROM prices")]
+    dates = [r[1] for r in history] + [p[1] for p in prices]
+    day, last, series = np.datetime64(min(dates)), np.datetime64(max(dates)), {}
+    while day <= last:
+        d, total = str(day), 0.0
+        for asset_id in {r[0] for r in history}:
+            quantities = [r[2] for r in history if r[0] == asset_id and r[1] <= d]
+            known = sorted(((p[1], p[2], p[3]) for p in prices if p[0] == asset_id and p[1] <= d), key=lambda k: k[:2])
+            if quantities and quantities[-1] and known: total += quantities[-1] * known[-1][2]
+        series[d] = total
+        day += 1
+    return series
+
+@pytest.fixture
+def series_conn():
+    conn = sqlite3.connect(":memory:"); conn.row_factory = sqlite3.Row
+    database._create_schema(conn)
+    for ticker in ("AAA", "BBB"):
+        database.add_asset(ticker, ticker, "Stock", "USD", conn=conn)
+    yield conn
+    conn.close()
+
+def assert_series_matches(conn):
+    calculations.refresh_portfolio_daily(conn=conn) # What the IPC handler does after every write
+    expected = reference_series(conn)
+    series = calculations.get_portfolio_series(conn=conn)
+    actual = {row["date"]: row["value"] or 0.0 for row in series}
+    for date, value in expected.items():
+        assert actual.get(date, 0.0) == pytest.approx(value), date
+
+def test_portfolio_series_matches_reference(series_conn):
+    conn = series_conn
+    database.add_transaction(1, "Buy", "2024-01-02", 10, 100.0, 0.0, "USD", conn=conn)
+    database.add_transaction(2, "Buy", "2024-01-05", 5, 50.0, 0.0, "USD", conn=conn)
+    database.add_prices([{"asset_id": 1, "date": "2024-01-03", "close": 105.0}, {"asset_id": 1, "date": "2024-01-10", "close": 110.0},
+                         {"asset_id": 2, "date": "2024-01-05", "close": 52.0}], conn=conn)
+    database.add_transaction(1, "Sell", "2024-01-08", 10, 108.0, 0.0, "USD", conn=conn) # Closes AAA
+    assert_series_matches(conn)
+    assert database.get_setting(database.PORTFOLIO_DIRTY_SETTING, conn=conn) is None
+    # Incremental: a back-dated trade and a later price only recompute from the earliest change
+    database.add_transaction(2, "Buy", "2024-01-04", 5, 49.0, 0.0, "USD", conn=conn)
+    database.add_prices([{"asset_id": 2, "date": "2024-01-15", "close": 60.0}], conn=conn)
+    assert database.get_setting(database.PORTFOLIO_DIRTY_SETTING, conn=conn) == "2024-01-04"
+    assert_series_matches(conn)
+    assert calculations.refresh_portfolio_daily(conn=conn) == 0 # Already current
+
+def test_portfolio_series_random_incremental(series_conn):
+    conn = series_conn
+    rng = random.Random(7)
+    for step in range(40):
+        asset_id = rng.choice((1, 2))
+        day = f"2024-02-{rng.randint(1, 28):02d}"
+        if rng.random() < 0.3:
+            database.add_prices([{"asset_id": asset_id, "date": day, "close": rng.uniform(10, 20)}], conn=conn)
+        else:
+            database.add_transaction(asset_id, "Buy", day, rng.randint(1, 5), rng.uniform(10, 20), 0.0, "USD", conn=conn)
+        if step % 8 == 0: calculations.refresh_portfolio_daily(conn=conn)
+    assert_series_matches(conn)
+
+def test_portfolio_series_ranges_and_frequencies(series_conn):
+    conn = series_conn
+    database.add_transaction(1, "Buy", "2024-01-30", 1, 10.0, 0.0, "USD", conn=conn)
+    database.add_prices([{"asset_id": 1, "date": "2024-02-15", "close": 20.0}, {"asset_id": 1, "date": "2024-03-02", "close": 30.0}], conn=conn)
+    assert calculations.get_portfolio_series(conn=conn) == [] # Reads don't refresh the series
+    calculations.refresh_portfolio_daily(conn=conn)
+    monthly = calculations.get_portfolio_series(freq="M", conn=conn)
+    assert monthly == [{"date": "2024-01-31", "value": 10.0}, {"date": "2024-02-29", "value": 20.0}, {"date": "2024-03-02", "value": 30.0}]
+    window = calculations.get_portfolio_series(start="2024-02-14", end="2024-02-16", conn=conn)
+    assert [row["value"] for row in window] == [10.0, 20.0, 20.0]
+    assert calculations.get_portfolio_series(asset_id=2, conn=conn) == []
+    assert calculations.get_portfolio_series(freq="Q", conn=conn) is None
+
+def test_refresh_inside_caller_transaction_does_not_commit_it(series_conn):
+    conn = series_conn
+    database.add_transaction(1, "Buy", "2024-01-02", 10, 100.0, 0.0, "USD", conn=conn)
+    conn.execute("BEGIN")
+    conn.execute("INSERT INTO settings (key, value) VALUES ('pending', 'x')")
+    assert calculations.refresh_portfolio_daily(conn=conn) > 0
+    assert conn.in_transaction # Left to the caller
+    conn.rollback()
+    assert database.get_setting("pending", conn=conn) is None
+    assert database.get_setting(database.PORTFOLIO_DIRTY_SETTING, conn=conn) == "2024-01-02" # The refresh went with it
+
+def test_portfolio_series_converts_to_base_currency(series_conn):
+    conn = series_conn
+    database.add_asset("CCC", "CCC", "Stock", "EUR", conn=conn)
+    database.add_transaction(1, "Buy", "2024-01-02", 10, 100.0, 0.0, "USD", conn=conn)
+    database.add_transaction(3, "Buy", "2024-01-02", 10, 100.0, 0.0, "EUR", conn=conn)
+    database.add_fx_rates([{"base": "EUR", "quote": "USD", "date": "2024-01-01", "rate": 1.25}, {"base": "EUR", "quote": "USD", "date": "2024-01-03", "rate": 1.5}], conn=conn)
+    database.add_prices([{"asset_id": 1, "date": "2024-01-03", "close": 100.0}], conn=conn)
+    calculations.refresh_portfolio_daily(conn=conn)
+    assert calculations.get_portfolio_series(base_currency="USD", conn=conn) == [{"date": "2024-01-02", "value": pytest.approx(2250.0)}, {"date": "2024-01-03", "value": pytest.approx(2500.0)}]
+    assert calculations.get_portfolio_series(base_currency="EUR", conn=conn)[0]["value"] == pytest.approx(1000.0 / 1.25 + 1000.0)
+
+
+# --- Returns ---
+def test_xirr_vectorized():
+    segments = [0, 0, 1, 1, 1, 2, 2]
+    years = [0.0, 1.0, 0.0, 0.5, 1.0, 0.0, 1.0]
+    amounts = [-1000.0, 1100.0, -100.0, -100.0, 230.0, 100.0, 50.0] # Last segment: no sign change
+    rates = calculations.xirr(segments, years, amounts, 3)
+    assert rates[0] == pytest.approx(0.1)
+    assert sum(a / (1 + rates[1]) ** t for a, t in zip(amounts[2:5], years[2:5])) == pytest.approx(0.0, abs=1e-6)
+    assert np.isnan(rates[2])
+
+def test_twr_and_xirr_from_database(series_conn):
+    conn = series_conn
+    database.add_transaction(1, "Buy", "2024-01-01", 10, 100.0, 0.0, "USD", conn=conn)
+    database.add_transaction(1, "Buy", "2024-01-03", 10, 110.0, 0.0, "USD", conn=conn)
+    database.add_transaction(1, "Sell", "2024-01-04", 20, 121.0, 0.0, "USD", conn=conn) # Closed
+    database.add_transaction(2, "Buy", "2024-01-02", 4, 50.0, 0.0, "USD", conn=conn)
+    database.add_prices([{"asset_id": 1, "date": "2024-01-02", "close": 110.0}, {"asset_id": 1, "date": "2024-01-03", "close": 121.0},
+                         {"asset_id": 2, "date": "2024-01-04", "close": 40.0}], conn=conn)
+    calculations.refresh_portfolio_daily(conn=conn)
+    database.clear_result_cache()
+    returns = calculations.get_returns(base_currency="USD", conn=conn)
+    aaa, bbb = returns["assets"]
+    assert aaa["twr"] == pytest.approx(0.21) # Flows neutralized: 1.1 * 1.1
+    assert (aaa["inflow"], aaa["outflow"], aaa["end_value"]) == (pytest.approx(2100.0), pytest.approx(2420.0), 0.0)
+    flows = [(-1000.0, 1), (-1100.0, 3), (2420.0, 4)] # Days from the day before the first flow
+    assert sum(a / (1 + aaa["xirr"]) ** (t / 365) for a, t in flows) == pytest.approx(0.0, abs=1e-6)
+    assert bbb["twr"] == pytest.approx(-0.2) and bbb["end_value"] == pytest.approx(160.0)
+    window = calculations.get_returns(start="2024-01-03", end="2024-01-04", base_currency="USD", conn=conn)
+    assert window["assets"][0]["twr"] == pytest.approx(0.1) and window["assets"][0]["start_value"] == pytest.approx(1100.0)
+    portfolio = returns["portfolio"]
+    assert portfolio["asset_id"] is None and portfolio["inflow"] == pytest.approx(2300.0)
+    assert portfolio["twr"] == pytest.approx(1300 / (1000 + 200) * 2620 / (1300 + 1100) * (160 + 2420) / 2620 - 1) # Daily totals linked
+
+def test_period_returns_and_movers(series_conn):
+    conn = series_conn
+    database.add_transaction(1, "Buy", "2024-01-01", 10, 100.0, 0.0, "USD", conn=conn)
+    database.add_transaction(2, "Buy", "2024-01-01", 10, 100.0, 0.0, "USD", conn=conn)
+    database.add_prices([{"asset_id": 1, "date": "2024-01-03", "close": 110.0}, {"asset_id": 2, "date": "2024-01-04", "close": 80.0},
+                         {"asset_id": 1, "date": "2024-01-04", "close": 121.0}], conn=conn)
+    database.add_fx_rates([{"base": "EUR", "quote": "USD", "date": "2024-01-01", "rate": 1.25}], conn=conn)
+    calculations.refresh_portfolio_daily(conn=conn)
+    database.clear_result_cache()
+    periods = calculations.get_period_returns(today="2024-01-10", base_currency="USD", conn=conn)
+    assert periods["as_of"] == "2024-01-04" # Last valued day
+    assert periods["returns"]["daily"] == pytest.approx((1210 + 800) / (1100 + 1000) - 1)
+    assert periods["returns"]["ytd"] == periods["returns"]["overall"] == pytest.approx(2010 / 2000 - 1)
+    in_eur = calculations.get_period_returns(today="2024-01-10", base_currency="EUR", conn=conn)
+    assert in_eur["returns"]["overall"] == pytest.approx(periods["returns"]["overall"]) # Constant rate: same return
+    movers = calculations.get_movers("wtd", today="2024-01-04", base_currency="USD", conn=conn)
+    assert [(m["ticker"], m["change"]) for m in movers["gainers"]] == [("AAA", pytest.approx(0.21))]
+    assert [(m["ticker"], m["change"]) for m in movers["losers"]] == [("BBB", pytest.approx(-0.2))]
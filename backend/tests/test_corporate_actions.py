@@ -0,0 +1,127 @@
+# tests/test_corporate_actions.py
+
+import pytest
+import datetime
+import sqlite3
+import sys
+from pathlib import Path
+
+np = pytest.importorskip("numpy")
+
+# Add src directory to sys.path
+src_path = Path(__file__).parent.parent / "src"
+sys.path.insert(0, str(src_path))
+import database
+import calculations
+import corporate_actions
+
+
+@pytest.fixture
+def conn():
+    conn = sqlite3.connect(":memory:")
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA foreign_keys = ON")
+    database._create_schema(conn)
+    for ticker in ("AAA", "BBB", "CCC", "NEW"):
+        database.add_asset(ticker, f"{ticker} Corp", "Stock", "USD", conn=conn)
+    database.add_transaction(1, "Buy", "2023-01-10", 10, 100.0, 0.0, "USD", conn=conn)
+    database.add_transaction(2, "Buy", "2023-01-10", 50, 20.0, 0.0, "USD", conn=conn)
+    database.add_transaction(3, "Buy", "2023-01-10", 5, 40.0, 0.0, "USD", conn=conn)
+    database.clear_result_cache()
+    yield conn
+    conn.close()
+
+def quarterly_dividends(asset_id, amount, last_ex, count=4, pay_lag=14):
+    last = datetime.date.fromisoformat(last_ex)
+    rows = []
+    for i in range(count):
+        ex = last - datetime.timedelta(days=91 * i)
+        rows.append({"asset_id": asset_id, "action_type": "Dividend", "ex_date": ex.isoformat(),
+                     "pay_date": (ex + datetime.timedelta(days=pay_lag)).isoformat(), "amount": amount, "currency": "USD"})
+    return rows
+
+
+# --- Storage ---
+def test_add_and_get_corporate_actions(conn):
+    rows = quarterly_dividends(1, 0.5, "2024-03-01")
+    assert corporate_actions.add_corporate_actions(rows, conn=conn) == 4
+    rows[0]["amount"] = 0.55 # Re-delivered event: updated in place
+    assert corporate_actions.add_corporate_actions(rows[:1], conn=conn) == 1
+    actions = corporate_actions.get_corporate_actions(asset_id=1, start="2024-01-01", conn=conn)
+    assert [(a["ex_date"], a["amount"], a["ticker"]) for a in actions] == [("2024-03-01", 0.55, "AAA")]
+    assert corporate_actions.add_corporate_actions([{"asset_id": 1, "action_type": "Merger", "ex_date": "2024-01-01", "amount": 1}], conn=conn) is None
+    assert len(corporate_actions.get_corporate_actions(conn=conn)) == 4
+
+
+# --- Adjustment ---
+def test_adjustment_factors_vectorized():
+    events = {"asset_id": np.array([1, 1, 2]), "date": np.array(["2021-01-01", "2022-01-01", "2021-06-01"], dtype="datetime64[D]"),
+              "quantity_factor": np.array([2.0, 3.0, 1.0]), "price_factor": np.array([0.5, 1 / 3, 0.8])}
+    asset_ids = [1, 1, 1, 1, 2, 2, 3]
+    dates = np.array(["2020-06-01", "2021-01-01", "2021-06-01", "2023-01-01", "2021-05-31", "2021-06-01", "2020-01-01"], dtype="datetime64[D]")
+    quantity_factor, price_factor = corporate_actions.adjustment_factors(asset_ids, dates, events)
+    assert quantity_factor == pytest.approx([6, 3, 3, 1, 1, 1, 1]) # Ex-date rows are already post-split
+    assert price_factor == pytest.approx([1 / 6, 1 / 3, 1 / 3, 1, 0.8, 1, 1])
+
+def test_adjusted_transactions_and_prices(conn):
+    database.add_transaction(1, "Buy", "2023-06-01", 5, 60.0, 0.0, "USD", conn=conn)
+    database.add_transaction(1, "Split", "2023-03-01", 2, 0.0, 0.0, "USD", conn=conn) # Recorded as a transaction
+    corporate_actions.add_corporate_actions([{"asset_id": 1, "action_type": "Split", "ex_date": "2024-01-02", "amount": 3},
+                                            {"asset_id": 2, "action_type": "SpinOff", "ex_date": "2023-06-01", "amount": 0.5,
+                                             "target_asset_id": 4, "cost_fraction": 0.25}], conn=conn)
+    arrays = corporate_actions.get_adjusted_transaction_arrays(conn=conn)
+    trades = arrays["asset_id"] == 1
+    assert arrays["quantity"][trades].tolist() == pytest.approx([60, 2, 15, 3]) # Buy, split row (unchanged), buy, split action row
+    assert arrays["price"][trades].tolist() == pytest.approx([100 / 6, 0.0, 20, 0.0])
+    database.add_prices([{"asset_id": 2, "date": "2023-05-31", "close": 20.0}, {"asset_id": 2, "date": "2023-06-01", "close": 15.0}], conn=conn)
+    prices = corporate_actions.get_adjusted_prices(2, conn=conn)
+    assert [(p["close"], p["adjusted_close"]) for p in prices] == [(20.0, pytest.approx(15.0)), (15.0, 15.0)]
+
+def test_split_actions_apply_to_holdings(conn):
+    corporate_actions.add_corporate_actions([{"asset_id": 1, "action_type": "Split", "ex_date": "2023-06-01", "amount": 4},
+                                            {"asset_id": 1, "action_type": "Dividend", "ex_date": "2024-05-01", "amount": 0.25, "currency": "USD"},
+                                            {"asset_id": 2, "action_type": "Split", "ex_date": "2022-01-01", "amount": 2}], conn=conn) # Before the first buy
+    holdings = {h["asset_id"]: h for h in database.get_holdings(conn=conn)}
+    assert holdings[1]["quantity"] == 40 and holdings[1]["cost_basis"] == 1000 and holdings[1]["last_transaction_date"] == "2023-01-10"
+    assert holdings[2]["quantity"] == 50
+    summary = {h["asset_id"]: h for h in calculations.get_holdings_summary(conn=conn)}
+    assert summary[1]["quantity"] == pytest.approx(40) and summary[1]["last_transaction_date"] == "2023-01-10"
+    assert corporate_actions.get_projected_dividend_income(horizon_days=60, today="2024-04-01", conn=conn) == {"USD": pytest.approx(10.0)}
+    database.add_transaction(1, "Sell", "2023-06-01", 40, 30.0, 0.0, "USD", conn=conn) # Trades on the ex-date are post-split
+    assert database.get_holdings(conn=conn)[0]["asset_id"] == 2
+    assert database.check_holdings_consistency(conn=conn) == []
+
+
+# --- Dividend Projections ---
+def test_upcoming_dividends_projects_cadence(conn):
+    corporate_actions.add_corporate_actions(quarterly_dividends(1, 0.5, "2024-03-01") + quarterly_dividends(2, 0.1, "2024-01-15", count=3), conn=conn)
+    corporate_actions.add_corporate_actions([{"asset_id": 3, "action_type": "Dividend", "ex_date": "2024-04-20", "amount": 1.0, "currency": "USD"}], conn=conn)
+    upcoming = corporate_actions.get_upcoming_dividends(horizon_days=120, today="2024-04-01", conn=conn)
+    assert [(d["ticker"], d["date"], d["estimated"]) for d in upcoming] == [
+        ("BBB", "2024-04-15", True), ("CCC", "2024-04-20", False), ("AAA", "2024-05-31", True), ("BBB", "2024-07-15", True)]
+    aaa = upcoming[2]
+    assert aaa["pay_date"] == "2024-06-14" and aaa["amount_per_share"] == 0.5 and aaa["amount"] == pytest.approx(5.0)
+    income = corporate_actions.get_projected_dividend_income(horizon_days=120, today="2024-04-01", conn=conn)
+    assert income == {"USD": pytest.approx(5.0 + 5.0 + 5.0 + 5.0)}
+
+def test_upcoming_dividends_skips_suspended_and_closed_positions(conn):
+    corporate_actions.add_corporate_actions(quarterly_dividends(1, 0.5, "2022-06-01") + quarterly_dividends(2, 0.1, "2024-03-01"), conn=conn)
+    database.add_transaction(2, "Sell", "2024-03-20", 50, 25.0, 0.0, "USD", conn=conn)
+    assert corporate_actions.get_upcoming_dividends(horizon_days=365, today="2024-04-01", conn=conn) == []
+
+def test_upcoming_dividends_from_received_dividends(conn):
+    for date in ("2023-03-15", "2023-06-14", "2023-09-13", "2023-12-13"):
+        database.add_transaction(2, "Dividend", date, 1, 12.5, 0.0, "USD", conn=conn) # Total received, quantity 1
+    upcoming = corporate_actions.get_upcoming_dividends(horizon_days=100, today="2024-01-01", conn=conn)
+    assert [(d["date"], d["amount_per_share"]) for d in upcoming] == [("2024-03-13", pytest.approx(0.25))] # 12.5 / 50 shares
+
+def test_projection_cache_invalidated_by_writes(conn):
+    corporate_actions.add_corporate_actions(quarterly_dividends(1, 0.5, "2024-03-01"), conn=conn)
+    first = corporate_actions.get_upcoming_dividends(horizon_days=120, today="2024-04-01", conn=conn)
+    assert corporate_actions.get_upcoming_dividends(horizon_days=120, today="2024-04-01", conn=conn) is first # Served from cache
+    database.add_transaction(1, "Buy", "2024-03-20", 10, 100.0, 0.0, "USD", conn=conn)
+    second = corporate_actions.get_upcoming_dividends(horizon_days=120, today="2024-04-01", conn=conn)
+    assert second is not first and second[0]["quantity"] == 20
+    corporate_actions.add_corporate_actions([{"asset_id": 1, "action_type": "Dividend", "ex_date": "2024-05-20", "amount": 0.6, "currency": "USD"}], conn=conn)
+    third = corporate_actions.get_upcoming_dividends(horizon_days=120, today="2024-04-01", conn=conn)
+    assert [(d["date"], d["estimated"]) for d in third][:1] == [("2024-05-20", False)]
@@ -0,0 +1,72 @@
+# tests/test_dashboard.py
+
+import pytest
+import sqlite3
+import sys
+from pathlib import Path
+
+np = pytest.importorskip("numpy")
+
+# Add src directory to sys.path
+src_path = Path(__file__).parent.parent / "src"
+sys.path.insert(0, str(src_path))
+import database
+import calculations
+import corporate_actions
+import dashboard
+
+
+@pytest.fixture
+def conn():
+    conn = sqlite3.connect(":memory:")
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA foreign_keys = ON")
+    database._create_schema(conn)
+    database.add_asset("AAA", "AAA Corp", "Stock", "USD", conn=conn)
+    database.add_asset("BTC", "Bitcoin", "Crypto", "USD", conn=conn)
+    database.add_transaction(1, "Buy", "2024-01-01", 10, 100.0, 0.0, "USD", conn=conn)
+    database.add_transaction(2, "Buy", "2024-01-01", 1, 1000.0, 0.0, "USD", conn=conn)
+    database.add_prices([{"asset_id": 1, "date": "2024-01-02", "close": 110.0}, {"asset_id": 2, "date": "2024-01-02", "close": 900.0}], conn=conn)
+    database.add_fx_rates([{"base": "EUR", "quote": "USD", "date": "2024-01-01", "rate": 1.25}], conn=conn)
+    database.set_setting("base_currency", "USD", conn=conn)
+    calculations.refresh_portfolio_daily(conn=conn) # As the IPC handler does after writes
+    database.clear_result_cache()
+    yield conn
+    conn.close()
+
+
+def test_dashboard_payload(conn):
+    payload = dashboard.get_dashboard(today="2024-01-02", conn=conn)
+    assert payload["base_currency"] == "USD" and payload["as_of"] == "2024-01-02"
+    assert payload["total_value"] == pytest.approx(2000.0)
+    assert payload["changes"]["daily"] == pytest.approx(0.0) # 1100 + 900 vs 1000 + 1000
+    assert [m["ticker"] for m in payload["movers"]["gainers"]] == ["AAA"] and [m["ticker"] for m in payload["movers"]["losers"]] == ["BTC"]
+    assert payload["allocation"] == {"labels": ["Stock", "Crypto"], "values": [pytest.approx(55.0), pytest.approx(45.0)]}
+    assert payload["dividends"] == []
+    with pytest.raises(ValueError):
+        dashboard.get_dashboard("quarterly", conn=conn)
+
+def test_dashboard_total_values_unpriced_positions_at_cost(conn):
+    database.add_asset("NEW", "No Prices Yet", "Stock", "USD", conn=conn)
+    database.add_transaction(3, "Buy", "2024-01-02", 5, 40.0, 0.0, "USD", conn=conn)
+    calculations.refresh_portfolio_daily(conn=conn)
+    payload = dashboard.get_dashboard(today="2024-01-02", conn=conn)
+    assert payload["total_value"] == pytest.approx(2200.0) # 1100 + 900 + 200 at cost, as in the allocation
+    assert payload["unconverted"] == [] # Every position has a rate into the base currency
+    assert payload["allocation"]["values"] == [pytest.approx(1300 / 22), pytest.approx(900 / 22)]
+
+def test_dashboard_rebuilds_only_stale_parts(conn):
+    first = dashboard.get_dashboard(today="2024-01-02", conn=conn)
+    assert dashboard.get_dashboard(today="2024-01-02", conn=conn) is first # Warm: served whole from cache
+    corporate_actions.add_corporate_actions([{"asset_id": 1, "action_type": "Dividend", "ex_date": "2024-02-01", "amount": 0.5, "currency": "USD"}], conn=conn)
+    second = dashboard.get_dashboard(today="2024-01-02", conn=conn)
+    assert second is not first and len(second["dividends"]) == 1
+    assert second["changes"] is first["changes"] and second["movers"] is first["movers"] # Valuation parts reused
+    database.add_prices([{"asset_id": 1, "date": "2024-01-02", "close": 120.0}], conn=conn)
+    calculations.refresh_portfolio_daily(conn=conn)
+    third = dashboard.get_dashboard(today="2024-01-02", conn=conn)
+    assert third["total_value"] == pytest.approx(2100.0) and third["dividends"] is second["dividends"]
+    database.set_setting("base_currency", "EUR", conn=conn)
+    in_eur = dashboard.get_dashboard(today="2024-01-02", conn=conn)
+    assert in_eur["base_currency"] == "EUR" and in_eur["total_value"] == pytest.approx(2100.0 / 1.25)
+    assert dashboard.get_dashboard(today="2024-01-02", conn=conn) is in_eur # Nothing written since: served from cache
@@ -4,6 +4,7 @@
 import pytest
 import sqlite3
 import sys
+import threading
 from pathlib import Path
 
 # Add src directory to sys.path
@@ -19,11 +20,8 @@ def db_conn():
     conn.row_factory = sqlite3.Row
     conn.execute("PRAGMA foreign_keys = ON") # Enable FK enforcement
 
-    # Create schema directly on this connection
-    cursor = conn.cursor()
-    cursor.execute("CREATE TABLE assets (id INTEGER PRIMARY KEY AUTOINCREMENT, ticker TEXT UNIQUE, name TEXT NOT NULL, asset_type TEXT NOT NULL, currency TEXT NOT NULL, isin TEXT UNIQUE);")
-    cursor.execute("CREATE TABLE transactions (id INTEGER PRIMARY KEY AUTOINCREMENT, asset_id INTEGER, transaction_type TEXT NOT NULL, date TEXT NOT NULL, quantity REAL, price REAL, fees REAL DEFAULT 0.0, currency TEXT NOT NULL, notes TEXT, FOREIGN KEY (asset_id) REFERENCES assets (id) ON DELETE SET NULL);")
-    cursor.execute("CREATE TABLE settings (key TEXT PRIMARY KEY, value TEXT);")
+    # Create the full application schema directly on this connection
+    database._create_schema(conn)
     conn.commit()
 
     yield conn # Provide the connection to the test function
@@ -147,3 +145,304 @@ def test_add_fee_transaction(db_conn):
     assert fee_tx['price'] == 5.00 # Added assertion
     assert fee_tx['notes'] == "Monthly fee" # Added assertion
 
+
+
+# --- Test Bulk Ingestion ---
+def test_bulk_upsert_assets_returns_id_map(db_conn):
+    """ Test bulk upsert inserts new assets, keeps existing ones and maps tickers to ids """
+    existing_id = database.add_asset("AAPL", "Apple Inc.", "Stock", "USD", conn=db_conn)
+    id_map = database.bulk_upsert_assets([
+        {"ticker": "AAPL", "name": "APPLE INC", "asset_type": "Stock", "currency": "USD", "isin": "US0378331005"},
+        {"ticker": "MSFT", "name": "Microsoft", "asset_type": "Stock", "currency": "USD", "isin": "US5949181045"},
+        {"ticker": None, "name": "Unlisted Bond", "asset_type": "Bond", "currency": "EUR", "isin": "XS0000000001"},
+    ], conn=db_conn)
+    assert id_map["AAPL"] == existing_id
+    assert set(id_map) == {"AAPL", "MSFT", "XS0000000001"}
+    apple = database.get_asset_by_id(existing_id, conn=db_conn)
+    assert apple["name"] == "Apple Inc." # Existing name is kept
+    assert apple["isin"] == "US0378331005" # Missing ISIN is filled in
+    assert len(database.get_all_assets(conn=db_conn)) == 3
+    # Re-running is idempotent
+    assert database.bulk_upsert_assets([{"ticker": "MSFT", "name": "Microsoft", "asset_type": "Stock", "currency": "USD"}], conn=db_conn) == {"MSFT": id_map["MSFT"]}
+    assert len(database.get_all_assets(conn=db_conn)) == 3
+
+def test_bulk_upsert_assets_maps_isin_match_under_other_ticker(db_conn):
+    """ A row whose ISIN belongs to an asset listed under another ticker maps to that asset """
+    existing_id = database.add_asset("RDSA", "Shell", "Stock", "EUR", "GB00BP6MXD84", conn=db_conn)
+    id_map = database.bulk_upsert_assets([{"ticker": "SHEL", "name": "Shell plc", "asset_type": "Stock", "currency": "EUR", "isin": "GB00BP6MXD84"}], conn=db_conn)
+    assert id_map == {"SHEL": existing_id}
+    assert database.get_asset_by_id(existing_id, conn=db_conn)["ticker"] == "RDSA" # The existing ticker is kept
+    assert len(database.get_all_assets(conn=db_conn)) == 1
+    # A known ticker does not take over an ISIN that belongs to another asset
+    other_id = database.add_asset("SHELL", "Shell (unlisted)", "Stock", "EUR", conn=db_conn)
+    assert database.bulk_upsert_assets([{"ticker": "SHELL", "name": "Shell", "asset_type": "Stock", "currency": "EUR", "isin": "GB00BP6MXD84"}], conn=db_conn) == {"SHELL": other_id}
+    assert database.get_asset_by_id(other_id, conn=db_conn)["isin"] is None
+
+def test_bulk_add_transactions(db_conn):
+    """ Test bulk insert of transactions from dict rows """
+    asset_id = database.add_asset("VWRL", "Vanguard All-World", "ETF", "GBP", conn=db_conn)
+    rows = [{"asset_id": asset_id, "transaction_type": "Buy", "date": f"2024-01-{day:02d}", "quantity": 1, "price": 100.0 + day, "currency": "GBP"} for day in range(1, 29)]
+    assert database.bulk_add_transactions(rows, conn=db_conn) == 28
+    txs = database.get_transactions_for_asset(asset_id, conn=db_conn)
+    assert len(txs) == 28
+    assert txs[0]['date'] == "2024-01-28"
+    assert txs[0]['fees'] == 0.0 # Missing fees default to 0.0
+
+def test_bulk_add_transactions_rolls_back_on_error(db_conn):
+    """ Test a failing row rolls back the whole bulk insert """
+    asset_id = database.add_asset("VUSA", "Vanguard S&P 500", "ETF", "GBP", conn=db_conn)
+    rows = [
+        {"asset_id": asset_id, "transaction_type": "Buy", "date": "2024-01-02", "quantity": 1, "price": 70.0, "currency": "GBP"},
+        {"asset_id": 999, "transaction_type": "Buy", "date": "2024-01-03", "quantity": 1, "price": 71.0, "currency": "GBP"}, # FK violation
+    ]
+    assert database.bulk_add_transactions(rows, conn=db_conn) is None
+    assert database.get_all_transactions(conn=db_conn) == []
+
+def test_transaction_writes_bump_data_version_once_per_call(db_conn):
+    """ Transaction writes bump the data version once per call, without row triggers """
+    asset_id = database.add_asset("VWRL", "Vanguard FTSE All-World", "ETF", "USD", conn=db_conn)
+    assert db_conn.execute("SELECT COUNT(*) FROM sqlite_master WHERE type = 'trigger' AND tbl_name = 'transactions'").fetchone()[0] == 0
+    version = lambda: database.get_data_versions(("transactions",), conn=db_conn)["transactions"]
+    start = version()
+    database.add_transaction(asset_id, "Buy", "2024-01-02", 1, 100.0, 0.0, "USD", conn=db_conn)
+    assert version() == start + 1
+    rows = [{"asset_id": asset_id, "transaction_type": "Buy", "date": f"2024-02-{day:02d}", "quantity": 1, "price": 100.0, "currency": "USD", "fingerprint": f"v{day}"} for day in range(1, 11)]
+    database.bulk_add_transactions(rows, conn=db_conn)
+    assert version() == start + 2
+    database.bulk_add_transactions(rows, conn=db_conn) # All duplicates: nothing written
+    assert version() == start + 2
+
+def test_result_cache_keys_and_transactions(db_conn):
+    """ Cached results accept list/dict arguments and are never stored from inside a caller's transaction """
+    calls = []
+    @database.cached_by_versions("settings")
+    def lookup(keys, options=None, conn=None):
+        calls.append(keys)
+        return [database.get_setting(key, conn=conn) for key in keys]
+    database.clear_result_cache()
+    database.set_setting("a", "1", conn=db_conn)
+    assert lookup(["a"], options={"x": [1]}, conn=db_conn) == ["1"]
+    assert lookup(["a"], options={"x": [1]}, conn=db_conn) == ["1"] and len(calls) == 1 # Frozen key hits
+    assert lookup(["a"], options={"x": {1}}, conn=db_conn) == ["1"] and len(calls) == 2
+    db_conn.execute("UPDATE settings SET value = '2' WHERE key = 'a'") # Uncommitted
+    assert lookup(["a"], conn=db_conn) == ["2"] and len(calls) == 3
+    db_conn.rollback()
+    assert lookup(["a"], conn=db_conn) == ["1"] and len(calls) == 4 # Nothing cached from the rolled back state
+    assert lookup(["a"], options=object.__new__(type("Unhashable", (), {"__hash__": None})), conn=db_conn) == ["1"] # Bypasses the cache
+
+
+# --- Test Holdings Snapshot ---
+def test_holdings_updated_incrementally(db_conn):
+    """ Test the holdings snapshot follows add_transaction and bulk inserts """
+    asset_id = database.add_asset("NVDA", "Nvidia", "Stock", "USD", conn=db_conn)
+    database.add_transaction(asset_id, "Buy", "2024-01-10", 10, 100.0, 1.0, "USD", conn=db_conn)
+    database.add_transaction(asset_id, "Dividend", "2024-01-20", 10, 0.04, 0.0, "USD", conn=db_conn) # Doesn't affect holdings
+    database.bulk_add_transactions([
+        {"asset_id": asset_id, "transaction_type": "Sell", "date": "2024-02-01", "quantity": 5, "price": 120.0, "fees": 1.0, "currency": "USD"},
+        {"asset_id": asset_id, "transaction_type": "Split", "date": "2024-06-10", "quantity": 10, "price": None, "currency": "USD"},
+    ], conn=db_conn)
+    holdings = database.get_holdings(conn=db_conn)
+    assert len(holdings) == 1
+    assert holdings[0]["ticker"] == "NVDA"
+    assert holdings[0]["quantity"] == 50
+    assert holdings[0]["cost_basis"] == pytest.approx(500.5)
+    assert holdings[0]["realized_pnl"] == pytest.approx(98.5) # 599 proceeds - 500.5 cost
+    assert holdings[0]["last_transaction_date"] == "2024-06-10"
+    assert database.check_holdings_consistency(conn=db_conn) == []
+
+def test_holdings_back_dated_insert_recomputes_from_its_date(db_conn):
+    """ Test a back-dated insert replays only the affected asset from the affected date """
+    a = database.add_asset("A", "A Corp", "Stock", "USD", conn=db_conn)
+    b = database.add_asset("B", "B Corp", "Stock", "USD", conn=db_conn)
+    database.add_transaction(a, "Buy", "2024-01-01", 10, 10.0, 0.0, "USD", conn=db_conn)
+    database.add_transaction(a, "Sell", "2024-03-01", 10, 15.0, 0.0, "USD", conn=db_conn)
+    database.add_transaction(b, "Buy", "2024-01-01", 1, 50.0, 0.0, "USD", conn=db_conn)
+    first_a_row = db_conn.execute("SELECT rowid, * FROM holdings_history WHERE asset_id = ? ORDER BY date LIMIT 1", (a,)).fetchone()
+    # Back-dated buy between the existing buy and the sell
+    database.add_transaction(a, "Buy", "2024-02-01", 10, 20.0, 0.0, "USD", conn=db_conn)
+    by_asset = {h["asset_id"]: h for h in database.get_holdings(conn=db_conn)}
+    assert by_asset[a]["quantity"] == 10
+    assert by_asset[a]["cost_basis"] == pytest.approx(150.0)
+    assert by_asset[a]["realized_pnl"] == pytest.approx(0.0) # Sold 10 of 20 at 15 vs average 15
+    assert by_asset[b]["quantity"] == 1
+    # History before the back-dated date was left untouched
+    assert tuple(db_conn.execute("SELECT rowid, * FROM holdings_history WHERE asset_id = ? ORDER BY date LIMIT 1", (a,)).fetchone()) == tuple(first_a_row)
+    assert database.check_holdings_consistency(conn=db_conn) == []
+
+def test_rebuild_and_consistency_check(db_conn):
+    """ Test the consistency check detects drift and rebuild_holdings repairs it """
+    asset_id = database.add_asset("SHEL", "Shell", "Stock", "GBP", conn=db_conn)
+    database.add_transaction(asset_id, "Buy", "2024-01-01", 100, 25.0, 5.0, "GBP", conn=db_conn)
+    db_conn.execute("UPDATE holdings SET quantity = 1")
+    mismatches = database.check_holdings_consistency(conn=db_conn)
+    assert mismatches == [{"asset_id": asset_id, "field": "quantity", "stored": 1.0, "expected": 100.0}]
+    assert database.rebuild_holdings(conn=db_conn) == 1
+    assert database.check_holdings_consistency(conn=db_conn) == []
+    assert database.get_holdings(conn=db_conn)[0]["cost_basis"] == pytest.approx(2505.0)
+
+
+# --- Test Connection Pool ---
+@pytest.fixture
+def file_db(tmp_path, monkeypatch):
+    """ File database selected via the env var, with pooled connections closed afterwards """
+    path = tmp_path / "pool.db"
+    monkeypatch.setenv("PIT_DATABASE_PATH", str(path))
+    database.initialize_database(path)
+    yield path
+    database.close_pooled_connections()
+
+def test_pooled_connection_reused_per_thread(file_db):
+    conn = database._get_db_connection()
+    assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+    assert conn.execute("PRAGMA synchronous").fetchone()[0] == 1 # NORMAL
+    nested = database._get_db_connection() # Handed out already: a separate connection
+    assert nested is not conn
+    nested.close()
+    conn.close()
+    assert database._get_db_connection() is conn # Released, not closed
+    conn.close()
+    other = []
+    thread = threading.Thread(target=lambda: other.append(database._get_db_connection()))
+    thread.start(); thread.join()
+    assert other[0] is not conn
+
+def test_released_connection_discards_uncommitted_work(file_db):
+    conn = database._get_db_connection()
+    conn.execute("INSERT INTO settings (key, value) VALUES ('k', 'v')")
+    conn.close()
+    assert database.get_setting("k") is None
+
+def test_readers_do_not_wait_for_writer(file_db):
+    writer = sqlite3.connect(file_db)
+    writer.execute("BEGIN IMMEDIATE")
+    writer.execute("INSERT INTO settings (key, value) VALUES ('base_currency', 'EUR')")
+    reader = database._get_db_connection()
+    reader.execute("PRAGMA busy_timeout = 0") # Would fail at once if the read had to wait
+    assert database.get_setting("base_currency", conn=reader) is None # Sees the last committed state
+    writer.commit()
+    assert database.get_setting("base_currency", conn=reader) == "EUR"
+    reader.execute(f"PRAGMA busy_timeout = {database._BUSY_TIMEOUT * 1000}")
+    reader.close()
+    writer.close()
+
+
+# --- Test Transaction Pagination ---
+def test_transactions_keyset_pages(db_conn):
+    asset_id = database.add_asset("PG", "Pager", "Stock", "USD", conn=db_conn)
+    rows = [{"asset_id": asset_id if i % 3 else None, "transaction_type": "Buy" if i % 3 else "Fee", "date": f"2024-01-{1 + i // 4:02d}",
+             "quantity": 1, "price": float(i), "fees": 0.0, "currency": "USD"} for i in range(50)]
+    database.bulk_add_transactions(rows, conn=db_conn)
+    expected = [dict(r) for r in database.get_all_transactions(conn=db_conn)]
+    collected, cursor = [], {"after_date": None, "after_id": None}
+    while cursor:
+        page = database.get_transactions_page(cursor["after_date"], cursor["after_id"], 7, conn=db_conn)
+        assert len(page["rows"]) <= 7
+        collected += page["rows"]
+        cursor = page["next"]
+    assert [r["id"] for r in collected] == [r["id"] for r in expected] # Same order, no gaps or repeats across equal dates
+    filtered = database.get_transactions_page(limit=100, filters={"transaction_type": ["Fee"], "start_date": "2024-01-05"}, conn=db_conn)
+    assert filtered["next"] is None
+    assert filtered["rows"] and all(r["transaction_type"] == "Fee" and r["date"] >= "2024-01-05" for r in filtered["rows"])
+    assert database.get_transactions_page(filters={"bogus": 1}, conn=db_conn) is None
+    chunks = list(database.iter_transactions({"asset_id": asset_id}, chunk_size=10, conn=db_conn))
+    assert sum(len(c) for c in chunks) == sum(1 for r in rows if r["asset_id"]) and max(len(c) for c in chunks) == 10
+
+def test_transactions_page_uses_date_id_index(db_conn):
+    plan = db_conn.execute("EXPLAIN QUERY PLAN SELECT * FROM transactions t WHERE (t.date, t.id) < (?, ?) ORDER BY t.date DESC, t.id DESC LIMIT 10", ("2024-01-01", 1)).fetchall()
+    details = " ".join(row[3] for row in plan)
+    assert "idx_transactions_date_id" in details and "TEMP B-TREE" not in details
+
+
+# --- Test Transaction Queries ---
+@pytest.fixture
+def report_conn(db_conn):
+    import random
+    rng = random.Random(11)
+    ids = [database.add_asset(t, f"{t} Inc", "Stock", "USD", conn=db_conn) for t in ("AAA", "BBB", "C_D")]
+    rows = []
+    for i in range(300):
+        kind = rng.choice(["Buy", "Buy", "Sell", "Dividend", "Fee"])
+        rows.append({"asset_id": None if kind == "Fee" else rng.choice(ids), "transaction_type": kind,
+                     "date": f"{rng.choice((2023, 2024))}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}",
+                     "quantity": None if kind == "Fee" else float(rng.randint(1, 9)), "price": round(rng.uniform(1, 200), 2),
+                     "fees": round(rng.uniform(0, 2), 2), "currency": rng.choice(("USD", "EUR")), "notes": "wire fee" if kind == "Fee" else None})
+    database.bulk_add_transactions(rows, conn=db_conn)
+    return db_conn, ids, rows
+
+def test_query_presets_match_python(report_conn):
+    conn, ids, rows = report_conn
+    fees = {}
+    for r in rows:
+        fees[r["date"][:7]] = fees.get(r["date"][:7], 0.0) + r["fees"] + (r["price"] if r["transaction_type"] == "Fee" else 0.0)
+    result = database.query_transactions(preset="fees_per_month", conn=conn)
+    assert [r["month"] for r in result] == sorted(fees)
+    assert all(r["total_fees"] == pytest.approx(fees[r["month"]]) for r in result)
+
+    invested = {}
+    for r in rows:
+        if r["transaction_type"] == "Buy": invested[r["asset_id"]] = invested.get(r["asset_id"], 0.0) + r["quantity"] * r["price"] + r["fees"]
+    result = database.query_transactions(preset="invested_per_asset", conn=conn)
+    assert {r["asset"]: r["invested"] for r in result} == pytest.approx(invested)
+    assert {r["ticker"] for r in result} == {"AAA", "BBB", "C_D"}
+
+    dividends = {}
+    for r in rows:
+        if r["transaction_type"] == "Dividend": dividends[(r["date"][:4], r["currency"])] = dividends.get((r["date"][:4], r["currency"]), 0.0) + r["quantity"] * r["price"]
+    result = database.query_transactions(preset="dividends_per_year", filters={"currency": "EUR"}, conn=conn)
+    assert {(r["year"], r["currency"]): r["amount"] for r in result} == pytest.approx({k: v for k, v in dividends.items() if k[1] == "EUR"})
+
+def test_query_filters_order_and_limit(report_conn):
+    conn, ids, rows = report_conn
+    spec = {"filters": {"ticker": ["AAA", "C_D"], "start_date": "2024-01-01", "transaction_type": "Buy"},
+            "group_by": ["asset"], "aggregates": ["count", "quantity"], "order_by": ["-quantity"], "limit": 1}
+    result = database.query_transactions(spec, conn=conn)
+    expected = {}
+    for r in rows:
+        if r["asset_id"] in (ids[0], ids[2]) and r["date"] >= "2024-01-01" and r["transaction_type"] == "Buy":
+            expected[r["asset_id"]] = expected.get(r["asset_id"], 0.0) + r["quantity"]
+    assert len(result) == 1 and result[0]["quantity"] == pytest.approx(max(expected.values()))
+    # search is a literal substring match ("_" is not a wildcard)
+    assert database.query_transactions({"filters": {"search": "C_D"}}, conn=conn)[0]["count"] == sum(1 for r in rows if r["asset_id"] == ids[2])
+    assert database.query_transactions({"filters": {"search": "B_B"}}, conn=conn)[0]["count"] == 0
+    assert database.query_transactions({"filters": {"search": "wire"}}, conn=conn)[0]["count"] == sum(1 for r in rows if r["transaction_type"] == "Fee")
+
+def test_query_rejects_unknown_names(report_conn):
+    conn = report_conn[0]
+    assert database.query_transactions({"group_by": ["week; DROP TABLE transactions"]}, conn=conn) is None
+    assert database.query_transactions({"aggregates": ["price"]}, conn=conn) is None
+    assert database.query_transactions({"group_by": ["month"], "order_by": ["fees"]}, conn=conn) is None
+    assert database.query_transactions(preset="nope", conn=conn) is None
+    assert conn.execute("SELECT COUNT(*) FROM transactions").fetchone()[0] == 300
+
+
+# --- Test Asset Search ---
+def test_search_assets_prefix_and_ranking(db_conn):
+    database.add_asset("APP", "AppLovin Corp", "Stock", "USD", conn=db_conn)
+    database.add_asset("AAPL", "Apple Inc.", "Stock", "USD", isin="US0378331005", conn=db_conn)
+    database.add_asset("MSFT", "Microsoft Corp", "Stock", "USD", conn=db_conn)
+    database.add_asset("BTC-USD", "Bitcoin", "Crypto", "USD", conn=db_conn)
+    assert [a["ticker"] for a in database.search_assets("app", conn=db_conn)][:1] == ["APP"] # Exact ticker first
+    assert {a["ticker"] for a in database.search_assets("ap", conn=db_conn)} == {"APP", "AAPL"}
+    assert [a["ticker"] for a in database.search_assets("US03783", conn=db_conn)] == ["AAPL"]
+    assert [a["ticker"] for a in database.search_assets("micro corp", conn=db_conn)] == ["MSFT"]
+    assert [a["ticker"] for a in database.search_assets("btc-u", conn=db_conn)] == ["BTC-USD"]
+    assert database.search_assets('" OR NOT', conn=db_conn) == [] # Operators are matched as words, not parsed
+    assert len(database.search_assets("a", limit=1, conn=db_conn)) == 1
+
+def test_search_index_follows_asset_changes(db_conn):
+    asset_id = database.add_asset("OLD", "Old Name", "Stock", "USD", conn=db_conn)
+    db_conn.execute("UPDATE assets SET ticker = 'NEW', name = 'Renamed Holdings' WHERE id = ?", (asset_id,))
+    assert database.search_assets("old", conn=db_conn) == []
+    assert [a["id"] for a in database.search_assets("renamed", conn=db_conn)] == [asset_id]
+    database.bulk_upsert_assets([{"ticker": "NEW", "name": "New", "asset_type": "Stock", "currency": "USD", "isin": "DE0007164600"}], conn=db_conn)
+    assert [a["id"] for a in database.search_assets("DE000716", conn=db_conn)] == [asset_id] # ISIN filled in by the upsert
+    db_conn.execute("DELETE FROM assets WHERE id = ?", (asset_id,))
+    assert database.search_assets("new", conn=db_conn) == []
+    assert db_conn.execute("INSERT INTO assets_fts (assets_fts) VALUES ('integrity-check')") is not None
+
+def test_search_assets_like_fallback(db_conn):
+    database.add_asset("AAPL", "Apple Inc.", "Stock", "USD", conn=db_conn)
+    db_conn.execute("DROP TABLE assets_fts") # As on a SQLite build without FTS5
+    for trigger in ("insert", "update", "delete"): db_conn.execute(f"DROP TRIGGER assets_fts_{trigger}")
+    assert [a["ticker"] for a in database.search_assets("app", conn=db_conn)] == ["AAPL"]
+    assert [a["ticker"] for a in database.search_assets("AAPL", conn=db_conn)] == ["AAPL"]
@@ -0,0 +1,78 @@
+# tests/test_fx.py
+
+import pytest
+import sqlite3
+import sys
+from pathlib import Path
+
+np = pytest.importorskip("numpy")
+
+# Add src directory to sys.path
+src_path = Path(__file__).parent.parent / "src"
+sys.path.insert(0, str(src_path))
+import database
+import fx
+import calculations
+
+
+@pytest.fixture
+def conn():
+    conn = sqlite3.connect(":memory:")
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA foreign_keys = ON")
+    database._create_schema(conn)
+    database.add_fx_rates([
+        {"base": "EUR", "quote": "USD", "date": "2024-01-01", "rate": 1.10},
+        {"base": "EUR", "quote": "USD", "date": "2024-01-05", "rate": 1.20},
+        {"base": "GBP", "quote": "USD", "date": "2024-01-01", "rate": 1.25},
+        {"base": "USD", "quote": "JPY", "date": "2024-01-03", "rate": 150.0},
+    ], conn=conn)
+    database.clear_result_cache()
+    yield conn
+    conn.close()
+
+
+# --- Conversion ---
+def test_as_of_inverse_and_triangulated_rates(conn):
+    converter = fx.get_fx_converter(conn=conn)
+    assert converter.rate("EUR", "USD", "2024-01-04") == pytest.approx(1.10) # Latest quote on or before the date
+    assert converter.rate("EUR", "USD", "2024-03-01") == pytest.approx(1.20) # Past the last quote
+    assert converter.rate("EUR", "USD", "2023-12-01") == pytest.approx(1.10) # Before the first quote
+    assert converter.rate("USD", "EUR", "2024-01-05") == pytest.approx(1 / 1.20)
+    assert converter.rate("EUR", "GBP", "2024-01-05") == pytest.approx(1.20 / 1.25) # Via USD
+    assert converter.rate("GBP", "JPY", "2024-01-02") == pytest.approx(1.25 * 150.0)
+    assert converter.rate("EUR", "EUR", "2024-01-02") == 1.0
+    assert np.isnan(converter.rate("CHF", "USD", "2024-01-02"))
+
+def test_convert_columns(conn):
+    converter = fx.get_fx_converter(conn=conn)
+    amounts = converter.convert([100.0, 100.0, 100.0, 100.0], ["EUR", "USD", "GBP", "EUR"], "USD",
+                                np.array(["2024-01-01", "2024-01-02", "2024-01-03", "2024-01-06"], dtype="datetime64[D]"))
+    assert amounts.tolist() == pytest.approx([110.0, 100.0, 125.0, 120.0])
+    assert fx.convert_amounts([10, 10], ["EUR", "CHF"], ["2024-01-05", "2024-01-05"], base_currency="USD", conn=conn) == [pytest.approx(12.0), None]
+
+def test_converter_cached_until_rates_change(conn):
+    first = fx.get_fx_converter(conn=conn)
+    first.rate("EUR", "GBP", "2024-01-02")
+    assert fx.get_fx_converter(conn=conn) is first and ("EUR", "GBP") in first._daily # Memo kept
+    database.add_fx_rates([{"base": "EUR", "quote": "USD", "date": "2024-01-03", "rate": 1.15}], conn=conn)
+    assert fx.get_fx_converter(conn=conn).rate("EUR", "USD", "2024-01-04") == pytest.approx(1.15)
+
+
+# --- Holdings in Base Currency ---
+def test_holdings_in_base_currency(conn):
+    database.add_asset("SAP", "SAP SE", "Stock", "EUR", conn=conn)
+    database.add_asset("AAPL", "Apple", "Stock", "USD", conn=conn)
+    database.add_transaction(1, "Buy", "2024-01-01", 10, 100.0, 1.0, "EUR", conn=conn)
+    database.add_transaction(1, "Buy", "2024-01-05", 10, 110.0, 0.0, "EUR", conn=conn)
+    database.add_transaction(2, "Buy", "2024-01-02", 5, 200.0, 0.0, "USD", conn=conn)
+    database.set_setting("base_currency", "USD", conn=conn)
+    prices = {1: 120.0, 2: 210.0}
+    holdings = {h["ticker"]: h for h in calculations.get_holdings_in_base_currency(prices=prices, today="2024-02-01", conn=conn)}
+    sap = holdings["SAP"]
+    assert sap["cost_basis"] == pytest.approx(1001.0 * 1.10 + 1100.0 * 1.20) # Historical rates
+    assert sap["market_value"] == pytest.approx(20 * 120.0 * 1.20) # Current rate
+    assert sap["avg_cost"] == pytest.approx(2101.0 / 20) and sap["currency"] == "EUR"
+    assert holdings["AAPL"]["market_value"] == pytest.approx(1050.0)
+    in_eur = {h["ticker"]: h for h in calculations.get_holdings_in_base_currency("EUR", prices=prices, today="2024-02-01", conn=conn)}
+    assert in_eur["SAP"]["cost_basis"] == pytest.approx(2101.0) and in_eur["AAPL"]["market_value"] == pytest.approx(1050.0 / 1.20)
@@ -0,0 +1,86 @@
+# tests/test_ibkr_parser.py
+
+import pytest
+import sqlite3
+import sys
+from pathlib import Path
+
+# Add src directory to sys.path
+src_path = Path(__file__).parent.parent / "src"
+sys.path.insert(0, str(src_path))
+import database
+from parsers import ibkr_parser
+
+STATEMENT = """Statement,Header,Field Name,Field Value
+Statement,Data,Title,Activity Statement
+Trades,Header,DataDiscriminator,Asset Category,Currency,Symbol,Date/Time,Quantity,T. Price,C. Price,Proceeds,Comm/Fee,Basis,Realized P/L,MTM P/L,Code
+Trades,Data,Order,Stocks,USD,AAPL,"2024-01-05, 10:30:00",10,185.5,186,-1855,-1,1856,0,5,O
+Trades,Data,ClosedLot,Stocks,USD,AAPL,"2023-06-01, 10:30:00",-5,150,,,,,,,
+Trades,Data,Order,Stocks,USD,AAPL,"2024-02-05, 11:00:00",-4,190,190,760,-1.2,-742,17,0,C
+Trades,SubTotal,,Stocks,USD,AAPL,,6,,,,,,,,
+Trades,Header,DataDiscriminator,Asset Category,Currency,Symbol,Date/Time,Quantity,T. Price,Proceeds,Comm in USD,Code
+Trades,Data,Order,Forex,USD,EUR.USD,"2024-01-03, 09:00:00","1,000",1.095,-1095,-2,
+Dividends,Header,Currency,Date,Description,Amount
+Dividends,Data,USD,2024-02-15,AAPL(US0378331005) Cash Dividend USD 0.24 per Share (Ordinary Dividend),1.44
+Dividends,Data,Total,,,1.44
+Withholding Tax,Header,Currency,Date,Description,Amount,Code
+Withholding Tax,Data,USD,2024-02-15,AAPL(US0378331005) Cash Dividend USD 0.24 per Share - US Tax,-0.22,
+Fees,Header,Subtitle,Currency,Date,Description,Amount
+Fees,Data,Other Fees,USD,2024-01-31,Market data fee,-10
+"""
+
+@pytest.fixture
+def statement_path(tmp_path):
+    path = tmp_path / "ibkr.csv"
+    path.write_text(STATEMENT)
+    return path
+
+@pytest.fixture
+def db_conn():
+    """ Fixture to set up and tear down an in-memory database """
+    conn = sqlite3.connect(":memory:")
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA foreign_keys = ON")
+    # Create the full application schema directly on this connection
+    database._create_schema(conn)
+    conn.commit()
+    yield conn
+    conn.close()
+
+
+def test_parse_normalizes_all_sections(statement_path):
+    records = list(ibkr_parser.iter_ibkr_records(statement_path))
+    assert [r["transaction_type"] for r in records] == ["Buy", "Sell", "FX", "Dividend", "Tax", "Fee"]
+    buy, sell, fx, dividend, tax, fee = records
+    assert buy["ticker"] == "AAPL" and buy["date"] == "2024-01-05" and buy["quantity"] == 10 and buy["fees"] == 1
+    assert sell["quantity"] == 4 and sell["price"] == 190 and sell["fees"] == 1.2
+    assert fx["ticker"] is None and fx["quantity"] == 1000 and fx["price"] == 1.095 and fx["notes"] == "FX EUR.USD"
+    assert dividend["isin"] == "US0378331005" and dividend["price"] == 0.24 and dividend["quantity"] == 6
+    assert tax["ticker"] == "AAPL" and tax["price"] == pytest.approx(0.22)
+    assert fee["ticker"] is None and fee["price"] == 10
+
+def test_parse_yields_fixed_size_batches(statement_path):
+    batches = list(ibkr_parser.parse_ibkr_statement(statement_path, batch_size=4))
+    assert [len(b) for b in batches] == [4, 2]
+
+def test_import_statement(statement_path, db_conn):
+    assert ibkr_parser.import_ibkr_statement(statement_path, batch_size=4, conn=db_conn) == 6
+    asset = database.get_asset_by_ticker("AAPL", conn=db_conn)
+    assert asset["isin"] == "US0378331005"
+    assert len(database.get_transactions_for_asset(asset["id"], conn=db_conn)) == 4
+    assert len(database.get_all_transactions(conn=db_conn)) == 6
+
+def test_import_missing_file_rolls_back(tmp_path, db_conn):
+    assert ibkr_parser.import_ibkr_statement(tmp_path / "missing.csv", conn=db_conn) is None
+    assert database.get_all_transactions(conn=db_conn) == []
+
+def test_reimport_skips_fingerprinted_rows(statement_path, db_conn):
+    assert ibkr_parser.import_ibkr_statement(statement_path, conn=db_conn) == 6
+    assert ibkr_parser.import_ibkr_statement(statement_path, conn=db_conn) == 0
+    assert len(database.get_all_transactions(conn=db_conn)) == 6
+
+def test_import_undecodable_file_rolls_back(tmp_path, db_conn):
+    path = tmp_path / "latin1.csv"
+    path.write_bytes("Trades,Header,Symbol\nTrades,Data,Soci\xe9t\xe9\n".encode("latin-1"))
+    assert ibkr_parser.import_ibkr_statement(path, conn=db_conn) is None
+    assert database.get_all_transactions(conn=db_conn) == []
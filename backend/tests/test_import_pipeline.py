@@ -0,0 +1,90 @@
+# tests/test_import_pipeline.py
+
+import pytest
+import sqlite3
+import sys
+from pathlib import Path
+
+# Add src directory to sys.path
+src_path = Path(__file__).parent.parent / "src"
+sys.path.insert(0, str(src_path))
+import database
+import jobs
+import import_pipeline
+
+IBKR_HEADER = """Statement,Header,Field Name,Field Value
+Trades,Header,DataDiscriminator,Asset Category,Currency,Symbol,Date/Time,Quantity,T. Price,C. Price,Proceeds,Comm/Fee,Basis,Realized P/L,MTM P/L,Code
+"""
+REVOLUT_HEADER = "Date,Ticker,Type,Quantity,Price per share,Total Amount,Currency,FX Rate\n"
+
+@pytest.fixture
+def db_conn():
+    """ Fixture to set up and tear down an in-memory database """
+    conn = sqlite3.connect(":memory:")
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA foreign_keys = ON")
+    database._create_schema(conn)
+    conn.commit()
+    yield conn
+    conn.close()
+
+def write_ibkr(path, trades, symbols=("AAPL", "MSFT", "NVDA")):
+    lines = [f'Trades,Data,Order,Stocks,USD,{symbols[n % len(symbols)]},"2024-{1 + n % 12:02d}-{1 + n % 28:02d}, 10:30:00",{1 + n % 7},{100 + n % 50},,,-1,,,,O'
+             for n in range(trades)]
+    path.write_text(IBKR_HEADER + "\n".join(lines) + "\n")
+    return str(path)
+
+def write_revolut(path, lines):
+    path.write_text(REVOLUT_HEADER + "\n".join(lines) + "\n")
+    return str(path)
+
+def transaction_count(conn):
+    return conn.execute("SELECT COUNT(*) FROM transactions").fetchone()[0]
+
+
+def test_parallel_import_resolves_assets_and_skips_duplicates(db_conn, tmp_path):
+    existing_id = database.add_asset("AAPL", "Apple Inc.", "Stock", "USD", conn=db_conn)
+    paths = [write_ibkr(tmp_path / "ibkr_a.csv", 300), write_ibkr(tmp_path / "ibkr_b.csv", 200, symbols=("SAP", "ASML")),
+             write_revolut(tmp_path / "revolut.csv", ["2024-01-02T10:00:00.000Z,,CASH TOP-UP,,,USD 1000,usd,1.00",
+                                                     "2024-01-03T14:30:00.000Z,AAPL,BUY - MARKET,2,USD 185.00,USD 370,USD,1.00",
+                                                     "2024-01-04T14:30:00.000Z,TSLA,BUY - MARKET,1,USD 240.00,USD 240,USD,1.00"])]
+    summary = import_pipeline.import_statements(paths, workers=2, batch_size=64, conn=db_conn)
+    assert summary["inserted"] == 503 and summary["rows"] == 503 and summary["duplicates"] == 0
+    assert summary["assets_created"] == 5 # MSFT, NVDA, SAP, ASML, TSLA; AAPL came from the preloaded map
+    assert summary["stages"]["write"]["rows"] == 503 and summary["stages"]["parse"]["batches"] == summary["stages"]["write"]["batches"]
+    assert db_conn.execute("SELECT COUNT(*) FROM transactions WHERE asset_id = ?", (existing_id,)).fetchone()[0] == 101
+    assert db_conn.execute("SELECT COUNT(*) FROM transactions WHERE asset_id IS NULL").fetchone()[0] == 1 # The cash top-up
+    assert db_conn.execute("SELECT currency FROM transactions WHERE transaction_type = 'Deposit'").fetchone()[0] == "USD"
+    assert database.check_holdings_consistency(conn=db_conn) == [] # Holdings replayed once at commit match a full rebuild
+    again = import_pipeline.import_statements(paths, workers=1, batch_size=64, conn=db_conn) # Same fingerprints in-process
+    assert again["inserted"] == 0 and again["duplicates"] == 503 and again["assets_created"] == 0
+    assert transaction_count(db_conn) == 503
+
+def test_cancelled_import_resumes_from_last_committed_batch(db_conn, tmp_path):
+    path = write_ibkr(tmp_path / "ibkr.csv", 1000)
+    def cancel_after_three(progress):
+        if progress["done"] >= 300: control.cancel() # Stops at the next report, after batch 4 is written
+    control = jobs.JobControl(cancel_after_three, interval=0)
+    with jobs.running(control), pytest.raises(jobs.JobCancelled):
+        import_pipeline.import_statements(path, mode="resumable", workers=1, batch_size=100, commit_every=3, conn=db_conn)
+    assert transaction_count(db_conn) == 300 # Batch 4 came after the last commit and was rolled back
+    summary = import_pipeline.import_statements(path, mode="resumable", workers=1, batch_size=100, commit_every=3, conn=db_conn)
+    assert summary["resumed_batches"] == 3 and summary["inserted"] == 700 and summary["duplicates"] == 0
+    assert transaction_count(db_conn) == 1000
+    assert database.check_holdings_consistency(conn=db_conn) == []
+    assert database.get_setting(import_pipeline.CHECKPOINT_SETTING, conn=db_conn) is None
+    # Atomic imports are all or nothing
+    control = jobs.JobControl(lambda progress: control.cancel(), interval=0)
+    with jobs.running(control), pytest.raises(jobs.JobCancelled):
+        import_pipeline.import_statements(write_ibkr(tmp_path / "more.csv", 500, symbols=("META",)), workers=1, batch_size=100, conn=db_conn)
+    assert transaction_count(db_conn) == 1000 and database.get_asset_by_ticker("META", conn=db_conn) is None
+
+def test_unreadable_statement_rolls_back(db_conn, tmp_path):
+    good = write_ibkr(tmp_path / "good.csv", 50)
+    unknown = tmp_path / "unknown.csv"
+    unknown.write_text("some,other,format\n1,2,3\n")
+    assert import_pipeline.detect_broker(good) == "ibkr" and import_pipeline.detect_broker(unknown) is None
+    assert import_pipeline.import_statements([good, str(unknown)], workers=2, conn=db_conn) is None
+    assert import_pipeline.import_statements([good, str(tmp_path / "missing.csv")], workers=1, conn=db_conn) is None
+    assert import_pipeline.import_statements(good, mode="eventually", conn=db_conn) is None
+    assert transaction_count(db_conn) == 0
@@ -0,0 +1,60 @@
+# tests/test_ipc_codec.py
+
+import pytest
+import json
+import base64
+import struct
+import sys
+from pathlib import Path
+
+# Add src directory to sys.path
+src_path = Path(__file__).parent.parent / "src"
+sys.path.insert(0, str(src_path))
+import ipc_codec
+
+ROWS = [
+    {"id": 1, "date": "2024-01-02", "ticker": "AAA", "quantity": 10.0, "price": 101.5, "fees": None, "closed": False},
+    {"id": 2, "date": "2024-01-03", "ticker": "BBB", "quantity": 2, "price": None, "fees": 1.0, "closed": True},
+    {"id": 3, "date": None, "ticker": None, "quantity": 0.5, "price": 99.0, "fees": 0.0, "closed": False},
+]
+
+
+@pytest.mark.parametrize("backend", ["json", "orjson"])
+def test_dumps_non_string_keys(backend, monkeypatch):
+    if backend == "orjson" and ipc_codec.orjson is None: pytest.skip("orjson is not installed")
+    monkeypatch.setattr(ipc_codec, "JSON_BACKEND", backend)
+    prices = {1: {"close": 101.5, "date": "2024-01-02"}, 2: {"close": None, "date": None}} # get_latest_prices: keyed by asset id
+    assert json.loads(ipc_codec.dumps({"id": 7, "data": prices})) == {"id": 7, "data": {"1": prices[1], "2": prices[2]}}
+    assert json.loads(ipc_codec.dumps({3: [1, 2], "USD": True})) == {"3": [1, 2], "USD": True}
+
+def test_columnar_round_trip():
+    payload = {"total": 3, "rows": ROWS, "nested": [{"a": 1}, {"a": 2, "b": "x"}], "plain": [1, 2]}
+    encoded = ipc_codec.to_columnar(payload)
+    assert encoded["rows"]["$columns"] == list(ROWS[0])
+    assert encoded["rows"]["$values"][0] == [1, 2, 3]
+    assert encoded["nested"] == {"$columns": ["a", "b"], "$values": [[1, 2], [None, "x"]]} # Missing keys become None
+    assert encoded["plain"] == [1, 2] and encoded["total"] == 3
+    assert ipc_codec.from_columnar(encoded)["rows"] == ROWS
+
+def test_binary_frame_round_trip():
+    frame = ipc_codec.encode_frame(ROWS)
+    assert frame[:4] == ipc_codec.FRAME_MAGIC and int.from_bytes(frame[5:9], "little") == len(frame)
+    columns = ipc_codec.decode_frame(frame)
+    assert columns["id"] == [1, 2, 3] and columns["closed"] == [False, True, False]
+    assert columns["date"] == ["2024-01-02", "2024-01-03", None] and columns["ticker"] == ["AAA", "BBB", None]
+    assert columns["quantity"] == [10.0, 2.0, 0.5] and columns["price"] == [101.5, None, 99.0] and columns["fees"] == [None, 1.0, 0.0]
+    layout = ipc_codec.encode_frame({"n": [1, 258], "x": [1.5, -2.0], "d": ["1970-01-02", "1970-01-03"]})
+    for body in (struct.pack("<2q", 1, 258), struct.pack("<2d", 1.5, -2.0), struct.pack("<2i", 1, 2)): assert body in layout # Little endian on any host
+    series = {"date": ["2024-01-01", "2024-01-02"], "value": [1.5, 2.5]}
+    assert ipc_codec.decode_frame(ipc_codec.encode_frame(series)) == series
+    with pytest.raises(ipc_codec.EncodingError):
+        ipc_codec.encode_frame([{"id": 1, "tags": [1, 2]}])
+
+def test_negotiation():
+    encoding, payload = ipc_codec.encode(ROWS, ["binary", "columnar"])
+    assert encoding == "binary" and ipc_codec.decode_frame(base64.b64decode(payload))["id"] == [1, 2, 3]
+    assert ipc_codec.encode({"groups": ROWS, "total": 3}, ["binary", "columnar"])[0] == "columnar" # Not tabular
+    assert ipc_codec.encode([{"id": 1, "tags": [1]}], ["binary", "columnar"])[0] == "columnar" # Nested rows fall through
+    assert ipc_codec.encode("USD", "columnar") == ("json", "USD")
+    assert ipc_codec.encode(ROWS, None) == ("json", ROWS) and ipc_codec.encode(ROWS, "xml") == ("json", ROWS)
+    assert ipc_codec.decode_frame(ipc_codec.encode_frame({"d": ["2024-01-01", "not a date"]}))["d"] == ["2024-01-01", "not a date"]
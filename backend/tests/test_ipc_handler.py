@@ -32,16 +32,20 @@ IPC_HANDLER_SCRIPT = src_path / "ipc_handler.py"
 TEST_DB_DIR = Path(__file__).parent / "test_data_ipc" # Use separate dir for IPC tests
 TEST_DB_PATH = TEST_DB_DIR / "test_ipc_pit.db"
 
+def db_files():
+    return [TEST_DB_PATH, TEST_DB_PATH.with_name(TEST_DB_PATH.name + "-wal"), TEST_DB_PATH.with_name(TEST_DB_PATH.name + "-shm")]
+
 @pytest.fixture(scope="function")
 def setup_test_db():
     """ Fixture to create/cleanup a temporary FILE database for IPC tests """
     TEST_DB_DIR.mkdir(parents=True, exist_ok=True)
-    if TEST_DB_PATH.exists():
-        try:
-            TEST_DB_PATH.unlink()
-        except OSError as e:
-            print(f"Warning: Could not delete existing test DB {TEST_DB_PATH}: {e}")
-            # Attempt to proceed anyway
+    for path in db_files(): # The database plus its WAL/shared-memory files
+        if path.exists():
+            try:
+                path.unlink()
+            except OSError as e:
+                print(f"Warning: Could not delete existing test DB {path}: {e}")
+                # Attempt to proceed anyway
 
     # Initialize the schema in the test database file
     database.initialize_database(db_path=TEST_DB_PATH)
@@ -63,7 +67,8 @@ def setup_test_db():
     # Teardown
     time.sleep(0.1)
     try:
-        if TEST_DB_PATH.exists(): TEST_DB_PATH.unlink()
+        for path in db_files():
+            if path.exists(): path.unlink()
         try: TEST_DB_DIR.rmdir()
         except OSError: pass
     except OSError as e:
@@ -188,3 +193,219 @@ def test_ipc_bad_arguments(setup_test_db):
     print(f"Error message: {error_msg}") # Debugging output
     assert "typeerror" in error_msg or "positional argument" in error_msg or "takes" in error_msg
 
+
+
+# --- Server Mode Tests ---
+
+def run_ipc_server(requests, *server_args):
+    """ Helper to run ipc_handler in --server mode, pipelining all requests before reading responses """
+    command = [ PYTHON_EXECUTABLE, str(IPC_HANDLER_SCRIPT), "--server", *server_args ]
+    env = os.environ.copy()
+    env["PIT_DATABASE_PATH"] = str(TEST_DB_PATH)
+    env["PYTHONPATH"] = str(src_path.parent) + os.pathsep + env.get("PYTHONPATH", "")
+    stdin_data = "".join(json.dumps(r) + "\n" for r in requests)
+
+    process = subprocess.run(command, input=stdin_data, capture_output=True, text=True, check=False, cwd=backend_base_path, env=env)
+    print(f"\n--- IPC Server ---\nExit Code: {process.returncode}\nStdout:\n{process.stdout}\nStderr:\n{process.stderr}\n--- End IPC Server ---")
+    assert process.returncode == 0, f"Server exited with {process.returncode}:\n{process.stderr}"
+    return [json.loads(line) for line in process.stdout.splitlines() if line.strip()]
+
+def test_ipc_server_multiple_requests_in_flight(setup_test_db):
+    responses = run_ipc_server([
+        {"id": 1, "function": "get_setting", "args": ["base_currency"]},
+        {"id": 2, "function": "add_asset", "args": ["SAP", "SAP SE", "Stock", "EUR", None]},
+        {"id": "three", "function": "get_asset_by_ticker", "args": ["SAP"]},
+    ])
+    by_id = {r["id"]: r for r in responses}
+    assert len(responses) == 3
+    assert by_id[1]["data"] == "USD"
+    assert isinstance(by_id[2]["data"], int)
+    assert by_id["three"]["data"]["id"] == by_id[2]["data"]
+
+def test_ipc_server_errors_are_tagged(setup_test_db):
+    responses = run_ipc_server([
+        {"id": 1, "function": "non_existent_function", "args": []},
+        {"id": 2, "function": "get_setting", "args": ["key1", "extra_arg"]},
+        {"id": 3, "function": "get_setting", "args": ["base_currency"]},
+    ])
+    by_id = {r["id"]: r for r in responses}
+    assert "Unknown function" in by_id[1]["error"]
+    assert "positional argument" in by_id[2]["error"].lower()
+    assert by_id[3]["data"] == "USD" # Server keeps serving after errors
+
+def test_ipc_server_invalid_request_line(setup_test_db):
+    command = [ PYTHON_EXECUTABLE, str(IPC_HANDLER_SCRIPT), "--server" ]
+    env = os.environ.copy()
+    env["PIT_DATABASE_PATH"] = str(TEST_DB_PATH)
+    process = subprocess.run(command, input="not json\n", capture_output=True, text=True, check=False, cwd=backend_base_path, env=env)
+    response = json.loads(process.stdout.strip())
+    assert response["id"] is None
+    assert "Invalid request format" in response["error"]
+
+
+# --- Batch Envelope Tests ---
+
+def run_ipc_batch(calls):
+    """ Helper to run a batch of calls through the --batch argv mode """
+    return run_ipc_handler("--batch", calls)
+
+def test_ipc_batch_lookup_then_insert_with_ref(setup_test_db):
+    asset_id = run_ipc_handler("add_asset", ["ASML", "ASML Holding", "Stock", "EUR", None])["data"]
+    result = run_ipc_batch([
+        {"function": "get_asset_by_ticker", "args": ["ASML"]},
+        {"function": "add_transaction", "args": [{"$ref": "0.id"}, "Buy", "2025-04-03", 5, 600.0, 2.0, "EUR", None]},
+    ])
+    assert "error" not in result, f"Expected no error, got: {result.get('error')}"
+    assert len(result["data"]) == 2
+    assert result["data"][0]["id"] == asset_id
+    conn = sqlite3.connect(TEST_DB_PATH); conn.row_factory = sqlite3.Row
+    txs = database.get_transactions_for_asset(asset_id, conn=conn); conn.close()
+    assert len(txs) == 1; assert txs[0]["id"] == result["data"][1]
+
+def test_ipc_batch_rolls_back_on_failure(setup_test_db):
+    result = run_ipc_batch([
+        {"function": "add_asset", "args": ["RDSA", "Shell", "Stock", "GBP", None]},
+        {"function": "get_asset_by_ticker", "args": ["MISSING"]},
+        {"function": "add_transaction", "args": [{"$ref": "1.id"}, "Buy", "2025-04-03", 5, 20.0, 0.0, "GBP", None]},
+    ])
+    assert "data" not in result
+    assert "batch call 2" in result["error"]
+    assert "(get_asset_by_ticker) returned null" in result["error"]
+    # The asset added by call 0 must have been rolled back with the rest of the batch
+    assert run_ipc_handler("get_asset_by_ticker", ["RDSA"])["data"] is None
+
+def test_ipc_batch_rolls_back_on_caught_database_error(setup_test_db):
+    result = run_ipc_batch([
+        {"function": "add_asset", "args": ["BATS", "BAT", "Stock", "GBP", None]},
+        {"function": "add_transaction", "args": [{"$ref": "0"}, "Buy", "2025-04-03", 5, 30.0, 0.0, "GBP", None]},
+        {"function": "add_transaction", "args": [99999, "Buy", "2025-04-03", 5, 30.0, 0.0, "GBP", None]}, # No such asset
+        {"function": "set_setting", "args": ["base_currency", "GBP"]},
+    ])
+    assert "data" not in result and "batch call 2" in result["error"]
+    conn = sqlite3.connect(TEST_DB_PATH)
+    assert conn.execute("SELECT COUNT(*) FROM assets WHERE ticker = 'BATS'").fetchone()[0] == 0
+    assert conn.execute("SELECT COUNT(*) FROM transactions").fetchone()[0] == 0
+    conn.close()
+
+def test_ipc_server_batch_request(setup_test_db):
+    responses = run_ipc_server([
+        {"id": 7, "batch": [
+            {"function": "add_asset", "args": ["ADYEN", "Adyen", "Stock", "EUR", None]},
+            {"function": "add_transaction", "args": [{"$ref": "0"}, "Buy", "2025-04-03", 1, 1400.0, 1.0, "EUR", None]},
+            {"function": "get_transactions_for_asset", "args": [{"$ref": "0"}]},
+        ]},
+        {"id": 8, "function": "get_asset_by_ticker", "args": ["ADYEN"]},
+    ])
+    by_id = {r["id"]: r for r in responses}
+    asset_id, tx_id, txs = by_id[7]["data"]
+    assert txs[0]["id"] == tx_id and txs[0]["asset_id"] == asset_id
+    assert by_id[8]["data"]["id"] == asset_id
+
+def test_ipc_calls_calculations_module(setup_test_db):
+    asset_id = run_ipc_handler("add_asset", ["KO", "Coca-Cola", "Stock", "USD", None])["data"]
+    run_ipc_handler("add_transaction", [asset_id, "Buy", "2025-01-02", 10, 60.0, 0.0, "USD", None])
+    result = run_ipc_handler("get_holdings_summary", [{str(asset_id): 65.0}, "fifo"])
+    assert "error" not in result, f"Expected no error, got: {result.get('error')}"
+    assert result["data"][0]["quantity"] == 10
+    assert result["data"][0]["unrealized_pnl"] == 50.0
+
+def test_ipc_writes_refresh_portfolio_series(setup_test_db):
+    asset_id = run_ipc_handler("add_asset", ["SER", "Series Corp", "Stock", "USD", None])["data"]
+    run_ipc_handler("add_transaction", [asset_id, "Buy", "2025-01-02", 10, 60.0, 0.0, "USD", None])
+    assert run_ipc_handler("get_setting", ["portfolio_daily_dirty_from"])["data"] is None # Refreshed by the write call
+    assert run_ipc_handler("get_portfolio_series", ["2025-01-02", "2025-01-02", "D", None, "USD"])["data"] == [{"date": "2025-01-02", "value": 600.0}]
+
+def test_ipc_failed_refresh_keeps_write_response(setup_test_db, monkeypatch):
+    import ipc_handler
+    import calculations
+    def failing_refresh(end=None, conn=None): raise ValueError("refresh failed")
+    monkeypatch.setattr(calculations, "refresh_portfolio_daily", failing_refresh)
+    conn = sqlite3.connect(TEST_DB_PATH); conn.row_factory = sqlite3.Row
+    asset_id = database.add_asset("RFR", "Refresh Corp", "Stock", "USD", conn=conn)
+    response = ipc_handler.dispatch("add_transaction", [asset_id, "Buy", "2025-01-02", 10, 60.0, 0.0, "USD", None], conn=conn)
+    assert "error" not in response and response["data"] is not None # Committed: the refresh failure is only logged
+    assert database.get_setting("portfolio_daily_dirty_from", conn=conn) == "2025-01-02" # Still marked stale for the next refresh
+    conn.close()
+
+def test_ipc_private_functions_not_callable(setup_test_db):
+    result = run_ipc_handler("_get_db_connection", [])
+    assert "Unknown function" in result["error"]
+
+def test_ipc_only_allowlisted_functions_callable(setup_test_db):
+    for function_name, args in (("initialize_database", []), ("close_pooled_connections", []), ("get_default_client", []), ("trace_connection", [None])):
+        assert "Unknown function" in run_ipc_handler(function_name, args)["error"]
+
+def test_ipc_invalid_log_level_falls_back_to_info(setup_test_db):
+    command = [ PYTHON_EXECUTABLE, str(IPC_HANDLER_SCRIPT), "get_setting", json.dumps(["base_currency"]) ]
+    env = os.environ.copy()
+    env["PIT_DATABASE_PATH"] = str(TEST_DB_PATH)
+    env["PIT_LOG_LEVEL"] = "verbose"
+    process = subprocess.run(command, capture_output=True, text=True, check=False, cwd=backend_base_path, env=env)
+    assert process.returncode == 0 and "data" in json.loads(process.stdout.strip())
+    assert "Invalid PIT_LOG_LEVEL" in process.stderr
+
+def test_ipc_server_streams_chunks(setup_test_db):
+    asset_id = run_ipc_handler("add_asset", ["STRM", "Stream Corp", "Stock", "USD", None])["data"]
+    rows = [{"asset_id": asset_id, "transaction_type": "Buy", "date": f"2025-01-{1 + i % 28:02d}", "quantity": 1,
+             "price": 10.0, "fees": 0.0, "currency": "USD"} for i in range(25)]
+    run_ipc_handler("bulk_add_transactions", [rows])
+    responses = run_ipc_server([
+        {"id": 1, "function": "iter_transactions", "args": [None, 10]},
+        {"id": 2, "function": "get_setting", "args": ["base_currency"]},
+    ])
+    chunks = [r["chunk"] for r in responses if r["id"] == 1 and "chunk" in r]
+    assert [len(c) for c in chunks] == [10, 10, 5]
+    assert [r for r in responses if r["id"] == 1][-1] == {"id": 1, "data": 25} # End of stream after its chunks
+    assert {"id": 2, "data": "USD"} in responses # Served alongside the stream
+    streamed = [row["id"] for chunk in chunks for row in chunk]
+    assert len(set(streamed)) == 25
+    # Outside server mode the chunks are collected into one list
+    assert len(run_ipc_handler("iter_transactions", [{"asset_id": asset_id}, 7])["data"]) == 25
+
+def test_ipc_server_metrics_and_profile(setup_test_db, monkeypatch, tmp_path):
+    monkeypatch.setenv("PIT_METRICS_SQL", "1")
+    monkeypatch.setenv("PIT_PROFILE_DIR", str(tmp_path))
+    responses = run_ipc_server([
+        {"id": 1, "function": "get_setting", "args": ["base_currency"]},
+        {"id": 2, "function": "get_all_assets", "args": [], "profile": True},
+        {"id": 3, "function": "get_metrics", "args": ["ipc.get_setting"]},
+        {"id": 4, "function": "get_metrics", "args": ["sql."]},
+    ], "--sequential") # Reads run concurrently otherwise: get_metrics could overtake the calls it reports
+    by_id = {r["id"]: r for r in responses}
+    assert Path(by_id[2]["profile"]).parent == tmp_path and Path(by_id[2]["profile"]).is_file()
+    report = by_id[3]["data"]
+    assert {"ipc.get_setting.parse", "ipc.get_setting.bind", "ipc.get_setting.execute", "ipc.get_setting.serialize"} <= set(report["histograms"])
+    assert report["counters"]["ipc.get_setting.calls"] == 1 and report["counters"]["ipc.get_setting.bytes"] > 0
+    assert report["histograms"]["ipc.get_setting.execute"]["count"] == 1
+    assert any("FROM settings WHERE key = ?" in name for name in by_id[4]["data"]["histograms"])
+
+def test_ipc_server_negotiates_encoding(setup_test_db):
+    import base64
+    import ipc_codec
+    run_ipc_handler("add_asset", ["ENC", "Encoding Corp", "Stock", "USD", None])
+    responses = run_ipc_server([
+        {"id": 1, "function": "get_all_assets", "args": [], "encoding": "columnar"},
+        {"id": 2, "function": "get_all_assets", "args": [], "encoding": ["binary", "columnar"]},
+        {"id": 3, "function": "get_setting", "args": ["base_currency"], "encoding": ["binary", "columnar"]},
+    ])
+    by_id = {r["id"]: r for r in responses}
+    assert by_id[1]["encoding"] == "columnar" and ipc_codec.from_columnar(by_id[1]["data"])[0]["ticker"] == "ENC"
+    assert by_id[2]["encoding"] == "binary" and ipc_codec.decode_frame(base64.b64decode(by_id[2]["data"]))["ticker"] == ["ENC"]
+    assert by_id[3] == {"id": 3, "data": "USD"} # Scalars stay plain JSON
+
+def test_ipc_server_jobs_report_progress(setup_test_db, tmp_path):
+    asset_id = run_ipc_handler("add_asset", ["JOB", "Job Corp", "Stock", "USD", None])["data"]
+    run_ipc_handler("add_transaction", [asset_id, "Buy", "2025-01-02", 10, 60.0, 0.0, "USD", None])
+    archive_path = str(tmp_path / "portfolio.pit")
+    responses = run_ipc_server([
+        {"id": 1, "function": "export_portfolio", "args": [archive_path]},
+        {"id": 2, "function": "import_portfolio", "args": [archive_path, True]}, # Jobs run one at a time, in order
+        {"id": 3, "function": "get_all_assets", "args": []},
+        {"id": 4, "cancel": 99}, # Nothing to cancel
+    ])
+    by_id = {r["id"]: r for r in responses if "progress" not in r}
+    assert by_id[2]["data"]["transactions"] == 1
+    progress = [r["progress"] for r in responses if r["id"] == 2 and "progress" in r]
+    assert progress and progress[-1]["done"] >= 1 and "rows imported" in progress[-1]["message"]
+    assert by_id[3]["data"][0]["ticker"] == "JOB"
+    assert by_id[4] == {"id": 4, "data": False}
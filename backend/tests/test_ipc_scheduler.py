@@ -0,0 +1,133 @@
+# tests/test_ipc_scheduler.py
+
+import io
+import json
+import time
+import queue
+import asyncio
+import threading
+import pytest
+import sys
+from pathlib import Path
+
+# Add src directory to sys.path
+src_path = Path(__file__).parent.parent / "src"
+sys.path.insert(0, str(src_path))
+import jobs
+import database
+import ipc_scheduler
+
+
+@pytest.fixture(autouse=True)
+def scheduler_db(tmp_path, monkeypatch):
+    monkeypatch.setenv("PIT_DATABASE_PATH", str(tmp_path / "scheduler.db")) # Worker connections open here
+
+
+def run_scheduler(handler, lines, readers=2):
+    """Runs a Scheduler with handler over lines (a list, or a queue.Queue ended by "") and returns the response dicts in order."""
+    if isinstance(lines, list):
+        source = io.StringIO("".join(json.dumps(line) + "\n" for line in lines))
+    else:
+        source = type("QueueInput", (), {"readline": lambda self: lines.get(timeout=10)})()
+    output = io.StringIO()
+    asyncio.run(ipc_scheduler.Scheduler(handler, output, readers).run(source))
+    return [json.loads(line) for line in output.getvalue().splitlines()]
+
+
+def test_interactive_reads_overtake_bulk_reads():
+    released = threading.Event()
+    def handler(line, conn=None):
+        request = json.loads(line)
+        if request["function"] == "iter_transactions": assert released.wait(5) # Holds its reader until get_setting ran
+        if request["function"] == "get_setting": released.set()
+        yield json.dumps({"id": request["id"], "data": threading.current_thread().name})
+    responses = run_scheduler(handler, [
+        {"id": 1, "function": "iter_transactions", "args": []},
+        {"id": 2, "function": "iter_transactions", "args": []},
+        {"id": 3, "function": "get_setting", "args": ["base_currency"]},
+    ])
+    assert [r["id"] for r in responses][0] == 3 # The reserved reader only takes interactive requests
+    assert all(r["data"].startswith("pit-read") for r in responses)
+
+def test_reads_wait_for_earlier_writes():
+    written = []
+    def handler(line, conn=None):
+        request = json.loads(line)
+        if request["function"] == "add_asset":
+            time.sleep(0.2)
+            written.append(request["args"][0])
+        yield json.dumps({"id": request["id"], "data": [threading.current_thread().name, list(written)]})
+    responses = run_scheduler(handler, [
+        {"id": 1, "function": "add_asset", "args": ["A"]},
+        {"id": 2, "function": "add_asset", "args": ["B"]},
+        {"id": 3, "function": "get_asset_by_ticker", "args": ["B"]},
+        {"id": 4, "function": "get_dashboard", "args": []}, # Reads portfolio_daily as the writes left it
+        {"id": 5, "function": "set_setting", "args": ["base_currency", "EUR"]},
+    ])
+    by_id = {r["id"]: r["data"] for r in responses}
+    assert by_id[1] == ["pit-write_0", ["A"]] and by_id[2] == ["pit-write_0", ["A", "B"]]
+    assert by_id[3][0].startswith("pit-read") and by_id[3][1] == ["A", "B"]
+    assert by_id[4][0].startswith("pit-read") and by_id[5][0] == "pit-write_0"
+
+def test_fetches_hand_their_writes_to_the_writer():
+    assert ipc_scheduler.classify({"function": "get_quotes"}) == ("read", ipc_scheduler.PRIORITIES["normal"])
+    def handler(line, conn=None):
+        request = json.loads(line)
+        stored_by = database.run_on_writer(lambda write_conn: threading.current_thread().name, conn)
+        yield json.dumps({"id": request["id"], "data": [threading.current_thread().name, stored_by]})
+    responses = run_scheduler(handler, [
+        {"id": 1, "function": "get_quotes", "args": [["AAA"]]},
+        {"id": 2, "function": "add_asset", "args": ["A"]}, # Already on the writer: runs inline
+    ])
+    by_id = {r["id"]: r["data"] for r in responses}
+    assert by_id[1][0].startswith("pit-read") and by_id[1][1] == "pit-write_0"
+    assert by_id[2] == ["pit-write_0", "pit-write_0"]
+
+def test_jobs_report_progress_and_cancel():
+    inbox = queue.Queue()
+    def handler(line, conn=None):
+        request = json.loads(line)
+        try:
+            for done in range(500):
+                jobs.report_progress(done, 500, "assets")
+                if done == 1: # Running with a second job queued behind it: cancel both
+                    for cancel_line in ({"id": 10, "cancel": 2}, {"id": 11, "cancel": 1}, {"id": 12, "cancel": 99}): inbox.put(json.dumps(cancel_line) + "\n")
+                    inbox.put("")
+                time.sleep(0.01)
+        except jobs.JobCancelled as e:
+            yield json.dumps({"id": request["id"], "error": f"Backend Error executing {request['function']}: {e}"})
+            return
+        yield json.dumps({"id": request["id"], "data": "finished"})
+    for request in ({"id": 1, "function": "backfill_price_history", "args": []}, {"id": 2, "function": "get_setting", "args": [], "job": True}):
+        inbox.put(json.dumps(request) + "\n")
+    responses = run_scheduler(handler, inbox)
+    by_id = {r["id"]: r for r in responses if "progress" not in r}
+    assert by_id[10]["data"] is True and by_id[11]["data"] is True and by_id[12]["data"] is False
+    assert by_id[2]["cancelled"] and "before it started" in by_id[2]["error"]
+    assert by_id[1]["cancelled"] and "cancelled" in by_id[1]["error"]
+    assert [r["progress"]["done"] for r in responses if "progress" in r][0] == 0 and all(r["id"] == 1 for r in responses if "progress" in r)
+
+def test_writes_take_turns_with_writing_jobs():
+    inbox, events = queue.Queue(), []
+    def handler(line, conn=None):
+        request = json.loads(line)
+        if request["function"] == "import_statements":
+            for step in range(3):
+                conn.execute("BEGIN IMMEDIATE")
+                events.append(f"job {step}")
+                if step == 0:
+                    inbox.put(json.dumps({"id": 2, "function": "set_setting", "args": []}) + "\n")
+                    inbox.put("")
+                    time.sleep(0.3) # The write arrives while the job has a transaction open
+                conn.commit()
+                jobs.report_progress(step + 1, 3) # Nothing uncommitted: the queued write goes first
+        else:
+            conn.execute("PRAGMA busy_timeout = 50") # Would fail with "database is locked" if it met the job at SQLite's lock
+            conn.execute("BEGIN IMMEDIATE")
+            events.append("write")
+            conn.commit()
+        yield json.dumps({"id": request["id"], "data": threading.current_thread().name})
+    inbox.put(json.dumps({"id": 1, "function": "import_statements", "args": []}) + "\n")
+    responses = run_scheduler(handler, inbox)
+    assert events == ["job 0", "write", "job 1", "job 2"]
+    assert {r["id"]: r["data"] for r in responses if "data" in r} == {1: "pit-job_0", 2: "pit-write_0"}
@@ -0,0 +1,55 @@
+# tests/test_metrics.py
+
+import pytest
+import sqlite3
+import sys
+from pathlib import Path
+
+# Add src directory to sys.path
+src_path = Path(__file__).parent.parent / "src"
+sys.path.insert(0, str(src_path))
+import metrics
+
+
+@pytest.fixture(autouse=True)
+def clean_metrics():
+    metrics.reset_metrics()
+    yield
+    metrics.reset_metrics()
+
+
+def test_histogram_percentiles_and_counters():
+    for ms in [0.5] * 85 + [20.0] * 14 + [500.0]: metrics.observe("op", ms)
+    metrics.increment("op.rows", 10)
+    metrics.increment("op.rows", 5)
+    report = metrics.get_metrics("op")
+    histogram = report["histograms"]["op"]
+    assert histogram["count"] == 100 and histogram["sum_ms"] == pytest.approx(42.5 + 280 + 500)
+    assert histogram["min_ms"] == 0.5 and histogram["max_ms"] == 500.0
+    assert 0.5 <= histogram["p50_ms"] <= 1.0 and 20.0 <= histogram["p90_ms"] <= 40.96 and histogram["p99_ms"] <= 40.96
+    assert sum(count for _, count in histogram["buckets"]) == 100
+    assert report["counters"] == {"op.rows": 15}
+    with metrics.timer("block"): pass
+    assert metrics.get_metrics(reset=True)["histograms"]["block"]["count"] == 1
+    assert metrics.get_metrics()["histograms"] == {}
+
+def test_sql_tracing_groups_statements():
+    conn = metrics.trace_connection(sqlite3.connect(":memory:"))
+    conn.execute("CREATE TABLE t (a INTEGER, b TEXT)")
+    conn.executemany("INSERT INTO t VALUES (?, ?)", [(i, f"row {i}") for i in range(50)])
+    conn.execute("SELECT b FROM t WHERE a = ?", (3,)).fetchall()
+    conn.execute("SELECT b FROM t WHERE a = ?", (4,)).fetchall()
+    metrics.flush_sql()
+    report = metrics.get_metrics("sql.")
+    assert report["counters"]["sql.INSERT INTO t VALUES (?, ?).executions"] == 50
+    assert report["counters"]["sql.SELECT b FROM t WHERE a = ?.executions"] == 2
+    assert report["histograms"]["sql.SELECT b FROM t WHERE a = ?"]["count"] == 1 # One sample per flush
+    assert metrics.normalize_sql("SELECT  *\n FROM x WHERE n = 'it''s' AND v > 1.5e3") == "SELECT * FROM x WHERE n = ? AND v > ?"
+    conn.close()
+
+def test_profiled_dumps_stats(monkeypatch, tmp_path):
+    monkeypatch.setattr(metrics, "PROFILE_DIR", tmp_path / "profiles")
+    with metrics.profiled("get_thing") as skipped: sum(range(10))
+    assert skipped["path"] is None
+    with metrics.profiled("get_thing", enabled=True) as dump: sum(range(10))
+    assert Path(dump["path"]).is_file() and Path(dump["path"]).name.startswith("get_thing-")
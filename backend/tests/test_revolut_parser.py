@@ -0,0 +1,86 @@
+# tests/test_revolut_parser.py
+
+import pytest
+import sqlite3
+import sys
+from pathlib import Path
+
+# Add src directory to sys.path
+src_path = Path(__file__).parent.parent / "src"
+sys.path.insert(0, str(src_path))
+import database
+import corporate_actions
+from parsers import revolut_parser
+
+HEADER = "Date,Ticker,Type,Quantity,Price per share,Total Amount,Currency,FX Rate\n"
+JANUARY = [
+    "2024-01-02T10:00:00.000Z,,CASH TOP-UP,,,USD 1000,USD,1.00",
+    "2024-01-03T14:30:00.000Z,AAPL,BUY - MARKET,2,USD 185.00,USD 370,USD,1.00",
+    "2024-01-03T14:30:00.000Z,AAPL,BUY - MARKET,2,USD 185.00,USD 370,USD,1.00", # Two identical fills
+    "2024-01-31T08:00:00.000Z,,CUSTODY FEE,,,USD -0.12,USD,1.00",
+]
+FEBRUARY = [
+    "2024-02-15T16:00:00.000Z,AAPL,DIVIDEND,,,USD 0.96,USD,1.00",
+    "2024-02-20T15:00:00.000Z,AAPL,SELL - LIMIT,1,USD 190.50,USD 190.50,USD,1.00",
+]
+
+@pytest.fixture
+def db_conn():
+    """ Fixture to set up and tear down an in-memory database """
+    conn = sqlite3.connect(":memory:")
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA foreign_keys = ON")
+    database._create_schema(conn)
+    conn.commit()
+    yield conn
+    conn.close()
+
+def write_statement(tmp_path, name, lines):
+    path = tmp_path / name
+    path.write_text(HEADER + "\n".join(lines) + "\n")
+    return path
+
+
+def test_parse_normalizes_rows(tmp_path):
+    path = write_statement(tmp_path, "jan.csv", JANUARY + FEBRUARY)
+    records = [r for batch in revolut_parser.parse_revolut_statement(path) for r in batch]
+    assert [r["transaction_type"] for r in records] == ["Deposit", "Buy", "Buy", "Fee", "Dividend", "Sell"]
+    assert records[0]["ticker"] is None and records[0]["price"] == 1000
+    assert records[1]["date"] == "2024-01-03" and records[1]["quantity"] == 2 and records[1]["price"] == 185
+    assert records[1]["fingerprint"] != records[2]["fingerprint"] # Identical fills stay distinct
+    assert records[3]["price"] == pytest.approx(0.12)
+    assert records[5]["price"] == 190.5
+
+def test_import_is_idempotent_and_incremental(tmp_path, db_conn):
+    january = write_statement(tmp_path, "jan.csv", JANUARY)
+    assert revolut_parser.import_revolut_statement(january, conn=db_conn) == 4
+    assert revolut_parser.get_high_water_mark("revolut", conn=db_conn) == "2024-01-31"
+    # Re-importing the same file adds nothing
+    assert revolut_parser.import_revolut_statement(january, conn=db_conn) == 0
+    # An overlapping export with January + February only adds February
+    both = write_statement(tmp_path, "jan_feb.csv", JANUARY + FEBRUARY)
+    assert revolut_parser.import_revolut_statement(both, conn=db_conn) == 2
+    assert revolut_parser.get_high_water_mark("revolut", conn=db_conn) == "2024-02-20"
+    assert len(database.get_all_transactions(conn=db_conn)) == 6
+
+def test_import_skips_rows_before_high_water_mark(tmp_path, db_conn):
+    database.set_setting("import_hwm:revolut", "2024-02-01", conn=db_conn)
+    path = write_statement(tmp_path, "all.csv", JANUARY + FEBRUARY)
+    assert revolut_parser.import_revolut_statement(path, conn=db_conn) == 2
+    assert {tx["transaction_type"] for tx in database.get_all_transactions(conn=db_conn)} == {"Dividend", "Sell"}
+
+def test_import_sources_have_separate_high_water_marks(tmp_path, db_conn):
+    path = write_statement(tmp_path, "jan.csv", JANUARY)
+    revolut_parser.import_revolut_statement(path, source="revolut-isa", conn=db_conn)
+    assert revolut_parser.get_high_water_mark("revolut-isa", conn=db_conn) == "2024-01-31"
+    assert revolut_parser.get_high_water_mark("revolut", conn=db_conn) is None
+
+def test_stock_splits_come_from_corporate_actions(tmp_path, db_conn):
+    path = write_statement(tmp_path, "split.csv", [
+        "2024-01-03T14:30:00.000Z,AAPL,BUY - MARKET,10,USD 185.00,USD 1850,USD,1.00",
+        "2024-06-10T08:00:00.000Z,AAPL,STOCK SPLIT,30,,,USD,1.00", # The extra shares of a 4:1 split
+    ])
+    assert revolut_parser.import_revolut_statement(path, conn=db_conn) == 1 # The split row is not booked as shares
+    asset_id = database.get_asset_by_ticker("AAPL", conn=db_conn)["id"]
+    corporate_actions.add_corporate_actions([{"asset_id": asset_id, "action_type": "Split", "ex_date": "2024-06-10", "amount": 4.0}], conn=db_conn)
+    assert [h["quantity"] for h in database.get_holdings(conn=db_conn)] == [40.0] # Counted once
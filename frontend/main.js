@@ -1,5 +1,18 @@
     // main.js - Electron Main Process (runs in Node.js environment)
     // *** UPDATED: Path/Size correction, Asset ID lookup in add transaction ***
+    // *** UPDATED: Resident Python backend instead of one process per call ***
+    // *** UPDATED: Asset lookup + insert sent as one batch ***
+    // *** UPDATED: Paged transactions and streamed chunks ***
+    // *** UPDATED: Asset type-ahead search; transactions for a picked asset insert directly by id ***
+    // *** UPDATED: Upcoming dividends from the corporate actions backend ***
+    // *** UPDATED: Holdings valued in the base currency by the fx backend ***
+    // *** UPDATED: Period returns and top movers from time-weighted returns ***
+    // *** UPDATED: Whole dashboard payload in one cached call ***
+    // *** UPDATED: Allocation by type, currency, asset or tag category with tag drill-downs ***
+    // *** UPDATED: Backend metrics (latency histograms and counters) for diagnostics ***
+    // *** UPDATED: Columnar and binary response encodings for large results ***
+    // *** UPDATED: Concurrent backend; price backfill as a cancellable job with progress ***
+    // *** UPDATED: Parallel statement import (IBKR/Revolut files) as a resumable, cancellable job ***
 
     const { app, BrowserWindow, ipcMain } = require('electron');
     const path = require('path');
@@ -34,53 +47,194 @@
     console.log(`[Main Process] Using Python Path: ${pythonExecutablePath}`);
     console.log(`[Main Process] Using Backend Src Path: ${backendSrcPath}`);
 
-    // Function to call Python script using python-shell
-    async function callPython(functionName, args = []) {
-        console.log(`[Main Process] Calling Python function: ${functionName} with args:`, args);
-        const options = {
-            mode: 'json', // Send/receive data as JSON
+    // --- Resident Python backend (ipc_handler.py --server) ---
+    // One long-lived process serves all calls over newline-delimited JSON, so we
+    // pay interpreter startup and DB connection cost once instead of per call.
+    let backendShell = null;
+    let nextRequestId = 1;
+    const pendingRequests = new Map(); // request id -> { resolve, reject, functionName, onChunk, onProgress }
+    const runningJobs = new Map(); // renderer job id -> backend request id
+
+    function rejectAllPending(reason) {
+        for (const [id, pending] of pendingRequests) {
+            pending.reject(new Error(`Failed to execute Python backend (${pending.functionName}): ${reason}`));
+        }
+        pendingRequests.clear();
+    }
+
+    // --- Response decoding (see backend/src/ipc_codec.py) ---
+    // Requests may send "encoding" (a name or a preference list); the backend tags responses that use one.
+    function decodeColumnar(value) {
+        if (Array.isArray(value)) return value.map(decodeColumnar);
+        if (value === null || typeof value !== 'object') return value;
+        if (value.$columns && value.$values && Object.keys(value).length === 2) {
+            const names = value.$columns;
+            const columns = value.$values.map(column => column.map(decodeColumnar));
+            const rowCount = columns.length ? columns[0].length : 0;
+            const rows = new Array(rowCount);
+            for (let i = 0; i < rowCount; i++) {
+                const row = {};
+                for (let c = 0; c < names.length; c++) row[names[c]] = columns[c][i];
+                rows[i] = row;
+            }
+            return rows;
+        }
+        const decoded = {};
+        for (const key of Object.keys(value)) decoded[key] = decodeColumnar(value[key]);
+        return decoded;
+    }
+
+    // Decodes a base64 PITF frame into { column name: values }. Float columns come back as Float64Array
+    // (nulls are NaN) and integer columns as Float64Array too; dates as ISO strings, nulls elsewhere as null.
+    const FRAME_FLOAT = 0, FRAME_INT = 1, FRAME_BOOL = 2, FRAME_DATE = 3;
+    function decodeBinaryFrame(encoded) {
+        const buffer = Buffer.from(encoded, 'base64');
+        const view = new DataView(buffer.buffer, buffer.byteOffset, buffer.byteLength);
+        if (buffer.toString('latin1', 0, 4) !== 'PITF' || view.getUint8(4) !== 1) throw new Error('Not a PITF frame of a supported version');
+        const rowCount = view.getUint32(9, true), columnCount = view.getUint16(13, true);
+        const aligned = new ArrayBuffer(buffer.byteLength); // Typed arrays need 8-byte aligned bodies
+        new Uint8Array(aligned).set(buffer);
+        const columns = {};
+        let offset = 15;
+        for (let c = 0; c < columnCount; c++) {
+            const nameLength = view.getUint16(offset, true);
+            const name = buffer.toString('utf8', offset + 2, offset + 2 + nameLength);
+            offset += 2 + nameLength;
+            const kind = view.getUint8(offset), nullsLength = view.getUint32(offset + 1, true);
+            const nulls = buffer.subarray(offset + 5, offset + 5 + nullsLength);
+            offset += 5 + nullsLength;
+            const bodyLength = view.getUint32(offset, true);
+            offset += 4;
+            offset += (8 - offset % 8) % 8;
+            let values;
+            if (kind === FRAME_FLOAT) values = new Float64Array(aligned, offset, rowCount);
+            else if (kind === FRAME_INT) values = Float64Array.from(new BigInt64Array(aligned, offset, rowCount), Number);
+            else if (kind === FRAME_BOOL) values = Array.from(buffer.subarray(offset, offset + rowCount), b => b !== 0);
+            else if (kind === FRAME_DATE) values = Array.from(new Int32Array(aligned, offset, rowCount), d => new Date(d * 86400000).toISOString().slice(0, 10));
+            else values = JSON.parse(buffer.toString('utf8', offset, offset + bodyLength));
+            if (nullsLength && kind !== FRAME_FLOAT) {
+                if (!Array.isArray(values)) values = Array.from(values);
+                for (let i = 0; i < rowCount; i++) if (nulls[i >> 3] >> (i & 7) & 1) values[i] = null;
+            }
+            columns[name] = values;
+            offset += bodyLength;
+        }
+        return columns;
+    }
+
+    function decodePayload(payload, encoding) {
+        if (encoding === 'columnar') return decodeColumnar(payload);
+        if (encoding === 'binary') return decodeBinaryFrame(payload);
+        return payload;
+    }
+
+    function getBackendShell() {
+        if (backendShell) return backendShell;
+        console.log('[Main Process] Starting resident Python backend...');
+        const shell = new PythonShell('ipc_handler.py', {
+            mode: 'json', // Send/receive data as newline-delimited JSON
             pythonPath: pythonExecutablePath, // Path to venv python executable
             scriptPath: backendSrcPath, // Path to the directory containing python scripts
-            args: [
-                functionName,          // Argument 1: Function name to call in Python
-                JSON.stringify(args)   // Argument 2: Arguments for the Python function (as JSON string)
-            ]
-        };
-        try {
-            const results = await PythonShell.run('ipc_handler.py', options);
-            console.log('[Main Process] Python raw result:', results); // Log raw result
-            if (results && results.length > 0) {
-                // Ensure result is parsed correctly if it's already an object
-                const resultData = (typeof results[0] === 'string') ? JSON.parse(results[0]) : results[0];
-                if (resultData.error) { throw new Error(`Python Error (${functionName}): ${resultData.error}`); }
-                console.log('[Main Process] Python parsed data:', resultData.data);
-                return resultData.data; // Return the actual data payload
+            args: ['--server']
+        });
+        shell.on('message', (message) => {
+            const pending = pendingRequests.get(message.id);
+            if (!pending) { console.warn('[Main Process] Response for unknown request id:', message.id); return; }
+            if (message.progress) { if (pending.onProgress) pending.onProgress(message.progress); return; } // Job progress; the request stays pending
+            if (message.chunk) { if (pending.onChunk) pending.onChunk(decodePayload(message.chunk, message.encoding)); return; } // Streamed rows; the request stays pending
+            pendingRequests.delete(message.id);
+            if (message.error) { pending.reject(new Error(`Python Error (${pending.functionName}): ${message.error}`)); return; }
+            try { pending.resolve(decodePayload(message.data, message.encoding)); }
+            catch (err) { pending.reject(new Error(`Failed to decode ${message.encoding} response (${pending.functionName}): ${err.message}`)); }
+        });
+        shell.on('stderr', (line) => console.log('[Python]', line));
+        shell.on('error', (err) => { console.error('[Main Process] Python backend error:', err); });
+        shell.on('close', () => {
+            console.warn('[Main Process] Python backend exited.');
+            if (backendShell === shell) backendShell = null; // Respawn on next call
+            rejectAllPending('backend process exited');
+        });
+        backendShell = shell;
+        return shell;
+    }
+
+    // Function to call a Python database function through the resident backend.
+    // Several calls may be in flight at once; responses are matched by request id.
+    // encoding ('columnar', 'binary' or a preference list) asks for a compact encoding of large results.
+    function callPython(functionName, args = [], encoding = null) {
+        console.log(`[Main Process] Calling Python function: ${functionName} with args:`, args);
+        return new Promise((resolve, reject) => {
+            const id = nextRequestId++;
+            pendingRequests.set(id, { resolve, reject, functionName });
+            try {
+                getBackendShell().send(encoding ? { id, function: functionName, args, encoding } : { id, function: functionName, args });
+            } catch (err) {
+                pendingRequests.delete(id);
+                reject(new Error(`Failed to execute Python backend (${functionName}): ${err.message || err}`));
             }
-            console.warn(`[Main Process] Unexpected or empty result from Python for ${functionName}`);
-            return null;
-        } catch (err) {
-            console.error(`[Main Process] Error executing PythonShell for ${functionName}:`, err);
-            // Check if the error message is already JSON from python-shell
-            let errorMessage = err.message || err;
-             try {
-                 // Attempt to parse potential JSON error string from PythonShell/Python script
-                 const errorPrefix = "Error: ";
-                 const jsonErrorIndex = errorMessage.indexOf('{');
-                 if (jsonErrorIndex > -1) {
-                     const jsonString = errorMessage.substring(jsonErrorIndex);
-                     const parsedError = JSON.parse(jsonString);
-                     if(parsedError && parsedError.error) {
-                        errorMessage = parsedError.error; // Use the error message from Python if available
-                     }
-                 } else if (errorMessage.startsWith(errorPrefix)) {
-                     // Clean up generic PythonShell error prefix if not JSON
-                     errorMessage = errorMessage.substring(errorPrefix.length);
-                 }
-             } catch(parseErr) { /* Ignore if not JSON */ }
-
-            throw new Error(`Failed to execute Python backend (${functionName}): ${errorMessage}`);
-        }
+        });
     }
+
+    // Calls a Python generator function; each chunk of rows is passed to onChunk as it arrives.
+    // Resolves with the total number of rows once the stream ends.
+    function callPythonStream(functionName, args, onChunk, encoding = null) {
+        console.log(`[Main Process] Streaming Python function: ${functionName} with args:`, args);
+        return new Promise((resolve, reject) => {
+            const id = nextRequestId++;
+            pendingRequests.set(id, { resolve, reject, functionName, onChunk });
+            try {
+                getBackendShell().send(encoding ? { id, function: functionName, args, encoding } : { id, function: functionName, args });
+            } catch (err) {
+                pendingRequests.delete(id);
+                reject(new Error(`Failed to execute Python backend (${functionName}): ${err.message || err}`));
+            }
+        });
+    }
+
+    // Runs a long call as a backend job (its own connection, off the writer): progress dicts
+    // ({ done, total, message }) are passed to onProgress; onStart receives the request id for cancelPython.
+    function callPythonJob(functionName, args, onProgress, onStart) {
+        console.log(`[Main Process] Starting Python job: ${functionName} with args:`, args);
+        return new Promise((resolve, reject) => {
+            const id = nextRequestId++;
+            pendingRequests.set(id, { resolve, reject, functionName, onProgress });
+            try {
+                getBackendShell().send({ id, function: functionName, args, job: true });
+                if (onStart) onStart(id);
+            } catch (err) {
+                pendingRequests.delete(id);
+                reject(new Error(`Failed to execute Python backend (${functionName}): ${err.message || err}`));
+            }
+        });
+    }
+
+    // Cancels a queued request or a running job; resolves true if the backend cancelled it.
+    function cancelPython(requestId) {
+        return new Promise((resolve, reject) => {
+            const id = nextRequestId++;
+            pendingRequests.set(id, { resolve, reject, functionName: 'cancel' });
+            try { getBackendShell().send({ id, cancel: requestId }); }
+            catch (err) { pendingRequests.delete(id); reject(new Error(`Failed to execute Python backend (cancel): ${err.message || err}`)); }
+        });
+    }
+
+    // Runs several calls as one batch in a single backend round trip and transaction.
+    // Later calls may use {"$ref": "<callIndex>.<key>"} to refer to earlier results.
+    function callPythonBatch(calls) {
+        console.log(`[Main Process] Calling Python batch:`, calls.map(c => c.function));
+        return new Promise((resolve, reject) => {
+            const id = nextRequestId++;
+            pendingRequests.set(id, { resolve, reject, functionName: 'batch' });
+            try {
+                getBackendShell().send({ id, batch: calls });
+            } catch (err) {
+                pendingRequests.delete(id);
+                reject(new Error(`Failed to execute Python backend (batch): ${err.message || err}`));
+            }
+        });
+    }
+
+    app.on('will-quit', () => { if (backendShell) { backendShell.end(() => {}); backendShell = null; } });
     // --- End Python Interaction Setup ---
 
 
@@ -109,52 +263,79 @@
 
       // Assets
       ipcMain.handle('db:add-asset', async (event, assetData) => { console.log(`[IPC] Handling db:add-asset:`, assetData); try { const newAssetId = await callPython('add_asset', [ assetData.ticker, assetData.name, assetData.assetType, assetData.currency, assetData.isin ]); return { success: true, id: newAssetId }; } catch (error) { console.error(`[IPC Error] db:add-asset:`, error); return { error: error.message }; } }); // Return success/id
+      ipcMain.handle('db:search-assets', async (event, prefix, limit) => { try { const assets = await callPython('search_assets', [prefix, limit || 10]); return assets; } catch (error) { console.error(`[IPC Error] db:search-assets:`, error); return { error: error.message }; } });
       ipcMain.handle('db:get-all-assets', async (event) => { console.log(`[IPC] Handling db:get-all-assets`); try { const assets = await callPython('get_all_assets'); return assets; } catch (error) { console.error(`[IPC Error] db:get-all-assets:`, error); return { error: error.message }; } });
 
       // Transactions
        ipcMain.handle('db:add-transaction', async (event, txData) => {
           console.log(`[IPC] Handling db:add-transaction:`, txData);
            try {
-                let asset_id = null;
-                // For non-Fee transactions, find the asset by ticker
-                if (txData.txType !== 'Fee' && txData.ticker) {
-                    console.log(`[IPC] Looking up asset_id for ticker: ${txData.ticker}`);
-                    // IMPORTANT: Make sure get_asset_by_ticker exists and is callable via callPython
-                    const asset = await callPython('get_asset_by_ticker', [txData.ticker]);
-                    if (!asset) {
-                         // Important: Throw error back to frontend if asset not found
-                         throw new Error(`Asset with ticker '${txData.ticker}' not found in database. Please add the asset first.`);
-                    }
-                    asset_id = asset.id;
-                    console.log(`[IPC] Found asset_id: ${asset_id}`);
-                } else if (txData.txType === 'Fee') {
+                // Arguments need to match the order in database.py:
+                // asset_id, transaction_type, date, quantity, price, fees, currency, notes=None
+                const txArgs = (assetIdArg) => [
+                    assetIdArg,
+                    txData.txType,
+                    txData.date,
+                    txData.quantity,
+                    txData.price,
+                    txData.fees,
+                    txData.currency,
+                    null // Placeholder for notes, add if needed in form/txData
+                ];
+                if (txData.txType === 'Fee') {
                      // For Fee type, asset_id can be null, name is in txData.name (passed as ticker/name)
                      console.log(`[IPC] Handling Fee transaction: ${txData.name}`);
-                } else if (!txData.ticker && txData.txType !== 'Fee') {
+                     const newTxId = await callPython('add_transaction', txArgs(null));
+                     return { success: true, id: newTxId };
+                }
+                if (txData.assetId) {
+                     // Asset picked from the type-ahead: its id is already known, no lookup needed
+                     const newTxId = await callPython('add_transaction', txArgs(txData.assetId));
+                     return { success: true, id: newTxId };
+                }
+                if (!txData.ticker) {
                      // Should not happen if form validation is correct, but good to check
                      throw new Error(`Ticker symbol is required for ${txData.txType} transactions.`);
                 }
-
-               // Call Python add_transaction with the found asset_id
-               // Arguments need to match the order in database.py:
-               // asset_id, transaction_type, date, quantity, price, fees, currency, notes=None
-               const newTxId = await callPython('add_transaction', [
-                   asset_id, // Pass the found ID (or null for fees)
-                   txData.txType,
-                   txData.date,
-                   txData.quantity,
-                   txData.price,
-                   txData.fees,
-                   txData.currency,
-                   null // Placeholder for notes, add if needed in form/txData
-               ]);
-              return { success: true, id: newTxId }; // Return success/id
+                // Look up the asset and insert the transaction in one round trip / one transaction.
+                // The insert refers to the looked-up id; if the asset is missing the batch is rolled back.
+                let results;
+                try {
+                    results = await callPythonBatch([
+                        { function: 'get_asset_by_ticker', args: [txData.ticker] },
+                        { function: 'add_transaction', args: txArgs({ $ref: '0.id' }) }
+                    ]);
+                } catch (batchError) {
+                    if (batchError.message.includes('(get_asset_by_ticker) returned null')) {
+                        // Important: Throw error back to frontend if asset not found
+                        throw new Error(`Asset with ticker '${txData.ticker}' not found in database. Please add the asset first.`);
+                    }
+                    throw batchError;
+                }
+              return { success: true, id: results[1] }; // Return success/id
           } catch (error) {
               console.error(`[IPC Error] db:add-transaction:`, error);
               return { error: error.message }; // Return error message to frontend
           }
       });
-       ipcMain.handle('db:get-all-transactions', async (event) => { console.log(`[IPC] Handling db:get-all-transactions`); try { const transactions = await callPython('get_all_transactions'); return transactions; } catch (error) { console.error(`[IPC Error] db:get-all-transactions:`, error); return { error: error.message }; } });
+       ipcMain.handle('db:get-all-transactions', async (event) => { console.log(`[IPC] Handling db:get-all-transactions`); try { const transactions = await callPython('get_all_transactions', [], 'columnar'); return transactions; } catch (error) { console.error(`[IPC Error] db:get-all-transactions:`, error); return { error: error.message }; } });
+       // Keyset pages: pass back the previous page's `next` cursor ({ after_date, after_id }) to get the following page
+       ipcMain.handle('db:get-transactions-page', async (event, cursor, limit, filters) => { console.log(`[IPC] Handling db:get-transactions-page`, cursor); try { const page = await callPython('get_transactions_page', [cursor?.after_date ?? null, cursor?.after_id ?? null, limit || 200, filters || null]); return page; } catch (error) { console.error(`[IPC Error] db:get-transactions-page:`, error); return { error: error.message }; } });
+       // Streams all matching transactions to the renderer as 'db:transactions-chunk' events tagged with streamId
+       ipcMain.handle('db:stream-transactions', async (event, streamId, filters, chunkSize) => { console.log(`[IPC] Handling db:stream-transactions ${streamId}`); try { const total = await callPythonStream('iter_transactions', [filters || null, chunkSize || 500], (rows) => event.sender.send('db:transactions-chunk', { streamId, rows }), 'columnar'); return { success: true, total }; } catch (error) { console.error(`[IPC Error] db:stream-transactions:`, error); return { error: error.message }; } });
+
+       // Dividends
+       ipcMain.handle('db:get-upcoming-dividends', async (event, horizonDays) => { console.log(`[IPC] Handling db:get-upcoming-dividends`); try { const rows = await callPython('get_upcoming_dividends', [horizonDays || 90]); return rows.map(d => ({ ticker: d.ticker, date: d.date, payDate: d.pay_date, amountPerShare: d.amount_per_share, amount: d.amount, currency: d.currency, estimated: d.estimated })); } catch (error) { console.error(`[IPC Error] db:get-upcoming-dividends:`, error); return { error: error.message }; } });
+       ipcMain.handle('db:get-holdings', async (event, baseCurrency) => { console.log(`[IPC] Handling db:get-holdings in ${baseCurrency}`); try { const rows = await callPython('get_holdings_in_base_currency', [baseCurrency || null]); return rows.filter(h => h.quantity > 0).map(h => ({ id: h.asset_id, ticker: h.ticker, name: h.name, quantity: h.quantity, avgCost: h.avg_cost, currentPrice: h.price, assetType: h.asset_type, currency: h.currency, costBasis: h.cost_basis, marketValue: h.market_value, gainLoss: h.unrealized_pnl, baseCurrency: h.base_currency })); } catch (error) { console.error(`[IPC Error] db:get-holdings:`, error); return { error: error.message }; } });
+       ipcMain.handle('db:get-period-returns', async (event, baseCurrency) => { console.log(`[IPC] Handling db:get-period-returns`); try { const result = await callPython('get_period_returns', [null, baseCurrency || null]); return Object.fromEntries(Object.entries(result.returns).map(([period, twr]) => [period, { value: twr === null ? null : twr * 100, positive: (twr || 0) >= 0 }])); } catch (error) { console.error(`[IPC Error] db:get-period-returns:`, error); return { error: error.message }; } });
+       ipcMain.handle('db:get-movers', async (event, period, baseCurrency) => { console.log(`[IPC] Handling db:get-movers for ${period}`); try { const result = await callPython('get_movers', [String(period).toLowerCase(), 5, null, baseCurrency || null]); const toPercent = (m) => ({ ticker: m.ticker, change: m.change * 100 }); return { period, gainers: result.gainers.map(toPercent), losers: result.losers.map(toPercent) }; } catch (error) { console.error(`[IPC Error] db:get-movers:`, error); return { error: error.message }; } });
+       ipcMain.handle('db:get-dashboard', async (event, period) => { console.log(`[IPC] Handling db:get-dashboard for ${period}`); try { const d = await callPython('get_dashboard', [String(period || 'daily').toLowerCase()]); const percent = (m) => ({ ticker: m.ticker, change: m.change * 100 }); return { baseCurrency: d.base_currency, totalValue: d.total_value, changes: Object.fromEntries(Object.entries(d.changes).map(([p, twr]) => [p, { value: twr === null ? null : twr * 100, positive: (twr || 0) >= 0 }])), movers: { period: period || 'Daily', gainers: d.movers.gainers.map(percent), losers: d.movers.losers.map(percent) }, dividends: d.dividends.map(x => ({ ticker: x.ticker, date: x.date, payDate: x.pay_date, amountPerShare: x.amount_per_share, amount: x.amount, currency: x.currency, estimated: x.estimated })), allocation: d.allocation }; } catch (error) { console.error(`[IPC Error] db:get-dashboard:`, error); return { error: error.message }; } });
+       ipcMain.handle('db:get-allocation', async (event, dimension, parentTagId) => { console.log(`[IPC] Handling db:get-allocation by ${dimension}`); try { const a = await callPython('get_allocation', [dimension || 'asset_type', parentTagId ?? null, null]); return { dimension: a.dimension, baseCurrency: a.base_currency, total: a.total, groups: a.groups.map(g => ({ key: g.key, label: g.label, value: g.value, percent: g.weight * 100, tagId: g.tag_id ?? null, hasChildren: !!g.has_children })) }; } catch (error) { console.error(`[IPC Error] db:get-allocation:`, error); return { error: error.message }; } });
+       ipcMain.handle('db:get-portfolio-series', async (event, start, end, freq) => { try { const series = await callPython('get_portfolio_series', [start ?? null, end ?? null, freq || 'D'], ['binary', 'columnar']); if (!series || Array.isArray(series)) return series ? { dates: series.map(p => p.date), values: series.map(p => p.value) } : series; return { dates: series.date, values: series.value }; } catch (error) { console.error(`[IPC Error] db:get-portfolio-series:`, error); return { error: error.message }; } });
+       ipcMain.handle('db:backfill-prices', async (event, jobId, end) => { console.log(`[IPC] Handling db:backfill-prices ${jobId}`); try { const summary = await callPythonJob('backfill_price_history', [end ?? null, null], (progress) => event.sender.send('db:job-progress', { jobId, progress }), (requestId) => runningJobs.set(jobId, requestId)); return summary; } catch (error) { console.error(`[IPC Error] db:backfill-prices:`, error); return { error: error.message, cancelled: error.message.includes('cancelled') }; } finally { runningJobs.delete(jobId); } });
+       ipcMain.handle('db:import-statements', async (event, jobId, paths, broker) => { console.log(`[IPC] Handling db:import-statements ${jobId} (${paths?.length} files)`); try { const summary = await callPythonJob('import_statements', [paths, broker ?? null, 'resumable'], (progress) => event.sender.send('db:job-progress', { jobId, progress }), (requestId) => runningJobs.set(jobId, requestId)); return summary; } catch (error) { console.error(`[IPC Error] db:import-statements:`, error); return { error: error.message, cancelled: error.message.includes('cancelled') }; } finally { runningJobs.delete(jobId); } });
+       ipcMain.handle('db:cancel-job', async (event, jobId) => { try { return runningJobs.has(jobId) ? await cancelPython(runningJobs.get(jobId)) : false; } catch (error) { console.error(`[IPC Error] db:cancel-job:`, error); return { error: error.message }; } });
+       ipcMain.handle('db:get-metrics', async (event, prefix, reset) => { try { return await callPython('get_metrics', [prefix ?? null, !!reset]); } catch (error) { console.error(`[IPC Error] db:get-metrics:`, error); return { error: error.message }; } });
       // --- End IPC Handlers ---
 
       createWindow();
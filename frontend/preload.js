@@ -15,14 +15,63 @@
         // Assets
         addAsset: (assetData) => ipcRenderer.invoke('db:add-asset', assetData),
         getAllAssets: () => ipcRenderer.invoke('db:get-all-assets'),
+        searchAssets: (prefix, limit) => ipcRenderer.invoke('db:search-assets', prefix, limit),
         // getAssetByTicker: (ticker) => ipcRenderer.invoke('db:get-asset-by-ticker', ticker), // Example for later
         // getAssetById: (id) => ipcRenderer.invoke('db:get-asset-by-id', id), // Example for later
 
         // Transactions
         addTransaction: (txData) => ipcRenderer.invoke('db:add-transaction', txData),
         getAllTransactions: () => ipcRenderer.invoke('db:get-all-transactions'),
+        getTransactionsPage: (cursor, limit, filters) => ipcRenderer.invoke('db:get-transactions-page', cursor, limit, filters),
+        // Calls onChunk(rows) for each chunk as it arrives; resolves with { success, total } once all rows were sent
+        streamTransactions: async (filters, onChunk, chunkSize) => {
+            const streamId = `${Date.now()}-${Math.random()}`;
+            const listener = (event, message) => { if (message.streamId === streamId) onChunk(message.rows); };
+            ipcRenderer.on('db:transactions-chunk', listener);
+            try { return await ipcRenderer.invoke('db:stream-transactions', streamId, filters, chunkSize); }
+            finally { ipcRenderer.removeListener('db:transactions-chunk', listener); }
+        },
         // getTransactionsForAsset: (assetId) => ipcRenderer.invoke('db:get-transactions-for-asset', assetId), // Example for later
 
+        // Holdings (market value, cost basis and gain/loss in baseCurrency)
+        getHoldings: (baseCurrency) => ipcRenderer.invoke('db:get-holdings', baseCurrency),
+
+        // Dashboard: portfolio value and changes, movers for period, dividends and allocation in one call
+        getDashboard: (period) => ipcRenderer.invoke('db:get-dashboard', period),
+
+        // Allocation by 'asset_type', 'currency', 'asset' or a tag category (children of parentTagId to drill down)
+        getAllocation: (dimension, parentTagId) => ipcRenderer.invoke('db:get-allocation', dimension, parentTagId),
+
+        // Portfolio value series: { dates: [ISO date], values: Float64Array } (freq 'D', 'W', 'M' or 'Y')
+        getPortfolioSeries: (start, end, freq) => ipcRenderer.invoke('db:get-portfolio-series', start, end, freq),
+
+        // Price history backfill as a cancellable job: onProgress({ done, total, message }); cancelJob(jobId) stops it
+        backfillPrices: async (jobId, end, onProgress) => {
+            const listener = (event, message) => { if (message.jobId === jobId && onProgress) onProgress(message.progress); };
+            ipcRenderer.on('db:job-progress', listener);
+            try { return await ipcRenderer.invoke('db:backfill-prices', jobId, end); }
+            finally { ipcRenderer.removeListener('db:job-progress', listener); }
+        },
+        // Broker statement import (broker null detects each file): onProgress({ done, message, stages }); a cancelled
+        // import keeps its committed batches and resumes when the same files are imported again
+        importStatements: async (jobId, paths, broker, onProgress) => {
+            const listener = (event, message) => { if (message.jobId === jobId && onProgress) onProgress(message.progress); };
+            ipcRenderer.on('db:job-progress', listener);
+            try { return await ipcRenderer.invoke('db:import-statements', jobId, paths, broker); }
+            finally { ipcRenderer.removeListener('db:job-progress', listener); }
+        },
+        cancelJob: (jobId) => ipcRenderer.invoke('db:cancel-job', jobId),
+
+        // Backend metrics: {counters, histograms} named ipc.<function>.<phase> and sql.<statement> (prefix filters)
+        getMetrics: (prefix, reset) => ipcRenderer.invoke('db:get-metrics', prefix, reset),
+
+        // Performance (time-weighted returns in percent)
+        getPeriodReturns: (baseCurrency) => ipcRenderer.invoke('db:get-period-returns', baseCurrency),
+        getMovers: (period, baseCurrency) => ipcRenderer.invoke('db:get-movers', period, baseCurrency),
+
+        // Dividends
+        getUpcomingDividends: (horizonDays) => ipcRenderer.invoke('db:get-upcoming-dividends', horizonDays),
+
         // Example: Expose a function to show file open dialog via main process
         // openFile: () => ipcRenderer.invoke('dialog:openFile')
     });